@@ -15,15 +15,58 @@
     # Number of seconds to reserve a disk when setting it up for a user.
     "disk_reserve_secs": 180,
 
+    # container manager configuration
+    "jboxd": {
+        # Number of worker threads for each class of commands.
+        # Session launches, backups and periodic maintenance run on separate pools so that one can not starve another.
+        # Control requests (status queries, plugin tasks) get a small pool of their own.
+        "workers": {
+            "launch": 10,
+            "backup": 3,
+            "maintenance": 4,
+            "control": 2
+        },
+        # Host usage (CPU, memory, disk, containers) is sampled every sample_secs in the background, and the last
+        # window samples kept for publishing stats.
+        # "host_sampler": {
+        #     "sample_secs": 10,
+        #     "window": 30
+        # }
+    },
+
+    # progress of session launches, pushed by the container manager to the web server on this port (on the same host).
+    # browsers waiting for their session are answered when the launch progresses, or after longpoll_secs.
+    # without a port, the web server checks on the container every few seconds instead.
+    "launch_status": {
+        "port": 8891,
+        "longpoll_secs": 20
+    },
+
+    # threads on which the web and API servers make blocking (docker, database, cloud) calls, off the IOLoop.
+    # call latencies can be queried from the admin handler (instance_info=latency) and are published periodically.
+    "async_service": {
+        "threads": 16
+    },
+
     # Installation specific session key. Used for encryption and signing. 
     "sesskey" : "$$SESSKEY",
     
     # Users that have access to the admin tab
     "admin_users" : [],
 
+    # In-process registry of docker containers, kept current from the docker events stream.
+    # Avoids listing/inspecting all containers on every lookup.
+    "container_cache": {
+        "enabled": True,
+        # Seconds after which the registry is rebuilt from a full container listing, as a safeguard against missed events
+        "resync_secs": 300
+    },
+
     # api container configuration
     "api": {
         "manager_port": 8887,
+        # Address that API containers reach request queues at. Defaults to the address of the docker0 interface.
+        # "bridge_ip": "172.17.0.1",
         # The docker image to launch
         "docker_image" : "juliabox/juliaboxapi",
         # Maximum memory allowed per docker container. Default 1GB. Per API multiplier from configuration
@@ -38,6 +81,21 @@
         "numapilocalmax" : 5,
         # Seconds to wait before force deleting a non-responding container
         "expire" : 1800,
+        # Requests sent to the containers of each API at a time. Requests beyond these wait, up to as many again,
+        # after which new requests are rejected as overloaded.
+        "max_in_flight" : 20,
+        # Scaling of API containers. Each API gets enough containers to serve its (smoothed) arrival rate of requests
+        # at the target utilization, given the percentile of service times, and at least one for every
+        # queue_per_container requests outstanding. Scales up immediately. Scales down one container at a time once
+        # fewer are needed for scale_down_delay_secs, and to none once idle for idle_secs.
+        "autoscale": {
+            "interval_secs": 5,
+            "target_utilization": 0.7,
+            "queue_per_container": 2,
+            "service_time_pct": 90,
+            "scale_down_delay_secs": 60,
+            "idle_secs": 300
+        },
         # ulimit for container, set as both hard and soft limit
         "ulimits" : { "nofile": 1024 }
     },
@@ -59,7 +117,15 @@
         # Upper time limit for a user session before it is auto-deleted. 0 means never expire
         "expire" : 0,
         # ulimit for container, set as both hard and soft limit
-        "ulimits" : { "nofile": 1024 }
+        "ulimits" : { "nofile": 1024 },
+        # Stopped containers with blank user home disks kept ready for new sessions, so that a launch only needs to
+        # restore user data. Sized from the number of launches in the last window_secs, between min and max.
+        # Requires a user home volume plugin that supports blank disks (e.g. vol_loopback).
+        "warm_pool": {
+            "min": 1,
+            "max": 5,
+            "window_secs": 900
+        }
     },
 
     # if using Google auth, the API key and secret to use
@@ -99,6 +165,31 @@
 	    # EBS disk template snapshot id
 	    "ebs_template": None,
 
+        # Cluster loads used to place sessions are fetched in the background every refresh_secs.
+        # Refreshed before use if older than max_age_secs.
+        # "cluster_snapshot": {
+        #     "refresh_secs": 30,
+        #     "max_age_secs": 120
+        # },
+
+        # Placement of new sessions on instances, by the compute plugins that support it.
+        # Compares the load of "choices" randomly picked instances, preferring ones with warm containers and
+        # ones where the user has a session.
+        # "placement": {
+        #     "choices": 2,
+        #     "warm_bonus": 10,
+        #     "affinity_bonus": 30
+        # },
+
+        # Stats are aggregated in process and sent in batches every flush_secs, to the compute plugin's monitoring
+        # service ("cloud"), to a file as JSON lines ("file", with "file": "-" for stdout), or nowhere ("none").
+        # At most max_pending aggregates are kept while the sink is failing.
+        # "metrics": {
+        #     "sink": "cloud",
+        #     "flush_secs": 60,
+        #     "max_pending": 1000
+        # },
+
     	"dummy" : "dummy"
     },
 
@@ -124,8 +215,28 @@ Welcome to JuliaBox. We hope you will like it and also share with your friends.
 
     "env_type" : "prod",
     "backup_location" : "/jboxengine/data/backups",
+    # Pre-generated SSH keypairs for new user homes, stored encrypted with the session key. Size 0 disables.
+    "ssh_keypool": {
+        "location": "/jboxengine/data/keys",
+        "size": 20
+    },
+    "backup": {
+        # Back up user homes incrementally, as a manifest of content addressed chunks in the bucket store.
+        # Only changed files are read and only chunks not already in the bucket are uploaded.
+        "incremental": True,
+        # Stream the compressed archive straight into (and restore from) the bucket store if supported,
+        # instead of staging it locally.
+        "stream": True,
+        # Compress with pigz (if installed) using these many threads. 0 uses all cores.
+        "parallel_compress": True,
+        "compress_threads": 0
+    },
     "pkg_location": "/jboxengine/data/packages",
+    # Session config folders, copied from the config files of the user home image extracted once into ".templates"
+    # here. Copies are reflinks where the filesystem supports them.
     "cfg_location": "/jboxengine/data/configs",
+    # Mount session config folders as overlays of the template instead of copying it (needs sudo and overlayfs).
+    "cfg_overlay": False,
     "mnt_location" : "/jboxengine/data/disks/loop/mnt",
     "user_home_image" : "/jboxengine/data/user_home.tar.gz",
     "pkg_image": "/jboxengine/data/julia_packages.tar.gz",
@@ -133,8 +244,23 @@ Welcome to JuliaBox. We hope you will like it and also share with your friends.
     "db": {
         # default connect string for sqlite database
         "connect_str": "/jboxengine/data/db/juliabox.db",
+        # Connections are pooled across threads (sqlite and cloudsql). Threads wait upto pool_timeout seconds for a
+        # connection when all pool_size of them are in use. An in-memory sqlite database uses just one connection.
+        # "pool_size": 4,
+        # "pool_timeout": 30,
+        # sqlite: compiled statements cached per connection, and whether to use write-ahead logging
+        # "cached_statements": 100,
+        # "wal": True,
         # table name mappings
         # "tables" : {
+        # },
+        # Cache of dynamic configuration values. Values of each kind are cached for ttl_secs (overrides of the defaults
+        # below). With version_check_secs set, changes made by any process are seen by others within that many
+        # seconds, at the cost of one read of a version record per process every version_check_secs.
+        # "dynconfig_cache": {
+        #     "ttl_secs": { "leader": 10, "allow_registration": 60, "registrations_hourly_rate": 60, "message": 60,
+        #                   "user_home_image": 60, "course": 300, "user_cluster": 60 },
+        #     "version_check_secs": 0
         # }
     },
 
@@ -1,4 +1,5 @@
 __author__ = 'tan'
 
 from api_container import APIContainer
-from api_connector import APIConnector
\ No newline at end of file
+from api_connector import APIConnector
+from api_autoscaler import APIAutoScaler
\ No newline at end of file
@@ -0,0 +1,206 @@
+__author__ = 'tan'
+import math
+import time
+import random
+
+from juliabox.jbox_util import LoggerMixin, JBoxCfg
+from api_queue import APIQueue
+from api_container import APIContainer
+
+
+class APIScaleState(object):
+    """ Load estimates and scaling decision for one API. """
+
+    def __init__(self, desired, now):
+        self.desired = desired
+        # smoothed arrival rate (requests per second) and service time estimate (seconds)
+        self.rate = 0.0
+        self.service_secs = None
+        self.last_active = now
+        # since when fewer containers than desired have been needed
+        self.lower_since = None
+        self.last_tick = now
+
+    def debug_str(self):
+        return "rate: %.2f/s, service: %s secs, desired: %d" % (self.rate, self.service_secs, self.desired)
+
+
+class APIAutoScaler(LoggerMixin):
+    """ Decides the number of containers of each API from its recent load.
+
+    For each API, the smoothed arrival rate of requests, a percentile of their service times and the number of
+    requests outstanding give the number of containers needed to keep them busy at the target utilization. Scaling up
+    to that is immediate. Scaling down is one container at a time, and only once fewer have been needed for
+    `scale_down_delay_secs`. APIs without any requests for `idle_secs` are scaled down to no containers. APIs with a
+    `min_idle` setting in their spec keep that many containers started beyond those needed, even when idle.
+
+    `decide` is shared by `tick`, which runs on the live API queues, and `simulate`, which runs against a synthetic load
+    for tuning the policy.
+    """
+
+    INTERVAL_SECS = 5
+    DEFAULT_POLICY = {
+        'target_utilization': 0.7,
+        'queue_per_container': 2,
+        'scale_down_delay_secs': 60,
+        'idle_secs': 300,
+        'service_time_pct': 90,
+        # weight of the latest arrival rate in the smoothed rate
+        'rate_weight': 0.5,
+        # assumed till an API has completed a request
+        'default_service_secs': 1.0
+    }
+    POLICY = dict(DEFAULT_POLICY)
+    # arrival rates (per second) below this are taken as no load
+    MIN_RATE = 0.001
+    STATES = dict()
+
+    @staticmethod
+    def configure():
+        APIAutoScaler.INTERVAL_SECS = JBoxCfg.get('api.autoscale.interval_secs', APIAutoScaler.INTERVAL_SECS)
+        APIAutoScaler.POLICY = APIAutoScaler.make_policy(JBoxCfg.get('api.autoscale', {}))
+        APIAutoScaler.log_info("API autoscaler every %r secs with policy %r", APIAutoScaler.INTERVAL_SECS,
+                               APIAutoScaler.POLICY)
+
+    @staticmethod
+    def make_policy(overrides=None):
+        policy = dict(APIAutoScaler.DEFAULT_POLICY)
+        if overrides is not None:
+            policy.update((k, v) for (k, v) in overrides.iteritems() if k in APIAutoScaler.DEFAULT_POLICY)
+        return policy
+
+    @staticmethod
+    def _percentile(values, pct):
+        values = sorted(values)
+        idx = int(math.ceil(len(values) * pct / 100.0)) - 1
+        return values[min(max(idx, 0), len(values) - 1)]
+
+    @staticmethod
+    def decide(state, arrivals, service_times, outstanding, max_count, now, policy, min_idle=0):
+        """ Update state with the load seen since the last decision and return the number of containers desired.
+        arrivals: number of requests received, service_times: seconds taken by requests completed,
+        outstanding: number of requests queued or being served now, min_idle: spare containers to keep started.
+        """
+        interval = max(now - state.last_tick, 0.001)
+        state.last_tick = now
+
+        wt = policy['rate_weight']
+        state.rate = wt * (arrivals / interval) + (1 - wt) * state.rate
+        if state.rate < APIAutoScaler.MIN_RATE:
+            # the smoothed rate never decays to zero by itself
+            state.rate = 0.0
+        if len(service_times) > 0:
+            state.service_secs = APIAutoScaler._percentile(service_times, policy['service_time_pct'])
+        service_secs = state.service_secs if state.service_secs is not None else policy['default_service_secs']
+
+        needed = int(math.ceil(state.rate * service_secs / policy['target_utilization']))
+        if outstanding > 0:
+            needed = max(needed, int(math.ceil(float(outstanding) / policy['queue_per_container'])))
+        if (arrivals > 0) or (outstanding > 0):
+            state.last_active = now
+            needed = max(needed, 1)
+        needed = min(needed + min_idle, max_count)
+
+        if needed >= state.desired:
+            state.desired = needed
+            state.lower_since = None
+        elif (now - state.last_active) >= policy['idle_secs']:
+            state.desired = needed
+            state.lower_since = None
+        elif state.lower_since is None:
+            state.lower_since = now
+        elif (now - state.lower_since) >= policy['scale_down_delay_secs']:
+            state.desired = max(needed, state.desired - 1, 1)
+            state.lower_since = now
+        return state.desired
+
+    @staticmethod
+    def tick():
+        """ Recalculate desired container counts of all APIs with queues, and launch or terminate containers.
+        Launches run on the async service, so that container creation does not hold up API requests.
+        """
+        now = time.time()
+        headroom = APIContainer.MAX_CONTAINERS - sum(APIContainer.num_api_containers(api_name)
+                                                    for api_name in APIContainer.API_CONTAINERS)
+        for api_name, queue in APIQueue.QUEUES.items():
+            state = APIAutoScaler.STATES.get(api_name, None)
+            if state is None:
+                # requests so far are taken as having arrived over the last interval
+                state = APIScaleState(APIContainer.DESIRED_CONTAINER_COUNTS.get(api_name, 0),
+                                      now - APIAutoScaler.INTERVAL_SECS)
+                APIAutoScaler.STATES[api_name] = state
+
+            current = APIContainer.num_api_containers(api_name)
+            max_count = min(APIContainer.MAX_PER_API_CONTAINERS, current + max(headroom, 0))
+            arrivals, service_times = queue.take_stats()
+            desired = APIAutoScaler.decide(state, arrivals, service_times, queue.num_outstanding, max_count, now,
+                                           APIAutoScaler.POLICY, min_idle=queue.min_idle)
+            headroom -= max(desired - current, 0)
+
+            if desired != APIContainer.DESIRED_CONTAINER_COUNTS.get(api_name, None):
+                APIAutoScaler.log_info("%s: %d containers desired, %d now. %s. %s", api_name, desired, current,
+                                       state.debug_str(), queue.debug_str())
+            APIContainer.DESIRED_CONTAINER_COUNTS[api_name] = desired
+
+        for api_name in APIAutoScaler.STATES.keys():
+            if api_name not in APIQueue.QUEUES:
+                del APIAutoScaler.STATES[api_name]
+
+        APIContainer.apply_desired_counts()
+
+    @staticmethod
+    def simulate(rates, service_secs, policy=None, interval_secs=5, boot_secs=10, max_count=5, initial=0, min_idle=0):
+        """ Run the autoscaler against a synthetic load, without any containers.
+        rates: requests per second in each interval, service_secs: mean service time (exponentially distributed).
+        Containers serve one request at a time, first come first served, and start serving boot_secs after launch.
+        Returns a list of per interval dicts with the load, queue length, and containers desired and serving.
+        """
+        policy = APIAutoScaler.make_policy(policy)
+        now = 0.0
+        state = APIScaleState(initial, now)
+        # time at which each container is free to serve the next request, and time at which booting ones are up
+        serving = [now] * initial
+        booting = []
+        queued = 0
+        timeline = []
+
+        for rate in rates:
+            tstart = now
+            now += interval_secs
+            serving.extend(t for t in booting if t <= now)
+            booting = [t for t in booting if t > now]
+
+            arrivals = 0
+            elapsed = random.expovariate(rate) if rate > 0 else interval_secs
+            while elapsed < interval_secs:
+                arrivals += 1
+                elapsed += random.expovariate(rate)
+            queued += arrivals
+
+            service_times = []
+            for idx in range(len(serving)):
+                free_at = max(serving[idx], tstart)
+                while (queued > 0) and (free_at < now):
+                    secs = random.expovariate(1.0 / service_secs)
+                    free_at += secs
+                    queued -= 1
+                    service_times.append(secs)
+                serving[idx] = free_at
+
+            desired = APIAutoScaler.decide(state, arrivals, service_times, queued, max_count, now, policy,
+                                           min_idle=min_idle)
+            if desired > len(serving) + len(booting):
+                booting.extend([now + boot_secs] * (desired - len(serving) - len(booting)))
+            while (desired < len(serving) + len(booting)) and (len(serving) > 0):
+                serving.remove(min(serving))
+
+            timeline.append({
+                'time': now,
+                'rate': rate,
+                'arrivals': arrivals,
+                'queued': queued,
+                'desired': desired,
+                'serving': len(serving),
+                'booting': len(booting)
+            })
+        return timeline
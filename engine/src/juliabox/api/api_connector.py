@@ -1,106 +1,232 @@
 __author__ = 'tan'
 import zmq
 import json
+import time
+import math
+from collections import deque
 from zmq.eventloop import ioloop, zmqstream
 
-from juliabox.jbox_util import LoggerMixin
+from juliabox.jbox_util import LoggerMixin, JBoxCfg
 from api_queue import APIQueue
 
 
+class APITimerWheel(object):
+    """ Timeouts of requests, kept in a ring of slots one tick apart.
+
+    Scheduling and cancelling a timeout are constant time, and each tick only looks at the timeouts in one slot.
+    Timeouts fire on the first tick on or after they are due, so they are accurate only to a tick.
+    """
+
+    def __init__(self, nslots=64):
+        self.slots = [dict() for _idx in range(nslots)]
+        self.pos = 0
+        # request id: slot index
+        self.slot_of = dict()
+
+    def schedule(self, rid, nticks):
+        nticks = max(int(nticks), 1)
+        rounds, offset = divmod(nticks - 1, len(self.slots))
+        slot = (self.pos + offset + 1) % len(self.slots)
+        self.slots[slot][rid] = rounds
+        self.slot_of[rid] = slot
+
+    def cancel(self, rid):
+        slot = self.slot_of.pop(rid, None)
+        if slot is not None:
+            del self.slots[slot][rid]
+
+    def advance(self):
+        """ Move on by a tick. Returns the ids of requests that timed out. """
+        self.pos = (self.pos + 1) % len(self.slots)
+        slot = self.slots[self.pos]
+        expired = []
+        for (rid, rounds) in slot.items():
+            if rounds == 0:
+                del slot[rid]
+                del self.slot_of[rid]
+                expired.append(rid)
+            else:
+                slot[rid] = rounds - 1
+        return expired
+
+    def __len__(self):
+        return len(self.slot_of)
+
+
+class APIRequest(object):
+    def __init__(self, rid, send_data, on_recv, on_timeout):
+        self.rid = rid
+        self.send_data = send_data
+        self.on_recv = on_recv
+        self.on_timeout = on_timeout
+        self.tsent = None
+
+
 class APIConnector(LoggerMixin):
+    """ Sends requests to the containers of an API, through its queue.
+
+    Each API has one connector, with one DEALER socket that carries all requests to the API. Each request is sent
+    with a request id ahead of the empty delimiter frame, which the REP socket of the API container returns with the
+    response. So requests need not wait for responses to earlier ones, and the API container protocol is unchanged.
+
+    A response is either a single JSON frame, with the result in its `data` field, or a JSON header frame followed by
+    raw body frames. Body frames are passed on as the `body` list of the response, without being decoded.
+
+    At most `MAX_IN_FLIGHT` requests of an API are sent at a time. Requests beyond that wait to be sent, up to as many
+    again, after which new requests are rejected as overloaded. Timeouts of all requests, waiting or sent, are kept in
+    timer wheels ticked every `TICK_SECS`. Responses to requests that have timed out are dropped.
+    """
     CONNS = dict()
-    MAX_CONNS = 2
     CMD_TERMINATE = ":terminate"
+    MAX_IN_FLIGHT = APIQueue.BUFFER_SZ
+    TICK_SECS = 0.5
+    TICKER = None
 
     def __init__(self, api_name):
         self.queue = APIQueue.get_queue(api_name)
         ctx = zmq.Context.instance()
         self.api_name = api_name
-        self.sock = ctx.socket(zmq.REQ)
+        self.sock = ctx.socket(zmq.DEALER)
+        self.sock.setsockopt(zmq.LINGER, 0)
         self.sock.connect(self.queue.get_endpoint_in())
-        self.has_errors = False
-        self.timeout_callback = None
+        self.stream = zmqstream.ZMQStream(self.sock)
+        self.stream.on_recv(self._on_recv)
         self.timeout = self.queue.get_timeout()
 
-        if api_name in APIConnector.CONNS:
-            APIConnector.CONNS[api_name].append(self)
-        else:
-            APIConnector.CONNS[api_name] = [self]
+        self.next_rid = 0
+        self.in_flight = dict()
+        self.waiting = deque()
+        # requests by id, whether waiting or in flight
+        self.requests = dict()
+        self.timers = APITimerWheel()
 
+        APIConnector.CONNS[api_name] = self
+        APIConnector._start_ticker()
         self.log_debug("%s: created", self.debug_str())
 
+    @staticmethod
+    def configure():
+        APIConnector.MAX_IN_FLIGHT = JBoxCfg.get('api.max_in_flight', APIConnector.MAX_IN_FLIGHT)
+
     def debug_str(self):
-        return "APIConnector %s. dflt timeout:%s" % (self.api_name, str(self.timeout))
+        return "APIConnector %s. dflt timeout:%s, in flight:%d, waiting:%d" % (self.api_name, str(self.timeout),
+                                                                               len(self.in_flight), len(self.waiting))
+
+    @staticmethod
+    def _start_ticker():
+        if APIConnector.TICKER is None:
+            APIConnector.TICKER = ioloop.PeriodicCallback(APIConnector._tick, APIConnector.TICK_SECS * 1000)
+            APIConnector.TICKER.start()
+
+    @staticmethod
+    def _tick():
+        for conn in APIConnector.CONNS.values():
+            for rid in conn.timers.advance():
+                conn._on_timeout(rid)
 
     @staticmethod
     def release_connectors(api_name):
-        if api_name in APIConnector.CONNS:
-            APIConnector.log_debug("releasing all %s connectors", api_name)
-            del APIConnector.CONNS[api_name]
-        else:
-            APIConnector.log_debug("already release all %s connectors", api_name)
+        conn = APIConnector.CONNS.pop(api_name, None)
+        if conn is None:
+            APIConnector.log_debug("already released %s connector", api_name)
+            return
+
+        APIConnector.log_debug("releasing %s connector with %d requests pending", api_name, len(conn.requests))
+        conn.stream.close()
+        # the API has no containers left to serve pending requests
+        for rid in conn.requests.keys():
+            conn._on_timeout(rid)
 
     @staticmethod
     def _get_conn(api_name):
-        if not ((api_name in APIConnector.CONNS) and (len(APIConnector.CONNS[api_name]) > 0)):
-            APIConnector(api_name)
-        return APIConnector.CONNS[api_name].pop()
-
-    def _release(self):
+        conn = APIConnector.CONNS.get(api_name, None)
+        if conn is None:
+            conn = APIConnector(api_name)
+        return conn
+
+    def _complete(self, rid):
+        req = self.requests.pop(rid, None)
+        if req is None:
+            return None
+        self.timers.cancel(rid)
+        if self.in_flight.pop(rid, None) is None:
+            self.waiting.remove(req)
         self.queue.incr_outstanding(-1)
-        if self.api_name in APIConnector.CONNS:
-            cache = APIConnector.CONNS[self.api_name]
-            if not self.has_errors and (len(cache) < APIConnector.MAX_CONNS):
-                cache.append(self)
+        self._send_waiting()
+        return req
+
+    def _send_waiting(self):
+        while (len(self.waiting) > 0) and (len(self.in_flight) < APIConnector.MAX_IN_FLIGHT) and \
+                not self.stream.closed():
+            self._send(self.waiting.popleft())
+
+    def _send(self, req):
+        self.in_flight[req.rid] = req
+        req.tsent = time.time()
+        self.stream.send_multipart([req.rid, '', req.send_data])
+
+    def _on_timeout(self, rid):
+        req = self._complete(rid)
+        if req is None:
+            return
+        APIConnector.log_debug("%s: request %s timed out", self.debug_str(), rid)
+        if req.on_timeout is not None:
+            req.on_timeout()
+
+    def _on_recv(self, msg):
+        rid = msg[0]
+        req = self._complete(rid)
+        if req is None:
+            APIConnector.log_debug("%s: dropped response to request %s, which timed out", self.debug_str(), rid)
+            return
+        APIConnector.log_debug("%s: response received to request %s", self.debug_str(), rid)
+        self.queue.record_service_time(time.time() - req.tsent)
+        if req.on_recv is not None:
+            # frames after the request id and the delimiter
+            resp = json.loads(msg[2])
+            if len(msg) > 3:
+                resp['body'] = msg[3:]
+            req.on_recv(resp)
 
     def conn_send_recv(self, send_data, on_recv, on_timeout, timeout=None):
-        stream = zmqstream.ZMQStream(self.sock)
-        loop = ioloop.IOLoop.instance()
         if timeout is None:
             timeout = self.timeout
 
-        def _on_timeout():
-            APIConnector.log_debug("%s: timed out", self.debug_str())
-            self.has_errors = True
-            self.timeout_callback = None
-            stream.stop_on_recv()
-            stream.close()
-            self._release()
-            if on_timeout is not None:
-                on_timeout()
-
-        def _on_recv(msg):
-            APIConnector.log_debug("%s: message received", self.debug_str())
-            if self.timeout_callback is not None:
-                loop.remove_timeout(self.timeout_callback)
-                self.timeout_callback = None
-            stream.stop_on_recv()
-            self._release()
-            msg = json.loads(msg[0])
-            if on_recv is not None:
-                on_recv(msg)
-
-        self.log_debug("%s: making call with timeout %r", self.debug_str(), timeout)
-        self.timeout_callback = loop.add_timeout(timeout, _on_timeout)
-        stream.on_recv(_on_recv)
+        rid = str(self.next_rid)
+        self.next_rid += 1
+        req = APIRequest(rid, send_data, on_recv, on_timeout)
+        self.requests[rid] = req
+        if timeout is not None:
+            self.timers.schedule(rid, math.ceil(timeout.total_seconds() / APIConnector.TICK_SECS))
         self.queue.incr_outstanding(1)
-        self.sock.send(send_data)
+
+        self.log_debug("%s: making call %s with timeout %r", self.debug_str(), rid, timeout)
+        if len(self.in_flight) < APIConnector.MAX_IN_FLIGHT:
+            self._send(req)
+        else:
+            self.waiting.append(req)
+
+    def is_overloaded(self):
+        return len(self.waiting) >= APIConnector.MAX_IN_FLIGHT
 
     @staticmethod
     def send_recv(api_name, cmd, args=None, vargs=None, on_recv=None, on_timeout=None, on_overload=None, timeout=None):
         send_data = APIConnector.make_req(cmd, args=args, vargs=vargs)
         api = APIConnector._get_conn(api_name)
+        api.queue.record_arrival()
 
-        if api.queue.mean_outstanding >= APIQueue.BUFFER_SZ:
-            on_overload()
+        if api.is_overloaded():
+            if on_overload is not None:
+                on_overload()
             return
 
         APIConnector.log_debug("%s: calling %s", api.debug_str(), cmd)
         api.conn_send_recv(send_data, on_recv, on_timeout, timeout)
 
     @staticmethod
-    def send_terminate_msg(api_name, on_recv=None):
-        APIConnector.send_recv(api_name, APIConnector.CMD_TERMINATE, on_recv=on_recv)
+    def send_terminate_msg(api_name, on_recv=None, on_timeout=None):
+        APIConnector.send_recv(api_name, APIConnector.CMD_TERMINATE, on_recv=on_recv, on_timeout=on_timeout,
+                               on_overload=on_timeout)
 
     @staticmethod
     def make_req(cmd, args=None, vargs=None):
@@ -110,4 +236,4 @@ class APIConnector(LoggerMixin):
         if (vargs is not None) and (len(vargs) > 0):
             req['vargs'] = vargs
 
-        return json.dumps(req)
\ No newline at end of file
+        return json.dumps(req)
@@ -5,12 +5,16 @@ import hashlib
 import datetime
 import pytz
 import docker.utils
+import tornado.ioloop
 from docker.utils import Ulimit
 
 from juliabox.jbox_container import BaseContainer
+from juliabox.jbox_container_cache import JBoxContainerCache
 from juliabox.jbox_util import JBoxCfg
+from juliabox.jbox_async_service import JBoxAsyncService
 from juliabox.jbox_tasks import JBoxAsyncJob
 from juliabox.cloud import Compute
+from juliabox.db import JBoxAPISpec
 
 from api_queue import APIQueue
 from api_connector import APIConnector
@@ -32,8 +36,17 @@ class APIContainer(BaseContainer):
 
     API_CONTAINERS = dict()
     DESIRED_CONTAINER_COUNTS = {}
+    # number of containers of each API sent a terminate message that have not yet exited
+    TERMINATING = {}
+    # number of containers of each API being created and started on the async service
+    LAUNCHING = {}
     PINGS = {}
 
+    # Containers are kept started for APIs with `min_idle` set in their spec, so that their requests rarely wait for a
+    # container to start. Requests that do are cold starts, timed till the first response from the API.
+    COLD_STARTS = {}
+    COLD_START_SECS = []
+
     def get_api_name(self):
         name = self.get_name()
         return None if name is None else APIContainer.get_api_name_from_container_name(name)
@@ -53,6 +66,7 @@ class APIContainer(BaseContainer):
         APIContainer.MAX_CONTAINERS = JBoxCfg.get('api.numlocalmax')
         APIContainer.MAX_PER_API_CONTAINERS = JBoxCfg.get('api.numapilocalmax')
         APIContainer.EXPIRE_SECS = JBoxCfg.get('api.expire')
+        JBoxContainerCache.configure()
 
     @staticmethod
     def unique_container_name(api_name):
@@ -78,17 +92,26 @@ class APIContainer(BaseContainer):
 
     @staticmethod
     def ensure_container_available(api_name):
-        if api_name in APIContainer.API_CONTAINERS:
-            containers = APIContainer.API_CONTAINERS[api_name]
-            if (len(containers) > 1) or (len(containers) == 1 and APIContainer.get_by_name(containers[0]) is not None):
-                APIContainer.log_debug("container already up for %s. count %r", api_name, len(containers))
+        # containers being terminated do not count, as requests queued behind the terminate message are not served
+        if APIContainer.num_api_containers(api_name) > 0:
+            containers = APIContainer.API_CONTAINERS.get(api_name, [])
+            if (APIContainer.LAUNCHING.get(api_name, 0) > 0) or (len(containers) > 1) or \
+                    (APIContainer.get_by_name(containers[0]) is not None):
+                APIContainer.log_debug("container already up or starting for %s. count %r", api_name,
+                                       len(containers))
                 return
 
         APIContainer.log_debug("Launching new %s. None exising: %r", api_name, APIContainer.API_CONTAINERS)
+        if api_name not in APIContainer.COLD_STARTS:
+            APIContainer.COLD_STARTS[api_name] = time.time()
+        APIContainer.DESIRED_CONTAINER_COUNTS[api_name] = max(APIContainer.DESIRED_CONTAINER_COUNTS.get(api_name, 0), 1)
         APIContainer.create_new(api_name)
 
     @staticmethod
     def create_new(api_name):
+        """ Launch a container for api_name. Docker calls run on the async service, off the IOLoop, and the container
+        is registered on the IOLoop once started. Returns a future of the container.
+        """
         container_name = APIContainer.unique_container_name(api_name)
         queue = APIQueue.get_queue(api_name)
         env = {
@@ -102,6 +125,24 @@ class APIContainer(BaseContainer):
         if image_name is None:
             image_name = APIContainer.DCKR_IMAGE
 
+        APIContainer.LAUNCHING[api_name] = APIContainer.LAUNCHING.get(api_name, 0) + 1
+        future = JBoxAsyncService.run('docker.create_api_container', APIContainer._create_and_start, image_name,
+                                      env, container_name)
+
+        def launched(f):
+            APIContainer.LAUNCHING[api_name] = max(APIContainer.LAUNCHING.get(api_name, 0) - 1, 0)
+            try:
+                cont = f.result()
+            except:
+                APIContainer.log_exception("Exception launching container of %s", api_name)
+                return
+            cont.on_start()
+        tornado.ioloop.IOLoop.instance().add_future(future, launched)
+        return future
+
+    @staticmethod
+    def _create_and_start(image_name, env, container_name):
+        """ Create and start a container, without registering it (see `create_new`). """
         hostcfg = docker.utils.create_host_config(mem_limit=APIContainer.MEM_LIMIT)
 
         jsonobj = APIContainer.DCKR.create_container(image_name,
@@ -112,35 +153,51 @@ class APIContainer(BaseContainer):
                                                      hostname='juliabox',
                                                      name=container_name)
         dockid = jsonobj["Id"]
+        JBoxContainerCache.update(dockid)
         cont = APIContainer(dockid)
         APIContainer.log_info("Created " + cont.debug_str())
-        cont.start()
+        APIContainer.DCKR.start(dockid)
+        cont.refresh()
+        APIContainer.log_info("Started " + cont.debug_str())
         return cont
 
     @staticmethod
-    def calc_desired_container_counts():
-        for api_name in APIContainer.API_CONTAINERS:
-            queue = APIQueue.get_queue(api_name, alloc=False)
-            if queue is None:
-                APIContainer.log_debug("no queue found for api: %s", api_name)
-                APIContainer.DESIRED_CONTAINER_COUNTS[api_name] = 0
-
-            desired = APIContainer.DESIRED_CONTAINER_COUNTS[api_name]
-            APIContainer.log_debug("re-calculating desired capacity with %s. now %d.", queue.debug_str(), desired)
-            if queue.mean_outstanding > 1:
-                incr = int(queue.mean_outstanding)
-                desired = min(desired + incr, APIContainer.MAX_PER_API_CONTAINERS)
-            elif queue.mean_outstanding < 0.01:  # approx 5 polls where 0 q length was found
-                desired = 0
-            elif queue.mean_outstanding < 0.5 and desired > 1:  # nothing is queued when mean is 1/3
-                desired -= 1
-            else:
-                desired = max(desired, 1)
-            APIContainer.DESIRED_CONTAINER_COUNTS[api_name] = desired
-            APIContainer.log_debug("calculated desired capacity with %s to %d.", queue.debug_str(), desired)
-
-            if queue.num_outstanding == 0:
-                queue.incr_outstanding(0)   # recalculate mean if no requests are coming
+    def num_api_containers(api_name):
+        """ Number of containers of the API, including those being launched and not those being terminated. """
+        return len(APIContainer.API_CONTAINERS.get(api_name, [])) + APIContainer.LAUNCHING.get(api_name, 0) - \
+            APIContainer.TERMINATING.get(api_name, 0)
+
+    @staticmethod
+    def apply_desired_counts():
+        """ Launch or terminate containers of each API to match the desired counts (see `APIAutoScaler`). """
+        def make_callbacks(api_name):
+            def terminated():
+                APIContainer.TERMINATING[api_name] = max(APIContainer.TERMINATING.get(api_name, 0) - 1, 0)
+
+            def cleanup(msg):
+                terminated()
+                if 'nid' in msg:
+                    cont = APIContainer.get_by_name(msg['nid'])
+                    if cont is not None:
+                        cont.delete()
+            return cleanup, terminated
+
+        for (api_name, desired) in APIContainer.DESIRED_CONTAINER_COUNTS.items():
+            ndiff = APIContainer.num_api_containers(api_name) - desired
+
+            # terminate if in excess
+            while ndiff > 0:
+                APIContainer.log_debug("terminating one instance of %s", api_name)
+                APIContainer.TERMINATING[api_name] = APIContainer.TERMINATING.get(api_name, 0) + 1
+                on_recv, on_timeout = make_callbacks(api_name)
+                APIConnector.send_terminate_msg(api_name, on_recv=on_recv, on_timeout=on_timeout)
+                ndiff -= 1
+
+            # launch if more required
+            while ndiff < 0:
+                APIContainer.log_debug("launching one instance of %s", api_name)
+                APIContainer.create_new(api_name)
+                ndiff += 1
 
     @staticmethod
     def refresh_container_list():
@@ -188,6 +245,33 @@ class APIContainer(BaseContainer):
         for api_name in dellist:
             del APIContainer.API_CONTAINERS[api_name]
 
+    @staticmethod
+    def refresh_warm_pools():
+        """ Set the number of idle containers to keep for each API from the API specs, and launch any missing. """
+        pooled = JBoxAPISpec.get_pooled_apis()
+        for (api_name, queue) in APIQueue.QUEUES.items():
+            queue.min_idle = pooled.get(api_name, 0)
+
+        for (api_name, min_idle) in pooled.iteritems():
+            queue = APIQueue.get_queue(api_name)
+            queue.min_idle = min_idle
+            min_count = min(min_idle, APIContainer.MAX_PER_API_CONTAINERS)
+            if APIContainer.DESIRED_CONTAINER_COUNTS.get(api_name, 0) < min_count:
+                APIContainer.log_info("Keeping %d idle containers of %s", min_count, api_name)
+                APIContainer.DESIRED_CONTAINER_COUNTS[api_name] = min_count
+
+    @staticmethod
+    def publish_pool_stats():
+        stats = APIContainer.COLD_START_SECS
+        APIContainer.COLD_START_SECS = []
+        nstarts = len(stats)
+        mean_secs = (sum(stats) / nstarts) if (nstarts > 0) else 0
+        max_secs = max(stats) if (nstarts > 0) else 0
+        APIContainer.log_info("API cold starts: %d, mean %.2f secs, max %.2f secs", nstarts, mean_secs, max_secs)
+        Compute.publish_stats_multi([("APIColdStarts", "Count", nstarts),
+                                     ("APIColdStartMeanTime", "Seconds", mean_secs),
+                                     ("APIColdStartMaxTime", "Seconds", max_secs)])
+
     @staticmethod
     def release_queues():
         APIContainer.log_debug("active apis: %r", APIContainer.API_CONTAINERS)
@@ -200,33 +284,21 @@ class APIContainer(BaseContainer):
     @staticmethod
     def maintain():
         """
-        For each API type, maintain a desired capacity calculated based on number of outstanding requests.
+        Remove dead and unresponsive containers, release queues of APIs without containers, and restore the desired
+        capacity of each API type, including idle containers kept for APIs with a `min_idle` setting. Desired
+        capacities are calculated by `APIAutoScaler` on a shorter interval.
         """
         APIContainer.log_info("Starting container maintenance...")
         APIContainer.refresh_container_list()
         APIContainer.release_queues()
-        APIContainer.calc_desired_container_counts()
-
-        def cleanup(msg):
-            if 'nid' in msg:
-                cont = APIContainer.get_by_name(msg['nid'])
-                cont.delete()
-
-        for (api_name, clist) in APIContainer.API_CONTAINERS.iteritems():
-            ndiff = len(clist) - APIContainer.DESIRED_CONTAINER_COUNTS[api_name]
-
-            # terminate if in excess
-            while ndiff > 0:
-                APIContainer.log_debug("terminating one instance of %s", api_name)
-                APIConnector.send_terminate_msg(api_name, on_recv=cleanup)
-                ndiff -= 1
-
-            # launch if more required
-            while ndiff < 0:
-                APIContainer.log_debug("launching one instance of %s", api_name)
-                APIContainer.create_new(api_name)
-                ndiff += 1
-
+        APIContainer.refresh_warm_pools()
+        for api_name in APIContainer.DESIRED_CONTAINER_COUNTS.keys():
+            if APIQueue.get_queue(api_name, alloc=False) is None:
+                del APIContainer.DESIRED_CONTAINER_COUNTS[api_name]
+                APIContainer.TERMINATING.pop(api_name, None)
+                APIContainer.COLD_STARTS.pop(api_name, None)
+        APIContainer.apply_desired_counts()
+        APIContainer.publish_pool_stats()
         APIContainer.log_info("Finished container maintenance.")
 
     @staticmethod
@@ -234,21 +306,22 @@ class APIContainer(BaseContainer):
         APIContainer.PINGS[name] = datetime.datetime.now(pytz.utc)
         APIContainer.log_debug("Recorded ping for %s", name)
 
+    @staticmethod
+    def record_response(name):
+        """ Record a response from container name, which completes a cold start of its API if one is pending. """
+        APIContainer.record_ping(name)
+        tstart = APIContainer.COLD_STARTS.pop(APIContainer.get_api_name_from_container_name(name), None)
+        if tstart is not None:
+            APIContainer.COLD_START_SECS.append(time.time() - tstart)
+
     @staticmethod
     def _get_last_ping(name):
         return APIContainer.PINGS[name] if (name in APIContainer.PINGS) else None
 
     @staticmethod
     def get_by_name(name):
-        if not name.startswith("/"):
-            nname = "/" + unicode(name)
-        else:
-            nname = unicode(name)
-
-        for c in APIContainer.DCKR.containers(all=True):
-            if ('Names' in c) and (c['Names'] is not None) and (c['Names'][0] == nname):
-                return APIContainer(c['Id'])
-        return None
+        cid = BaseContainer.get_id_by_name(name)
+        return None if cid is None else APIContainer(cid)
 
     @staticmethod
     def register_api_container(api_name, cname):
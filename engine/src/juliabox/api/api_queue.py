@@ -12,12 +12,13 @@ from juliabox.cloud import Compute
 class APIQueue(LoggerMixin):
     BUFFER_SZ = 20
     QUEUES = dict()
-    QLEN_WT = 0.25
     QUEUE_CACHE = []
 
     def __init__(self, api_name):
         self.cmd = self.image_name = self.api_name = None
-        self.num_outstanding = self.mean_outstanding = self.timeout = 0
+        self.num_outstanding = self.timeout = 0
+        self.num_arrived = self.min_idle = 0
+        self.service_times = []
 
         self.reset(api_name)
         self.qdev = qdev = ThreadDevice(zmq.QUEUE, zmq.XREP, zmq.XREQ)
@@ -44,7 +45,8 @@ class APIQueue(LoggerMixin):
     def reset(self, api_name):
         self.api_name = api_name
         self.num_outstanding = 0
-        self.mean_outstanding = 0
+        self.num_arrived = 0
+        self.service_times = []
 
         spec = JBoxAPISpec(api_name)
         timeout_secs = spec.get_timeout_secs()
@@ -52,15 +54,15 @@ class APIQueue(LoggerMixin):
 
         self.cmd = spec.get_cmd()
         self.image_name = spec.get_image_name()
+        self.min_idle = spec.get_min_idle()
 
     @staticmethod
     def _zmq_major_ver():
         return int(zmq.zmq_version()[0])
 
     def debug_str(self):
-        return "APIQueue %s (%s, %s). outstanding: %g, %g" % (self.api_name, self.get_endpoint_in(),
-                                                              self.get_endpoint_out(), self.num_outstanding,
-                                                              self.mean_outstanding)
+        return "APIQueue %s (%s, %s). outstanding: %g" % (self.api_name, self.get_endpoint_in(),
+                                                          self.get_endpoint_out(), self.num_outstanding)
 
     def get_endpoint_in(self):
         return self.endpoints[0]
@@ -118,6 +120,18 @@ class APIQueue(LoggerMixin):
 
         return endpoint_in, endpoint_out
 
+    def record_arrival(self):
+        self.num_arrived += 1
+
+    def record_service_time(self, secs):
+        self.service_times.append(secs)
+
+    def take_stats(self):
+        """ Number of requests received and service times of requests completed, since the last call. """
+        stats = self.num_arrived, self.service_times
+        self.num_arrived = 0
+        self.service_times = []
+        return stats
+
     def incr_outstanding(self, num):
         self.num_outstanding += num
-        self.mean_outstanding = (APIQueue.QLEN_WT * self.mean_outstanding + self.num_outstanding) / (1+APIQueue.QLEN_WT)
@@ -1,3 +1,6 @@
 __author__ = 'tan'
 
-from compute import JBPluginCloud, Compute
\ No newline at end of file
+from compute import JBPluginCloud, Compute
+from cluster_snapshot import JBoxClusterSnapshot
+from placement import JBoxPlacement
+from metrics import JBoxMetrics
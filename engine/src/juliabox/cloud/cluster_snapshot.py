@@ -0,0 +1,120 @@
+__author__ = 'tan'
+
+import threading
+import time
+
+from juliabox.jbox_util import LoggerMixin, JBoxCfg
+
+
+class JBoxClusterSnapshot(LoggerMixin):
+    """ The state of the cluster as last fetched, for placement decisions made on each login.
+
+    The compute plugin registers a `fetch` function that returns the cluster state, e.g. loads of instances. It is
+    called by a background thread every `REFRESH_SECS`, so that lookups are served from memory. A snapshot older than
+    `MAX_AGE_SECS` (e.g. when the background refreshes keep failing) is refreshed before being returned. If that fails
+    too, the stale snapshot is returned rather than failing the lookup, and the failure counted.
+    """
+
+    REFRESH_SECS = 30
+    MAX_AGE_SECS = 120
+
+    FETCH = None
+    LOCK = threading.Lock()
+    STATE = None
+    TAKEN_AT = 0
+    REFRESHER = None
+    STATS = {
+        'refreshes': 0,
+        'refresh_errors': 0,
+        # refreshes done in the lookup, because the snapshot was missing or too old
+        'sync_refreshes': 0,
+        'refresh_secs': 0.0,
+        # age of the oldest snapshot returned
+        'max_age': 0.0
+    }
+
+    @staticmethod
+    def configure(fetch):
+        JBoxClusterSnapshot.REFRESH_SECS = JBoxCfg.get('cloud_host.cluster_snapshot.refresh_secs',
+                                                       JBoxClusterSnapshot.REFRESH_SECS)
+        JBoxClusterSnapshot.MAX_AGE_SECS = JBoxCfg.get('cloud_host.cluster_snapshot.max_age_secs',
+                                                       JBoxClusterSnapshot.MAX_AGE_SECS)
+        JBoxClusterSnapshot.FETCH = staticmethod(fetch)
+
+    @staticmethod
+    def is_configured():
+        return JBoxClusterSnapshot.FETCH is not None
+
+    @staticmethod
+    def _start_refresher():
+        with JBoxClusterSnapshot.LOCK:
+            if JBoxClusterSnapshot.REFRESHER is not None:
+                return
+            t = threading.Thread(target=JBoxClusterSnapshot._run, name="jbox_cluster_snapshot")
+            t.daemon = True
+            JBoxClusterSnapshot.REFRESHER = t
+        t.start()
+
+    @staticmethod
+    def _run():
+        while True:
+            time.sleep(JBoxClusterSnapshot.REFRESH_SECS)
+            try:
+                JBoxClusterSnapshot.refresh()
+            except:
+                JBoxClusterSnapshot.log_exception("Exception refreshing cluster snapshot")
+
+    @staticmethod
+    def refresh():
+        tstart = time.time()
+        try:
+            state = JBoxClusterSnapshot.FETCH()
+        except:
+            with JBoxClusterSnapshot.LOCK:
+                JBoxClusterSnapshot.STATS['refresh_errors'] += 1
+            raise
+
+        now = time.time()
+        with JBoxClusterSnapshot.LOCK:
+            JBoxClusterSnapshot.STATE = state
+            JBoxClusterSnapshot.TAKEN_AT = now
+            JBoxClusterSnapshot.STATS['refreshes'] += 1
+            JBoxClusterSnapshot.STATS['refresh_secs'] = now - tstart
+        JBoxClusterSnapshot.log_debug("Refreshed cluster snapshot in %g secs", now - tstart)
+        return state
+
+    @staticmethod
+    def get():
+        """ The latest cluster state. Must not be modified by the caller. """
+        JBoxClusterSnapshot._start_refresher()
+        with JBoxClusterSnapshot.LOCK:
+            state = JBoxClusterSnapshot.STATE
+            age = time.time() - JBoxClusterSnapshot.TAKEN_AT
+
+        if (state is None) or (age > JBoxClusterSnapshot.MAX_AGE_SECS):
+            with JBoxClusterSnapshot.LOCK:
+                JBoxClusterSnapshot.STATS['sync_refreshes'] += 1
+            try:
+                state = JBoxClusterSnapshot.refresh()
+                age = 0.0
+            except:
+                if state is None:
+                    raise
+                JBoxClusterSnapshot.log_exception("Exception refreshing cluster snapshot. Using one %g secs old", age)
+
+        with JBoxClusterSnapshot.LOCK:
+            JBoxClusterSnapshot.STATS['max_age'] = max(JBoxClusterSnapshot.STATS['max_age'], age)
+        return state
+
+    @staticmethod
+    def get_stats(reset=True):
+        """ Counts since the last reset, the time taken by the last refresh and the current age of the snapshot. """
+        with JBoxClusterSnapshot.LOCK:
+            stats = dict(JBoxClusterSnapshot.STATS)
+            stats['age'] = (time.time() - JBoxClusterSnapshot.TAKEN_AT) if JBoxClusterSnapshot.STATE is not None \
+                else None
+            if reset:
+                for name in ('refreshes', 'refresh_errors', 'sync_refreshes'):
+                    JBoxClusterSnapshot.STATS[name] = 0
+                JBoxClusterSnapshot.STATS['max_age'] = 0.0
+        return stats
@@ -4,6 +4,7 @@ import socket
 import fcntl
 import struct
 from juliabox.jbox_util import LoggerMixin, JBoxPluginType, JBoxCfg
+from placement import JBoxPlacement
 import random
 
 
@@ -13,7 +14,9 @@ class JBPluginCloud(LoggerMixin):
     - `JBPluginCloud.JBP_BUCKETSTORE`, `JBPluginCloud.JBP_BUCKETSTORE_S3`:
         Provides storage for blobs of data in named buckets. Similar to Amazon S3 or OpenStack Swift.
         - `push(bucket, local_file, metadata=None)`
+        - `push_stream(bucket, key_name, fileobj, metadata=None)`: Optional. Upload from a stream of unknown length.
         - `pull(bucket, local_file, metadata_only=False)`
+        - `pull_stream(bucket, key_name)`: Optional. Open for reading as a file like object, or None if not found.
         - `delete(bucket, local_file)`
         - `copy(from_file, to_file, from_bucket, to_bucket=None)`
         - `move(from_file, to_file, from_bucket, to_bucket=None)`
@@ -41,7 +44,8 @@ class JBPluginCloud(LoggerMixin):
         - `get_instance_public_ip(instance_id=None)`
         - `get_instance_local_ip(instance_id=None)`
         - `publish_stats(stat_name, stat_unit, stat_value)`: Record performance/load statistics.
-        - `publish_stats_multi(stats)`: Record multiple performance/load statistics.
+        - `publish_stats_multi(stats)`: Record multiple performance/load statistics. May be sent on in batches later,
+            through `JBoxMetrics`.
         - `get_instance_stats(instance, stat_name, namespace=None)`: Query recorded statistics.
         - `get_cluster_stats(stat_name, namespace=None)`: Query cluster wide recorded statistics.
         - `get_cluster_average_stats(stat_name, namespace=None, results=None)`: Query cluster wide averages of recorded statistics.
@@ -51,6 +55,8 @@ class JBPluginCloud(LoggerMixin):
         - `get_redirect_instance_id()`: If the current instance is not ready to accept further load, a suggestion on which instance to load instead.
         - `get_image_recentness(instance=None)`: Whether the application image running on the instance is the latest.
         - `get_available_instances()`: Returns a list of instance props when using fixed size cluster.
+        - `get_placement_candidates()`: Optional. Instances that sessions can be placed on, with their last published
+            state, as taken by `JBoxPlacement.choose`.
     """
 
     JBP_BUCKETSTORE = "cloud.bucketstore"
@@ -96,6 +102,7 @@ class Compute(LoggerMixin):
         plugin.configure()
         Compute.impl = plugin
         Compute.SCALE = JBoxCfg.get('cloud_host.scale_down')
+        JBoxPlacement.configure()
 
     @staticmethod
     def get_install_id():
@@ -135,6 +142,9 @@ class Compute(LoggerMixin):
 
     @staticmethod
     def get_docker_bridge_ip():
+        bridge_ip = JBoxCfg.get('api.bridge_ip')
+        if bridge_ip is not None:
+            return bridge_ip
         return Compute.get_instance_interface_ip('docker0')
 
     @staticmethod
@@ -187,6 +197,18 @@ class Compute(LoggerMixin):
                 return None
         return Compute.impl.get_redirect_instance_id()
 
+    @staticmethod
+    def supports_placement():
+        return hasattr(Compute.impl, 'get_placement_candidates')
+
+    @staticmethod
+    def place_session(affinity=None):
+        """ Instance to launch a new session on, or None if no instance is eligible.
+        Only if `supports_placement`. Otherwise sessions are placed through `should_accept_session` and
+        `get_redirect_instance_id`.
+        """
+        return JBoxPlacement.choose(Compute.impl.get_placement_candidates(), affinity=affinity)
+
     @staticmethod
     def should_accept_session(is_leader):
         self_instance_id = Compute.get_instance_id()
@@ -0,0 +1,159 @@
+__author__ = 'tan'
+
+import sys
+import json
+import time
+import datetime
+import threading
+from collections import deque
+
+from juliabox.jbox_util import LoggerMixin, JBoxCfg
+
+
+class JBoxMetrics(LoggerMixin):
+    """ Aggregates stats published in this process, and sends them to a sink in batches from a background thread.
+
+    Samples of a stat recorded within a flush interval are coalesced into one aggregate with the count, sum, min, max
+    and last value of the samples. Every `FLUSH_SECS`, aggregates of the interval are handed to the sink in one call.
+    If the sink fails, aggregates are kept to be sent with the next flush, up to `MAX_PENDING`, beyond which the oldest
+    are dropped.
+
+    The sink is a function taking a list of aggregates, each a dict with `name`, `unit`, `timestamp` (UTC datetime of
+    the start of the interval), `count`, `sum`, `min`, `max` and `last`. Configured by "cloud_host.metrics":
+        - `sink`: "cloud" to use the one provided by the compute plugin, "file" to write JSON lines to `file` ("-" for
+            stdout), or "none" to discard stats.
+    """
+
+    FLUSH_SECS = 60
+    MAX_PENDING = 1000
+
+    SINK = None
+    LOCK = threading.Lock()
+    CURRENT = dict()
+    CURRENT_START = None
+    PENDING = deque()
+    FLUSHER = None
+    STATS = {
+        'flushes': 0,
+        'flush_errors': 0,
+        'dropped': 0
+    }
+
+    @staticmethod
+    def configure(cloud_sink=None):
+        cfg = JBoxCfg.get('cloud_host.metrics', {})
+        JBoxMetrics.FLUSH_SECS = cfg.get('flush_secs', JBoxMetrics.FLUSH_SECS)
+        JBoxMetrics.MAX_PENDING = cfg.get('max_pending', JBoxMetrics.MAX_PENDING)
+
+        sink = cfg.get('sink', 'cloud')
+        if sink == 'cloud':
+            JBoxMetrics.SINK = None if cloud_sink is None else staticmethod(cloud_sink)
+        elif sink == 'file':
+            JBoxMetrics.SINK = staticmethod(JBoxMetrics.make_file_sink(cfg.get('file', '-')))
+        else:
+            JBoxMetrics.SINK = None
+        JBoxMetrics.log_info("Metrics sink: %s, flushed every %r secs", sink if JBoxMetrics.is_enabled() else None,
+                             JBoxMetrics.FLUSH_SECS)
+
+    @staticmethod
+    def is_enabled():
+        return JBoxMetrics.SINK is not None
+
+    @staticmethod
+    def make_file_sink(path):
+        lock = threading.Lock()
+
+        def file_sink(aggregates):
+            lines = [json.dumps(dict(agg, timestamp=agg['timestamp'].isoformat())) + '\n' for agg in aggregates]
+            with lock:
+                if path == '-':
+                    sys.stdout.writelines(lines)
+                    sys.stdout.flush()
+                else:
+                    with open(path, 'a') as f:
+                        f.writelines(lines)
+        return file_sink
+
+    @staticmethod
+    def _start_flusher():
+        with JBoxMetrics.LOCK:
+            if JBoxMetrics.FLUSHER is not None:
+                return
+            t = threading.Thread(target=JBoxMetrics._run, name="jbox_metrics_flusher")
+            t.daemon = True
+            JBoxMetrics.FLUSHER = t
+        t.start()
+
+    @staticmethod
+    def _run():
+        while True:
+            time.sleep(JBoxMetrics.FLUSH_SECS)
+            JBoxMetrics.flush()
+
+    @staticmethod
+    def record(stats):
+        """ Record samples of stats, as a list of (name, unit, value). """
+        if not JBoxMetrics.is_enabled():
+            return
+        JBoxMetrics._start_flusher()
+        with JBoxMetrics.LOCK:
+            if JBoxMetrics.CURRENT_START is None:
+                JBoxMetrics.CURRENT_START = datetime.datetime.utcnow()
+            for (stat_name, stat_unit, stat_value) in stats:
+                agg = JBoxMetrics.CURRENT.get((stat_name, stat_unit), None)
+                if agg is None:
+                    JBoxMetrics.CURRENT[(stat_name, stat_unit)] = {
+                        'name': stat_name,
+                        'unit': stat_unit,
+                        'timestamp': JBoxMetrics.CURRENT_START,
+                        'count': 1,
+                        'sum': stat_value,
+                        'min': stat_value,
+                        'max': stat_value,
+                        'last': stat_value
+                    }
+                else:
+                    agg['count'] += 1
+                    agg['sum'] += stat_value
+                    agg['min'] = min(agg['min'], stat_value)
+                    agg['max'] = max(agg['max'], stat_value)
+                    agg['last'] = stat_value
+
+    @staticmethod
+    def flush():
+        """ Send aggregates recorded so far, and any left over from failed flushes, to the sink. """
+        with JBoxMetrics.LOCK:
+            JBoxMetrics.PENDING.extend(JBoxMetrics.CURRENT.values())
+            JBoxMetrics.CURRENT = dict()
+            JBoxMetrics.CURRENT_START = None
+            while len(JBoxMetrics.PENDING) > JBoxMetrics.MAX_PENDING:
+                JBoxMetrics.PENDING.popleft()
+                JBoxMetrics.STATS['dropped'] += 1
+            batch = list(JBoxMetrics.PENDING)
+            JBoxMetrics.PENDING.clear()
+
+        if (len(batch) == 0) or not JBoxMetrics.is_enabled():
+            return
+        try:
+            JBoxMetrics.SINK(batch)
+            with JBoxMetrics.LOCK:
+                JBoxMetrics.STATS['flushes'] += 1
+        except:
+            JBoxMetrics.log_exception("Exception flushing %d metrics. Will retry.", len(batch))
+            with JBoxMetrics.LOCK:
+                JBoxMetrics.STATS['flush_errors'] += 1
+                # newer aggregates recorded meanwhile stay behind the ones being retried
+                JBoxMetrics.PENDING.extendleft(reversed(batch))
+                while len(JBoxMetrics.PENDING) > JBoxMetrics.MAX_PENDING:
+                    JBoxMetrics.PENDING.popleft()
+                    JBoxMetrics.STATS['dropped'] += 1
+
+    @staticmethod
+    def get_stats(reset=True):
+        with JBoxMetrics.LOCK:
+            stats = dict(JBoxMetrics.STATS)
+            stats['pending'] = len(JBoxMetrics.PENDING)
+            if reset:
+                for name in JBoxMetrics.STATS:
+                    JBoxMetrics.STATS[name] = 0
+        return stats
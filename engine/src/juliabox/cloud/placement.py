@@ -0,0 +1,79 @@
+__author__ = 'tan'
+
+import random
+
+from juliabox.jbox_util import LoggerMixin, JBoxCfg
+
+
+class JBoxPlacement(LoggerMixin):
+    """ Picks the instance to launch a session on, in one decision.
+
+    Candidates are instances with their last published state:
+        - `load`: overall load percent
+        - `accept`: whether the instance accepts sessions
+        - `disk_ids_used`: percent of disk ids in use (optional)
+        - `warm`: number of warm containers ready to be used (optional)
+        - `recentness`: of the application image, as in `get_image_recentness` (optional)
+
+    Instances fully loaded, out of disk ids, not accepting or running an older image are not eligible. Among the
+    eligible, `choices` are picked at random and the one with the lowest score wins (the power of two choices), which
+    spreads load without every placement herding on to the one least loaded instance as per possibly stale loads.
+    The instance the user has a session on is always among those compared. Score is the load, less `warm_bonus` if a
+    warm container is ready and `affinity_bonus` for the user's instance. If no instance is eligible, none is picked,
+    and the caller falls back to its own path (e.g. launching locally if possible, or reporting no capacity).
+    """
+
+    DEFAULT_POLICY = {
+        'choices': 2,
+        'warm_bonus': 10,
+        'affinity_bonus': 30
+    }
+    POLICY = dict(DEFAULT_POLICY)
+
+    @staticmethod
+    def configure():
+        JBoxPlacement.POLICY = JBoxPlacement.make_policy(JBoxCfg.get('cloud_host.placement', {}))
+
+    @staticmethod
+    def make_policy(overrides=None):
+        policy = dict(JBoxPlacement.DEFAULT_POLICY)
+        if overrides is not None:
+            policy.update((k, v) for (k, v) in overrides.iteritems() if k in JBoxPlacement.DEFAULT_POLICY)
+        return policy
+
+    @staticmethod
+    def is_eligible(props):
+        return props.get('accept', True) and (props.get('load', 0) < 100) and \
+            (props.get('disk_ids_used', 0) < 100) and (props.get('recentness', 0) >= 0)
+
+    @staticmethod
+    def score(props, affine, policy):
+        score = props.get('load', 0)
+        if props.get('warm', 0) > 0:
+            score -= policy['warm_bonus']
+        if affine:
+            score -= policy['affinity_bonus']
+        return score
+
+    @staticmethod
+    def choose(candidates, affinity=None, policy=None, rnd=random):
+        """ Instance id to launch a session on, or None if no instance is eligible.
+        candidates: instance id: props, affinity: instance id of the user's session, if any.
+        """
+        if policy is None:
+            policy = JBoxPlacement.POLICY
+
+        # sorted, so that choices are reproducible with a seeded rnd
+        eligible = sorted(iid for (iid, props) in candidates.iteritems() if JBoxPlacement.is_eligible(props))
+        if len(eligible) == 0:
+            # instances not accepting sessions or on an older image are never picked, even if they have capacity
+            JBoxPlacement.log_debug("No eligible instance out of %r", sorted(candidates.keys()))
+            return None
+
+        compared = rnd.sample(eligible, min(int(policy['choices']), len(eligible)))
+        if (affinity in eligible) and (affinity not in compared):
+            compared.append(affinity)
+
+        chosen = min(compared, key=lambda iid: (JBoxPlacement.score(candidates[iid], iid == affinity, policy), iid))
+        JBoxPlacement.log_debug("Placing on %s, out of %r (affinity: %r)", chosen, compared, affinity)
+        return chosen
@@ -1,4 +1,5 @@
 from db_base import JBoxDB, JBPluginDB, JBoxDBItemNotFound
+from conn_pool import JBoxDBConnPool
 from user_v2 import JBoxUserV2
 from user_profile import JBoxUserProfile
 from container import JBoxSessionProps
@@ -18,6 +19,7 @@ def configure():
     for cls in (JBoxUserV2, JBoxSessionProps, JBoxDynConfig, JBoxAPISpec):
         cls.NAME = tablenames.get(cls.NAME, cls.NAME)
         JBoxDB.log_info("%s provided by table %s", cls.__name__, cls.NAME)
+    JBoxDynConfig.configure_cache()
 
     for plugin in JBPluginDB.jbox_get_plugins(JBPluginDB.JBP_TABLE):
         JBoxDB.log_info("Found plugin %r provides %r", plugin, plugin.provides)
@@ -35,7 +37,8 @@ def is_cluster_leader():
     self_id = Compute.get_instance_id()
     cluster = Compute.get_install_id()
     instances = Compute.get_all_instances()
-    leader = JBoxDynConfig.get_cluster_leader(cluster)
+    # elections must see the latest leader
+    leader = JBoxDynConfig.get_cluster_leader(cluster, cached=False)
     img_recentness = Compute.get_image_recentness()
     JBoxDB.log_debug("cluster: %s. instances: %s. leader: %s. image recentness: %d",
                      cluster, repr(instances), repr(leader), img_recentness)
@@ -27,16 +27,16 @@ class JBoxAPISpec(JBoxDB):
 
     KEYS = ['api_name']
     ATTRIBUTES = ['publisher', 'cmd', 'image_name', 'description',
-                  'timeout_secs', 'create_time']
+                  'timeout_secs', 'create_time', 'min_idle']
     SQL_INDEXES = [
         {'name': 'publisher-api_name-index', 'cols': ['publisher', 'api_name']}
     ]
     KEYS_TYPES = [JBoxDB.VCHAR]
     TYPES = [JBoxDB.VCHAR, JBoxDB.TEXT, JBoxDB.VCHAR, JBoxDB.VCHAR,
-             JBoxDB.INT, JBoxDB.INT]
+             JBoxDB.INT, JBoxDB.INT, JBoxDB.INT]
 
     def __init__(self, api_name, cmd=None, image_name=None, description=None,
-                 publisher=None, timeout_secs=None, create=False):
+                 publisher=None, timeout_secs=None, min_idle=None, create=False):
         try:
             self.item = self.fetch(api_name=api_name)
             self.is_new = False
@@ -54,6 +54,8 @@ class JBoxAPISpec(JBoxDB):
                     data['image_name'] = image_name
                 if timeout_secs is not None:
                     data['timeout_secs'] = timeout_secs
+                if min_idle is not None:
+                    data['min_idle'] = min_idle
 
                 self.create(data)
                 self.item = self.fetch(api_name=api_name)
@@ -76,6 +78,11 @@ class JBoxAPISpec(JBoxDB):
     def get_image_name(self):
         return self.get_attrib('image_name', 'juliabox/juliaboxapi:latest')
 
+    def get_min_idle(self):
+        """ Number of containers to keep started for the API beyond those serving requests. """
+        min_idle = self.get_attrib('min_idle', None)
+        return 0 if min_idle is None else int(min_idle)
+
     def get_cmd(self):
         return self.get_attrib('cmd', None)
 
@@ -97,6 +104,9 @@ class JBoxAPISpec(JBoxDB):
     def set_image_name(self, image_name):
         self.set_attrib('image_name', image_name)
 
+    def set_min_idle(self, min_idle):
+        self.set_attrib('min_idle', min_idle)
+
     def as_json(self):
         def _add_not_none(d, n, v):
             if v is not None:
@@ -110,6 +120,7 @@ class JBoxAPISpec(JBoxDB):
         _add_not_none(jsonval, 'publisher', self.get_publisher())
         _add_not_none(jsonval, 'timeout_secs', self.get_timeout_secs())
         _add_not_none(jsonval, 'create_time', self.get_create_time())
+        _add_not_none(jsonval, 'min_idle', self.get_min_idle())
         return jsonval
 
     @staticmethod
@@ -129,7 +140,19 @@ class JBoxAPISpec(JBoxDB):
         return ret
 
     @staticmethod
-    def set_api_info(api_name, cmd=None, image_name=None, description=None, publisher=None, timeout_secs=None):
+    def get_pooled_apis():
+        """ Names of APIs that have containers kept started, mapped to the number of idle containers to keep. """
+        pooled = dict()
+        for record in JBoxAPISpec.scan(min_idle__gt=0):
+            # tables created before min_idle was added do not filter on it
+            min_idle = record.get('min_idle', None)
+            if (min_idle is not None) and (int(min_idle) > 0):
+                pooled[record['api_name']] = int(min_idle)
+        return pooled
+
+    @staticmethod
+    def set_api_info(api_name, cmd=None, image_name=None, description=None, publisher=None, timeout_secs=None,
+                     min_idle=None):
         try:
             api = JBoxAPISpec(api_name)
             if cmd is not None:
@@ -142,7 +165,9 @@ class JBoxAPISpec(JBoxDB):
                 api.set_publisher(publisher)
             if timeout_secs is not None:
                 api.set_timeout_secs(timeout_secs)
+            if min_idle is not None:
+                api.set_min_idle(min_idle)
             api.save()
         except JBoxDBItemNotFound:
             JBoxAPISpec(api_name, cmd=cmd, image_name=image_name, description=description, publisher=publisher,
-                        timeout_secs=timeout_secs, create=True)
+                        timeout_secs=timeout_secs, min_idle=min_idle, create=True)
@@ -0,0 +1,210 @@
+__author__ = 'tan'
+
+import time
+import threading
+import Queue
+from contextlib import contextmanager
+
+from juliabox.jbox_util import LoggerMixin
+
+
+class JBoxDBConnPool(LoggerMixin):
+    """ A pool of database connections, shared by all threads of the process.
+
+    Connections are made with `connect` when needed, upto `size` of them, and handed out to one thread at a time.
+    When all are in use, threads wait for one to be returned, for upto `timeout` seconds. A connection that has failed
+    (raises one of `discard_on`) is discarded instead of being returned, and is replaced by a new one when needed next.
+
+    A thread may hold on to a connection for a unit of work, during which all operations of the thread use it and
+    commits are left to the end of the unit (`unit_of_work`). Units of work may be nested, and are committed when the
+    outermost one completes, or rolled back if it raises an exception. Connections that commit every statement by
+    themselves are passed a `begin` function to start a transaction for the unit.
+
+    Time taken by each statement is recorded with `timed`, and reported by `get_stats` along with the utilisation of
+    the pool.
+    """
+    POOLS = dict()
+    DEFAULT_SIZE = 4
+    DEFAULT_TIMEOUT = 30
+
+    def __init__(self, name, connect, size=DEFAULT_SIZE, timeout=DEFAULT_TIMEOUT, discard_on=(), begin=None):
+        self.name = name
+        self.connect = connect
+        self.discard_on = discard_on
+        self.begin = begin
+        self.size = size
+        self.timeout = timeout
+        self.idle = Queue.LifoQueue()
+        self.threadlocal = threading.local()
+        self.lock = threading.Lock()
+        self.num_conns = 0
+        self.num_busy = 0
+        self.max_busy = 0
+        self.num_waits = 0
+        self.max_wait = 0.0
+        self.num_statements = 0
+        self.statement_secs = 0.0
+        self.max_statement_secs = 0.0
+        JBoxDBConnPool.POOLS[name] = self
+        self.log_info("Created connection pool %s with %d connections", name, size)
+
+    def _take(self):
+        with self.lock:
+            try:
+                conn = self.idle.get_nowait()
+            except Queue.Empty:
+                conn = None
+                if self.num_conns < self.size:
+                    # counted before connecting, so that the pool never grows beyond its size
+                    self.num_conns += 1
+                    make_new = True
+                else:
+                    make_new = False
+            if conn is not None:
+                self._record_busy()
+                return conn
+
+        if make_new:
+            try:
+                conn = self.connect()
+            except:
+                with self.lock:
+                    self.num_conns -= 1
+                raise
+            with self.lock:
+                self._record_busy()
+            return conn
+
+        tstart = time.time()
+        try:
+            conn = self.idle.get(timeout=self.timeout)
+        except Queue.Empty:
+            raise Exception("Timed out waiting for a connection from pool %s" % (self.name,))
+        wait_secs = time.time() - tstart
+        with self.lock:
+            self.num_waits += 1
+            self.max_wait = max(self.max_wait, wait_secs)
+            self._record_busy()
+        return conn
+
+    def _record_busy(self):
+        self.num_busy += 1
+        self.max_busy = max(self.max_busy, self.num_busy)
+
+    def _give_back(self, conn, failed=False):
+        with self.lock:
+            self.num_busy -= 1
+            if failed:
+                self.num_conns -= 1
+        if failed:
+            self.log_info("Discarding failed connection from pool %s", self.name)
+            try:
+                conn.close()
+            except:
+                pass
+        else:
+            self.idle.put(conn)
+
+    def in_unit_of_work(self):
+        return getattr(self.threadlocal, 'conn', None) is not None
+
+    @contextmanager
+    def connection(self):
+        """ A connection for the duration of the block. The one held by the unit of work of this thread, if any.
+        Changes not committed by the block are rolled back if it raises an exception.
+        """
+        conn = getattr(self.threadlocal, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self._take()
+        failed = False
+        try:
+            yield conn
+        except self.discard_on:
+            failed = True
+            raise
+        except:
+            try:
+                conn.rollback()
+            except self.discard_on:
+                failed = True
+            raise
+        finally:
+            self._give_back(conn, failed=failed)
+
+    @contextmanager
+    def unit_of_work(self):
+        """ Hold on to one connection, and commit once at the end, for all operations of this thread in the block. """
+        if self.in_unit_of_work():
+            self.threadlocal.depth += 1
+            try:
+                yield self.threadlocal.conn
+            finally:
+                self.threadlocal.depth -= 1
+            return
+
+        conn = self._take()
+        self.threadlocal.conn = conn
+        self.threadlocal.depth = 1
+        failed = False
+        try:
+            if self.begin is not None:
+                self.begin(conn)
+            yield conn
+            self.timed(conn.commit)
+        except self.discard_on:
+            failed = True
+            raise
+        except:
+            try:
+                conn.rollback()
+            except self.discard_on:
+                failed = True
+            raise
+        finally:
+            self.threadlocal.conn = None
+            self.threadlocal.depth = 0
+            self._give_back(conn, failed=failed)
+
+    def commit(self, conn):
+        """ Commit, unless in a unit of work, which commits at its end. """
+        if not self.in_unit_of_work():
+            self.timed(conn.commit)
+
+    def timed(self, fn, *args):
+        tstart = time.time()
+        result = fn(*args)
+        secs = time.time() - tstart
+        with self.lock:
+            self.num_statements += 1
+            self.statement_secs += secs
+            self.max_statement_secs = max(self.max_statement_secs, secs)
+        return result
+
+    def get_stats(self, reset=True):
+        with self.lock:
+            stats = {
+                'size': self.size,
+                'conns': self.num_conns,
+                'busy': self.num_busy,
+                'max_busy': self.max_busy,
+                'waits': self.num_waits,
+                'max_wait': self.max_wait,
+                'statements': self.num_statements,
+                'mean_statement_time': (self.statement_secs / self.num_statements) if self.num_statements > 0 else 0.0,
+                'max_statement_time': self.max_statement_secs
+            }
+            if reset:
+                self.max_busy = self.num_busy
+                self.num_waits = 0
+                self.max_wait = 0.0
+                self.num_statements = 0
+                self.statement_secs = 0.0
+                self.max_statement_secs = 0.0
+        return stats
+
+    @staticmethod
+    def get_all_stats(reset=True):
+        return dict((name, pool.get_stats(reset=reset)) for name, pool in JBoxDBConnPool.POOLS.iteritems())
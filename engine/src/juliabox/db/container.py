@@ -92,6 +92,30 @@ class JBoxSessionProps(JBoxDB):
             sessprops.set_container_state(container_state)
         sessprops.save()
 
+    @staticmethod
+    def attach_instances(cluster, instance_id, container_states):
+        """ Same as `attach_instance` for many sessions, with a batch read and a batch write.
+        container_states: session name: container state
+        """
+        states = dict()
+        for (session_id, container_state) in container_states.iteritems():
+            if session_id.startswith("/"):
+                session_id = session_id[1:]
+            states[JBoxDB.qual(cluster, session_id)] = container_state
+
+        existing = JBoxSessionProps.batch_fetch([{'session_id': qsession_id} for qsession_id in states])
+        records = dict((record['session_id'], record) for record in existing)
+        attach_time = JBoxSessionProps.datetime_to_epoch_secs(datetime.datetime.now(pytz.utc))
+        for (qsession_id, container_state) in states.iteritems():
+            record = records.get(qsession_id, None)
+            if record is None:
+                records[qsession_id] = record = {'session_id': qsession_id}
+            record['instance_id'] = instance_id
+            record['attach_time'] = attach_time
+            if container_state:
+                record['container_state'] = container_state
+        JBoxSessionProps.batch_save(records.values())
+
     @staticmethod
     def detach_instance(cluster, session_id, instance_id):
         sessprops = JBoxSessionProps(cluster, session_id, create=True)
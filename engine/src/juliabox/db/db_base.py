@@ -1,5 +1,6 @@
 import datetime
 import pytz
+from contextlib import contextmanager
 
 from juliabox.jbox_util import LoggerMixin, JBoxCfg, JBoxPluginType
 
@@ -19,6 +20,18 @@ class JBoxDB(LoggerMixin):
         JBoxDB.DB_IMPL = JBPluginDB.jbox_get_plugin(JBPluginDB.JBP_DB)
         JBoxDB.DB_IMPL.configure()
 
+    @staticmethod
+    @contextmanager
+    def unit_of_work():
+        """ Commit writes made by this thread in the block together at its end, if the database plugin supports it.
+        Otherwise each write is committed as it is made.
+        """
+        if hasattr(JBoxDB.DB_IMPL, 'unit_of_work'):
+            with JBoxDB.DB_IMPL.unit_of_work():
+                yield
+        else:
+            yield
+
     @classmethod
     def table(cls):
         if cls.TABLE is None:
@@ -46,6 +59,22 @@ class JBoxDB(LoggerMixin):
     def query_count(cls, **kwargs):
         return JBoxDB.DB_IMPL.record_count(cls.table(), **kwargs)
 
+    @classmethod
+    def batch_fetch(cls, keys):
+        if len(keys) == 0:
+            return []
+        return JBoxDB.DB_IMPL.record_batch_fetch(cls.table(), keys)
+
+    @classmethod
+    def batch_save(cls, records):
+        if len(records) > 0:
+            JBoxDB.DB_IMPL.record_batch_save(cls.table(), records)
+
+    @classmethod
+    def batch_delete(cls, keys):
+        if len(keys) > 0:
+            JBoxDB.DB_IMPL.record_batch_delete(cls.table(), keys)
+
     def save(self):
         JBoxDB.DB_IMPL.record_save(self.__class__.table(), self.item)
 
@@ -107,6 +136,11 @@ class JBPluginDB(JBoxDB):
         - `record_count(table, **kwargs)`: Count matching records. Selection criteria passed in kwargs.
         - `record_save(table, data)`: Update a single record with data (dictionary of column names and values)
         - `record_delete(table, data)`: Delete a single record with keys specified in data (dictionary of column names and values)
+        - `record_batch_fetch(table, keys)`: Fetch the records with keys in the list (of dictionaries of key names and values). Records not found are left out.
+        - `record_batch_save(table, records)`: Create or overwrite the records in the list (of complete records, as fetched or as dictionaries of column names and values)
+        - `record_batch_delete(table, keys)`: Delete the records with keys in the list (of dictionaries of key names and values)
+        May optionally implement:
+        - `unit_of_work()`: Context manager, in which operations of the thread share a connection and writes are committed together at the end (rolled back on exception)
     - `JBPluginDB.JBP_TABLE`, `JBPluginDB.JBP_TABLE_DYNAMODB` and `JBPluginDB.JBP_TABLE_RDBMS`:
         Provide a table implementation. Must extend `JBPluginDB` and provide the following attributes:
         - `TABLE`: to hold the opened table handle
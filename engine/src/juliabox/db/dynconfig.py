@@ -1,5 +1,8 @@
 import json
+import time
+import uuid
 import datetime
+import threading
 import pytz
 
 from boto.dynamodb2.fields import HashKey
@@ -7,7 +10,7 @@ from boto.dynamodb2.types import STRING
 import isodate
 
 from juliabox.db import JBoxDB, JBoxDBItemNotFound
-from juliabox.jbox_util import parse_iso_time
+from juliabox.jbox_util import parse_iso_time, JBoxCfg
 
 
 class JBoxDynConfig(JBoxDB):
@@ -30,6 +33,27 @@ class JBoxDynConfig(JBoxDB):
 
     DEFAULT_REGISTRATION_RATE = 60
 
+    # Values are read through a process local cache, each kind of value kept for its own time to live, and not cached
+    # if it has none. Setters write through the cache. With version checks enabled, setters also change the version
+    # record of the cluster, and processes that see it change drop their cached values.
+    CACHE_TTL_SECS = {
+        'leader': 10,
+        'allow_registration': 60,
+        'registrations_hourly_rate': 60,
+        'message': 60,
+        'user_home_image': 60,
+        'course': 300,
+        'user_cluster': 60
+    }
+    VERSION_CHECK_SECS = 0
+    VERSION_KEY = 'dynconfig_version'
+    NOT_FOUND = object()
+    CACHE = dict()
+    CACHE_LOCK = threading.Lock()
+    CACHE_STATS = {'hits': 0, 'misses': 0, 'invalidations': 0}
+    # cluster: (version, time checked)
+    VERSIONS = dict()
+
     def __init__(self, prop, create=False, value=None):
         try:
             self.item = self.fetch(name=prop)
@@ -54,56 +78,131 @@ class JBoxDynConfig(JBoxDB):
         return self.get_attrib('value')
 
     @staticmethod
-    def unset_cluster_leader(cluster):
+    def configure_cache():
+        JBoxDynConfig.CACHE_TTL_SECS.update(JBoxCfg.get('db.dynconfig_cache.ttl_secs', {}))
+        JBoxDynConfig.VERSION_CHECK_SECS = JBoxCfg.get('db.dynconfig_cache.version_check_secs', 0)
+
+    @staticmethod
+    def get_cache_stats(reset=True):
+        with JBoxDynConfig.CACHE_LOCK:
+            stats = dict(JBoxDynConfig.CACHE_STATS)
+            if reset:
+                for n in JBoxDynConfig.CACHE_STATS:
+                    JBoxDynConfig.CACHE_STATS[n] = 0
+        return stats
+
+    @staticmethod
+    def _ttl(key):
+        # course keys are qualified with the course id
+        return JBoxDynConfig.CACHE_TTL_SECS.get(key.split('|')[0], 0)
+
+    @staticmethod
+    def _fetch_value(name):
         try:
-            record = JBoxDynConfig(JBoxDB.qual(cluster, 'leader'))
-            record.delete()
+            return JBoxDynConfig(name).get_value()
         except JBoxDBItemNotFound:
+            return JBoxDynConfig.NOT_FOUND
+
+    @staticmethod
+    def _check_version(cluster, now):
+        if JBoxDynConfig.VERSION_CHECK_SECS <= 0:
+            return
+        version, checked = JBoxDynConfig.VERSIONS.get(cluster, (None, 0))
+        if (now - checked) < JBoxDynConfig.VERSION_CHECK_SECS:
+            return
+
+        latest = JBoxDynConfig._fetch_value(JBoxDB.qual(cluster, JBoxDynConfig.VERSION_KEY))
+        with JBoxDynConfig.CACHE_LOCK:
+            JBoxDynConfig.VERSIONS[cluster] = (latest, now)
+            if (version is not None) and (latest != version):
+                pfx = JBoxDB.qual(cluster, '')
+                for name in JBoxDynConfig.CACHE.keys():
+                    if name.startswith(pfx):
+                        del JBoxDynConfig.CACHE[name]
+                JBoxDynConfig.CACHE_STATS['invalidations'] += 1
+
+    @staticmethod
+    def _read(cluster, key, default=None, cached=True):
+        """ Value of a record, or default if there is none. """
+        name = JBoxDB.qual(cluster, key)
+        ttl = JBoxDynConfig._ttl(key)
+        now = time.time()
+        if ttl > 0:
+            JBoxDynConfig._check_version(cluster, now)
+            with JBoxDynConfig.CACHE_LOCK:
+                entry = JBoxDynConfig.CACHE.get(name, None)
+                if cached and (entry is not None) and (entry[1] > now):
+                    JBoxDynConfig.CACHE_STATS['hits'] += 1
+                    value = entry[0]
+                    return default if (value is JBoxDynConfig.NOT_FOUND) else value
+                JBoxDynConfig.CACHE_STATS['misses'] += 1
+
+        value = JBoxDynConfig._fetch_value(name)
+        if ttl > 0:
+            with JBoxDynConfig.CACHE_LOCK:
+                JBoxDynConfig.CACHE[name] = (value, now + ttl)
+        return default if (value is JBoxDynConfig.NOT_FOUND) else value
+
+    @staticmethod
+    def _written(cluster, key, value):
+        ttl = JBoxDynConfig._ttl(key)
+        if ttl <= 0:
             return
+        with JBoxDynConfig.CACHE_LOCK:
+            JBoxDynConfig.CACHE[JBoxDB.qual(cluster, key)] = (value, time.time() + ttl)
+        if JBoxDynConfig.VERSION_CHECK_SECS > 0:
+            # a new unique version, so that concurrent changes are never mistaken for one
+            JBoxDynConfig._write(cluster, JBoxDynConfig.VERSION_KEY, uuid.uuid4().hex)
+
+    @staticmethod
+    def _write(cluster, key, value):
+        # the value and the version record change together
+        with JBoxDB.unit_of_work():
+            record = JBoxDynConfig(JBoxDB.qual(cluster, key), create=True, value=value)
+            if not record.is_new:
+                record.set_value(value)
+                record.save()
+            JBoxDynConfig._written(cluster, key, value)
+
+    @staticmethod
+    def _delete(cluster, key):
+        with JBoxDB.unit_of_work():
+            try:
+                JBoxDynConfig(JBoxDB.qual(cluster, key)).delete()
+            except JBoxDBItemNotFound:
+                pass
+            JBoxDynConfig._written(cluster, key, JBoxDynConfig.NOT_FOUND)
+
+    @staticmethod
+    def unset_cluster_leader(cluster):
+        JBoxDynConfig._delete(cluster, 'leader')
 
     @staticmethod
     def set_cluster_leader(cluster, instance):
-        record = JBoxDynConfig(JBoxDB.qual(cluster, 'leader'), create=True, value=instance)
-        if not record.is_new:
-            record.set_value(instance)
-            record.save()
+        JBoxDynConfig._write(cluster, 'leader', instance)
 
     @staticmethod
-    def get_cluster_leader(cluster):
-        try:
-            return JBoxDynConfig(JBoxDB.qual(cluster, 'leader')).get_value()
-        except JBoxDBItemNotFound:
-            return None
+    def get_cluster_leader(cluster, cached=True):
+        return JBoxDynConfig._read(cluster, 'leader', cached=cached)
 
     @staticmethod
     def set_allow_registration(cluster, allow):
-        record = JBoxDynConfig(JBoxDB.qual(cluster, 'allow_registration'), create=True, value=str(allow))
-        if not record.is_new:
-            record.set_value(str(allow))
-            record.save()
+        JBoxDynConfig._write(cluster, 'allow_registration', str(allow))
 
     @staticmethod
     def get_allow_registration(cluster):
-        try:
-            record = JBoxDynConfig(JBoxDB.qual(cluster, 'allow_registration'))
-        except JBoxDBItemNotFound:
-            return True
-
-        return record.get_value() == 'True'
+        return JBoxDynConfig._read(cluster, 'allow_registration', default='True') == 'True'
 
     @staticmethod
     def get_registration_hourly_rate(cluster):
-        try:
-            return int(JBoxDynConfig(JBoxDB.qual(cluster, 'registrations_hourly_rate')).get_value())
-        except JBoxDBItemNotFound:
+        rate = JBoxDynConfig._read(cluster, 'registrations_hourly_rate', default=JBoxDynConfig.NOT_FOUND)
+        if rate is JBoxDynConfig.NOT_FOUND:
             return JBoxDynConfig.DEFAULT_REGISTRATION_RATE
+        return int(rate)
 
     @staticmethod
     def set_registration_hourly_rate(cluster, rate):
-        record = JBoxDynConfig(JBoxDB.qual(cluster, 'registrations_hourly_rate'), create=True, value=str(rate))
-        if not record.is_new:
-            record.set_value(str(rate))
-            record.save()
+        JBoxDynConfig._write(cluster, 'registrations_hourly_rate', str(rate))
 
     @staticmethod
     def set_message(cluster, message, valid_delta):
@@ -114,20 +213,11 @@ class JBoxDynConfig(JBoxDB):
             'msg': message,
             'valid_till': isodate.datetime_isoformat(tvalid)
         }
-        msg = json.dumps(msg)
-        record = JBoxDynConfig(JBoxDB.qual(cluster, 'message'), create=True, value=msg)
-        if not record.is_new:
-            record.set_value(msg)
-            record.save()
+        JBoxDynConfig._write(cluster, 'message', json.dumps(msg))
 
     @staticmethod
     def get_message(cluster, del_expired=True):
-        try:
-            record = JBoxDynConfig(JBoxDB.qual(cluster, 'message'))
-        except JBoxDBItemNotFound:
-            return None
-
-        msg = record.get_value()
+        msg = JBoxDynConfig._read(cluster, 'message')
         if msg is None:
             return None
 
@@ -140,17 +230,16 @@ class JBoxDynConfig(JBoxDB):
             return msg['msg']
 
         if del_expired:
-            record.delete()
+            JBoxDynConfig._delete(cluster, 'message')
 
         return None
 
     @staticmethod
     def get_user_home_image(cluster):
-        try:
-            record = JBoxDynConfig(JBoxDB.qual(cluster, 'user_home_image'))
-        except JBoxDBItemNotFound:
+        img = JBoxDynConfig._read(cluster, 'user_home_image')
+        if img is None:
             return None, None, None
-        img = json.loads(record.get_value())
+        img = json.loads(img)
         pkg_file = img['pkg_file'] if 'pkg_file' in img else None
         home_file = img['home_file'] if 'home_file' in img else None
         return img['bucket'], pkg_file, home_file
@@ -162,27 +251,19 @@ class JBoxDynConfig(JBoxDB):
             'pkg_file': pkg_file,
             'home_file': home_file
         }
-        img = json.dumps(img)
-        record = JBoxDynConfig(JBoxDB.qual(cluster, 'user_home_image'), create=True, value=img)
-        if not record.is_new:
-            record.set_value(img)
-            record.save()
+        JBoxDynConfig._write(cluster, 'user_home_image', json.dumps(img))
 
     @staticmethod
     def set_stat_collected_date(cluster):
         dt = datetime.datetime.now(pytz.utc).isoformat()
-        record = JBoxDynConfig(JBoxDB.qual(cluster, 'stat_date'), create=True, value=dt)
-        if not record.is_new:
-            record.set_value(dt)
-            record.save()
+        JBoxDynConfig._write(cluster, 'stat_date', dt)
 
     @staticmethod
     def get_stat_collected_date(cluster):
-        try:
-            record = JBoxDynConfig(JBoxDB.qual(cluster, 'stat_date'))
-        except JBoxDBItemNotFound:
+        dt = JBoxDynConfig._read(cluster, 'stat_date')
+        if dt is None:
             return None
-        return parse_iso_time(record.get_value())
+        return parse_iso_time(dt)
 
     @staticmethod
     def is_stat_collected_within(cluster, days):
@@ -194,50 +275,35 @@ class JBoxDynConfig(JBoxDB):
 
     @staticmethod
     def set_stat(cluster, stat_name, stat):
-        val = json.dumps(stat)
-        record = JBoxDynConfig(JBoxDB.qual(cluster, stat_name), create=True, value=val)
-        if not record.is_new:
-            record.set_value(val)
-            record.save()
+        JBoxDynConfig._write(cluster, stat_name, json.dumps(stat))
 
     @staticmethod
     def get_stat(cluster, stat_name):
-        try:
-            record = JBoxDynConfig(JBoxDB.qual(cluster, stat_name))
-        except JBoxDBItemNotFound:
+        stat = JBoxDynConfig._read(cluster, stat_name)
+        if stat is None:
             return None
-        return json.loads(record.get_value())
+        return json.loads(stat)
 
     @staticmethod
     def get_course(cluster, course_id):
-        try:
-            course_key = '|'.join(['course', course_id])
-            record = JBoxDynConfig(JBoxDB.qual(cluster, course_key))
-        except JBoxDBItemNotFound:
+        course_key = '|'.join(['course', course_id])
+        course = JBoxDynConfig._read(cluster, course_key)
+        if course is None:
             return None
-        return json.loads(record.get_value())
+        return json.loads(course)
 
     @staticmethod
     def set_course(cluster, course_id, course_details):
-        val = json.dumps(course_details)
         course_key = '|'.join(['course', course_id])
-        record = JBoxDynConfig(JBoxDB.qual(cluster, course_key), create=True, value=val)
-        if not record.is_new:
-            record.set_value(val)
-            record.save()
+        JBoxDynConfig._write(cluster, course_key, json.dumps(course_details))
 
     @staticmethod
     def get_user_cluster_config(cluster):
-        try:
-            record = JBoxDynConfig(JBoxDB.qual(cluster, 'user_cluster'))
-        except JBoxDBItemNotFound:
+        cfg = JBoxDynConfig._read(cluster, 'user_cluster')
+        if cfg is None:
             return None
-        return json.loads(record.get_value())
+        return json.loads(cfg)
 
     @staticmethod
     def set_user_cluster_config(cluster, cfg):
-        val = json.dumps(cfg)
-        record = JBoxDynConfig(JBoxDB.qual(cluster, 'user_cluster'), create=True, value=val)
-        if not record.is_new:
-            record.set_value(val)
-            record.save()
+        JBoxDynConfig._write(cluster, 'user_cluster', json.dumps(cfg))
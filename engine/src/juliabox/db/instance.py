@@ -21,10 +21,10 @@ class JBoxInstanceProps(JBoxDB):
     TABLE = None
 
     KEYS = ['instance_id']
-    ATTRIBUTES = ['load', 'accept', 'api_status', 'publish_time']
+    ATTRIBUTES = ['load', 'accept', 'api_status', 'publish_time', 'disk_ids_used', 'warm']
     SQL_INDEXES = None
     KEYS_TYPES = [JBoxDB.VCHAR]
-    TYPES = [JBoxDB.VCHAR, JBoxDB.INT, JBoxDB.TEXT, JBoxDB.INT]
+    TYPES = [JBoxDB.VCHAR, JBoxDB.INT, JBoxDB.TEXT, JBoxDB.INT, JBoxDB.INT, JBoxDB.INT]
 
     # maintenance runs are once in 5 minutes
     # TODO: make configurable
@@ -67,6 +67,18 @@ class JBoxInstanceProps(JBoxDB):
     def set_api_status(self, api_status):
         self.set_attrib('api_status', json.dumps(api_status))
 
+    def get_disk_ids_used(self):
+        return int(self.get_attrib('disk_ids_used', 0))
+
+    def set_disk_ids_used(self, disk_ids_used):
+        self.set_attrib('disk_ids_used', int(disk_ids_used))
+
+    def get_warm(self):
+        return int(self.get_attrib('warm', 0))
+
+    def set_warm(self, warm):
+        self.set_attrib('warm', int(warm))
+
     def set_publish_time(self):
         now = datetime.datetime.now(pytz.utc)
         self.set_attrib('publish_time', JBoxInstanceProps.datetime_to_epoch_secs(now))
@@ -76,7 +88,22 @@ class JBoxInstanceProps(JBoxDB):
         return int(self.get_attrib('publish_time', JBoxInstanceProps.datetime_to_epoch_secs(now)))
 
     @staticmethod
-    def set_props(cluster, instance_id, load=None, accept=None, api_status=None):
+    def set_props(cluster, instance_id, load=None, accept=None, api_status=None, disk_ids_used=None, warm=None):
+        if (load is not None) and (accept is not None) and (api_status is not None) and \
+                (disk_ids_used is not None) and (warm is not None):
+            # all attributes are being set, so the record can be written without reading it first
+            now = datetime.datetime.now(pytz.utc)
+            JBoxInstanceProps.batch_save([{
+                'instance_id': JBoxDB.qual(cluster, instance_id),
+                'load': str(load),
+                'accept': 1 if accept else 0,
+                'api_status': json.dumps(api_status),
+                'disk_ids_used': int(disk_ids_used),
+                'warm': int(warm),
+                'publish_time': JBoxInstanceProps.datetime_to_epoch_secs(now)
+            }])
+            return
+
         instance_props = JBoxInstanceProps(cluster, instance_id, create=True)
         if load is not None:
             instance_props.set_load(load)
@@ -84,14 +111,17 @@ class JBoxInstanceProps(JBoxDB):
             instance_props.set_accept(accept)
         if api_status is not None:
             instance_props.set_api_status(api_status)
+        if disk_ids_used is not None:
+            instance_props.set_disk_ids_used(disk_ids_used)
+        if warm is not None:
+            instance_props.set_warm(warm)
         instance_props.set_publish_time()
         instance_props.save()
 
     @staticmethod
     def purge_stale_instances(cluster):
-        for iid in JBoxInstanceProps.get_stale_instances(cluster):
-            instance = JBoxInstanceProps(cluster, iid)
-            instance.delete()
+        JBoxInstanceProps.batch_delete([{'instance_id': JBoxDB.qual(cluster, iid)}
+                                        for iid in JBoxInstanceProps.get_stale_instances(cluster)])
 
     @staticmethod
     def get_stale_instances(cluster):
@@ -116,7 +146,9 @@ class JBoxInstanceProps(JBoxDB):
             props = {
                 'load': float(record.get('load', '0.0')),
                 'accept': bool(record.get('accept', 0)),
-                'api_status': json.loads(record.get('api_status', '{}'))
+                'api_status': json.loads(record.get('api_status', '{}')),
+                'disk_ids_used': int(record.get('disk_ids_used', 0) or 0),
+                'warm': int(record.get('warm', 0) or 0)
             }
             result[iid] = props
         return result
@@ -2,10 +2,13 @@ from datetime import datetime, timedelta
 
 import isodate
 import re
+import tornado.web
+import tornado.gen
 
 from juliabox.cloud import Compute
 from juliabox.jbox_util import JBoxCfg
-from handler_base import JBoxHandler
+from juliabox.jbox_async_service import JBoxAsyncService
+from handler_base import JBoxHandler, AsyncSessContainer
 from juliabox.interactive import SessContainer
 from juliabox.jbox_tasks import JBoxAsyncJob
 from juliabox.db import JBoxUserV2, JBoxDynConfig, JBPluginDB, JBoxSessionProps, JBoxInstanceProps
@@ -13,6 +16,8 @@ from juliabox.api import APIContainer
 
 
 class AdminHandler(JBoxHandler):
+    @tornado.web.asynchronous
+    @tornado.gen.coroutine
     def get(self):
         sessname = self.get_session_id()
         user_id = self.get_user_id()
@@ -20,11 +25,11 @@ class AdminHandler(JBoxHandler):
             self.send_error()
             return
 
-        user = JBoxUserV2(user_id)
         is_admin = sessname in JBoxCfg.get("admin_sessnames", [])
-        manage_containers = is_admin or user.has_role(JBoxUserV2.ROLE_MANAGE_CONTAINERS)
-        show_report = is_admin or user.has_role(JBoxUserV2.ROLE_ACCESS_STATS)
-        cont = SessContainer.get_by_name(sessname)
+        roles = yield JBoxAsyncService.run('db.get_user_roles', AdminHandler.get_user_roles, user_id)
+        manage_containers = is_admin or roles[JBoxUserV2.ROLE_MANAGE_CONTAINERS]
+        show_report = is_admin or roles[JBoxUserV2.ROLE_ACCESS_STATS]
+        cont = yield AsyncSessContainer.get_by_name(sessname)
 
         if cont is None:
             self.send_error()
@@ -32,23 +37,40 @@ class AdminHandler(JBoxHandler):
 
         if self.handle_if_logout(cont):
             return
-        if self.handle_if_stats(is_admin or show_report):
+        handled = yield self.handle_if_stats(is_admin or show_report)
+        if handled:
             return
         if self.handle_if_show_cfg(is_admin):
             return
-        if self.handle_if_instance_info(is_admin):
+        handled = yield self.handle_if_instance_info(is_admin)
+        if handled:
             return
-        if self.handle_if_open_port(sessname, user_id):
+        handled = yield self.handle_if_open_port(sessname, user_id)
+        if handled:
             return
 
-        juliaboxver, _upgrade_available = self.get_upgrade_available(cont)
-
-        expire = JBoxCfg.get('interactive.expire')
-        d = dict(
+        d = yield JBoxAsyncService.run('docker.get_session_info', AdminHandler.get_session_info, cont)
+        d.update(
             manage_containers=manage_containers,
             show_report=show_report,
             sessname=sessname,
-            user_id=user_id,
+            user_id=user_id
+        )
+
+        self.rendertpl("ipnbadmin.tpl", d=d)
+
+    @staticmethod
+    def get_user_roles(user_id):
+        user = JBoxUserV2(user_id)
+        return dict((role, user.has_role(role)) for role in (JBoxUserV2.ROLE_MANAGE_CONTAINERS,
+                                                             JBoxUserV2.ROLE_ACCESS_STATS))
+
+    @staticmethod
+    def get_session_info(cont):
+        juliaboxver, _upgrade_available = AdminHandler.get_upgrade_available(cont)
+
+        expire = JBoxCfg.get('interactive.expire')
+        return dict(
             created=isodate.datetime_isoformat(cont.time_created()),
             started=isodate.datetime_isoformat(cont.time_started()),
             allowed_till=isodate.datetime_isoformat((cont.time_started() + timedelta(seconds=expire))),
@@ -60,8 +82,6 @@ class AdminHandler(JBoxHandler):
             juliaboxver=juliaboxver
         )
 
-        self.rendertpl("ipnbadmin.tpl", d=d)
-
     def handle_if_show_cfg(self, is_allowed):
         show_cfg = self.get_argument('show_cfg', None)
         if show_cfg is None:
@@ -74,10 +94,16 @@ class AdminHandler(JBoxHandler):
         self.write(response)
         return True
 
+    @staticmethod
+    def get_container_host_port(sessname, port):
+        cont = SessContainer.get_by_name(sessname)
+        return cont._get_host_ports([port])[0]
+
+    @tornado.gen.coroutine
     def handle_if_open_port(self, sessname, user_id):
         port = self.get_argument('open_port', None)
         if port is None:
-            return False
+            raise tornado.gen.Return(False)
 
         portname = self.get_argument('port_name', "", strip=True)
         if re.match(r"^[a-zA-Z0-9]{1,20}$", portname) is None:
@@ -89,14 +115,14 @@ class AdminHandler(JBoxHandler):
             if port < 8050 or port > 8052:
                 response = {'code': -1, 'data': 'Only ports in the range 8050-8052 can be used.'}
             else:
-                cont = SessContainer.get_by_name(sessname)
-                hostport = cont._get_host_ports([port])[0]
+                hostport = yield JBoxAsyncService.run('docker.get_container_host_port',
+                                                      AdminHandler.get_container_host_port, sessname, port)
                 self.set_container_ports({
                     portname: hostport
                 })
                 response = {'code': 0, 'data': ''}
         self.write(response)
-        return True
+        raise tornado.gen.Return(True)
 
     def handle_if_logout(self, cont):
         logout = self.get_argument('logout', False)
@@ -108,34 +134,41 @@ class AdminHandler(JBoxHandler):
             return True
         return False
 
+    @staticmethod
+    def get_instance_info(stats):
+        if stats == 'load':
+            result = {}
+            # get cluster loads
+            average_load = Compute.get_cluster_average_stats('Load')
+            if average_load is not None:
+                result['Average Load'] = average_load
+
+            machine_loads = Compute.get_cluster_stats('Load')
+            if machine_loads is not None:
+                for n, v in machine_loads.iteritems():
+                    result['Instance ' + n] = v
+        elif stats == 'sessions':
+            result = JBoxSessionProps.get_active_sessions(Compute.get_install_id())
+        elif stats == 'apis':
+            result = JBoxInstanceProps.get_instance_status(Compute.get_install_id())
+        elif stats == 'latency':
+            result = JBoxAsyncService.get_stats(reset=False)
+        else:
+            raise Exception("unknown command %s" % (stats,))
+        return result
+
+    @tornado.gen.coroutine
     def handle_if_instance_info(self, is_allowed):
         stats = self.get_argument('instance_info', None)
         if stats is None:
-            return False
+            raise tornado.gen.Return(False)
 
         if not is_allowed:
             AdminHandler.log_error("Show instance info not allowed for user")
             response = {'code': -1, 'data': 'You do not have permissions to view these stats'}
         else:
             try:
-                if stats == 'load':
-                    result = {}
-                    # get cluster loads
-                    average_load = Compute.get_cluster_average_stats('Load')
-                    if average_load is not None:
-                        result['Average Load'] = average_load
-
-                    machine_loads = Compute.get_cluster_stats('Load')
-                    if machine_loads is not None:
-                        for n, v in machine_loads.iteritems():
-                            result['Instance ' + n] = v
-                elif stats == 'sessions':
-                    result = JBoxSessionProps.get_active_sessions(Compute.get_install_id())
-                elif stats == 'apis':
-                    result = JBoxInstanceProps.get_instance_status(Compute.get_install_id())
-                else:
-                    raise Exception("unknown command %s" % (stats,))
-
+                result = yield JBoxAsyncService.run('admin.get_instance_info', AdminHandler.get_instance_info, stats)
                 response = {'code': 0, 'data': result}
             except:
                 AdminHandler.log_error("exception while getting stats")
@@ -143,7 +176,7 @@ class AdminHandler(JBoxHandler):
                 response = {'code': -1, 'data': 'error getting stats'}
 
         self.write(response)
-        return True
+        raise tornado.gen.Return(True)
 
     @staticmethod
     def get_session_stats():
@@ -160,20 +193,24 @@ class AdminHandler(JBoxHandler):
         }
         return stats
 
+    @staticmethod
+    def get_stats(stats):
+        if stats == 'stat_sessions':
+            return AdminHandler.get_session_stats()
+        return JBoxDynConfig.get_stat(Compute.get_install_id(), stats)
+
+    @tornado.gen.coroutine
     def handle_if_stats(self, is_allowed):
         stats = self.get_argument('stats', None)
         if stats is None:
-            return False
+            raise tornado.gen.Return(False)
 
         if not is_allowed:
             AdminHandler.log_error("Show stats not allowed for user")
             response = {'code': -1, 'data': 'You do not have permissions to view these stats'}
         else:
             try:
-                if stats == 'stat_sessions':
-                    stats = self.get_session_stats()
-                else:
-                    stats = JBoxDynConfig.get_stat(Compute.get_install_id(), stats)
+                stats = yield JBoxAsyncService.run('db.get_stats', AdminHandler.get_stats, stats)
                 response = {'code': 0, 'data': stats} if stats is not None else {'code': 1, 'data': {}}
             except:
                 AdminHandler.log_error("exception while getting stats")
@@ -181,7 +218,7 @@ class AdminHandler(JBoxHandler):
                 response = {'code': -1, 'data': 'error getting stats'}
 
         self.write(response)
-        return True
+        raise tornado.gen.Return(True)
 
     @staticmethod
     def get_upgrade_available(cont):
@@ -2,7 +2,6 @@ __author__ = 'tan'
 import tornado.web
 import tornado.httputil
 import json
-import struct
 
 from handler_base import JBoxHandler
 from juliabox.api import APIContainer, APIConnector
@@ -38,21 +37,30 @@ class APIHandler(JBoxHandler):
 
     @staticmethod
     def pack_into_binary(data):
-        packed = str()
-        for d in data:
-            packed += struct.pack('B', d)
-        return packed
+        return str(bytearray(data))
 
     def on_recv(self, msg):
         self.log_info("response received for %s", self.request.uri)
         if 'nid' in msg:
-            APIContainer.record_ping(msg['nid'])
+            APIContainer.record_response(msg['nid'])
         code = msg.get('code', 500)
         if code == 200:
             start_line = tornado.httputil.ResponseStartLine('', self._status_code, self._reason)
             hdrs = tornado.httputil.HTTPHeaders(msg.get('hdrs', {}))
-            data = msg['data']
+            conn = self.request.connection
+
+            if 'body' in msg:
+                # raw body frames are written out as they are, as chunks if there are many and no length is given
+                body = msg['body']
+                if (len(body) == 1) and ("Content-Length" not in hdrs):
+                    hdrs.add("Content-Length", str(len(body[0])))
+                conn.write_headers(start_line, hdrs)
+                for chunk in body:
+                    conn.write(chunk)
+                conn.finish()
+                return
 
+            data = msg['data']
             if type(data) == list:
                 hdrs.add("Content-Length", str(len(data)))
                 data = APIHandler.pack_into_binary(data)
@@ -61,8 +69,8 @@ class APIHandler(JBoxHandler):
             else:
                 data = str(data)
 
-            self.request.connection.write_headers(start_line, hdrs, data)
-            self.request.connection.finish()
+            conn.write_headers(start_line, hdrs, data)
+            conn.finish()
         else:
             self.send_error(status_code=code)
 
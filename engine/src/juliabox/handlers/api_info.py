@@ -1,13 +1,19 @@
+import tornado.web
+import tornado.gen
+
 from handler_base import JBoxHandler
 from juliabox.jbox_util import JBoxCfg
 from juliabox.jbox_crypto import signstr
 from juliabox.cloud import Compute
 from juliabox.db import JBoxInstanceProps
+from juliabox.jbox_async_service import JBoxAsyncService
 
 __author__ = 'tan'
 
 
 class APIInfoHandler(JBoxHandler):
+    @tornado.web.asynchronous
+    @tornado.gen.coroutine
     def get(self):
         self.log_debug("APIInfo handler got GET request")
         key = self.get_argument("key", None)
@@ -23,7 +29,8 @@ class APIInfoHandler(JBoxHandler):
             self.send_error()
             return
 
-        api_status = JBoxInstanceProps.get_instance_status(Compute.get_install_id())
+        api_status = yield JBoxAsyncService.run('db.get_instance_status', JBoxInstanceProps.get_instance_status,
+                                                Compute.get_install_id())
         self.log_info("cluster api status: %r", api_status)
 
         # filter out instances that should not accept more load
@@ -7,11 +7,14 @@ import os
 
 import isodate
 import tornado.escape
+import tornado.gen
 from tornado.web import RequestHandler
 
 from juliabox.jbox_util import LoggerMixin, unique_sessname, unquote, JBoxCfg, JBoxPluginType
 from juliabox.interactive import SessContainer
 from juliabox.jbox_tasks import JBoxAsyncJob
+from juliabox.jbox_launch_status import JBoxLaunchStatus
+from juliabox.jbox_async_service import JBoxAsyncService, JBoxAsyncProxy
 from juliabox.jbox_crypto import signstr
 from juliabox.cloud import Compute
 from juliabox.db import is_proposed_cluster_leader, JBoxUserV2, JBoxDynConfig, JBoxSessionProps, JBoxDBItemNotFound
@@ -304,6 +307,11 @@ class JBoxCookies(RequestHandler, LoggerMixin):
         return cookie['x']
 
 
+# blocking calls made while handling requests, run off the IOLoop
+AsyncSessContainer = JBoxAsyncProxy(SessContainer, 'docker')
+AsyncCompute = JBoxAsyncProxy(Compute, 'compute')
+
+
 class JBoxHandler(JBoxCookies):
     def __init__(self, application, request, **kwargs):
         super(JBoxHandler, self).__init__(application, request, **kwargs)
@@ -311,10 +319,11 @@ class JBoxHandler(JBoxCookies):
     def rendertpl(self, tpl, **kwargs):
         self.render("../../../www/" + tpl, **kwargs)
 
+    @tornado.gen.coroutine
     def is_valid_req(self):
         sessname = self.get_session_id()
         if sessname is None:
-            return False
+            raise tornado.gen.Return(False)
 
         ports = self.get_ports()
         isvalid = True
@@ -327,17 +336,20 @@ class JBoxHandler(JBoxCookies):
             container_ports = (ports[JBoxCookies.COOKIE_PORT_SHELL],
                                ports[JBoxCookies.COOKIE_PORT_UPL],
                                ports[JBoxCookies.COOKIE_PORT_IPNB])
-            if not SessContainer.is_valid_container("/" + sessname, container_ports):
-                isvalid = False
+            isvalid = yield AsyncSessContainer.is_valid_container("/" + sessname, container_ports)
 
         if not isvalid:
             self.log_info('Not valid request. Container deleted or ports not matching.')
-            return False
+            raise tornado.gen.Return(False)
 
-        return True
+        raise tornado.gen.Return(True)
 
     @classmethod
     def try_launch_container(cls, user_id, max_hop=False):
+        """ Blocking. Use `JBoxHandler.async_try_launch_container` from request handlers.
+        Returns whether the session is being launched here, and if not, the instance it was placed on (if known).
+        With max_hop, launches here unless this instance is fully loaded.
+        """
         sessname = unique_sessname(user_id)
         cont = SessContainer.get_by_name(sessname)
         cls.log_debug("have existing container for %s: %r", sessname, None != cont)
@@ -348,19 +360,34 @@ class JBoxHandler(JBoxCookies):
             self_load = Compute.get_instance_stats(Compute.get_instance_id(), 'Load')
             if self_load < 100:
                 SessContainer.invalidate_container(sessname)
+                JBoxLaunchStatus.reset(sessname)
                 JBoxAsyncJob.async_launch_by_name(sessname, user_id, True)
-                return True
+                return True, None
+
+        if (cont is None) or (not cont.is_running()):
+            placed_instance = None
+            if Compute.supports_placement():
+                # a stopped container of the user here is preferred
+                placed_instance = Compute.place_session(affinity=(Compute.get_instance_id() if cont is not None
+                                                                  else None))
+                accept = (placed_instance == Compute.get_instance_id())
+            else:
+                accept = Compute.should_accept_session(is_proposed_cluster_leader())
 
-        is_leader = is_proposed_cluster_leader()
-        if ((cont is None) or (not cont.is_running())) and (not Compute.should_accept_session(is_leader)):
-            if cont is not None:
-                SessContainer.invalidate_container(cont.get_name())
-                JBoxAsyncJob.async_backup_and_cleanup(cont.dockid)
-            return False
+            if not accept:
+                if cont is not None:
+                    SessContainer.invalidate_container(cont.get_name())
+                    JBoxAsyncJob.async_backup_and_cleanup(cont.dockid)
+                return False, placed_instance
 
         SessContainer.invalidate_container(sessname)
+        JBoxLaunchStatus.reset(sessname)
         JBoxAsyncJob.async_launch_by_name(sessname, user_id, True)
-        return True
+        return True, None
+
+    @classmethod
+    def async_try_launch_container(cls, user_id, max_hop=False):
+        return JBoxAsyncService.run('handler.try_launch_container', cls.try_launch_container, user_id, max_hop=max_hop)
 
     def unset_affinity(self):
         self.clear_container()
@@ -401,59 +428,86 @@ class JBoxHandler(JBoxCookies):
         except JBoxDBItemNotFound:
             return None
 
+    @tornado.gen.coroutine
     def redirect_to_logged_in_instance(self, user_id):
-        loggedin_instance = self.find_logged_in_instance(user_id)
+        loggedin_instance = yield JBoxAsyncService.run('db.find_logged_in_instance', self.find_logged_in_instance,
+                                                       user_id)
         if loggedin_instance \
                 and loggedin_instance != Compute.get_instance_id() \
                 and loggedin_instance != 'localhost':
             # redirect to the instance that has the user's session
             self.log_info("Already logged in to %s. Redirecting", loggedin_instance)
-            redirect_ip = Compute.get_instance_local_ip(loggedin_instance)
+            redirect_ip = yield AsyncCompute.get_instance_local_ip(loggedin_instance)
             self.set_redirect_instance_id(redirect_ip)
             self.redirect('/')
-            return True
+            raise tornado.gen.Return(True)
         self.log_info("Logged in %s", "here already" if loggedin_instance else "nowhere")
-        return False
+        raise tornado.gen.Return(False)
+
+    @staticmethod
+    def _get_activated_user(user_id):
+        jbuser = JBoxUserV2(user_id, create=True)
+        activated = JBPluginHandler.is_user_activated(jbuser)
+        if activated and jbuser.is_new:
+            jbuser.save()
+        return activated
+
+    @tornado.gen.coroutine
+    def set_launch_instance_affinity(self, redirect_instance=None):
+        """ Set affinity to the instance a session was placed on, or else to an appropriate instance for launching a
+        session, if there is one. """
+        if redirect_instance is None:
+            redirect_instance = yield AsyncCompute.get_redirect_instance_id()
+        if redirect_instance is not None:
+            redirect_ip = yield AsyncCompute.get_instance_local_ip(redirect_instance)
+            self.set_redirect_instance_id(redirect_ip)
 
+    @tornado.gen.coroutine
     def post_auth_launch_container(self, user_id):
         for plugin in JBPluginHandler.jbox_get_plugins(JBPluginHandler.JBP_HANDLER_POST_AUTH):
             self.log_info("Passing user %r to post auth plugin %r", user_id, plugin)
-            pass_allowed = plugin.process_user_id(self, user_id)
+            pass_allowed = yield tornado.gen.maybe_future(plugin.process_user_id(self, user_id))
             if not pass_allowed:
                 self.log_info('Login restricted for user %r by plugin %r', user_id, plugin)
                 return
 
-        jbuser = JBoxUserV2(user_id, create=True)
-
-        if not JBPluginHandler.is_user_activated(jbuser):
+        activated = yield JBoxAsyncService.run('db.get_activated_user', JBoxHandler._get_activated_user, user_id)
+        if not activated:
             self.redirect('/?pending_activation=' + user_id)
             return
 
         self.set_authenticated(user_id)
-        if jbuser.is_new:
-            jbuser.save()
 
-        if self.redirect_to_logged_in_instance(user_id):
+        redirected = yield self.redirect_to_logged_in_instance(user_id)
+        if redirected:
             return
 
         # check if the current instance is appropriate for launching this
-        if self.try_launch_container(user_id, max_hop=False):
-            self.set_container_initialized(Compute.get_instance_local_ip(), user_id)
+        launched, redirect_instance = yield self.async_try_launch_container(user_id, max_hop=False)
+        if launched:
+            local_ip = yield AsyncCompute.get_instance_local_ip()
+            self.set_container_initialized(local_ip, user_id)
+            self.redirect('/')
+        elif redirect_instance is not None:
+            # placed on another instance, which will launch it without placing it again
+            yield self.set_launch_instance_affinity(redirect_instance)
+            self.redirect('/?h=1')
         else:
             # redirect to an appropriate instance
-            redirect_instance = Compute.get_redirect_instance_id()
-            if redirect_instance is not None:
-                redirect_ip = Compute.get_instance_local_ip(redirect_instance)
-                self.set_redirect_instance_id(redirect_ip)
-        self.redirect('/')
+            yield self.set_launch_instance_affinity()
+            self.redirect('/')
 
-    def post_auth_store_credentials(self, user_id, authtype, credtok):
-        # TODO: make this generic for other authentication/authorization modes
+    @staticmethod
+    def _store_credentials(user_id, credtok):
         jbuser = JBoxUserV2(user_id, create=True)
         jbuser.set_gtok(base64.b64encode(credtok))
         jbuser.save()
+
+    @tornado.gen.coroutine
+    def post_auth_store_credentials(self, user_id, authtype, credtok):
+        # TODO: make this generic for other authentication/authorization modes
+        yield JBoxAsyncService.run('db.store_credentials', JBoxHandler._store_credentials, user_id, credtok)
         self.redirect('/')
-        return
 
     def get_client_ip(self):
         x_real_ip = self.request.headers.get("X-Real-IP")
@@ -505,6 +559,10 @@ class JBPluginHandler(JBoxHandler):
         - `register(app)`: register self with tornado application to handle the desired URI
     - `JBPluginHandler.JBP_JS_TOP`:
         Provides path to a javascript file to be included in the top level window.
+    - `JBPluginHandler.JBP_HANDLER_POST_AUTH`:
+        Checks a user after authentication, before the session is launched.
+        - `process_user_id(handler, user_id)`: True to let the user in. Otherwise, responds with handler and returns
+            False. May be a coroutine, to run blocking calls off the IOLoop.
     """
 
     __metaclass__ = JBoxPluginType
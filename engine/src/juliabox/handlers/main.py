@@ -1,12 +1,19 @@
 import json
+import time
+import datetime
 import httplib2
 
+import tornado.web
+import tornado.gen
+from tornado.concurrent import Future
 from oauth2client.client import OAuth2Credentials
 
-from handler_base import JBoxHandler, JBPluginHandler
+from handler_base import JBoxHandler, JBPluginHandler, AsyncCompute
 from juliabox.jbox_util import unique_sessname, JBoxCfg
-from juliabox.interactive import SessContainer
 from juliabox.cloud import Compute
+from juliabox.interactive import SessContainer
+from juliabox.jbox_launch_status import JBoxLaunchStatus
+from juliabox.jbox_async_service import JBoxAsyncService
 
 
 class MainHandler(JBoxHandler):
@@ -14,6 +21,14 @@ class MainHandler(JBoxHandler):
                              "Please try again in a few hours. " + \
                              "We will also send you an email as things quieten down and your account is enabled."
 
+    # loading steps are counted in units of this many seconds, giving up after MAX_LOADING_STEPS
+    LOADING_STEP_SECS = 2
+    MAX_LOADING_STEPS = 90
+    # seconds between checks on the container when launch status is not pushed
+    POLL_SECS = 2
+
+    @tornado.web.asynchronous
+    @tornado.gen.coroutine
     def get(self):
         user_id = self.get_user_id()
 
@@ -30,39 +45,92 @@ class MainHandler(JBoxHandler):
             if self.is_loading():
                 is_ajax = self.get_argument('monitor_loading', None) is not None
                 if is_ajax:
-                    self.do_monitor_loading_ajax(user_id)
+                    yield self.do_monitor_loading_ajax(user_id)
                 else:
-                    self.do_monitor_loading(user_id)
+                    yield self.do_monitor_loading(user_id)
             else:
-                self.chk_and_launch_docker(user_id)
+                yield self.chk_and_launch_docker(user_id)
 
     def is_loading(self):
         return self.get_loading_state() is not None
 
-    def do_monitor_loading_ajax(self, user_id):
-        sessname = unique_sessname(user_id)
-        self.log_debug("AJAX monitoring loading of session [%s] user[%s]...", sessname, user_id)
+    @staticmethod
+    def _get_session_ports(sessname):
+        """ Host ports of the session container, or None if it is not running. """
         cont = SessContainer.get_by_name(sessname)
         if (cont is None) or (not cont.is_running()):
-            loading_step = int(self.get_loading_state(), 0)
-            if loading_step > 90:
-                self.log_error("Could not start instance. Session [%s] for user [%s] didn't load.", sessname, user_id)
-                self.write({'code': -1})
-                return
+            return None
+        return cont.get_host_ports()
 
-            loading_step += 1
-            self.set_loading_state(loading_step)
-            self.write({'code': 0})
+    @staticmethod
+    def _is_session_running(sessname):
+        cont = SessContainer.get_by_name(sessname)
+        return (cont is not None) and cont.is_running()
+
+    @tornado.gen.coroutine
+    def _wait_for_launch_status(self, sessname, seq):
+        """ Status of the launch of sessname, once it is newer than seq (or on timeout). """
+        status = JBoxLaunchStatus.get_status(sessname)
+        if (status is not None) and (status['seq'] > seq):
+            raise tornado.gen.Return(status)
+
+        wait_secs = JBoxLaunchStatus.LONGPOLL_SECS if JBoxLaunchStatus.is_enabled() else MainHandler.POLL_SECS
+        future = Future()
+        JBoxLaunchStatus.add_waiter(sessname, future)
+        try:
+            status = yield tornado.gen.with_timeout(datetime.timedelta(seconds=wait_secs), future)
+        except tornado.gen.TimeoutError:
+            status = JBoxLaunchStatus.get_status(sessname)
+        finally:
+            JBoxLaunchStatus.remove_waiter(sessname, future)
+        raise tornado.gen.Return(status)
+
+    @tornado.gen.coroutine
+    def do_monitor_loading_ajax(self, user_id):
+        """ Long poll for the launch of the user's session.
+        Responds when the launch status pushed by the container manager changes, or after a timeout. Docker is
+        queried (on a separate thread) only when no status is known, e.g. if this server restarted midway.
+        """
+        sessname = unique_sessname(user_id)
+        self.log_debug("AJAX monitoring loading of session [%s] user[%s]...", sessname, user_id)
+        seq = int(self.get_argument('seq', 0))
+        tstart = time.time()
+        status = yield self._wait_for_launch_status(sessname, seq)
+        if status is None:
+            running = yield JBoxAsyncService.run('docker.is_session_running', MainHandler._is_session_running,
+                                                 sessname)
         else:
+            running = (status['stage'] == JBoxLaunchStatus.STAGE_READY)
+
+        if running:
             self.write({'code': 1})
+            return
 
+        loading_step = int(self.get_loading_state(), 0)
+        if (status is not None) and (status['stage'] == JBoxLaunchStatus.STAGE_FAILED):
+            loading_step = MainHandler.MAX_LOADING_STEPS
+        loading_step += max(1, int((time.time() - tstart) / MainHandler.LOADING_STEP_SECS))
+        if loading_step > MainHandler.MAX_LOADING_STEPS:
+            self.log_error("Could not start instance. Session [%s] for user [%s] didn't load.", sessname, user_id)
+            # leave the loading state set, for the page reload to report the failure
+            self.set_loading_state(loading_step)
+            self.write({'code': -1})
+            return
+
+        self.set_loading_state(loading_step)
+        resp = {'code': 0}
+        if status is not None:
+            resp.update(seq=status['seq'], stage=status['stage'], progress=status['progress'])
+        self.write(resp)
+
+    @tornado.gen.coroutine
     def do_monitor_loading(self, user_id):
         sessname = unique_sessname(user_id)
         self.log_debug("Monitoring loading of session [%s] user[%s]...", sessname, user_id)
-        cont = SessContainer.get_by_name(sessname)
-        if (cont is None) or (not cont.is_running()):
+        ports = yield JBoxAsyncService.run('docker.get_session_ports', MainHandler._get_session_ports, sessname)
+        if ports is None:
             loading_step = int(self.get_loading_state(), 0)
-            if loading_step > 90:
+            if loading_step > MainHandler.MAX_LOADING_STEPS:
                 self.log_error("Could not start instance. Session [%s] for user [%s] didn't load.", sessname, user_id)
                 self.clear_container()
                 self.rendertpl("index.tpl", cfg=JBoxCfg.nv,
@@ -80,7 +148,7 @@ class MainHandler(JBoxHandler):
                            cfg=JBoxCfg.nv,
                            js_includes=JBPluginHandler.PLUGIN_JAVASCRIPTS)
         else:
-            (shellport, uplport, ipnbport) = cont.get_host_ports()
+            (shellport, uplport, ipnbport) = ports
 
             self.set_container_ports({
                 JBoxHandler.COOKIE_PORT_SHELL: shellport,
@@ -93,17 +161,22 @@ class MainHandler(JBoxHandler):
                            plugin_features=json.dumps(self.application.settings["plugin_features"]),
                            js_includes=JBPluginHandler.PLUGIN_JAVASCRIPTS)
 
+    @tornado.gen.coroutine
     def chk_and_launch_docker(self, user_id):
-        if self.redirect_to_logged_in_instance(user_id):
+        redirected = yield self.redirect_to_logged_in_instance(user_id)
+        if redirected:
             return
 
         nhops = int(self.get_argument('h', 0))
         numhopmax = JBoxCfg.get('numhopmax', 0)
         max_hop = nhops > numhopmax
-        launched = self.try_launch_container(user_id, max_hop=max_hop)
+        # sessions placed on this instance by another are launched here, without placing them again
+        placed = (nhops > 0) and Compute.supports_placement()
+        launched, redirect_instance = yield self.async_try_launch_container(user_id, max_hop=(max_hop or placed))
 
         if launched:
-            self.set_container_initialized(Compute.get_instance_local_ip(), user_id)
+            local_ip = yield AsyncCompute.get_instance_local_ip()
+            self.set_container_initialized(local_ip, user_id)
             self.rendertpl("loading.tpl",
                            user_id=user_id,
                            cfg=JBoxCfg.nv,
@@ -120,10 +193,7 @@ class MainHandler(JBoxHandler):
             self.log_error("Server maxed out. Can't launch container at hop %d for user %s", nhops, user_id)
             self.rendertpl("index.tpl", cfg=JBoxCfg.nv, state=self.state(error=msg, success=''))
         else:
-            redirect_instance = Compute.get_redirect_instance_id()
-            if redirect_instance is not None:
-                redirect_ip = Compute.get_instance_local_ip(redirect_instance)
-                self.set_redirect_instance_id(redirect_ip)
+            yield self.set_launch_instance_affinity(redirect_instance)
             self.redirect('/?h=' + str(nhops + 1))
 
     @staticmethod
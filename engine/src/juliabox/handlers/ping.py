@@ -10,7 +10,7 @@ class PingHandler(JBoxHandler):
     @tornado.web.asynchronous
     @tornado.gen.coroutine
     def get(self):
-        valid_req = self.is_valid_req()
+        valid_req = yield self.is_valid_req()
         sessname = self.get_session_id(validate=False)
         if valid_req:
             SessContainer.record_ping("/" + sessname)
@@ -1,10 +1,14 @@
 import datetime
+import threading
+import collections
+import uuid
 import pytz
 
 from juliabox.cloud import Compute
 from juliabox.jbox_tasks import JBoxAsyncJob
 from juliabox.jbox_util import JBoxCfg
 from juliabox.jbox_container import BaseContainer
+from juliabox.jbox_container_cache import JBoxContainerCache
 from juliabox.vol import VolMgr, JBoxVol
 import docker.utils
 from docker.utils import Ulimit
@@ -26,8 +30,16 @@ class SessContainer(BaseContainer):
     VOLUMES = ['/home/juser', JBoxVol.CONFIG_MOUNT_POINT, JBoxVol.PKG_MOUNT_POINT]
     MAX_CONTAINERS = 0
     VALID_CONTAINERS = {}
-    INITIAL_DISK_USED_PCT = None
-    LAST_CPU_PCT = None
+
+    # Warm pool of stopped containers with blank user home disks, sized from the number of launches in the last
+    # WARM_POOL_WINDOW_SECS, between WARM_POOL_MIN and WARM_POOL_MAX.
+    WARM_POOL_MIN = 0
+    WARM_POOL_MAX = 0
+    WARM_POOL_WINDOW_SECS = 900
+    WARM_LOCK = threading.Lock()
+    # warm containers being handed over to a session or deleted
+    WARM_CLAIMED = set()
+    LAUNCH_TIMES = collections.deque()
 
     def get_host_ports(self):
         if self.host_ports is None:
@@ -59,13 +71,20 @@ class SessContainer(BaseContainer):
 
         SessContainer.CPU_LIMIT = JBoxCfg.get('interactive.cpu_limit')
         SessContainer.MAX_CONTAINERS = JBoxCfg.get('interactive.numlocalmax')
+        SessContainer.WARM_POOL_MIN = JBoxCfg.get('interactive.warm_pool.min', 0)
+        SessContainer.WARM_POOL_MAX = JBoxCfg.get('interactive.warm_pool.max', 0)
+        SessContainer.WARM_POOL_WINDOW_SECS = JBoxCfg.get('interactive.warm_pool.window_secs', 900)
+        JBoxContainerCache.configure()
 
     @staticmethod
     def _create_new(name, email):
         home_disk = VolMgr.get_disk_for_user(email)
         cfg_disk = VolMgr.get_cfg_mount_for_user(email)
         pkgs_disk = VolMgr.get_pkg_mount_for_user(email)
+        return SessContainer._create_container(name, home_disk, cfg_disk, pkgs_disk)
 
+    @staticmethod
+    def _create_container(name, home_disk, cfg_disk, pkgs_disk):
         vols = {
             home_disk.disk_path: {
                 'bind': SessContainer.VOLUMES[0],
@@ -95,6 +114,7 @@ class SessContainer(BaseContainer):
                                                           hostname='juliabox',
                                                           name=name)
         dockid = jsonobj["Id"]
+        JBoxContainerCache.update(dockid)
         cont = SessContainer(dockid)
         SessContainer.log_info("Created %s with hostcfg %r, cpu_limit: %r, volumes: %r", cont.debug_str(), hostcfg,
                                SessContainer.CPU_LIMIT, vols)
@@ -108,6 +128,115 @@ class SessContainer(BaseContainer):
             SessContainer.log_info("Invalidating container %s", cname)
             del SessContainer.VALID_CONTAINERS[cname]
 
+    @staticmethod
+    def _create_warm():
+        home_disk = VolMgr.get_blank_disk()
+        if home_disk is None:
+            return None
+        name = uuid.uuid4().hex[:16] + BaseContainer.SFX_WARM
+        try:
+            cfg_disk = VolMgr.get_cfg_mount_for_session(name)
+            pkgs_disk = VolMgr.get_pkg_mount_for_user(None)
+            return SessContainer._create_container(name, home_disk, cfg_disk, pkgs_disk)
+        except:
+            home_disk.release()
+            raise
+
+    @staticmethod
+    def _pick_warm(max_picks=1):
+        """ Mark up to max_picks warm containers as claimed and return them. """
+        picked = []
+        with SessContainer.WARM_LOCK:
+            for c in BaseContainer.warm_containers(allcontainers=True):
+                if len(picked) >= max_picks:
+                    break
+                if c['Id'] not in SessContainer.WARM_CLAIMED:
+                    SessContainer.WARM_CLAIMED.add(c['Id'])
+                    picked.append(SessContainer(c['Id']))
+        return picked
+
+    @staticmethod
+    def _unpick_warm(cont):
+        with SessContainer.WARM_LOCK:
+            SessContainer.WARM_CLAIMED.discard(cont.dockid)
+
+    @staticmethod
+    def _is_warm_current(cont):
+        pkgs_disk = VolMgr.get_pkg_mount_from_container(cont.dockid)
+        return (pkgs_disk is not None) and (pkgs_disk.disk_path == VolMgr.get_pkg_mount_for_user(None).disk_path)
+
+    @staticmethod
+    def _claim_warm(name, email):
+        """ Hand over a warm container to session name, restoring the user's data on its disk. """
+        while True:
+            picked = SessContainer._pick_warm()
+            if len(picked) == 0:
+                return None
+            cont = picked[0]
+            try:
+                if not SessContainer._is_warm_current(cont):
+                    SessContainer.log_info("Discarding outdated warm container %s", cont.debug_str())
+                    cont.delete(backup=False)
+                    continue
+                VolMgr.assign_disk_to_user(cont.dockid, email)
+                cont.rename(name)
+                SessContainer.log_info("Claimed warm container %s", cont.debug_str())
+                return cont
+            except:
+                SessContainer.log_exception("Error claiming warm container %s", cont.debug_str())
+                cont.delete(backup=False)
+            finally:
+                SessContainer._unpick_warm(cont)
+
+    @staticmethod
+    def _record_launch():
+        tnow = time.time()
+        with SessContainer.WARM_LOCK:
+            SessContainer.LAUNCH_TIMES.append(tnow)
+            while SessContainer.LAUNCH_TIMES[0] < (tnow - SessContainer.WARM_POOL_WINDOW_SECS):
+                SessContainer.LAUNCH_TIMES.popleft()
+
+    @staticmethod
+    def warm_pool_target():
+        tnow = time.time()
+        with SessContainer.WARM_LOCK:
+            while (len(SessContainer.LAUNCH_TIMES) > 0) and \
+                    (SessContainer.LAUNCH_TIMES[0] < (tnow - SessContainer.WARM_POOL_WINDOW_SECS)):
+                SessContainer.LAUNCH_TIMES.popleft()
+            recent_launches = len(SessContainer.LAUNCH_TIMES)
+        target = max(SessContainer.WARM_POOL_MIN, min(SessContainer.WARM_POOL_MAX, recent_launches))
+        # do not hold back capacity from sessions
+        nfree = SessContainer.MAX_CONTAINERS - BaseContainer.num_active(BaseContainer.SFX_INT)
+        return max(0, min(target, nfree))
+
+    @staticmethod
+    def refill_warm_pool():
+        target = SessContainer.warm_pool_target()
+        nwarm = len(BaseContainer.warm_containers(allcontainers=True))
+        SessContainer.log_debug("Warm containers: %d, target: %d", nwarm, target)
+
+        if nwarm > target:
+            for cont in SessContainer._pick_warm(max_picks=(nwarm - target)):
+                try:
+                    cont.delete(backup=False)
+                finally:
+                    SessContainer._unpick_warm(cont)
+
+        while nwarm < target:
+            cont = SessContainer._create_warm()
+            if cont is None:
+                SessContainer.log_info("No disks available for warm containers")
+                break
+            nwarm += 1
+
+    @staticmethod
+    def drain_warm_pool():
+        for cont in SessContainer._pick_warm(max_picks=SessContainer.MAX_CONTAINERS):
+            try:
+                cont.delete(backup=False)
+            finally:
+                SessContainer._unpick_warm(cont)
+
     @staticmethod
     def launch_by_name(name, email, reuse=True):
         SessContainer.log_info("Launching container %s", name)
@@ -118,6 +247,10 @@ class SessContainer(BaseContainer):
             cont.delete()
             cont = None
 
+        if cont is None:
+            SessContainer._record_launch()
+            cont = SessContainer._claim_warm(name, email)
+
         if cont is None:
             cont = SessContainer._create_new(name, email)
 
@@ -200,6 +333,7 @@ class SessContainer(BaseContainer):
                 del SessContainer.PINGS[cname]
 
         SessContainer.VALID_CONTAINERS = all_cnames
+        container_id_list.extend([cdesc['Id'] for cdesc in BaseContainer.warm_containers(allcontainers=True)])
         VolMgr.refresh_disk_use_status(container_id_list=container_id_list)
         SessContainer.log_info("Finished container maintenance.")
 
@@ -212,14 +346,10 @@ class SessContainer(BaseContainer):
             except:
                 pass
         else:
-            all_containers = SessContainer.session_containers(allcontainers=True)
-            for cdesc in all_containers:
-                cid = cdesc['Id']
+            cid = BaseContainer.get_id_by_name(cname)
+            if cid is not None:
+                SessContainer.VALID_CONTAINERS[cname] = cid
                 cont = SessContainer(cid)
-                cont_name = cont.get_name()
-                SessContainer.VALID_CONTAINERS[cont_name] = cid
-                if cname == cont_name:
-                    break
 
         if cont is None:
             return False
@@ -257,15 +387,8 @@ class SessContainer(BaseContainer):
 
     @staticmethod
     def get_by_name(name):
-        if not name.startswith("/"):
-            nname = "/" + unicode(name)
-        else:
-            nname = unicode(name)
-
-        for c in SessContainer.session_containers(allcontainers=True):
-            if ('Names' in c) and (c['Names'] is not None) and (c['Names'][0] == nname):
-                return SessContainer(c['Id'])
-        return None
+        cid = BaseContainer.get_id_by_name(name)
+        return None if cid is None else SessContainer(cid)
 
     @staticmethod
     def record_ping(name):
@@ -0,0 +1,120 @@
+import bisect
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from jbox_util import LoggerMixin, JBoxCfg
+
+
+class JBoxAsyncService(LoggerMixin):
+    """ Runs blocking calls (docker, database, cloud APIs) of the web tier on a bounded pool of threads.
+
+    `run` returns a future that Tornado coroutines can yield, so that a slow call holds up only the request that made
+    it and not the IOLoop. Calls are named (e.g. `docker.get_by_name`) and a histogram of the latency of each name is
+    maintained. Latencies include the time spent waiting for a free thread.
+    """
+
+    THREADS = 16
+    EXECUTOR = None
+
+    # upper bounds (milliseconds) of latency histogram buckets. the last bucket is unbounded.
+    BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    LOCK = threading.Lock()
+    LATENCY = dict()
+
+    @staticmethod
+    def configure():
+        JBoxAsyncService.THREADS = JBoxCfg.get('async_service.threads', JBoxAsyncService.THREADS)
+        if JBoxAsyncService.EXECUTOR is None:
+            JBoxAsyncService.EXECUTOR = ThreadPoolExecutor(JBoxAsyncService.THREADS)
+            JBoxAsyncService.log_info("async service with %d threads", JBoxAsyncService.THREADS)
+
+    @staticmethod
+    def run(name, fn, *args, **kwargs):
+        """ Schedule `fn(*args, **kwargs)` and return a future of its result. """
+        if JBoxAsyncService.EXECUTOR is None:
+            JBoxAsyncService.configure()
+        return JBoxAsyncService.EXECUTOR.submit(JBoxAsyncService._timed, name, time.time(), fn, args, kwargs)
+
+    @staticmethod
+    def _timed(name, queued_at, fn, args, kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            JBoxAsyncService._record(name, time.time() - queued_at)
+
+    @staticmethod
+    def _record(name, secs):
+        ms = secs * 1000
+        with JBoxAsyncService.LOCK:
+            hist = JBoxAsyncService.LATENCY.get(name, None)
+            if hist is None:
+                hist = {
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'buckets': [0] * (len(JBoxAsyncService.BUCKETS_MS) + 1)
+                }
+                JBoxAsyncService.LATENCY[name] = hist
+            hist['count'] += 1
+            hist['total_ms'] += ms
+            hist['max_ms'] = max(hist['max_ms'], ms)
+            hist['buckets'][bisect.bisect_left(JBoxAsyncService.BUCKETS_MS, ms)] += 1
+
+    @staticmethod
+    def _percentile(hist, pct):
+        """ Upper bound of the bucket containing the pct percentile (the max for the unbounded bucket). """
+        rank = hist['count'] * pct / 100.0
+        seen = 0
+        for idx, count in enumerate(hist['buckets']):
+            seen += count
+            if (seen >= rank) and (count > 0):
+                if idx < len(JBoxAsyncService.BUCKETS_MS):
+                    return min(JBoxAsyncService.BUCKETS_MS[idx], hist['max_ms'])
+                break
+        return hist['max_ms']
+
+    @staticmethod
+    def get_stats(reset=True):
+        """ Latency histograms of calls made since the last reset, by call name. """
+        with JBoxAsyncService.LOCK:
+            latency = JBoxAsyncService.LATENCY
+            if reset:
+                JBoxAsyncService.LATENCY = dict()
+
+        stats = dict()
+        for name, hist in latency.iteritems():
+            stats[name] = {
+                'count': hist['count'],
+                'mean_ms': hist['total_ms'] / hist['count'],
+                'max_ms': hist['max_ms'],
+                'p50_ms': JBoxAsyncService._percentile(hist, 50),
+                'p99_ms': JBoxAsyncService._percentile(hist, 99),
+                'buckets_ms': JBoxAsyncService.BUCKETS_MS,
+                'buckets': hist['buckets']
+            }
+        return stats
+
+
+class JBoxAsyncProxy(object):
+    """ Future returning wrapper around a class (or object) with blocking methods.
+
+    `JBoxAsyncProxy(SessContainer, 'docker').get_by_name(name)` schedules `SessContainer.get_by_name(name)` on the async
+    service, with latency recorded as `docker.get_by_name`. Calling the proxy of a class constructs an instance.
+    """
+    def __init__(self, target, group):
+        self._target = target
+        self._group = group
+
+    def __getattr__(self, attr):
+        fn = getattr(self._target, attr)
+        name = self._group + '.' + attr
+
+        def _run(*args, **kwargs):
+            return JBoxAsyncService.run(name, fn, *args, **kwargs)
+        return _run
+
+    def __call__(self, *args, **kwargs):
+        return JBoxAsyncService.run(self._group + '.' + self._target.__name__, self._target, *args, **kwargs)
@@ -3,13 +3,12 @@ import multiprocessing
 import psutil
 
 from jbox_util import LoggerMixin, parse_iso_time
+from jbox_container_cache import JBoxContainerCache
 from juliabox.db import JBPluginDB
 
 
 class BaseContainer(LoggerMixin):
     DCKR = None
-    LAST_CPU_PCT = None
-    INITIAL_DISK_USED_PCT = None
 
     # JuliaBox service daemon container names are suffixed so that they are not treated as regular session containers.
     # Can move to an exclusion list if more complicated patterns are required.
@@ -17,6 +16,8 @@ class BaseContainer(LoggerMixin):
     SFX_SVC = CONTAINER_NAME_SEP + 'jboxsvc'
     SFX_API = CONTAINER_NAME_SEP + 'jboxapi'
     SFX_INT = CONTAINER_NAME_SEP + 'jboxint'
+    # stopped session containers kept ready to be handed over to new sessions
+    SFX_WARM = CONTAINER_NAME_SEP + 'jboxwarm'
 
     def __init__(self, dockid):
         self.dockid = dockid
@@ -28,10 +29,11 @@ class BaseContainer(LoggerMixin):
         self.props = None
         self.dbgstr = None
         self.host_ports = None
+        JBoxContainerCache.invalidate(self.dockid)
 
     def get_props(self):
         if self.props is None:
-            self.props = BaseContainer.DCKR.inspect_container(self.dockid)
+            self.props = JBoxContainerCache.inspect(self.dockid)
         return self.props
 
     def _get_host_ports(self, ports):
@@ -82,12 +84,25 @@ class BaseContainer(LoggerMixin):
     @staticmethod
     def session_containers(allcontainers=True):
         sessions = []
-        for c in BaseContainer.DCKR.containers(all=allcontainers):
+        for c in JBoxContainerCache.containers(all=allcontainers):
             name = c["Names"][0] if (("Names" in c) and (c["Names"] is not None)) else c["Id"][0:12]
-            if not name.endswith(BaseContainer.SFX_SVC) and not name.endswith(BaseContainer.SFX_API):
+            if not name.endswith(BaseContainer.SFX_SVC) and not name.endswith(BaseContainer.SFX_API) and \
+                    not name.endswith(BaseContainer.SFX_WARM):
                 sessions.append(c)
         return sessions
 
+    @staticmethod
+    def warm_containers(allcontainers=True):
+        return BaseContainer._containers_of_type(BaseContainer.SFX_WARM, allcontainers=allcontainers)
+
+    @staticmethod
+    def get_id_by_name(name):
+        if not name.startswith("/"):
+            name = "/" + unicode(name)
+        else:
+            name = unicode(name)
+        return JBoxContainerCache.get_id_by_name(name)
+
     @staticmethod
     def api_containers(allcontainers=True):
         return BaseContainer._containers_of_type(BaseContainer.SFX_API, allcontainers=allcontainers)
@@ -99,23 +114,25 @@ class BaseContainer(LoggerMixin):
     @staticmethod
     def num_active(sfx=None):
         cnt = 0
-        for c in BaseContainer.DCKR.containers(all=True):
+        for c in JBoxContainerCache.containers(all=True):
             name = c["Names"][0] if (("Names" in c) and (c["Names"] is not None)) else c["Id"][0:12]
             if name.endswith(BaseContainer.SFX_SVC):
                 typ = BaseContainer.SFX_SVC
             elif name.endswith(BaseContainer.SFX_API):
                 typ = BaseContainer.SFX_API
+            elif name.endswith(BaseContainer.SFX_WARM):
+                typ = BaseContainer.SFX_WARM
             else:
                 typ = BaseContainer.SFX_INT
 
-            if ((sfx is None) and (typ != BaseContainer.SFX_SVC)) or (typ == sfx):
+            if ((sfx is None) and (typ not in (BaseContainer.SFX_SVC, BaseContainer.SFX_WARM))) or (typ == sfx):
                 cnt += 1
         return cnt
 
     @staticmethod
     def _containers_of_type(sfx, allcontainers=True):
         sessions = []
-        for c in BaseContainer.DCKR.containers(all=allcontainers):
+        for c in JBoxContainerCache.containers(all=allcontainers):
             name = c["Names"][0] if (("Names" in c) and (c["Names"] is not None)) else c["Id"][0:12]
             if name.endswith(sfx):
                 sessions.append(c)
@@ -195,6 +212,12 @@ class BaseContainer(LoggerMixin):
         BaseContainer.log_info("Killed %s", self.debug_str())
         self.on_kill()
 
+    def rename(self, name):
+        BaseContainer.log_info("Renaming %s to %s", self.debug_str(), name)
+        BaseContainer.DCKR.rename(self.dockid, name)
+        JBoxContainerCache.update(self.dockid)
+        self.refresh()
+
     def delete(self, backup=False):
         BaseContainer.log_info("Deleting %s", self.debug_str())
         self.refresh()
@@ -203,6 +226,7 @@ class BaseContainer(LoggerMixin):
             self.kill()
         self.before_delete(cname, backup=backup)
         BaseContainer.DCKR.remove_container(self.dockid)
+        JBoxContainerCache.update(self.dockid)
         BaseContainer.log_info("Deleted %s", self.debug_str())
 
     def record_usage(self):
@@ -0,0 +1,205 @@
+__author__ = 'tan'
+import json
+import threading
+import time
+
+from jbox_util import LoggerMixin, JBoxCfg
+
+
+class JBoxContainerCache(LoggerMixin):
+    """ In-process registry of docker containers, kept current by following the docker events stream.
+
+    Holds the container summaries (as returned by `containers(all=True)`) indexed by id and by name, and caches
+    `inspect_container` results till the next event on the container (or an explicit `invalidate`).
+    Falls back to querying docker directly when disabled or while the events stream is not connected.
+    """
+
+    DCKR = None
+    ENABLED = True
+    RESYNC_SECS = 300
+    RECONNECT_SECS = 5
+
+    LOCK = threading.RLock()
+    SUMMARIES = dict()
+    NAMES = dict()
+    PROPS = dict()
+    # incremented on every change to a container, to avoid caching inspection results that raced with an event
+    GENERATION = dict()
+    SYNCED = False
+    LAST_SYNC = 0
+    LISTENER = None
+
+    # docker events that are not about a change in container state
+    IGNORE_EVENTS = ('untag', 'delete', 'pull', 'tag', 'push', 'import', 'exec_create', 'exec_start', 'top')
+
+    @staticmethod
+    def configure():
+        JBoxContainerCache.DCKR = JBoxCfg.dckr
+        JBoxContainerCache.ENABLED = JBoxCfg.get('container_cache.enabled', True)
+        JBoxContainerCache.RESYNC_SECS = JBoxCfg.get('container_cache.resync_secs', JBoxContainerCache.RESYNC_SECS)
+
+        if JBoxContainerCache.ENABLED and (JBoxContainerCache.LISTENER is None):
+            t = threading.Thread(target=JBoxContainerCache._listen, name='jbox_container_cache')
+            t.daemon = True
+            JBoxContainerCache.LISTENER = t
+            t.start()
+
+    @staticmethod
+    def _is_active():
+        return JBoxContainerCache.ENABLED and JBoxContainerCache.SYNCED
+
+    @staticmethod
+    def _name_of(summary):
+        if ('Names' in summary) and (summary['Names'] is not None) and (len(summary['Names']) > 0):
+            return summary['Names'][0]
+        return None
+
+    @staticmethod
+    def _set_summary(cid, summary):
+        with JBoxContainerCache.LOCK:
+            old = JBoxContainerCache.SUMMARIES.pop(cid, None)
+            if old is not None:
+                old_name = JBoxContainerCache._name_of(old)
+                if JBoxContainerCache.NAMES.get(old_name) == cid:
+                    del JBoxContainerCache.NAMES[old_name]
+            JBoxContainerCache.PROPS.pop(cid, None)
+            JBoxContainerCache.GENERATION[cid] = JBoxContainerCache.GENERATION.get(cid, 0) + 1
+
+            if summary is not None:
+                JBoxContainerCache.SUMMARIES[cid] = summary
+                name = JBoxContainerCache._name_of(summary)
+                if name is not None:
+                    JBoxContainerCache.NAMES[name] = cid
+            else:
+                del JBoxContainerCache.GENERATION[cid]
+
+    @staticmethod
+    def sync():
+        """ Rebuild the registry from a full container listing. """
+        summaries = JBoxContainerCache.DCKR.containers(all=True)
+        with JBoxContainerCache.LOCK:
+            JBoxContainerCache.SUMMARIES = dict()
+            JBoxContainerCache.NAMES = dict()
+            JBoxContainerCache.PROPS = dict()
+            JBoxContainerCache.GENERATION = dict()
+            for summary in summaries:
+                JBoxContainerCache._set_summary(summary['Id'], summary)
+            JBoxContainerCache.LAST_SYNC = time.time()
+        JBoxContainerCache.log_debug("synced %d containers", len(summaries))
+
+    @staticmethod
+    def update(cid):
+        """ Re-read the summary of a single container, or remove it from the registry if it no longer exists. """
+        if not JBoxContainerCache._is_active():
+            return
+        summaries = JBoxContainerCache.DCKR.containers(all=True, filters={'id': cid})
+        summary = None
+        for s in summaries:
+            if s['Id'] == cid or s['Id'].startswith(cid):
+                summary = s
+                cid = s['Id']
+                break
+        if summary is None:
+            cid = JBoxContainerCache._full_id(cid)
+        JBoxContainerCache._set_summary(cid, summary)
+
+    @staticmethod
+    def _full_id(cid):
+        with JBoxContainerCache.LOCK:
+            if cid in JBoxContainerCache.SUMMARIES:
+                return cid
+            for full_id in JBoxContainerCache.SUMMARIES.keys():
+                if full_id.startswith(cid):
+                    return full_id
+        return cid
+
+    @staticmethod
+    def invalidate(cid):
+        """ Drop cached inspection results of a container. """
+        with JBoxContainerCache.LOCK:
+            full_id = JBoxContainerCache._full_id(cid)
+            JBoxContainerCache.PROPS.pop(full_id, None)
+            if full_id in JBoxContainerCache.GENERATION:
+                JBoxContainerCache.GENERATION[full_id] += 1
+
+    @staticmethod
+    def _on_event(event):
+        if isinstance(event, basestring):
+            event = json.loads(event)
+        if event.get('Type', 'container') != 'container':
+            return
+        status = event.get('status', event.get('Action', ''))
+        cid = event.get('id', None)
+        if (cid is None) or (status in JBoxContainerCache.IGNORE_EVENTS):
+            return
+        JBoxContainerCache.log_debug("event %s on %s", status, cid)
+        if status == 'destroy':
+            JBoxContainerCache._set_summary(JBoxContainerCache._full_id(cid), None)
+        else:
+            JBoxContainerCache.update(cid)
+
+    @staticmethod
+    def _listen():
+        while True:
+            try:
+                # events generated while we sync are replayed from since
+                since = int(time.time())
+                JBoxContainerCache.sync()
+                JBoxContainerCache.SYNCED = True
+                JBoxContainerCache.log_info("following docker events")
+                for event in JBoxContainerCache.DCKR.events(since=since, decode=True):
+                    JBoxContainerCache._on_event(event)
+                JBoxContainerCache.log_warn("docker events stream closed")
+            except:
+                JBoxContainerCache.log_exception("exception following docker events")
+            JBoxContainerCache.SYNCED = False
+            time.sleep(JBoxContainerCache.RECONNECT_SECS)
+
+    @staticmethod
+    def _resync_if_stale():
+        if (time.time() - JBoxContainerCache.LAST_SYNC) > JBoxContainerCache.RESYNC_SECS:
+            JBoxContainerCache.sync()
+
+    @staticmethod
+    def _is_running(summary):
+        status = summary.get('Status', '')
+        return status.startswith('Up') or status.startswith('Restarting')
+
+    @staticmethod
+    def containers(all=True):
+        """ Same as docker `containers(all=all)`. """
+        if not JBoxContainerCache._is_active():
+            return JBoxContainerCache.DCKR.containers(all=all)
+        JBoxContainerCache._resync_if_stale()
+        with JBoxContainerCache.LOCK:
+            summaries = JBoxContainerCache.SUMMARIES.values()
+        if all:
+            return summaries
+        return [s for s in summaries if JBoxContainerCache._is_running(s)]
+
+    @staticmethod
+    def get_id_by_name(name):
+        """ Id of the container with the given name (with leading /), or None. """
+        if not JBoxContainerCache._is_active():
+            for c in JBoxContainerCache.DCKR.containers(all=True):
+                if JBoxContainerCache._name_of(c) == name:
+                    return c['Id']
+            return None
+        with JBoxContainerCache.LOCK:
+            return JBoxContainerCache.NAMES.get(name, None)
+
+    @staticmethod
+    def inspect(cid):
+        """ Same as docker `inspect_container(cid)`, but cached till the container changes. """
+        if not JBoxContainerCache._is_active():
+            return JBoxContainerCache.DCKR.inspect_container(cid)
+        full_id = JBoxContainerCache._full_id(cid)
+        with JBoxContainerCache.LOCK:
+            props = JBoxContainerCache.PROPS.get(full_id, None)
+            generation = JBoxContainerCache.GENERATION.get(full_id, None)
+        if props is None:
+            props = JBoxContainerCache.DCKR.inspect_container(cid)
+            with JBoxContainerCache.LOCK:
+                if (generation is not None) and (JBoxContainerCache.GENERATION.get(full_id, None) == generation):
+                    JBoxContainerCache.PROPS[full_id] = props
+        return props
@@ -0,0 +1,116 @@
+import time
+import threading
+from collections import deque
+
+import psutil
+
+from jbox_util import LoggerMixin, JBoxCfg
+from jbox_container import BaseContainer
+from vol import VolMgr
+
+
+class JBoxHostSampler(LoggerMixin):
+    """ Samples host usage (CPU, memory, disk, disk ids and containers) on a background thread.
+
+    The last `WINDOW` samples, taken every `SAMPLE_SECS`, are kept in a ring buffer, so that publishing stats and
+    deciding whether to accept sessions read them from memory instead of inspecting containers and querying psutil.
+    Sessions launched or removed between samples are counted in memory (`note_launch`, `note_removal`) and reflected
+    in the container counts till the next sample.
+    """
+
+    SAMPLE_SECS = 10
+    WINDOW = 30
+
+    LOCK = threading.Lock()
+    SAMPLES = deque(maxlen=WINDOW)
+    # change in session containers since the last sample
+    PENDING_SESSIONS = 0
+    INITIAL_DISK_USED_PCT = None
+    SAMPLER = None
+
+    @staticmethod
+    def configure():
+        JBoxHostSampler.SAMPLE_SECS = JBoxCfg.get('jboxd.host_sampler.sample_secs', JBoxHostSampler.SAMPLE_SECS)
+        JBoxHostSampler.WINDOW = JBoxCfg.get('jboxd.host_sampler.window', JBoxHostSampler.WINDOW)
+        with JBoxHostSampler.LOCK:
+            JBoxHostSampler.SAMPLES = deque(JBoxHostSampler.SAMPLES, maxlen=JBoxHostSampler.WINDOW)
+            if JBoxHostSampler.SAMPLER is not None:
+                return
+            t = threading.Thread(target=JBoxHostSampler._run, name="jbox_host_sampler")
+            t.daemon = True
+            JBoxHostSampler.SAMPLER = t
+
+        # the first sample is taken right away, so that there is always one to read
+        JBoxHostSampler.sample()
+        t.start()
+
+    @staticmethod
+    def _run():
+        while True:
+            time.sleep(JBoxHostSampler.SAMPLE_SECS)
+            try:
+                JBoxHostSampler.sample()
+            except:
+                JBoxHostSampler.log_exception("Exception sampling host usage")
+
+    @staticmethod
+    def _disk_used_pct():
+        disk_used_pct = 0
+        for x in psutil.disk_partitions():
+            if not VolMgr.is_mount_path(x.mountpoint):
+                try:
+                    disk_used_pct = max(psutil.disk_usage(x.mountpoint).percent, disk_used_pct)
+                except:
+                    pass
+        if JBoxHostSampler.INITIAL_DISK_USED_PCT is None:
+            JBoxHostSampler.INITIAL_DISK_USED_PCT = disk_used_pct
+        return max(0, (disk_used_pct - JBoxHostSampler.INITIAL_DISK_USED_PCT))
+
+    @staticmethod
+    def sample():
+        # sessions noted till now are reflected in this sample. those noted while it is being taken are kept pending.
+        with JBoxHostSampler.LOCK:
+            pending = JBoxHostSampler.PENDING_SESSIONS
+        VolMgr.refresh_disk_use_status()
+        sample = {
+            'time': time.time(),
+            # since the last sample
+            'cpu': psutil.cpu_percent(),
+            'mem': psutil.virtual_memory().percent,
+            'disk': JBoxHostSampler._disk_used_pct(),
+            'disk_ids': VolMgr.used_pct(),
+            'sessions': BaseContainer.num_active(BaseContainer.SFX_INT),
+            'apis': BaseContainer.num_active(BaseContainer.SFX_API),
+            'warm': BaseContainer.num_active(BaseContainer.SFX_WARM)
+        }
+        with JBoxHostSampler.LOCK:
+            JBoxHostSampler.SAMPLES.append(sample)
+            JBoxHostSampler.PENDING_SESSIONS -= pending
+        return sample
+
+    @staticmethod
+    def note_launch():
+        with JBoxHostSampler.LOCK:
+            JBoxHostSampler.PENDING_SESSIONS += 1
+
+    @staticmethod
+    def note_removal():
+        with JBoxHostSampler.LOCK:
+            JBoxHostSampler.PENDING_SESSIONS -= 1
+
+    @staticmethod
+    def latest():
+        """ The latest sample, with sessions launched or removed since. """
+        with JBoxHostSampler.LOCK:
+            sample = dict(JBoxHostSampler.SAMPLES[-1])
+            sample['sessions'] = max(0, sample['sessions'] + JBoxHostSampler.PENDING_SESSIONS)
+        return sample
+
+    @staticmethod
+    def mean(name, nsamples=None):
+        """ Mean of a value over the last nsamples (or the whole window). """
+        with JBoxHostSampler.LOCK:
+            samples = list(JBoxHostSampler.SAMPLES)
+        if nsamples is not None:
+            samples = samples[-nsamples:]
+        return float(sum(s[name] for s in samples)) / len(samples)
@@ -0,0 +1,134 @@
+import os
+import json
+import uuid
+import threading
+
+from jbox_util import LoggerMixin, JBoxCfg, make_sure_path_exists
+from jbox_crypto import ssh_keygen, encrypt, decrypt
+
+
+class JBoxSSHKeyPool(LoggerMixin):
+    """ A bounded pool of pre-generated SSH keypairs for new user homes.
+
+    Keys are generated by a background thread and kept in files under `LOCATION`, encrypted with the installation
+    session key, so that the pool survives restarts. When the pool is empty (or not configured), keys are generated
+    on demand as before and counted as misses.
+    """
+
+    LOCATION = None
+    SIZE = 0
+    KEY_SIZE = 2048
+    ENCKEY = None
+    # seconds between checks of the pool depth, in addition to being woken up on every key taken
+    CHECK_SECS = 60
+
+    LOCK = threading.Lock()
+    WAKEUP = threading.Event()
+    GENERATOR = None
+    DEPTH = 0
+    NUM_HITS = 0
+    NUM_MISSES = 0
+
+    KEY_SFX = '.key'
+
+    @staticmethod
+    def configure():
+        JBoxSSHKeyPool.SIZE = JBoxCfg.get('ssh_keypool.size', 0)
+        JBoxSSHKeyPool.ENCKEY = JBoxCfg.get('sesskey')
+        location = JBoxCfg.get('ssh_keypool.location')
+        if (JBoxSSHKeyPool.SIZE <= 0) or (location is None):
+            JBoxSSHKeyPool.log_info("SSH keypair pool not configured")
+            return
+
+        location = os.path.expanduser(location)
+        make_sure_path_exists(location)
+        JBoxSSHKeyPool.LOCATION = location
+        with JBoxSSHKeyPool.LOCK:
+            JBoxSSHKeyPool.DEPTH = len(JBoxSSHKeyPool._list_keys())
+        JBoxSSHKeyPool.log_info("SSH keypair pool at %s. size: %d, available: %d",
+                                location, JBoxSSHKeyPool.SIZE, JBoxSSHKeyPool.DEPTH)
+
+        if JBoxSSHKeyPool.GENERATOR is None:
+            t = threading.Thread(target=JBoxSSHKeyPool._generate, name='jbox_ssh_keypool')
+            t.daemon = True
+            JBoxSSHKeyPool.GENERATOR = t
+            t.start()
+
+    @staticmethod
+    def _list_keys():
+        return [f for f in os.listdir(JBoxSSHKeyPool.LOCATION) if f.endswith(JBoxSSHKeyPool.KEY_SFX)]
+
+    @staticmethod
+    def _store(public_key, private_key):
+        key_name = uuid.uuid4().hex
+        tmp_path = os.path.join(JBoxSSHKeyPool.LOCATION, key_name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(encrypt(json.dumps([public_key, private_key]), JBoxSSHKeyPool.ENCKEY))
+        os.chmod(tmp_path, 0600)
+        with JBoxSSHKeyPool.LOCK:
+            os.rename(tmp_path, os.path.join(JBoxSSHKeyPool.LOCATION, key_name + JBoxSSHKeyPool.KEY_SFX))
+            JBoxSSHKeyPool.DEPTH += 1
+
+    @staticmethod
+    def _take():
+        with JBoxSSHKeyPool.LOCK:
+            keys = JBoxSSHKeyPool._list_keys()
+            if len(keys) == 0:
+                JBoxSSHKeyPool.DEPTH = 0
+                return None
+            key_path = os.path.join(JBoxSSHKeyPool.LOCATION, keys[0])
+            with open(key_path) as f:
+                enc_keys = f.read()
+            os.remove(key_path)
+            JBoxSSHKeyPool.DEPTH = len(keys) - 1
+        public_key, private_key = json.loads(decrypt(enc_keys, JBoxSSHKeyPool.ENCKEY))
+        return str(public_key), str(private_key)
+
+    @staticmethod
+    def _generate():
+        while True:
+            try:
+                while JBoxSSHKeyPool.DEPTH < JBoxSSHKeyPool.SIZE:
+                    public_key, private_key = ssh_keygen(JBoxSSHKeyPool.KEY_SIZE)
+                    JBoxSSHKeyPool._store(public_key, private_key)
+                JBoxSSHKeyPool.log_debug("SSH keypair pool full with %d keys", JBoxSSHKeyPool.DEPTH)
+            except:
+                JBoxSSHKeyPool.log_exception("Exception generating SSH keypairs")
+            JBoxSSHKeyPool.WAKEUP.wait(JBoxSSHKeyPool.CHECK_SECS)
+            JBoxSSHKeyPool.WAKEUP.clear()
+
+    @staticmethod
+    def get_keypair():
+        """ Returns a (public key, private key) tuple, from the pool if available. """
+        keys = None
+        if JBoxSSHKeyPool.LOCATION is not None:
+            try:
+                keys = JBoxSSHKeyPool._take()
+            except:
+                JBoxSSHKeyPool.log_exception("Exception reading SSH keypair from pool")
+            JBoxSSHKeyPool.WAKEUP.set()
+
+        with JBoxSSHKeyPool.LOCK:
+            if keys is None:
+                JBoxSSHKeyPool.NUM_MISSES += 1
+            else:
+                JBoxSSHKeyPool.NUM_HITS += 1
+
+        if keys is None:
+            JBoxSSHKeyPool.log_debug("SSH keypair pool empty. Generating keys.")
+            keys = ssh_keygen(JBoxSSHKeyPool.KEY_SIZE)
+        return keys
+
+    @staticmethod
+    def get_stats(reset=True):
+        with JBoxSSHKeyPool.LOCK:
+            stats = {
+                'size': JBoxSSHKeyPool.SIZE,
+                'depth': JBoxSSHKeyPool.DEPTH,
+                'hits': JBoxSSHKeyPool.NUM_HITS,
+                'misses': JBoxSSHKeyPool.NUM_MISSES
+            }
+            if reset:
+                JBoxSSHKeyPool.NUM_HITS = 0
+                JBoxSSHKeyPool.NUM_MISSES = 0
+        return stats
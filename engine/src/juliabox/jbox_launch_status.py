@@ -0,0 +1,171 @@
+import threading
+import time
+import zmq
+
+from jbox_util import LoggerMixin, JBoxCfg
+from cloud import Compute
+from jbox_tasks import JBoxAsyncJob
+
+
+class JBoxLaunchStatus(LoggerMixin):
+    """ Progress of session launches, pushed from the container manager to the web tier.
+
+    The container manager publishes a message at each stage of a launch on a ZMQ PUB socket. The web tier follows
+    them in a background thread, keeps the latest status of each session, and wakes up requests (on the IOLoop)
+    waiting for the status of a session to change. Statuses carry a sequence number assigned by the web tier, that
+    the browser sends back to wait for the next change.
+    """
+
+    STAGE_PREPARING = 'preparing'
+    STAGE_DISK = 'disk'
+    STAGE_RESTORE = 'restore'
+    STAGE_STARTED = 'started'
+    STAGE_READY = 'ready'
+    STAGE_FAILED = 'failed'
+
+    # restore progress is published in steps of this many percent
+    PROGRESS_STEP = 5
+    # statuses are forgotten this many seconds after their last change
+    STATUS_TTL_SECS = 3600
+
+    PORT = None
+    LONGPOLL_SECS = 20
+
+    LOCK = threading.Lock()
+    PUB_SOCK = None
+    SUBSCRIBER = None
+    IOLOOP = None
+    STATUS = dict()
+    WAITERS = dict()
+    SEQ = 0
+
+    @staticmethod
+    def configure():
+        JBoxLaunchStatus.PORT = JBoxCfg.get('launch_status.port')
+        JBoxLaunchStatus.LONGPOLL_SECS = JBoxCfg.get('launch_status.longpoll_secs', JBoxLaunchStatus.LONGPOLL_SECS)
+
+    @staticmethod
+    def is_enabled():
+        return JBoxLaunchStatus.PORT is not None
+
+    @staticmethod
+    def _addr():
+        return 'tcp://%s:%d' % (Compute.get_instance_local_ip(), JBoxLaunchStatus.PORT)
+
+    @staticmethod
+    def init_publisher():
+        """ Called by the container manager. """
+        if not JBoxLaunchStatus.is_enabled():
+            JBoxLaunchStatus.log_info("launch status publishing not configured")
+            return
+        sock = zmq.Context.instance().socket(zmq.PUB)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.bind(JBoxLaunchStatus._addr())
+        JBoxLaunchStatus.PUB_SOCK = sock
+
+    @staticmethod
+    def publish(sessname, stage, progress=None):
+        """ Publish the launch stage of a session. Does nothing where the publisher is not initialized. """
+        if JBoxLaunchStatus.PUB_SOCK is None:
+            return
+        msg = JBoxAsyncJob._make_msg(stage, {'sessname': sessname, 'progress': progress})
+        JBoxLaunchStatus.log_debug("launch status %s: %s %r", sessname, stage, progress)
+        try:
+            # zmq sockets must not be used concurrently, and launches run on many threads
+            with JBoxLaunchStatus.LOCK:
+                JBoxLaunchStatus.PUB_SOCK.send_json(msg, zmq.NOBLOCK)
+        except zmq.ZMQError:
+            JBoxLaunchStatus.log_exception("error publishing launch status of %s", sessname)
+
+    @staticmethod
+    def progress_reporter(sessname):
+        """ A callable taking (done, total) that publishes restore progress of sessname, in steps of PROGRESS_STEP. """
+        last = [-1]
+
+        def _report(done, total):
+            if total <= 0:
+                return
+            pct = min(100, int(done * 100 / total))
+            pct -= pct % JBoxLaunchStatus.PROGRESS_STEP
+            if pct > last[0]:
+                last[0] = pct
+                JBoxLaunchStatus.publish(sessname, JBoxLaunchStatus.STAGE_RESTORE, pct)
+        return _report
+
+    @staticmethod
+    def init_subscriber(ioloop):
+        """ Called by the web tier, to follow launch statuses and wake up waiters on ioloop. """
+        if not JBoxLaunchStatus.is_enabled():
+            JBoxLaunchStatus.log_info("launch status push not configured. falling back to polling.")
+            return
+        JBoxLaunchStatus.IOLOOP = ioloop
+        if JBoxLaunchStatus.SUBSCRIBER is None:
+            t = threading.Thread(target=JBoxLaunchStatus._follow, name='jbox_launch_status')
+            t.daemon = True
+            JBoxLaunchStatus.SUBSCRIBER = t
+            t.start()
+
+    @staticmethod
+    def _follow():
+        sock = zmq.Context.instance().socket(zmq.SUB)
+        sock.setsockopt(zmq.SUBSCRIBE, '')
+        sock.connect(JBoxLaunchStatus._addr())
+        JBoxLaunchStatus.log_info("following launch status at %s", JBoxLaunchStatus._addr())
+        while True:
+            try:
+                stage, data = JBoxAsyncJob._extract_msg(sock.recv_json())
+                JBoxLaunchStatus._set_status(data['sessname'], stage, data['progress'])
+            except:
+                JBoxLaunchStatus.log_exception("exception following launch status")
+                time.sleep(1)
+
+    @staticmethod
+    def _set_status(sessname, stage, progress):
+        tnow = time.time()
+        with JBoxLaunchStatus.LOCK:
+            JBoxLaunchStatus.SEQ += 1
+            JBoxLaunchStatus.STATUS[sessname] = {
+                'stage': stage,
+                'progress': progress,
+                'seq': JBoxLaunchStatus.SEQ,
+                'time': tnow
+            }
+            for name in [n for n, s in JBoxLaunchStatus.STATUS.iteritems()
+                         if (tnow - s['time']) > JBoxLaunchStatus.STATUS_TTL_SECS]:
+                del JBoxLaunchStatus.STATUS[name]
+        JBoxLaunchStatus.IOLOOP.add_callback(JBoxLaunchStatus._notify, sessname)
+
+    @staticmethod
+    def reset(sessname):
+        """ Forget the status of an earlier launch of sessname. """
+        with JBoxLaunchStatus.LOCK:
+            JBoxLaunchStatus.STATUS.pop(sessname, None)
+
+    @staticmethod
+    def get_status(sessname):
+        with JBoxLaunchStatus.LOCK:
+            status = JBoxLaunchStatus.STATUS.get(sessname, None)
+            return dict(status) if status is not None else None
+
+    # the methods below run on the IOLoop thread only
+
+    @staticmethod
+    def _notify(sessname):
+        waiters = JBoxLaunchStatus.WAITERS.pop(sessname, [])
+        status = JBoxLaunchStatus.get_status(sessname)
+        for future in waiters:
+            if not future.done():
+                future.set_result(status)
+
+    @staticmethod
+    def add_waiter(sessname, future):
+        """ Resolve future with the status of sessname on its next change. """
+        JBoxLaunchStatus.WAITERS.setdefault(sessname, []).append(future)
+
+    @staticmethod
+    def remove_waiter(sessname, future):
+        waiters = JBoxLaunchStatus.WAITERS.get(sessname, [])
+        if future in waiters:
+            waiters.remove(future)
+        if len(waiters) == 0:
+            JBoxLaunchStatus.WAITERS.pop(sessname, None)
@@ -19,6 +19,8 @@ class JBoxAsyncJob(LoggerMixin):
     CMD_RECORD_PERF_COUNTERS = 8
     CMD_PLUGIN_MAINTENANCE = 9
     CMD_PLUGIN_TASK = 10
+    # scheduled internally by the container manager
+    CMD_REFILL_WARM_POOL = 11
 
     CMD_REQ_RESP = 50
     CMD_SESSION_STATUS = 51
@@ -0,0 +1,122 @@
+import threading
+import time
+import Queue
+
+from jbox_util import LoggerMixin, JBoxCfg
+
+
+class JBoxWorkerPool(LoggerMixin):
+    """ A bounded pool of worker threads fed from a FIFO queue.
+
+    Container manager commands are classified into pools so that a burst of one kind of task (e.g. backups) can not
+    starve another (e.g. session launches). Each pool keeps track of its queue depth and the time tasks spend waiting
+    in the queue before being picked up.
+    """
+
+    POOL_LAUNCH = 'launch'
+    POOL_BACKUP = 'backup'
+    POOL_MAINTENANCE = 'maintenance'
+    POOL_CONTROL = 'control'
+
+    DEFAULT_SIZES = {
+        POOL_LAUNCH: 10,
+        POOL_BACKUP: 3,
+        POOL_MAINTENANCE: 4,
+        POOL_CONTROL: 2
+    }
+
+    # weight of the most recent sample in the moving average of wait times
+    WAIT_WT = 0.25
+
+    POOLS = dict()
+
+    def __init__(self, name, num_workers):
+        self.name = name
+        self.num_workers = max(1, int(num_workers))
+        self.queue = Queue.Queue()
+        self.lock = threading.Lock()
+        self.num_busy = 0
+        self.num_done = 0
+        self.mean_wait = 0.0
+        self.max_wait = 0.0
+        self.workers = []
+        for idx in range(0, self.num_workers):
+            t = threading.Thread(target=self._run, name=self._idle_name(idx))
+            t.daemon = True
+            self.workers.append(t)
+            t.start()
+        self.log_info("Created %s", self.debug_str())
+
+    def _idle_name(self, idx):
+        return "jbox_worker_%s_%d" % (self.name, idx)
+
+    def debug_str(self):
+        return "JBoxWorkerPool %s. workers: %d, busy: %d, queued: %d, mean wait: %g secs" % \
+               (self.name, self.num_workers, self.num_busy, self.queue.qsize(), self.mean_wait)
+
+    @staticmethod
+    def configure():
+        sizes = JBoxCfg.get('jboxd.workers', dict())
+        for name, dflt_size in JBoxWorkerPool.DEFAULT_SIZES.iteritems():
+            if name not in JBoxWorkerPool.POOLS:
+                JBoxWorkerPool.POOLS[name] = JBoxWorkerPool(name, sizes.get(name, dflt_size))
+
+    @staticmethod
+    def get_pool(name):
+        return JBoxWorkerPool.POOLS[name]
+
+    @staticmethod
+    def submit(name, task_name, target, args):
+        """ Queue `target(*args)` for execution on the named pool.
+
+        While the task is running, the name of the worker thread is set to `task_name`, so that the task can identify
+        itself with `threading.current_thread().name`.
+        """
+        pool = JBoxWorkerPool.get_pool(name)
+        pool.queue.put((task_name, target, args, time.time()))
+        pool.log_debug("queued %s on %s", task_name, pool.debug_str())
+
+    def _record_wait(self, wait_secs):
+        with self.lock:
+            self.num_busy += 1
+            self.mean_wait = (JBoxWorkerPool.WAIT_WT * wait_secs) + ((1 - JBoxWorkerPool.WAIT_WT) * self.mean_wait)
+            self.max_wait = max(self.max_wait, wait_secs)
+
+    def _record_done(self):
+        with self.lock:
+            self.num_busy -= 1
+            self.num_done += 1
+
+    def _run(self):
+        this_thread = threading.current_thread()
+        idle_name = this_thread.name
+        while True:
+            task_name, target, args, queued_at = self.queue.get()
+            self._record_wait(time.time() - queued_at)
+            this_thread.name = task_name
+            try:
+                target(*args)
+            except:
+                self.log_exception("Exception running %s on pool %s", task_name, self.name)
+            finally:
+                this_thread.name = idle_name
+                self._record_done()
+                self.queue.task_done()
+
+    def get_stats(self, reset_max=True):
+        with self.lock:
+            stats = {
+                'workers': self.num_workers,
+                'busy': self.num_busy,
+                'queued': self.queue.qsize(),
+                'done': self.num_done,
+                'mean_wait': self.mean_wait,
+                'max_wait': self.max_wait
+            }
+            if reset_max:
+                self.max_wait = 0.0
+        return stats
+
+    @staticmethod
+    def get_all_stats(reset_max=True):
+        return dict((name, pool.get_stats(reset_max=reset_max)) for name, pool in JBoxWorkerPool.POOLS.iteritems())
@@ -1,8 +1,12 @@
 __author__ = 'tan'
 import os
 
+import tornado.web
+import tornado.gen
+
 from juliabox.handlers import JBPluginHandler, JBPluginUI
 from juliabox.jbox_util import JBoxCfg
+from juliabox.jbox_async_service import JBoxAsyncService
 from juliabox.db import JBoxUserV2, JBoxAPISpec, JBoxDBItemNotFound
 
 
@@ -46,6 +50,8 @@ class APIAdminHandler(JBPluginHandler):
     def get(self):
         return self.post()
 
+    @tornado.web.asynchronous
+    @tornado.gen.coroutine
     def post(self):
         self.log_debug("API management handler got POST request")
         sessname = self.get_session_id()
@@ -55,40 +61,56 @@ class APIAdminHandler(JBPluginHandler):
             self.send_error()
             return
 
-        user = JBoxUserV2(user_id)
-        is_admin = sessname in JBoxCfg.get("admin_sessnames", []) or user.has_role(JBoxUserV2.ROLE_SUPER)
+        is_super, is_publisher = yield JBoxAsyncService.run('db.get_api_user_roles', APIAdminHandler.get_user_roles,
+                                                            user_id)
+        is_admin = sessname in JBoxCfg.get("admin_sessnames", []) or is_super
         self.log_info("API manager. user_id[%s] is_admin[%r]", user_id, is_admin)
 
-        if user.has_resource_profile(JBoxUserV2.RES_PROF_API_PUBLISHER):
-            if self.handle_get_api_info(user_id, is_admin):
+        if is_publisher:
+            handled = yield self.handle_get_api_info(user_id, is_admin)
+            if handled:
                 return
-            if self.handle_create_api(user_id, is_admin):
+            handled = yield self.handle_create_api(user_id, is_admin)
+            if handled:
                 return
-            if self.handle_delete_api(user_id, is_admin):
+            handled = yield self.handle_delete_api(user_id, is_admin)
+            if handled:
                 return
         else:
-            if self.handle_enable_api(user_id, is_admin):
+            handled = yield self.handle_enable_api(user_id, is_admin)
+            if handled:
                 return
 
         self.log_error("no handlers found")
         # only AJAX requests responded to
         self.send_error()
 
-    def handle_enable_api(self, user_id, is_admin):
-        mode = self.get_argument('mode', None)
-        if (mode is None) or (mode != "enable"):
-            return False
+    @staticmethod
+    def get_user_roles(user_id):
+        user = JBoxUserV2(user_id)
+        return user.has_role(JBoxUserV2.ROLE_SUPER), user.has_resource_profile(JBoxUserV2.RES_PROF_API_PUBLISHER)
+
+    @staticmethod
+    def enable_api(user_id):
         user = JBoxUserV2(user_id)
         user.set_resource_profile(JBoxUserV2.RES_PROF_API_PUBLISHER)
         user.save()
+
+    @tornado.gen.coroutine
+    def handle_enable_api(self, user_id, is_admin):
+        mode = self.get_argument('mode', None)
+        if (mode is None) or (mode != "enable"):
+            raise tornado.gen.Return(False)
+        yield JBoxAsyncService.run('db.enable_api', APIAdminHandler.enable_api, user_id)
         response = {'code': 0, 'data': ''}
         self.write(response)
-        return True
+        raise tornado.gen.Return(True)
 
+    @tornado.gen.coroutine
     def handle_get_api_info(self, user_id, is_admin):
         mode = self.get_argument('mode', None)
         if (mode is None) or (mode != "info"):
-            return False
+            raise tornado.gen.Return(False)
 
         publisher = user_id
         api_name = None
@@ -96,46 +118,62 @@ class APIAdminHandler(JBPluginHandler):
             publisher = self.get_argument('publisher', user_id)
             api_name = self.get_argument('api_name', None)
 
-        apiinfo = JBoxAPISpec.get_api_info(publisher, api_name)
+        apiinfo = yield JBoxAsyncService.run('db.get_api_info', JBoxAPISpec.get_api_info, publisher, api_name)
         response = {'code': 0, 'data': apiinfo}
         self.write(response)
-        return True
+        raise tornado.gen.Return(True)
+
+    @staticmethod
+    def delete_api(api_name, publisher):
+        try:
+            api = JBoxAPISpec(api_name=api_name)
+            if api.get_publisher() != publisher:
+                return {'code': -1, 'data': 'No delete permission on this API'}
+            api.delete()
+            return {'code': 0, 'data': 'API ' + api_name + ' was deleted'}
+        except JBoxDBItemNotFound:
+            return {'code': 1, 'data': 'No such API - ' + api_name}
 
+    @tornado.gen.coroutine
     def handle_delete_api(self, user_id, is_admin):
         mode = self.get_argument('mode', None)
         if (mode is None) or (mode != "delete"):
-            return False
+            raise tornado.gen.Return(False)
 
         api_name = self.get_argument('api_name', None)
         if api_name is None:
             self.log_error("missing api_name")
             self.send_error()
-            return True
+            raise tornado.gen.Return(True)
 
         publisher = user_id
         if is_admin:
             publisher = self.get_argument('publisher', publisher)
 
-        try:
-            api = JBoxAPISpec(api_name=api_name)
-            if api.get_publisher() != publisher:
-                response = {'code': -1, 'data': 'No delete permission on this API'}
-                self.write(response)
-                return True
-            api.delete()
+        response = yield JBoxAsyncService.run('db.delete_api', APIAdminHandler.delete_api, api_name, publisher)
+        self.write(response)
+        raise tornado.gen.Return(True)
 
-            response = {'code': 0, 'data': 'API ' + api_name + ' was deleted'}
-            self.write(response)
-            return True
+    @staticmethod
+    def create_api(api_name, cmd, description, publisher, min_idle):
+        try:
+            JBoxAPISpec(api_name=api_name)
+            return {'code': -1, 'data': 'API already exists'}
         except JBoxDBItemNotFound:
-            response = {'code': 1, 'data': 'No such API - ' + api_name}
-            self.write(response)
-            return True
+            pass
+
+        api = JBoxAPISpec(api_name, cmd=cmd, description=description, publisher=publisher, min_idle=min_idle,
+                          create=True)
+        if api.get_publisher() != publisher:
+            # API got created by someone else!
+            return {'code': -1, 'data': 'API already exists'}
+        return {'code': 0, 'data': ''}
 
+    @tornado.gen.coroutine
     def handle_create_api(self, user_id, is_admin):
         mode = self.get_argument('mode', None)
         if (mode is None) or (mode != "create"):
-            return False
+            raise tornado.gen.Return(False)
 
         api_name = self.get_argument('api_name', '', strip=True)
         cmd = self.get_argument('cmd', '', strip=True)
@@ -145,32 +183,30 @@ class APIAdminHandler(JBPluginHandler):
                 self.log_error("mandatory parameters missing")
                 response = {'code': -1, 'data': 'manadatory attributes missing'}
                 self.write(response)
-                return True
+                raise tornado.gen.Return(True)
         if len(api_name) > 32 or len(cmd) > 512 or len(description) > 512:
             self.log_error("api specification fields too large")
             response = {'code': -1, 'data': 'API specification fields too large'}
             self.write(response)
-            return True
+            raise tornado.gen.Return(True)
 
         publisher = user_id
+        min_idle = None
         if is_admin:
             publisher = self.get_argument('publisher', publisher, strip=True)
-
-        try:
-            JBoxAPISpec(api_name=api_name)
-            response = {'code': -1, 'data': 'API already exists'}
-            self.write(response)
-            return True
-        except JBoxDBItemNotFound:
-            pass
-
-        api = JBoxAPISpec(api_name, cmd=cmd, description=description, publisher=publisher, create=True)
-        if api.get_publisher() != publisher:
-            # API got created by someone else!
-            response = {'code': -1, 'data': 'API already exists'}
-            self.write(response)
-            return True
-
-        response = {'code': 0, 'data': ''}
+            # containers kept started for the API take up capacity, so only admins can ask for them
+            min_idle = self.get_argument('min_idle', '', strip=True)
+            if len(min_idle) == 0:
+                min_idle = None
+            else:
+                try:
+                    min_idle = max(int(min_idle), 0)
+                except ValueError:
+                    response = {'code': -1, 'data': 'min_idle must be a number'}
+                    self.write(response)
+                    raise tornado.gen.Return(True)
+
+        response = yield JBoxAsyncService.run('db.create_api', APIAdminHandler.create_api, api_name, cmd, description,
+                                              publisher, min_idle)
         self.write(response)
-        return True
\ No newline at end of file
+        raise tornado.gen.Return(True)
\ No newline at end of file
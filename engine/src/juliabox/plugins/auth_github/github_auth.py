@@ -12,6 +12,7 @@ import tornado.httputil
 from tornado.auth import OAuth2Mixin, _auth_return_future, AuthError
 
 from juliabox.jbox_util import JBoxCfg, gen_random_secret
+from juliabox.jbox_async_service import JBoxAsyncService
 from juliabox.handlers import JBPluginHandler, JBPluginUI
 from juliabox.db import JBoxUserProfile
 
@@ -100,12 +101,12 @@ class GitHubAuthHandler(JBPluginHandler, OAuth2Mixin):
                     return
 
             try:
-                self.update_user_profile(user_id, user_info)
+                yield JBoxAsyncService.run('db.update_user_profile', self.update_user_profile, user_id, user_info)
             except:
                 self.log_error("exception while capturing user profile")
                 traceback.print_exc()
             GitHubAuthHandler.log_debug("logging in user_id=%r", user_id)
-            self.post_auth_launch_container(user_id)
+            yield self.post_auth_launch_container(user_id)
             return
         else:
             state = gen_random_secret()
@@ -6,7 +6,6 @@ import httplib2
 import traceback
 import functools
 import urllib
-import time
 
 import tornado
 import tornado.web
@@ -17,6 +16,7 @@ from oauth2client import GOOGLE_REVOKE_URI, GOOGLE_TOKEN_URI
 from oauth2client.client import OAuth2Credentials, _extract_id_token
 
 from juliabox.jbox_util import JBoxCfg, gen_random_secret
+from juliabox.jbox_async_service import JBoxAsyncService
 from juliabox.handlers import JBPluginHandler, JBPluginUI
 from juliabox.db import JBoxUserV2, JBoxUserProfile
 
@@ -128,7 +128,7 @@ class GoogleAuthHandler(JBPluginHandler, OAuth2Mixin):
                     if tries >= 2:
                         traceback.print_exc()
                         break
-                    time.sleep(2 ** tries)
+                    yield tornado.gen.sleep(2 ** tries)
                     tries += 1
 
             if not user_info:
@@ -137,7 +137,7 @@ class GoogleAuthHandler(JBPluginHandler, OAuth2Mixin):
                     success=""))
                 return
             try:
-                self.update_user_profile(user_info)
+                yield JBoxAsyncService.run('db.update_user_profile', self.update_user_profile, user_info)
             except:
                 self.log_error("exception while capturing user profile")
                 traceback.print_exc()
@@ -146,10 +146,10 @@ class GoogleAuthHandler(JBPluginHandler, OAuth2Mixin):
             if task == 'store_creds':
                 creds = self.make_credentials(user)
                 credtok = creds.to_json()
-                self.post_auth_store_credentials(user_id, "gdrive", credtok)
+                yield self.post_auth_store_credentials(user_id, "gdrive", credtok)
                 return
             else:
-                self.post_auth_launch_container(user_id)
+                yield self.post_auth_launch_container(user_id)
                 return
         else:
             secret = gen_random_secret()
@@ -12,6 +12,7 @@ import tornado.httputil
 from tornado.auth import OAuth2Mixin, _auth_return_future, AuthError
 
 from juliabox.jbox_util import JBoxCfg, gen_random_secret
+from juliabox.jbox_async_service import JBoxAsyncService
 from juliabox.handlers import JBPluginHandler, JBPluginUI
 from juliabox.db import JBoxUserProfile
 
@@ -76,13 +77,13 @@ class LinkedInAuthHandler(JBPluginHandler, OAuth2Mixin):
             user = yield self.get_authenticated_user(redirect_uri=self_redirect_uri, code=code)
             user_info = yield self.get_user_info(user)
             try:
-                self.update_user_profile(user_info)
+                yield JBoxAsyncService.run('db.update_user_profile', self.update_user_profile, user_info)
             except:
                 self.log_error("exception while capturing user profile")
                 traceback.print_exc()
             user_id = user_info['emailAddress']
             LinkedInAuthHandler.log_debug("logging in user_id=%r", user_id)
-            self.post_auth_launch_container(user_id)
+            yield self.post_auth_launch_container(user_id)
             return
         else:
             error = self.get_argument('error', False)
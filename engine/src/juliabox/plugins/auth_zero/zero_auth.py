@@ -41,7 +41,7 @@ class ZeroAuthHandler(JBPluginHandler):
         user_id = unquote(self.get_argument("user_id"))
 
         if len(user_id) > 0:
-            self.post_auth_launch_container(user_id)
+            yield self.post_auth_launch_container(user_id)
         else:
             self.rendertpl("index.tpl", cfg=JBoxCfg.nv, state=self.state(
                 error="Please provide an email Id to login with.", success=''))
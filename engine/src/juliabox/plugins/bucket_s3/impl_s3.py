@@ -3,6 +3,7 @@ __author__ = 'tan'
 import os
 import boto
 from boto.s3.key import Key
+from cStringIO import StringIO
 
 from juliabox.cloud import JBPluginCloud
 
@@ -11,6 +12,8 @@ class JBoxS3(JBPluginCloud):
     provides = [JBPluginCloud.JBP_BUCKETSTORE, JBPluginCloud.JBP_BUCKETSTORE_S3]
     CONN = None
     BUCKETS = dict()
+    # S3 requires all parts except the last to be at least 5MB
+    PART_SIZE = 16 * 1024 * 1024
 
     @staticmethod
     def connect():
@@ -35,6 +38,26 @@ class JBoxS3(JBPluginCloud):
         k.set_contents_from_filename(local_file)
         return k
 
+    @staticmethod
+    def push_stream(bucket, key_name, fileobj, metadata=None):
+        """ Upload data read from fileobj till EOF as a multipart upload, without knowing the size beforehand. """
+        mp = JBoxS3.connect_bucket(bucket).initiate_multipart_upload(key_name, metadata=metadata)
+        try:
+            part_num = 0
+            while True:
+                part = fileobj.read(JBoxS3.PART_SIZE)
+                if (len(part) == 0) and (part_num > 0):
+                    break
+                part_num += 1
+                mp.upload_part_from_file(StringIO(part), part_num)
+                if len(part) < JBoxS3.PART_SIZE:
+                    break
+            mp.complete_upload()
+        except:
+            mp.cancel_upload()
+            raise
+        return JBoxS3.connect_bucket(bucket).get_key(key_name)
+
     @staticmethod
     def pull(bucket, local_file, metadata_only=False):
         key_name = os.path.basename(local_file)
@@ -43,6 +66,14 @@ class JBoxS3(JBPluginCloud):
             k.get_contents_to_filename(local_file)
         return k
 
+    @staticmethod
+    def pull_stream(bucket, key_name):
+        """ Open key_name for reading without downloading it to a local file. Returns None if it does not exist. """
+        k = JBoxS3.connect_bucket(bucket).get_key(key_name)
+        if k is not None:
+            k.open_read()
+        return k
+
     @staticmethod
     def delete(bucket, local_file):
         key_name = os.path.basename(local_file)
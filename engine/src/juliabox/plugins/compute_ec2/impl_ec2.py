@@ -7,7 +7,7 @@ import boto.ec2
 import boto.ec2.cloudwatch
 import boto.ec2.autoscale
 
-from juliabox.cloud import JBPluginCloud, Compute
+from juliabox.cloud import JBPluginCloud, Compute, JBoxClusterSnapshot, JBoxMetrics
 from juliabox.jbox_util import JBoxCfg, parse_iso_time, retry
 from juliabox.db import JBoxInstanceProps
 
@@ -39,6 +39,8 @@ class CompEC2(JBPluginCloud):
     PUBLIC_IP = None
 
     SELF_STATS = dict()
+    # cloudwatch limit on metrics in one put_metric_data request
+    MAX_METRICS_PER_PUT = 20
 
     @staticmethod
     def configure():
@@ -48,6 +50,8 @@ class CompEC2(JBPluginCloud):
 
         CompEC2.INSTALL_ID = JBoxCfg.get('cloud_host.install_id', 'JuliaBox')
         CompEC2.REGION = JBoxCfg.get('cloud_host.region', 'us-east-1')
+        JBoxClusterSnapshot.configure(CompEC2._fetch_cluster_state)
+        JBoxMetrics.configure(CompEC2.publish_stats_batch)
 
     @staticmethod
     def get_install_id():
@@ -119,17 +123,35 @@ class CompEC2(JBPluginCloud):
     @staticmethod
     def publish_stats(stat_name, stat_unit, stat_value):
         """ Publish custom cloudwatch statistics. Used for status monitoring and auto scaling. """
-        CompEC2.SELF_STATS[stat_name] = stat_value
-        dims = {'InstanceID': CompEC2.get_instance_id()}
-        CompEC2.log_info("CloudWatch %s.%s.%s=%r(%s)", CompEC2.INSTALL_ID, CompEC2.get_instance_id(),
-                         stat_name, stat_value, stat_unit)
-        CompEC2._connect_cloudwatch().put_metric_data(namespace=CompEC2.INSTALL_ID, name=stat_name,
-                                                      unit=stat_unit, value=stat_value, dimensions=dims)
+        CompEC2.publish_stats_multi([(stat_name, stat_unit, stat_value)])
 
     @staticmethod
     def publish_stats_multi(stats):
+        """ Stats are cached for use here right away, and sent to cloudwatch in batches by JBoxMetrics. """
         for (stat_name, stat_unit, stat_value) in stats:
-            CompEC2.publish_stats(stat_name, stat_unit, stat_value)
+            CompEC2.SELF_STATS[stat_name] = stat_value
+            CompEC2.log_info("CloudWatch %s.%s.%s=%r(%s)", CompEC2.INSTALL_ID, CompEC2.get_instance_id(),
+                             stat_name, stat_value, stat_unit)
+        JBoxMetrics.record(stats)
+
+    @staticmethod
+    def publish_stats_batch(aggregates):
+        """ Sink for JBoxMetrics. Sends aggregates as statistic sets, as many per request as cloudwatch allows. """
+        dims = {'InstanceID': CompEC2.get_instance_id()}
+        conn = CompEC2._connect_cloudwatch()
+        for idx in range(0, len(aggregates), CompEC2.MAX_METRICS_PER_PUT):
+            batch = aggregates[idx:(idx + CompEC2.MAX_METRICS_PER_PUT)]
+            conn.put_metric_data(namespace=CompEC2.INSTALL_ID,
+                                 name=[agg['name'] for agg in batch],
+                                 unit=[agg['unit'] for agg in batch],
+                                 timestamp=[agg['timestamp'] for agg in batch],
+                                 statistics=[{
+                                     'maximum': agg['max'],
+                                     'minimum': agg['min'],
+                                     'samplecount': agg['count'],
+                                     'sum': agg['sum']
+                                 } for agg in batch],
+                                 dimensions=dims)
 
     @staticmethod
     def get_instance_stats(instance, stat_name, namespace=None):
@@ -245,8 +267,8 @@ class CompEC2(JBPluginCloud):
 
     @staticmethod
     def get_redirect_instance_id():
-        cluster_load = CompEC2.get_cluster_stats('Load')
-        cluster_load = {k: v for k, v in cluster_load.iteritems() if CompEC2.get_image_recentness(k) >= 0}
+        cluster = JBoxClusterSnapshot.get()
+        cluster_load = {k: v for k, v in cluster['loads'].iteritems() if cluster['recentness'].get(k, 0) >= 0}
         avg_load = CompEC2.get_cluster_average_stats('Load', results=cluster_load)
 
         if avg_load >= 50:
@@ -275,19 +297,26 @@ class CompEC2(JBPluginCloud):
     @staticmethod
     def should_accept_session(is_leader):
         self_instance_id = CompEC2.get_instance_id()
-        self_load = CompEC2.get_instance_stats(self_instance_id, 'Load')
+        cluster = JBoxClusterSnapshot.get()
+        recentness = cluster['recentness']
+
+        # own load as last published by this process, else as last fetched from the cluster
+        if 'Load' in CompEC2.SELF_STATS:
+            self_load = CompEC2.SELF_STATS['Load']
+        else:
+            self_load = cluster['loads'].get(self_instance_id, None)
+            if self_load is None:
+                self_load = CompEC2.get_instance_stats(self_instance_id, 'Load')
         CompEC2.log_debug("Self load: %r", self_load)
 
-        cluster_load = CompEC2.get_cluster_stats('Load')
+        cluster_load = dict(cluster['loads'])
         CompEC2.log_debug("Cluster load: %r", cluster_load)
 
-        # add self to cluster if not yet registered in cluster stats
-        if self_instance_id not in cluster_load.keys():
-            cluster_load[self_instance_id] = self_load
+        # use own latest load, and add self to cluster if not yet registered in cluster state
+        cluster_load[self_instance_id] = self_load
 
         # remove machines with older AMIs
-        cluster_load = {k: v for k, v in cluster_load.iteritems()
-                        if CompEC2.get_image_recentness(k) >= 0 and v is not None}
+        cluster_load = {k: v for k, v in cluster_load.iteritems() if recentness.get(k, 0) >= 0 and v is not None}
         CompEC2.log_debug("Cluster load (excluding old amis): %r", cluster_load)
 
         avg_load = CompEC2.get_cluster_average_stats('Load', results=cluster_load)
@@ -302,7 +331,7 @@ class CompEC2(JBPluginCloud):
             return False
 
         # handle ami switchover. newer AMIs always accept, older AMIs always reject
-        ami_recentness = CompEC2.get_image_recentness()
+        ami_recentness = recentness.get(self_instance_id, 0)
         CompEC2.log_debug("AMI recentness = %d", ami_recentness)
         if ami_recentness > 0:
             CompEC2.log_debug("Accepting: more recent AMI")
@@ -448,16 +477,16 @@ class CompEC2(JBPluginCloud):
         instances = CompEC2.get_all_instances()
         if instances is None:
             return 0
-        max_ami_ver = 0
-        min_ami_ver = sys.maxint
-        for inst in instances:
-            ami_ver = CompEC2._image_version(inst)
-            max_ami_ver = max(max_ami_ver, ami_ver)
-            min_ami_ver = min(min_ami_ver, ami_ver)
+        ami_vers = [CompEC2._image_version(inst) for inst in instances]
 
         if instance is None:
             instance = CompEC2.get_instance_id()
-        self_ami_ver = CompEC2._image_version(instance)
+        return CompEC2._image_recentness(instance, CompEC2._image_version(instance), ami_vers)
+
+    @staticmethod
+    def _image_recentness(instance, self_ami_ver, ami_vers):
+        max_ami_ver = max([0] + ami_vers)
+        min_ami_ver = min([sys.maxint] + ami_vers)
         CompEC2.log_debug("ami versions: max: %d, min: %d, self(%s):%d", max_ami_ver, min_ami_ver,
                           instance, self_ami_ver)
         if self_ami_ver == 0:
@@ -469,6 +498,46 @@ class CompEC2(JBPluginCloud):
         else:
             return 0
 
+    @staticmethod
+    def _fetch_cluster_state():
+        """ Loads, published state and image recentness of instances in the cluster, for JBoxClusterSnapshot.
+
+        Loads and state are those published by the instances to JBoxInstanceProps, read in one scan instead of a
+        CloudWatch query per instance. Image versions are cached once known, so only new instances need EC2 lookups.
+        """
+        instances = CompEC2.get_all_instances()
+        ami_vers = dict((inst, CompEC2._image_version(inst)) for inst in instances)
+        recentness = dict((inst, CompEC2._image_recentness(inst, ver, ami_vers.values()))
+                          for (inst, ver) in ami_vers.iteritems())
+
+        status = JBoxInstanceProps.get_instance_status(CompEC2.INSTALL_ID)
+        status = dict((inst, props) for (inst, props) in status.iteritems() if inst in ami_vers)
+        loads = dict((inst, props['load']) for (inst, props) in status.iteritems())
+        return {
+            'loads': loads,
+            'status': status,
+            'recentness': recentness
+        }
+
+    @staticmethod
+    def get_placement_candidates():
+        self_instance_id = CompEC2.get_instance_id()
+        cluster = JBoxClusterSnapshot.get()
+        candidates = dict()
+        for (inst, props) in cluster['status'].iteritems():
+            candidates[inst] = dict(props, recentness=cluster['recentness'].get(inst, 0))
+
+        # own state may not be published yet, and own load is known better here
+        self_props = candidates.setdefault(self_instance_id, {
+            'accept': True,
+            'recentness': cluster['recentness'].get(self_instance_id, 0)
+        })
+        self_load = CompEC2.SELF_STATS.get('Load', self_props.get('load', None))
+        if self_load is None:
+            self_load = CompEC2.get_instance_stats(self_instance_id, 'Load')
+        self_props['load'] = self_load if self_load is not None else 0
+        return candidates
+
     @staticmethod
     def _state_check(obj, state):
         obj.update()
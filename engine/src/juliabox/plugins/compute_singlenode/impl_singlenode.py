@@ -2,7 +2,7 @@ __author__ = 'tan'
 
 import socket
 
-from juliabox.cloud import JBPluginCloud
+from juliabox.cloud import JBPluginCloud, JBoxMetrics
 from juliabox.jbox_util import JBoxCfg
 from juliabox.db import JBoxInstanceProps
 
@@ -22,6 +22,8 @@ class CompSingleNode(JBPluginCloud):
     @staticmethod
     def configure():
         CompSingleNode.INSTALL_ID = JBoxCfg.get('cloud_host.install_id', 'JuliaBox')
+        # there is no cloud sink, but stats can be sent to a file sink
+        JBoxMetrics.configure()
 
     @staticmethod
     def get_install_id():
@@ -80,6 +82,7 @@ class CompSingleNode(JBPluginCloud):
         CompSingleNode.log_info("Stats: %s.%s.%s=%r(%s)",
                                 CompSingleNode.INSTALL_ID, CompSingleNode.get_instance_id(),
                                 stat_name, stat_value, stat_unit)
+        JBoxMetrics.record([(stat_name, stat_unit, stat_value)])
 
     @staticmethod
     def publish_stats_multi(stats):
@@ -4,8 +4,12 @@ import pytz
 import json
 import traceback
 
+import tornado.web
+import tornado.gen
+
 from juliabox.cloud import Compute
 from juliabox.jbox_util import JBoxCfg
+from juliabox.jbox_async_service import JBoxAsyncService
 from juliabox.handlers import JBPluginHandler
 from juliabox.interactive import SessContainer
 from juliabox.db import JBoxUserV2, JBoxDynConfig
@@ -27,6 +31,8 @@ class HomeworkHandler(JBPluginHandler):
         self.log_debug("Homework handler got GET request")
         return self.post()
 
+    @tornado.web.asynchronous
+    @tornado.gen.coroutine
     def post(self):
         self.log_debug("Homework handler got POST request")
         sessname = self.get_session_id()
@@ -36,41 +42,51 @@ class HomeworkHandler(JBPluginHandler):
             self.send_error()
             return
 
-        user = JBoxUserV2(user_id)
-        is_admin = sessname in JBoxCfg.get("admin_sessnames", []) or user.has_role(JBoxUserV2.ROLE_SUPER)
-        course_owner = is_admin or user.has_role(JBoxUserV2.ROLE_OFFER_COURSES)
-        cont = SessContainer.get_by_name(sessname)
+        is_admin, course_owner, courses_offered, cont_found = yield JBoxAsyncService.run(
+            'db.get_course_user', HomeworkHandler.get_course_user, sessname, user_id)
         self.log_info("user_id[%r], is_admin[%r], course_owner[%r]", user_id, is_admin, course_owner)
 
-        if cont is None:
+        if not cont_found:
             self.log_info("user_id[%r] container not found", user_id)
             self.send_error()
             return
 
-        courses_offered = user.get_courses_offered()
-
-        if self.handle_if_check(user_id):
+        handled = yield self.handle_if_check(user_id)
+        if handled:
             return
-        if self.handle_create_course(user_id):
+        handled = yield self.handle_create_course(user_id)
+        if handled:
             return
-        if self.handle_get_metadata(is_admin, courses_offered):
+        handled = yield self.handle_get_metadata(is_admin, courses_offered)
+        if handled:
             return
-        if self.handle_if_report(user_id, is_admin, courses_offered):
+        handled = yield self.handle_if_report(user_id, is_admin, courses_offered)
+        if handled:
             return
 
         self.log_error("no handlers found")
         # only AJAX requests responded to
         self.send_error()
 
+    @staticmethod
+    def get_course_user(sessname, user_id):
+        """ Roles and courses of the user, and whether the session container exists. """
+        user = JBoxUserV2(user_id)
+        is_admin = sessname in JBoxCfg.get("admin_sessnames", []) or user.has_role(JBoxUserV2.ROLE_SUPER)
+        course_owner = is_admin or user.has_role(JBoxUserV2.ROLE_OFFER_COURSES)
+        cont = SessContainer.get_by_name(sessname)
+        return is_admin, course_owner, user.get_courses_offered(), (cont is not None)
+
     #
     # verify against correct answer
     # if not already answered correctly or mode is submit, update scores and store last submitted answer
     # update attempts if not already answered correctly
     # return valid/invalid, score, last correct answer
+    @tornado.gen.coroutine
     def handle_if_check(self, user_id):
         mode = self.get_argument('mode', None)
         if (mode is None) or ((mode != "check") and (mode != "submit")):
-            return False
+            raise tornado.gen.Return(False)
         self.log_debug("handling check")
         params = self.get_argument('params', None)
         if params is None:
@@ -87,8 +103,8 @@ class HomeworkHandler(JBPluginHandler):
 
         record = (mode == "submit")
 
-        status, score, used_attempts, max_score, max_attempts, explanation = \
-            JBoxCourseHomework.check_answer(course, problemset, question, user_id, answer, record)
+        status, score, used_attempts, max_score, max_attempts, explanation = yield JBoxAsyncService.run(
+            'db.check_answer', JBoxCourseHomework.check_answer, course, problemset, question, user_id, answer, record)
         response = {
             'code': 0,
             'data': {
@@ -101,12 +117,13 @@ class HomeworkHandler(JBPluginHandler):
             }
         }
         self.write(response)
-        return True
+        raise tornado.gen.Return(True)
 
+    @tornado.gen.coroutine
     def handle_if_report(self, user_id, is_admin, courses_offered):
         mode = self.get_argument('mode', None)
         if (mode is None) or ((mode != "report") and (mode != "myreport")):
-            return False
+            raise tornado.gen.Return(False)
 
         self.log_debug("handling report")
         params = self.get_argument('params', None)
@@ -128,14 +145,16 @@ class HomeworkHandler(JBPluginHandler):
                 err = "Course %s not found!" % (course_id,)
 
         if err is None:
-            course = JBoxDynConfig.get_course(Compute.get_install_id(), course_id)
+            course = yield JBoxAsyncService.run('db.get_course', JBoxDynConfig.get_course, Compute.get_install_id(),
+                                                course_id)
             if problemset_id not in course['problemsets']:
                 err = "Problem set %s not found!" % (problemset_id,)
             elif question_ids is None:
                 question_ids = course['questions'][problemset_id]
 
         if err is None:
-            report = JBoxCourseHomework.get_report(course_id, problemset_id, question_ids, student_id=student_id)
+            report = yield JBoxAsyncService.run('db.get_report', JBoxCourseHomework.get_report, course_id,
+                                                problemset_id, question_ids, student_id=student_id)
             code = 0
         else:
             report = err
@@ -143,12 +162,13 @@ class HomeworkHandler(JBPluginHandler):
 
         response = {'code': code, 'data': report}
         self.write(response)
-        return True
+        raise tornado.gen.Return(True)
 
+    @tornado.gen.coroutine
     def handle_get_metadata(self, is_admin, courses_offered):
         mode = self.get_argument('mode', None)
         if (mode is None) or (mode != "metadata"):
-            return False
+            raise tornado.gen.Return(False)
 
         self.log_debug("handling answers")
         params = self.get_argument('params', None)
@@ -162,7 +182,8 @@ class HomeworkHandler(JBPluginHandler):
             send_answers = False
 
         err = None
-        course = JBoxDynConfig.get_course(Compute.get_install_id(), course_id)
+        course = yield JBoxAsyncService.run('db.get_course', JBoxDynConfig.get_course, Compute.get_install_id(),
+                                            course_id)
         self.log_debug("got course %r", course)
         if problemset_id not in course['problemsets']:
             err = "Problem set %s not found!" % (problemset_id,)
@@ -170,7 +191,9 @@ class HomeworkHandler(JBPluginHandler):
             question_ids = course['questions'][problemset_id]
 
         if err is None:
-            report = JBoxCourseHomework.get_problemset_metadata(course_id, problemset_id, question_ids, send_answers)
+            report = yield JBoxAsyncService.run('db.get_problemset_metadata',
+                                                JBoxCourseHomework.get_problemset_metadata,
+                                                course_id, problemset_id, question_ids, send_answers)
             code = 0
         else:
             report = err
@@ -178,7 +201,7 @@ class HomeworkHandler(JBPluginHandler):
 
         response = {'code': code, 'data': report}
         self.write(response)
-        return True
+        raise tornado.gen.Return(True)
 
     @staticmethod
     def upload_course(user_id, course):
@@ -258,17 +281,18 @@ class HomeworkHandler(JBPluginHandler):
 
         return 0
 
+    @tornado.gen.coroutine
     def handle_create_course(self, user_id):
         mode = self.get_argument('mode', None)
         if (mode is None) or (mode != 'create'):
-            return False
+            raise tornado.gen.Return(False)
 
         self.log_debug("handling create course")
 
         try:
             course = self.get_argument('params', None)
             course = json.loads(course)
-            ret = HomeworkHandler.upload_course(user_id, course)
+            ret = yield JBoxAsyncService.run('db.upload_course', HomeworkHandler.upload_course, user_id, course)
             msg = '' if ret == 0 else 'Course id already used by another user. \
                 Please use a different course id or request the creator to add you as course administrator.'
         except:
@@ -280,4 +304,4 @@ class HomeworkHandler(JBPluginHandler):
             'data': msg
         }
         self.write(response)
-        return True
+        raise tornado.gen.Return(True)
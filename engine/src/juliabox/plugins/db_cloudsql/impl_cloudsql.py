@@ -1,11 +1,10 @@
 __author__ = 'Nishanth'
 
-import threading
 import MySQLdb
 import decimal
 import copy
 
-from juliabox.db import JBPluginDB, JBoxDBItemNotFound
+from juliabox.db import JBPluginDB, JBoxDBItemNotFound, JBoxDBConnPool
 from juliabox.jbox_util import JBoxCfg, LoggerMixin
 
 
@@ -20,13 +19,14 @@ class JBoxMySQLTable(LoggerMixin):
         'beginswith': (' like %%(%s)s', lambda x: x + '%'),
         'between': (' between %%(%s)s and %%(%s)s', lambda x: x)
     }
+    # records per statement in batch operations
+    BATCH_SZ = 200
 
     def __init__(self, table_name):
         self.name = '`' + table_name + '`'
         pragma_sql = 'show columns from %s' % (self.name,)
-        c = JBoxCloudSQL.execute(pragma_sql)
-        rows = c.fetchall()
-        pragma_cols = [spec[0] for spec in c.description]
+        description, rows = JBoxCloudSQL.execute(pragma_sql)
+        pragma_cols = [spec[0] for spec in description]
 
         columns = []
         pk = []
@@ -36,7 +36,6 @@ class JBoxMySQLTable(LoggerMixin):
             columns.append(colname)
             if rowdict['Key'] == 'PRI':
                 pk.append(colname)
-        c.close()
         self.columns = columns
         self.pk = pk
         params = []
@@ -47,14 +46,20 @@ class JBoxMySQLTable(LoggerMixin):
         self.insert_statement = "insert into " + self.name + \
                                 " (" + ", ".join(qcols) + ")" + \
                                 " values (" + ", ".join(params) + ")"
+        self.replace_statement = "replace" + self.insert_statement[len("insert"):]
+        # statements that do not vary with the records are built once
+        key_criteria = ' where ' + ' and '.join(["`%s` = %%(%s)s" % (keyname, keyname) for keyname in self.pk])
+        self.delete_statement = "delete from " + self.name + key_criteria
+        self.update_statement = "update " + self.name + " set " + \
+                                ", ".join(["`%s` = %%(%s)s" % (col, col) for col in columns if col not in pk]) + \
+                                key_criteria
 
     def insert(self, record_):
         record = copy.deepcopy(record_)
         for col in self.columns:
             if col not in record.keys():
                 record[col] = None
-        c = JBoxCloudSQL.execute(self.insert_statement, record)
-        c.close()
+        JBoxCloudSQL.execute(self.insert_statement, record)
 
     @staticmethod
     def _op(name, opstr, value, names, values):
@@ -100,88 +105,77 @@ class JBoxMySQLTable(LoggerMixin):
         stmt = 'select %s from %s%s%s' % (selattribs, self.name,
                                           use_index_sql, criteria)
         params = dict(zip(colnames, values))
-        c = JBoxCloudSQL.execute(stmt, params)
-        return c
+        return JBoxCloudSQL.execute(stmt, params)[1]
 
     def select(self, **kwargs):
-        c = self._select(False, **kwargs)
-        row = c.fetchone()
-        if row is None:
+        rows = self._select(False, **kwargs)
+        if len(rows) == 0:
             raise JBoxDBItemNotFound()
-
-        item = dict(zip(self.columns, row))
-        c.close()
-        return item
+        return dict(zip(self.columns, rows[0]))
 
     def scan(self, **kwargs):
-        c = self._select(False, **kwargs)
-        return (dict(zip(self.columns, row)) for row in c)
+        rows = self._select(False, **kwargs)
+        return (dict(zip(self.columns, row)) for row in rows)
 
     def count(self, **kwargs):
-        c = self._select(True, **kwargs)
-        row = c.fetchone()
-        if row is None:
+        rows = self._select(True, **kwargs)
+        if len(rows) == 0:
             return 0
-        return row[0]
+        return rows[0][0]
 
-    def delete(self, record):
-        names = []
-        values = []
-        colnames = []
+    def _check_keys(self, record):
         for keyname in self.pk:
-            keyval = record.get(keyname, None)
-            if keyval is None:
-                continue
-            names.append("`%s` = %%(%s)s" % (keyname, keyname))
-            values.append(keyval)
-            colnames.append(keyname)
+            if record.get(keyname, None) is None:
+                raise JBoxDBItemNotFound()
 
-        if len(names) != len(self.pk):
-            raise JBoxDBItemNotFound()
-        criteria = ' where ' + ' and '.join(names)
-        stmt = "delete from %s%s" % (self.name, criteria)
-
-        # self.log_debug("SQL: %s", stmt)
-        c = JBoxCloudSQL.execute(stmt, dict(zip(colnames, values)))
-        c.close()
+    def delete(self, record):
+        self._check_keys(record)
+        JBoxCloudSQL.execute(self.delete_statement, dict((keyname, record[keyname]) for keyname in self.pk))
 
     def update(self, record):
-        keynames = []
-        updates = []
-        values = []
-        names = []
-
-        for keyname in self.columns:
-            if keyname in self.pk:
-                continue
-            keyval = record.get(keyname, None)
-            updates.append("`%s` = %%(%s)s" % (keyname, keyname))
-            values.append(keyval)
-            names.append(keyname)
-        updatecols = ', '.join(updates)
-
-        for keyname in self.pk:
-            keyval = record.get(keyname, None)
-            if keyval is None:
-                continue
-            keynames.append("`%s` = %%(%s)s" % (keyname, keyname))
-            values.append(keyval)
-            names.append(keyname)
-
-        if len(keynames) != len(self.pk):
-            raise JBoxDBItemNotFound()
-        criteria = ' where ' + ' and '.join(keynames)
+        self._check_keys(record)
+        JBoxCloudSQL.execute(self.update_statement, dict((col, record.get(col, None)) for col in self.columns))
 
-        stmt = "update %s set %s%s" % (self.name, updatecols, criteria)
-
-        # self.log_debug("SQL: %s", stmt)
-        c = JBoxCloudSQL.execute(stmt, dict(zip(names, values)))
-        c.close()
+    def _key_criteria(self, keys):
+        names = []
+        values = []
+        for key in keys:
+            names.append('(' + ' and '.join(["`%s` = %%s" % (keyname,) for keyname in self.pk]) + ')')
+            values.extend([key[keyname] for keyname in self.pk])
+        return ' where ' + ' or '.join(names), values
+
+    def batch_select(self, keys):
+        items = []
+        for idx in range(0, len(keys), JBoxMySQLTable.BATCH_SZ):
+            criteria, values = self._key_criteria(keys[idx:(idx + JBoxMySQLTable.BATCH_SZ)])
+            rows = JBoxCloudSQL.execute('select * from %s%s' % (self.name, criteria), tuple(values))[1]
+            items.extend([dict(zip(self.columns, row)) for row in rows])
+        return items
+
+    def batch_replace(self, records):
+        params = []
+        for record in records:
+            params.append(dict([(col, record.get(col, None)) for col in self.columns]))
+        # MySQLdb sends these as multi row statements
+        JBoxCloudSQL.execute(self.replace_statement, params, many=True)
+
+    def batch_delete(self, keys):
+        # all the batches in one transaction
+        with JBoxCloudSQL.unit_of_work():
+            for idx in range(0, len(keys), JBoxMySQLTable.BATCH_SZ):
+                criteria, values = self._key_criteria(keys[idx:(idx + JBoxMySQLTable.BATCH_SZ)])
+                JBoxCloudSQL.execute('delete from %s%s' % (self.name, criteria), tuple(values))
 
 class JBoxCloudSQL(JBPluginDB):
+    """ MySQL database on Google Cloud SQL, with connections pooled across threads.
+
+    Connections commit each statement as it is executed, except in a unit of work, which runs in one transaction.
+    Besides the connection parameters, "db" may have `pool_size` and `pool_timeout`: connections in the pool, and
+    seconds to wait for one when all are in use.
+    """
     provides = [JBPluginDB.JBP_DB, JBPluginDB.JBP_DB_CLOUDSQL]
 
-    threadlocal = threading.local()
+    POOL = None
     USER = None
     PASSWD = None
     UNIX_SOCKET = None
@@ -196,32 +190,66 @@ class JBoxCloudSQL(JBPluginDB):
             JBoxCloudSQL.PASSWD = dbconf['passwd']
             JBoxCloudSQL.UNIX_SOCKET = dbconf['unix_socket']
             JBoxCloudSQL.DB = dbconf['db']
+        else:
+            dbconf = dict()
+        JBoxCloudSQL.POOL = JBoxDBConnPool("cloudsql", JBoxCloudSQL._connect,
+                                           size=dbconf.get('pool_size', JBoxDBConnPool.DEFAULT_SIZE),
+                                           timeout=dbconf.get('pool_timeout', JBoxDBConnPool.DEFAULT_TIMEOUT),
+                                           discard_on=(AttributeError, MySQLdb.OperationalError),
+                                           begin=JBoxCloudSQL._begin)
 
     @staticmethod
-    def conn(reconnect=False):
-        c = getattr(JBoxCloudSQL.threadlocal, 'cloudsql_conn', None)
-        if c is None or reconnect:
-            JBoxCloudSQL.log_debug("connecting with %s", JBoxCloudSQL.USER)
-            JBoxCloudSQL.threadlocal.cloudsql_conn = c = MySQLdb.connect(
-                user=JBoxCloudSQL.USER, passwd=JBoxCloudSQL.PASSWD,
-                unix_socket=JBoxCloudSQL.UNIX_SOCKET, db=JBoxCloudSQL.DB)
-            c.autocommit(True)
-            c.set_character_set('utf8')
-            cur = c.cursor()
-            cur.execute('SET NAMES utf8;')
-            cur.execute('SET CHARACTER SET utf8;')
-            cur.execute('SET character_set_connection=utf8;')
+    def _connect():
+        JBoxCloudSQL.log_debug("connecting with %s", JBoxCloudSQL.USER)
+        c = MySQLdb.connect(user=JBoxCloudSQL.USER, passwd=JBoxCloudSQL.PASSWD,
+                            unix_socket=JBoxCloudSQL.UNIX_SOCKET, db=JBoxCloudSQL.DB)
+        c.autocommit(True)
+        c.set_character_set('utf8')
+        cur = c.cursor()
+        cur.execute('SET NAMES utf8;')
+        cur.execute('SET CHARACTER SET utf8;')
+        cur.execute('SET character_set_connection=utf8;')
+        cur.close()
         return c
 
     @staticmethod
-    def execute(sql, params=None):
+    def _begin(conn):
+        cur = conn.cursor()
+        cur.execute('START TRANSACTION')
+        cur.close()
+
+    @staticmethod
+    def unit_of_work():
+        return JBoxCloudSQL.POOL.unit_of_work()
+
+    @staticmethod
+    def _execute(conn, sql, params, many):
+        cursor = conn.cursor()
         try:
-            cursor = JBoxCloudSQL.conn().cursor()
-            cursor.execute(sql, params)
-        except (AttributeError, MySQLdb.OperationalError):
-            cursor = JBoxCloudSQL.conn(reconnect=True).cursor()
-            cursor.execute(sql, params)
-        return cursor
+            if many:
+                cursor.executemany(sql, params)
+            else:
+                cursor.execute(sql, params)
+            # read in full, so that the connection can go back to the pool
+            return cursor.description, cursor.fetchall()
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def execute(sql, params=None, many=False):
+        """ Execute a statement. Returns the description and rows of the result.
+        Retried if the connection has failed, except in a unit of work. Failed connections are discarded, and idle ones
+        may all have been dropped by the server, so retries continue till one is made afresh.
+        """
+        pool = JBoxCloudSQL.POOL
+        for attempt in range(pool.size + 1):
+            try:
+                with pool.connection() as conn:
+                    return pool.timed(JBoxCloudSQL._execute, conn, sql, params, many)
+            except (AttributeError, MySQLdb.OperationalError):
+                if pool.in_unit_of_work() or (attempt == pool.size):
+                    raise
+                JBoxCloudSQL.log_info("Retrying statement after connection failure")
 
     @staticmethod
     def table_open(tablename):
@@ -254,3 +282,15 @@ class JBoxCloudSQL(JBPluginDB):
     @staticmethod
     def record_delete(table, record):
         table.delete(record)
+
+    @staticmethod
+    def record_batch_fetch(table, keys):
+        return table.batch_select(keys)
+
+    @staticmethod
+    def record_batch_save(table, records):
+        table.batch_replace(records)
+
+    @staticmethod
+    def record_batch_delete(table, keys):
+        table.batch_delete(keys)
@@ -49,4 +49,22 @@ class JBoxDynamoDB(JBPluginDB):
     @staticmethod
     def record_delete(table, record):
         if table is not None:
-            record.delete()
\ No newline at end of file
+            record.delete()
+
+    @staticmethod
+    def record_batch_fetch(table, keys):
+        # BatchGetItem, in as many requests as needed
+        return list(table.batch_get(keys=keys))
+
+    @staticmethod
+    def record_batch_save(table, records):
+        # BatchWriteItem, flushed every 25 records
+        with table.batch_write() as batch:
+            for record in records:
+                batch.put_item(data=dict(record.items()))
+
+    @staticmethod
+    def record_batch_delete(table, keys):
+        with table.batch_write() as batch:
+            for key in keys:
+                batch.delete_item(**key)
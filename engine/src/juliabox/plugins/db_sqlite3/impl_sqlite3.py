@@ -1,10 +1,9 @@
 __author__ = 'tan'
 
-import threading
 import sqlite3
 import decimal
 
-from juliabox.db import JBPluginDB, JBoxDBItemNotFound
+from juliabox.db import JBPluginDB, JBoxDBItemNotFound, JBoxDBConnPool
 from juliabox.jbox_util import JBoxCfg, LoggerMixin
 
 
@@ -19,14 +18,18 @@ class JBoxSQLiteTable(LoggerMixin):
         'beginswith': (' like ?', lambda x: x + '%'),
         'between': (' between ? and ?', lambda x: x)
     }
+    # records per statement in batch operations, to stay within the limit of 999 parameters for keys of upto 4 columns
+    BATCH_SZ = 200
 
     def __init__(self, table_name):
         self.name = table_name
-        c = JBoxSQLite3.conn().cursor()
-        pragma_sql = 'pragma table_info("%s")' % (table_name,)
-        c.execute(pragma_sql)
-        rows = c.fetchall()
-        pragma_cols = [spec[0] for spec in c.description]
+        with JBoxSQLite3.POOL.connection() as conn:
+            c = conn.cursor()
+            pragma_sql = 'pragma table_info("%s")' % (table_name,)
+            c.execute(pragma_sql)
+            rows = c.fetchall()
+            pragma_cols = [spec[0] for spec in c.description]
+            c.close()
 
         columns = []
         pk = []
@@ -36,21 +39,24 @@ class JBoxSQLiteTable(LoggerMixin):
             columns.append(colname)
             if rowdict['pk'] > 0:
                 pk.append(colname)
-        c.close()
         self.columns = columns
         self.pk = pk
+        self.datacols = [colname for colname in columns if colname not in pk]
+        # statements are built once, so that the same text is executed every time and found in the statement cache
         self.insert_statement = "insert into " + table_name + \
                                 " (" + ", ".join(self.columns) + ")" + \
                                 " values (" + ", ".join(['?'] * len(self.columns)) + ")"
+        self.replace_statement = "insert or replace" + self.insert_statement[len("insert"):]
+        key_criteria = ' where ' + ' and '.join(["%s = ?" % (keyname,) for keyname in self.pk])
+        self.delete_statement = "delete from " + table_name + key_criteria
+        self.update_statement = "update " + table_name + \
+                                " set " + ", ".join(["%s = ?" % (colname,) for colname in self.datacols]) + key_criteria
 
     def insert(self, record):
         values = []
         for colname in self.columns:
             values.append(record[colname] if colname in record else None)
-        c = JBoxSQLite3.conn().cursor()
-        c.execute(self.insert_statement, tuple(values))
-        c.close()
-        self.commit()
+        JBoxSQLite3.write(self.insert_statement, tuple(values))
 
     @staticmethod
     def _op(name, opstr, value, names, values):
@@ -79,95 +85,85 @@ class JBoxSQLiteTable(LoggerMixin):
         else:
             criteria = ''
         stmt = 'select %s from %s%s' % (selattribs, self.name, criteria)
-
-        c = JBoxSQLite3.conn().cursor()
-        c.execute(stmt, tuple(values))
-        return c
+        return JBoxSQLite3.read(stmt, tuple(values))
 
     def select(self, **kwargs):
-        c = self._select(False, **kwargs)
-        row = c.fetchone()
-        if row is None:
+        rows = self._select(False, **kwargs)
+        if len(rows) == 0:
             raise JBoxDBItemNotFound()
-
-        item = dict(zip(self.columns, row))
-        c.close()
-        return item
+        return dict(zip(self.columns, rows[0]))
 
     def scan(self, **kwargs):
-        c = self._select(False, **kwargs)
-        return (dict(zip(self.columns, row)) for row in c)
+        # rows are read in full, so that the connection goes back to the pool right away
+        rows = self._select(False, **kwargs)
+        return (dict(zip(self.columns, row)) for row in rows)
 
     def count(self, **kwargs):
-        c = self._select(True, **kwargs)
-        row = c.fetchone()
-        if row is None:
+        rows = self._select(True, **kwargs)
+        if len(rows) == 0:
             return 0
-        return row[0]
+        return rows[0][0]
 
-    def delete(self, record):
-        names = []
-        values = []
-        for keyname in self.pk:
-            keyval = record.get(keyname, None)
-            if keyval is None:
-                continue
-            names.append("%s = ?" % (keyname,))
-            values.append(keyval)
-
-        if len(names) != len(self.pk):
+    def _key_values(self, record):
+        values = [record.get(keyname, None) for keyname in self.pk]
+        if None in values:
             raise JBoxDBItemNotFound()
-        criteria = ' where ' + ' and '.join(names)
-        stmt = "delete from %s%s" % (self.name, criteria)
+        return values
 
-        c = JBoxSQLite3.conn().cursor()
-        # self.log_debug("SQL: %s", stmt)
-        c.execute(stmt, tuple(values))
-        c.close()
-        self.commit()
+    def delete(self, record):
+        JBoxSQLite3.write(self.delete_statement, tuple(self._key_values(record)))
 
     def update(self, record):
-        keynames = []
-        updates = []
-        values = []
-
-        for keyname in self.columns:
-            if keyname in self.pk:
-                continue
-            keyval = record.get(keyname, None)
-            updates.append("%s = ?" % (keyname,))
-            values.append(keyval)
-        updatecols = ', '.join(updates)
-
-        for keyname in self.pk:
-            keyval = record.get(keyname, None)
-            if keyval is None:
-                continue
-            keynames.append("%s = ?" % (keyname,))
-            values.append(keyval)
-
-        if len(keynames) != len(self.pk):
-            raise JBoxDBItemNotFound()
-        criteria = ' where ' + ' and '.join(keynames)
-
-        stmt = "update %s set %s%s" % (self.name, updatecols, criteria)
+        values = [record.get(colname, None) for colname in self.datacols] + self._key_values(record)
+        JBoxSQLite3.write(self.update_statement, tuple(values))
 
-        c = JBoxSQLite3.conn().cursor()
-        # self.log_debug("SQL: %s", stmt)
-        c.execute(stmt, tuple(values))
-        c.close()
-        self.commit()
-
-    @staticmethod
-    def commit():
-        JBoxSQLite3.conn().commit()
+    def _key_criteria(self, keys):
+        names = []
+        values = []
+        for key in keys:
+            names.append('(' + ' and '.join(["%s = ?" % (keyname,) for keyname in self.pk]) + ')')
+            values.extend([key[keyname] for keyname in self.pk])
+        return ' where ' + ' or '.join(names), values
+
+    def batch_select(self, keys):
+        items = []
+        # one connection for all the batches
+        with JBoxSQLite3.unit_of_work():
+            for idx in range(0, len(keys), JBoxSQLiteTable.BATCH_SZ):
+                criteria, values = self._key_criteria(keys[idx:(idx + JBoxSQLiteTable.BATCH_SZ)])
+                rows = JBoxSQLite3.read('select * from %s%s' % (self.name, criteria), tuple(values))
+                items.extend([dict(zip(self.columns, row)) for row in rows])
+        return items
+
+    def batch_replace(self, records):
+        values = [tuple([record.get(colname, None) for colname in self.columns]) for record in records]
+        JBoxSQLite3.write(self.replace_statement, values, many=True)
+
+    def batch_delete(self, keys):
+        # all the batches in one transaction
+        with JBoxSQLite3.unit_of_work():
+            for idx in range(0, len(keys), JBoxSQLiteTable.BATCH_SZ):
+                criteria, values = self._key_criteria(keys[idx:(idx + JBoxSQLiteTable.BATCH_SZ)])
+                JBoxSQLite3.write('delete from %s%s' % (self.name, criteria), tuple(values))
 
 
 class JBoxSQLite3(JBPluginDB):
+    """ SQLite database, with connections pooled across threads.
+
+    Configured by "db":
+        - `connect_str`: path of the database file, or ":memory:" (the default) for an in-memory database.
+        - `pool_size`, `pool_timeout`: connections in the pool, and seconds to wait for one when all are in use. An
+            in-memory database is not shared between connections, so it is always accessed over one connection.
+        - `cached_statements`: number of compiled statements cached per connection.
+        - `wal`: whether to use write-ahead logging, in which readers do not block the writer nor each other, and
+            commits need not sync the database file. Default true.
+    """
     provides = [JBPluginDB.JBP_DB, JBPluginDB.JBP_DB_RDBMS]
 
-    threadlocal = threading.local()
     CONNECT_STR = ":memory:" # default to an in-memory database
+    CACHED_STATEMENTS = 100
+    WAL = True
+    POOL = None
 
     @staticmethod
     def configure():
@@ -185,17 +181,50 @@ class JBoxSQLite3(JBPluginDB):
 
         dbconf = JBoxCfg.get("db")
         JBoxSQLite3.log_debug("db_conf: %r", dbconf)
-        if dbconf is not None and 'connect_str' in dbconf:
-            JBoxSQLite3.CONNECT_STR = dbconf['connect_str']
+        if dbconf is None:
+            dbconf = dict()
+        JBoxSQLite3.CONNECT_STR = dbconf.get('connect_str', JBoxSQLite3.CONNECT_STR)
+        JBoxSQLite3.CACHED_STATEMENTS = dbconf.get('cached_statements', JBoxSQLite3.CACHED_STATEMENTS)
+        JBoxSQLite3.WAL = dbconf.get('wal', JBoxSQLite3.WAL)
+        pool_size = dbconf.get('pool_size', JBoxDBConnPool.DEFAULT_SIZE)
+        if JBoxSQLite3.CONNECT_STR == ":memory:":
+            pool_size = 1
+        JBoxSQLite3.POOL = JBoxDBConnPool("sqlite", JBoxSQLite3._connect, size=pool_size,
+                                          timeout=dbconf.get('pool_timeout', JBoxDBConnPool.DEFAULT_TIMEOUT))
 
     @staticmethod
-    def conn():
-        c = getattr(JBoxSQLite3.threadlocal, 'sqlite_conn', None)
-        if c is None:
-            JBoxSQLite3.log_debug("connecting with %s", JBoxSQLite3.CONNECT_STR)
-            JBoxSQLite3.threadlocal.sqlite_conn = c = sqlite3.connect(JBoxSQLite3.CONNECT_STR)
+    def _connect():
+        JBoxSQLite3.log_debug("connecting with %s", JBoxSQLite3.CONNECT_STR)
+        # pooled connections are used by one thread at a time, but not always by the one that made them
+        c = sqlite3.connect(JBoxSQLite3.CONNECT_STR, check_same_thread=False,
+                            cached_statements=JBoxSQLite3.CACHED_STATEMENTS)
+        if JBoxSQLite3.WAL and (JBoxSQLite3.CONNECT_STR != ":memory:"):
+            c.execute('pragma journal_mode=WAL')
+            c.execute('pragma synchronous=NORMAL')
         return c
 
+    @staticmethod
+    def unit_of_work():
+        return JBoxSQLite3.POOL.unit_of_work()
+
+    @staticmethod
+    def _fetchall(conn, sql, params):
+        c = conn.execute(sql, params)
+        rows = c.fetchall()
+        c.close()
+        return rows
+
+    @staticmethod
+    def read(sql, params=()):
+        with JBoxSQLite3.POOL.connection() as conn:
+            return JBoxSQLite3.POOL.timed(JBoxSQLite3._fetchall, conn, sql, params)
+
+    @staticmethod
+    def write(sql, params=(), many=False):
+        with JBoxSQLite3.POOL.connection() as conn:
+            JBoxSQLite3.POOL.timed(conn.executemany if many else conn.execute, sql, params)
+            JBoxSQLite3.POOL.commit(conn)
+
     @staticmethod
     def table_open(tablename):
         return JBoxSQLiteTable(tablename)
@@ -226,4 +255,16 @@ class JBoxSQLite3(JBPluginDB):
 
     @staticmethod
     def record_delete(table, record):
-        table.delete(record)
\ No newline at end of file
+        table.delete(record)
+
+    @staticmethod
+    def record_batch_fetch(table, keys):
+        return table.batch_select(keys)
+
+    @staticmethod
+    def record_batch_save(table, records):
+        table.batch_replace(records)
+
+    @staticmethod
+    def record_batch_delete(table, keys):
+        table.batch_delete(keys)
\ No newline at end of file
@@ -1,5 +1,8 @@
 import os
+import tornado.web
+import tornado.gen
 from juliabox.jbox_util import unquote, JBoxCfg
+from juliabox.jbox_async_service import JBoxAsyncService
 from juliabox.handlers import JBPluginHandler
 from juliabox.db import JBoxUserV2, JBoxDBItemNotFound
 from email_verify_tbl import EmailVerifyDB
@@ -32,8 +35,24 @@ class EmailVerifyHandler(JBPluginHandler):
 
             EmailVerifyHandler.CONFIGURED = True
 
+    @staticmethod
+    def start_verification(user_id, email, base_uri):
+        record = EmailVerifyDB(user_id)
+        record.set_email(email)
+
+        mail_body = base_uri + '?' + urllib.urlencode({
+            "user_id": user_id,
+            "email": email,
+            "verification_code": record.get_code()
+        })
+        EmailVerifyHandler.EMAIL_PLUGIN.send_email(email, EmailVerifyHandler.EMAIL_SENDER, 'JuliaBox account activation', mail_body)
 
+    @staticmethod
+    def verify(user_id, verification_code):
+        return EmailVerifyDB(user_id).verify(verification_code)
 
+    @tornado.web.asynchronous
+    @tornado.gen.coroutine
     def get(self):
         EmailVerifyHandler.configure()
 
@@ -51,21 +70,15 @@ class EmailVerifyHandler(JBPluginHandler):
             return
 
         if verification_code == None:
-            record = EmailVerifyDB(user_id)
-            record.set_email(email)
-
             base_uri = self.request.protocol + "://" + self.request.host + self.request.uri.split('?')[0]
-            mail_body = base_uri + '?' + urllib.urlencode({
-                "user_id": user_id,
-                "email": email,
-                "verification_code": record.get_code()
-            })
-            EmailVerifyHandler.EMAIL_PLUGIN.send_email(email, EmailVerifyHandler.EMAIL_SENDER, 'JuliaBox account activation', mail_body)
+            yield JBoxAsyncService.run('db.start_email_verification', EmailVerifyHandler.start_verification, user_id,
+                                       email, base_uri)
 
             self.render(os.path.join(EmailWhitelistHandler.TEMPLATE_PATH, "message.tpl"), cfg=JBoxCfg.nv, message="Email sent. Please click the link in the mail.")
         else:
-            record = EmailVerifyDB(user_id)
-            if record.verify(verification_code):
+            verified = yield JBoxAsyncService.run('db.verify_email', EmailVerifyHandler.verify, user_id,
+                                                  verification_code)
+            if verified:
                 s = dict(error="", success="Verification OK, please log in again", info="", pending_activation=False, user_id="")
                 self.rendertpl("index.tpl", cfg=JBoxCfg.nv, state=s)
             else:
@@ -1,5 +1,7 @@
 import os
+import tornado.gen
 from juliabox.jbox_util import unquote, JBoxCfg
+from juliabox.jbox_async_service import JBoxAsyncService
 from juliabox.handlers import JBPluginHandler
 from juliabox.db import JBoxUserV2, JBoxDBItemNotFound
 from email_verify_tbl import EmailVerifyDB
@@ -47,18 +49,24 @@ class EmailWhitelistHandler(JBPluginHandler):
 
 
     @staticmethod
+    def is_verified(user_id):
+        # create a pending email verify request if needed
+        return EmailVerifyDB(user_id).is_verified()
+
+    @staticmethod
+    @tornado.gen.coroutine
     def process_user_id(handler, user_id):
         EmailWhitelistHandler.configure()
 
         # Check if the user_id matches
         if EmailWhitelistHandler.is_whitelisted(user_id):
-            return True
+            raise tornado.gen.Return(True)
 
-        # No match on user_id, create a pending email verify request if needed
-        verify_record = EmailVerifyDB(user_id)
-        if verify_record.is_verified():
-            return True
+        # No match on user_id
+        verified = yield JBoxAsyncService.run('db.is_email_verified', EmailWhitelistHandler.is_verified, user_id)
+        if verified:
+            raise tornado.gen.Return(True)
 
         handler.render(os.path.join(EmailWhitelistHandler.TEMPLATE_PATH, "email_whitelist.tpl"), cfg=JBoxCfg.nv, user_id=user_id, message="Please enter white-listed email as per tutor instructions:")
 
-        return False
+        raise tornado.gen.Return(False)
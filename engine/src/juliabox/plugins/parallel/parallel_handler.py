@@ -1,7 +1,11 @@
 __author__ = 'tan'
 import os
 
+import tornado.web
+import tornado.gen
+
 from juliabox.handlers import JBPluginHandler, JBPluginUI
+from juliabox.jbox_async_service import JBoxAsyncService
 from juliabox.interactive import SessContainer
 from juliabox.db import JBoxUserV2
 from juliabox.vol import VolMgr, JBoxVol
@@ -48,6 +52,8 @@ class ParallelHandler(JBPluginHandler):
     def get(self):
         return self.post()
 
+    @tornado.web.asynchronous
+    @tornado.gen.coroutine
     def post(self):
         sessname = self.get_session_id()
         user_id = self.get_user_id()
@@ -61,18 +67,26 @@ class ParallelHandler(JBPluginHandler):
             self.send_error()
             return
 
+        response = yield JBoxAsyncService.run('cluster.do_cluster_op', ParallelHandler.do_cluster_op, sessname, user_id,
+                                              mode, self.get_argument('ninsts', 0), self.get_argument('avzone', ''),
+                                              self.get_argument('spot_price', 0.0))
+        if response is None:
+            self.send_error()
+            return
+        self.write(response)
+
+    @staticmethod
+    def do_cluster_op(sessname, user_id, mode, ninsts, avzone, spot_price):
+        """ Response to the cluster operation, or None if the session container was not found. """
         user = JBoxUserV2(user_id)
         is_allowed = user.has_resource_profile(JBoxUserV2.RES_PROF_CLUSTER)
         if not is_allowed:
             ParallelHandler.log_error("Cluster access not allowed for user")
-            response = {'code': -1, 'data': 'You do not have permissions to use any clusters'}
-            self.write(response)
-            return True
+            return {'code': -1, 'data': 'You do not have permissions to use any clusters'}
 
         cont = SessContainer.get_by_name(sessname)
         if cont is None:
-            self.send_error()
-            return
+            return None
 
         ParallelHandler.log_debug("Parallel request %s for %s", mode, cont.debug_str())
 
@@ -86,16 +100,15 @@ class ParallelHandler(JBPluginHandler):
                     'max_cores': max_cores,
                     'credits': balance
                 }
-                self.write_machinefile(cont, uc)
+                ParallelHandler.write_machinefile(cont, uc)
                 response = {'code': 0, 'data': status}
             elif mode == 'terminate':
                 action = 'terminate' if uc.isactive() else 'delete'
                 uc.terminate_or_delete()
                 response = {'code': 0, 'data': action}
             elif mode == 'create':
-                ninsts = int(self.get_argument('ninsts', 0))
-                avzone = self.get_argument('avzone', '')
-                spot_price = float(self.get_argument('spot_price', 0.0))
+                ninsts = int(ninsts)
+                spot_price = float(spot_price)
                 if ninsts > (max_cores / UserCluster.INSTANCE_CORES):
                     response = {'code': -1, 'data': 'You are allowed a maximum of ' + str(max_cores) + ' cores.'}
                 elif (spot_price > UserCluster.INSTANCE_COST) or (spot_price < 0):
@@ -116,9 +129,10 @@ class ParallelHandler(JBPluginHandler):
             ParallelHandler._get_logger().exception("exception in cluster operation")
             response = {'code': -1, 'data': ex.message}
 
-        self.write(response)
+        return response
 
-    def _write_machinefile(self, cont, filename, machines):
+    @staticmethod
+    def _write_machinefile(cont, filename, machines):
         cluster_hosts = set(machines)
         if len(cluster_hosts) == 0:
             return
@@ -137,18 +151,19 @@ class ParallelHandler(JBPluginHandler):
         if cluster_hosts == existing_hosts:
             return
 
-        self.log_debug("writing machinefile for %s to path: %s", cont.debug_str(), machinefile)
+        ParallelHandler.log_debug("writing machinefile for %s to path: %s", cont.debug_str(), machinefile)
         with open(machinefile, 'w') as f:
             for host in cluster_hosts:
                 f.write(host+'\n')
 
-    def write_machinefile(self, cont, uc):
-        self._write_machinefile(cont, "machinefile.public", uc.public_hosts)
-        self._write_machinefile(cont, "machinefile.private", uc.private_hosts)
-        self._write_machinefile(cont, "machinefile.ip.private", uc.private_ips)
-        self._write_machinefile(cont, "machinefile.ip.public", uc.public_ips)
+    @staticmethod
+    def write_machinefile(cont, uc):
+        ParallelHandler._write_machinefile(cont, "machinefile.public", uc.public_hosts)
+        ParallelHandler._write_machinefile(cont, "machinefile.private", uc.private_hosts)
+        ParallelHandler._write_machinefile(cont, "machinefile.ip.private", uc.private_ips)
+        ParallelHandler._write_machinefile(cont, "machinefile.ip.public", uc.public_ips)
         # keep default as private IP addresses - should be the most efficient
-        self._write_machinefile(cont, "machinefile", uc.private_ips)
+        ParallelHandler._write_machinefile(cont, "machinefile", uc.private_ips)
 
     @staticmethod
     def create_user_script(cont):
@@ -1,5 +1,7 @@
 import os
+import tornado.gen
 from juliabox.jbox_util import JBoxCfg
+from juliabox.jbox_async_service import JBoxAsyncService
 from juliabox.handlers import JBPluginHandler
 from juliabox.db import JBoxUserV2, JBoxDBItemNotFound
 
@@ -32,17 +34,23 @@ class SiteRedirectHandler(JBPluginHandler):
             SiteRedirectHandler.CONFIGURED = True
 
     @staticmethod
+    def is_registered(user_id):
+        try:
+            JBoxUserV2(user_id, create=False)
+            return True
+        except JBoxDBItemNotFound:
+            return False
+
+    @staticmethod
+    @tornado.gen.coroutine
     def process_user_id(handler, user_id):
         SiteRedirectHandler.configure()
 
         redirect = True
         if SiteRedirectHandler.REDIRECT_TYPE == SiteRedirectHandler.TYPE_NEW:
-            try:
-                # check if user id is already registered
-                JBoxUserV2(user_id, create=False)
-                redirect = False
-            except JBoxDBItemNotFound:
-                pass
+            # check if user id is already registered
+            registered = yield JBoxAsyncService.run('db.is_registered', SiteRedirectHandler.is_registered, user_id)
+            redirect = not registered
 
         if redirect:
             handler.render(os.path.join(SiteRedirectHandler.TEMPLATE_PATH, "redirect.tpl"),
@@ -50,6 +58,6 @@ class SiteRedirectHandler(JBPluginHandler):
                            redirect_url=SiteRedirectHandler.REDIRECT_URL,
                            redirect_msg=SiteRedirectHandler.REDIRECT_MSG)
             SiteRedirectHandler.log_info("Redirected user %s to %s", user_id, SiteRedirectHandler.REDIRECT_URL)
-            return False
+            raise tornado.gen.Return(False)
         else:
-            return True
\ No newline at end of file
+            raise tornado.gen.Return(True)
\ No newline at end of file
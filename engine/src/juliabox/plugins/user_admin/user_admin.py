@@ -1,8 +1,12 @@
 __author__ = 'tan'
 import os
 
+import tornado.web
+import tornado.gen
+
 from juliabox.handlers import JBPluginHandler, JBPluginUI
 from juliabox.jbox_util import JBoxCfg
+from juliabox.jbox_async_service import JBoxAsyncService
 from juliabox.db import JBoxUserV2, JBoxDBItemNotFound
 
 
@@ -50,6 +54,8 @@ class UserAdminHandler(JBPluginHandler):
     def get(self):
         return self.post()
 
+    @tornado.web.asynchronous
+    @tornado.gen.coroutine
     def post(self):
         self.log_debug("User management handler got POST request")
         sessname = self.get_session_id()
@@ -59,40 +65,36 @@ class UserAdminHandler(JBPluginHandler):
             self.send_error()
             return
 
-        user = JBoxUserV2(user_id)
-        is_admin = sessname in JBoxCfg.get("admin_sessnames", []) or user.has_role(JBoxUserV2.ROLE_SUPER)
+        is_admin = sessname in JBoxCfg.get("admin_sessnames", [])
+        if not is_admin:
+            is_admin = yield JBoxAsyncService.run('db.is_super_user', UserAdminHandler.is_super_user, user_id)
         self.log_info("User manager. user_id[%s] is_admin[%r]", user_id, is_admin)
 
         if not is_admin:
             self.send_error(status_code=403)
             return
 
-        if self.handle_get_user(user_id, is_admin):
+        handled = yield self.handle_get_user(user_id, is_admin)
+        if handled:
             return
-        if self.handle_update_user(user_id, is_admin):
+        handled = yield self.handle_update_user(user_id, is_admin)
+        if handled:
             return
 
         self.log_error("no handlers found")
         # only AJAX requests responded to
         self.send_error()
 
-    def handle_get_user(self, user_id, is_admin):
-        mode = self.get_argument('mode', None)
-        if (mode is None) or (mode != "fetch"):
-            return False
-
-        fetch_uid = self.get_argument('user_id', '', strip=True)
-        if fetch_uid is None or len(fetch_uid) == 0:
-            response = {'code': -1, 'data': 'Invalid user id!'}
-            self.write(response)
-            return True
+    @staticmethod
+    def is_super_user(user_id):
+        return JBoxUserV2(user_id).has_role(JBoxUserV2.ROLE_SUPER)
 
+    @staticmethod
+    def get_user_info(fetch_uid):
         try:
             fetch_user = JBoxUserV2(fetch_uid)
         except JBoxDBItemNotFound:
-            response = {'code': -1, 'data': 'No such user - %s' % (fetch_uid,)}
-            self.write(response)
-            return True
+            return {'code': -1, 'data': 'No such user - %s' % (fetch_uid,)}
 
         courses = ','.join(fetch_user.get_courses_offered())
 
@@ -103,52 +105,67 @@ class UserAdminHandler(JBPluginHandler):
             'cores': fetch_user.get_max_cluster_cores(),
             'courses': courses
         }
-        response = {'code': 0, 'data': resp}
+        return {'code': 0, 'data': resp}
+
+    @tornado.gen.coroutine
+    def handle_get_user(self, user_id, is_admin):
+        mode = self.get_argument('mode', None)
+        if (mode is None) or (mode != "fetch"):
+            raise tornado.gen.Return(False)
+
+        fetch_uid = self.get_argument('user_id', '', strip=True)
+        if fetch_uid is None or len(fetch_uid) == 0:
+            response = {'code': -1, 'data': 'Invalid user id!'}
+        else:
+            response = yield JBoxAsyncService.run('db.get_user_info', UserAdminHandler.get_user_info, fetch_uid)
         self.write(response)
-        return True
+        raise tornado.gen.Return(True)
 
+    @tornado.gen.coroutine
     def handle_update_user(self, user_id, is_admin):
         mode = self.get_argument('mode', None)
         if (mode is None) or (mode != "update"):
-            return False
+            raise tornado.gen.Return(False)
 
         fetch_uid = self.get_argument('user_id', '', strip=True)
         if fetch_uid is None or len(fetch_uid) == 0:
             response = {'code': -1, 'data': 'Invalid user id!'}
-            self.write(response)
-            return True
+        else:
+            response = yield JBoxAsyncService.run('db.update_user', UserAdminHandler.update_user, fetch_uid,
+                                                  self.get_argument('cores', None, strip=True),
+                                                  self.get_argument('courses', None, strip=True),
+                                                  self.get_argument('role', None, strip=True),
+                                                  self.get_argument('resprof', None, strip=True))
+        self.write(response)
+        raise tornado.gen.Return(True)
 
+    @staticmethod
+    def update_user(fetch_uid, cores, courses, role, resprof):
         try:
             fetch_user = JBoxUserV2(fetch_uid)
         except JBoxDBItemNotFound:
-            response = {'code': -1, 'data': 'No such user - %s' % (fetch_uid,)}
-            self.write(response)
-            return True
+            return {'code': -1, 'data': 'No such user - %s' % (fetch_uid,)}
 
         updated = False
 
-        cores = self.get_argument('cores', None, strip=True)
         if cores is not None and len(cores) > 0:
             cores = int(cores)
             if cores != fetch_user.get_max_cluster_cores():
                 fetch_user.set_max_cluster_cores(cores)
                 updated = True
 
-        courses = self.get_argument('courses', None, strip=True)
         if courses is not None and len(courses) > 0:
             courses = courses.split(',')
             if courses != fetch_user.get_courses_offered():
                 fetch_user.set_courses_offered(courses)
                 updated = True
 
-        role = self.get_argument('role', None, strip=True)
         if role is not None and len(role) > 0:
             role = int(role)
             if role != fetch_user.get_role():
                 fetch_user.set_attrib('role', role)
                 updated = True
 
-        resprof = self.get_argument('resprof', None, strip=True)
         if resprof is not None and len(resprof) > 0:
             resprof = int(resprof)
             if resprof != fetch_user.get_resource_profile():
@@ -157,6 +174,4 @@ class UserAdminHandler(JBPluginHandler):
 
         if updated:
             fetch_user.save()
-        response = {'code': 0, 'data': ''}
-        self.write(response)
-        return True
\ No newline at end of file
+        return {'code': 0, 'data': ''}
\ No newline at end of file
@@ -1,26 +1,60 @@
 import os
+import sh
+import fcntl
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
 
 from juliabox.jbox_util import ensure_delete, make_sure_path_exists, unique_sessname, JBoxCfg
+from juliabox.jbox_util import create_host_mnt_command
 from juliabox.vol import JBoxVol
+from juliabox.cloud import Compute
 
 
 class JBoxDefaultConfigVol(JBoxVol):
+    """ Per session copies of the configuration files in the user home image.
+
+    The user home image is extracted once into a template folder, along with the instance specific notebook
+    configuration. Templates are named after both, so that a change in either gets a new template. Session config
+    folders are copied from the template, as reflinks where the filesystem supports them. The template is not hard
+    linked, because sessions can modify their config folder. Templates are shared by the processes on the host, which
+    lock the template folder exclusively to extract or delete templates, and shared while copying or mounting one.
+
+    In overlay mode (`cfg_overlay`), session config folders are instead overlayfs mounts with the template as the
+    read-only lower layer and a per session upper layer that holds only the files changed by the session. Creating and
+    deleting them does not depend on the size of the template. Falls back to copying if the mount fails. Overlays are
+    mounted in the host mount namespace (see `create_host_mnt_command`), which this process may not be in, so they are
+    looked up and unmounted there too.
+    """
     provides = [JBoxVol.JBP_CONFIG]
 
     FS_LOC = None
+    TEMPLATE_LOC = None
+    OVERLAY_LOC = None
+    OVERLAY = False
+    CURRENT_TEMPLATE = None
+    TMP_PREFIX = '.tmp_'
+    LOCK = threading.Lock()
 
     @staticmethod
     def configure():
         cfg_location = os.path.expanduser(JBoxCfg.get('cfg_location'))
         make_sure_path_exists(cfg_location)
         JBoxDefaultConfigVol.FS_LOC = cfg_location
+        # on the same filesystem as session config folders, so that they can be reflinked
+        JBoxDefaultConfigVol.TEMPLATE_LOC = os.path.join(cfg_location, '.templates')
+        make_sure_path_exists(JBoxDefaultConfigVol.TEMPLATE_LOC)
+        JBoxDefaultConfigVol.OVERLAY = JBoxCfg.get('cfg_overlay', False)
+        if JBoxDefaultConfigVol.OVERLAY:
+            JBoxDefaultConfigVol.OVERLAY_LOC = os.path.join(cfg_location, '.overlays')
+            make_sure_path_exists(JBoxDefaultConfigVol.OVERLAY_LOC)
 
     @staticmethod
     def _get_config_mounts_used(cid):
         used = []
-        props = JBoxDefaultConfigVol.dckr().inspect_container(cid)
         try:
-            for _cpath, hpath in JBoxVol.extract_mounts(props):
+            for _cpath, hpath in JBoxVol.get_mounts(cid):
                 if hpath.startswith(JBoxDefaultConfigVol.FS_LOC):
                     used.append(hpath.split('/')[-1])
         except:
@@ -29,17 +63,21 @@ class JBoxDefaultConfigVol(JBoxVol):
         return used
 
     @staticmethod
-    def refresh_disk_use_status(container_id_list=None):
+    def refresh_disk_use_status(container_id_list=None, mount_index=None):
         pass
 
     @staticmethod
     def get_disk_for_user(user_email):
         JBoxDefaultConfigVol.log_debug("creating configs disk for %s", user_email)
+        return JBoxDefaultConfigVol.get_disk_for_session(unique_sessname(user_email), user_email=user_email)
+
+    @staticmethod
+    def get_disk_for_session(sessname, user_email=None):
         if JBoxDefaultConfigVol.FS_LOC is None:
             JBoxDefaultConfigVol.configure()
 
-        disk_path = os.path.join(JBoxDefaultConfigVol.FS_LOC, unique_sessname(user_email))
-        cfgvol = JBoxDefaultConfigVol(disk_path, user_email=user_email)
+        disk_path = os.path.join(JBoxDefaultConfigVol.FS_LOC, sessname)
+        cfgvol = JBoxDefaultConfigVol(disk_path, user_email=user_email, sessname=sessname)
         cfgvol._unpack_config()
         return cfgvol
 
@@ -61,26 +99,164 @@ class JBoxDefaultConfigVol(JBoxVol):
 
     @staticmethod
     def refresh_user_home_image():
-        pass
+        JBoxDefaultConfigVol._get_template()
+
+    @staticmethod
+    def _get_template():
+        """ Template folder for the current user home image. Extracted if not done already in this process. """
+        if JBoxDefaultConfigVol.FS_LOC is None:
+            JBoxDefaultConfigVol.configure()
+
+        tpl_name = JBoxDefaultConfigVol._template_name()
+        tpl_path = os.path.join(JBoxDefaultConfigVol.TEMPLATE_LOC, tpl_name)
+        with JBoxDefaultConfigVol.LOCK:
+            # another process, on a different image, may have deleted it
+            if (JBoxDefaultConfigVol.CURRENT_TEMPLATE != tpl_name) or not os.path.exists(tpl_path):
+                with JBoxDefaultConfigVol._templates_locked(exclusive=True):
+                    if os.path.exists(tpl_path):
+                        JBoxDefaultConfigVol.log_info("Config template %s exists. Reusing...", tpl_path)
+                    else:
+                        JBoxDefaultConfigVol._extract_template(tpl_path)
+                    JBoxDefaultConfigVol.CURRENT_TEMPLATE = tpl_name
+                    JBoxDefaultConfigVol._del_unused_templates()
+        return tpl_path
+
+    @staticmethod
+    @contextmanager
+    def _templates_locked(exclusive):
+        with open(os.path.join(JBoxDefaultConfigVol.TEMPLATE_LOC, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _template_name():
+        # templates hold the instance config, so a change in it (e.g. the alias hostname) needs a new one
+        instance_cfg = JBoxVol.NOTEBOOK_WEBSOCK_PROTO + Compute.get_alias_hostname()
+        return os.path.basename(JBoxVol.USER_HOME_IMG).split('.')[0] + '_' + hashlib.sha1(instance_cfg).hexdigest()[:8]
+
+    @staticmethod
+    def _extract_template(tpl_path):
+        # extract into a temporary folder and rename, so that a partial extract is never used
+        tmp_path = tempfile.mkdtemp(prefix=JBoxDefaultConfigVol.TMP_PREFIX, dir=JBoxDefaultConfigVol.TEMPLATE_LOC)
+        try:
+            os.chmod(tmp_path, 0755)
+            JBoxDefaultConfigVol.log_info("Extracting config template from %s", JBoxVol.USER_HOME_IMG)
+            tpl = JBoxDefaultConfigVol(tmp_path)
+            tpl.restore_user_home(True)
+            # templates are not modified once in place, as they may be the lower layer of overlay mounts
+            tpl.setup_instance_config()
+            os.rename(tmp_path, tpl_path)
+        except:
+            ensure_delete(tmp_path, include_itself=True)
+            raise
+        JBoxDefaultConfigVol.log_info("Extracted config template to %s", tpl_path)
+
+    @staticmethod
+    def _host_overlay_mounts():
+        """ Mount point: options of overlay mounts in the host mount namespace. """
+        overlays = dict()
+        for line in str(create_host_mnt_command("cat /proc/mounts")()).splitlines():
+            fields = line.split()
+            if (len(fields) >= 4) and (fields[2] == 'overlay'):
+                overlays[fields[1]] = fields[3]
+        return overlays
+
+    @staticmethod
+    def _overlay_lower_dirs():
+        """ Lower layers of overlay mounts on the host. """
+        lower_dirs = set()
+        for mount_opts in JBoxDefaultConfigVol._host_overlay_mounts().values():
+            for opt in mount_opts.split(','):
+                if opt.startswith('lowerdir='):
+                    lower_dirs.update(opt[len('lowerdir='):].split(':'))
+        return lower_dirs
+
+    @staticmethod
+    def _del_unused_templates():
+        # session config folders that are copies do not refer to templates, but overlay mounts do
+        in_use = set()
+        if JBoxDefaultConfigVol.OVERLAY:
+            try:
+                lower_dirs = JBoxDefaultConfigVol._overlay_lower_dirs()
+            except:
+                JBoxDefaultConfigVol.log_exception("Error listing overlay mounts. Not deleting unused config templates.")
+                return
+            in_use = set(os.path.basename(os.path.normpath(d)) for d in lower_dirs
+                         if d.startswith(JBoxDefaultConfigVol.TEMPLATE_LOC))
+        for tpl_name in os.listdir(JBoxDefaultConfigVol.TEMPLATE_LOC):
+            # temporary folders left behind are deleted too, as no extraction is in progress while this runs
+            if tpl_name == '.lock':
+                continue
+            if (tpl_name != JBoxDefaultConfigVol.CURRENT_TEMPLATE) and (tpl_name not in in_use):
+                JBoxDefaultConfigVol.log_info("Deleting unused config template %s", tpl_name)
+                ensure_delete(os.path.join(JBoxDefaultConfigVol.TEMPLATE_LOC, tpl_name), include_itself=True)
 
     def release(self, backup=False):
-        ensure_delete(self.disk_path, include_itself=True)
+        self._delete_config()
 
     @staticmethod
     def disk_ids_used_pct():
         return 0
 
-    def _unpack_config(self):
+    def _overlay_path(self):
+        return os.path.join(JBoxDefaultConfigVol.OVERLAY_LOC, os.path.basename(self.disk_path))
+
+    def _delete_config(self):
+        # only sessions set up as overlays have an overlay folder. umount raises if it fails, so that a mounted folder
+        # (and through it the template) is never deleted.
+        if (JBoxDefaultConfigVol.OVERLAY_LOC is not None) and os.path.exists(self._overlay_path()) and \
+                (os.path.normpath(self.disk_path) in JBoxDefaultConfigVol._host_overlay_mounts()):
+            JBoxDefaultConfigVol.log_debug("Unmounting config overlay %s", self.disk_path)
+            create_host_mnt_command("umount " + self.disk_path)()
         if os.path.exists(self.disk_path):
             JBoxDefaultConfigVol.log_debug("Config folder exists %s. Deleting...", self.disk_path)
             ensure_delete(self.disk_path, include_itself=True)
             JBoxDefaultConfigVol.log_debug("Config folder deleted %s", self.disk_path)
+        if JBoxDefaultConfigVol.OVERLAY_LOC is not None:
+            overlay_path = self._overlay_path()
+            if os.path.exists(overlay_path):
+                ensure_delete(overlay_path, include_itself=True)
+
+    def _mount_overlay(self, tpl_path):
+        overlay_path = self._overlay_path()
+        upper_dir = os.path.join(overlay_path, 'upper')
+        work_dir = os.path.join(overlay_path, 'work')
+        try:
+            os.mkdir(overlay_path)
+            os.mkdir(upper_dir)
+            os.mkdir(work_dir)
+            os.mkdir(self.disk_path)
+            mount_opts = "lowerdir=%s,upperdir=%s,workdir=%s" % (tpl_path, upper_dir, work_dir)
+            create_host_mnt_command("mount -t overlay overlay -o %s %s" % (mount_opts, self.disk_path))()
+            JBoxDefaultConfigVol.log_debug("Mounted config overlay of %s at %s", tpl_path, self.disk_path)
+            return True
+        except:
+            JBoxDefaultConfigVol.log_exception("Error mounting config overlay at %s. Copying instead.", self.disk_path)
+            self._delete_config()
+            return False
+
+    def _unpack_config(self):
+        self._delete_config()
 
-        JBoxDefaultConfigVol.log_debug("Will unpack config to %s", self.disk_path)
-        os.mkdir(self.disk_path)
-        JBoxDefaultConfigVol.log_debug("Created config folder %s", self.disk_path)
+        # another process may delete the template before it is locked, in which case it is extracted again
+        for _attempt in range(2):
+            tpl_path = JBoxDefaultConfigVol._get_template()
+            # held while copying or mounting, so that the template is not deleted meanwhile by another process
+            with JBoxDefaultConfigVol._templates_locked(exclusive=False):
+                if os.path.exists(tpl_path):
+                    self._copy_template(tpl_path)
+                    return
+        raise Exception("Config template %s deleted while in use" % (tpl_path,))
 
-        self.restore_user_home(True)
-        JBoxDefaultConfigVol.log_debug("Restored config files to %s", self.disk_path)
-        self.setup_instance_config()
-        JBoxDefaultConfigVol.log_debug("Setup instance config at %s", self.disk_path)
\ No newline at end of file
+    def _copy_template(self, tpl_path):
+        if JBoxDefaultConfigVol.OVERLAY and self._mount_overlay(tpl_path):
+            return
+        JBoxDefaultConfigVol.log_debug("Will copy config from %s to %s", tpl_path, self.disk_path)
+        result = sh.cp("-a", "--reflink=auto", tpl_path, self.disk_path)
+        if result.exit_code != 0:
+            JBoxDefaultConfigVol.log_error("Error copying config template %r", result.exit_code)
+            raise Exception("Error copying config files")
+        JBoxDefaultConfigVol.log_debug("Copied config files to %s", self.disk_path)
\ No newline at end of file
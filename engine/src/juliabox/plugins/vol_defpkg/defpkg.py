@@ -5,7 +5,6 @@ import tarfile
 
 from juliabox.jbox_util import ensure_delete, make_sure_path_exists, JBoxCfg
 from juliabox.vol import JBoxVol
-from juliabox.interactive import SessContainer
 
 
 class JBoxDefaultPackagesVol(JBoxVol):
@@ -25,31 +24,25 @@ class JBoxDefaultPackagesVol(JBoxVol):
         JBoxDefaultPackagesVol.LOCK = threading.Lock()
         JBoxDefaultPackagesVol.refresh_disk_use_status()
 
+    @staticmethod
+    def _get_package_mounts(host_paths):
+        return [hpath.split('/')[-1] for hpath in host_paths if hpath.startswith(JBoxDefaultPackagesVol.FS_LOC)]
+
     @staticmethod
     def _get_package_mounts_used(cid):
-        used = []
-        props = JBoxDefaultPackagesVol.dckr().inspect_container(cid)
         try:
-            for _cpath, hpath in JBoxVol.extract_mounts(props):
-                if hpath.startswith(JBoxDefaultPackagesVol.FS_LOC):
-                    used.append(hpath.split('/')[-1])
+            return JBoxDefaultPackagesVol._get_package_mounts([hpath for _cpath, hpath in JBoxVol.get_mounts(cid)])
         except:
             JBoxDefaultPackagesVol.log_error("error finding package mount points used in " + cid)
             return []
-        return used
 
     @staticmethod
-    def refresh_disk_use_status(container_id_list=None):
+    def refresh_disk_use_status(container_id_list=None, mount_index=None):
+        if mount_index is None:
+            mount_index = JBoxVol.get_mount_index(container_id_list)
         JBoxDefaultPackagesVol.LOCK.acquire()
-        bundles = set()
         try:
-            if container_id_list is None:
-                container_id_list = [cdesc['Id'] for cdesc in SessContainer.session_containers(allcontainers=True)]
-
-            for cid in container_id_list:
-                mount_points = JBoxDefaultPackagesVol._get_package_mounts_used(cid)
-                bundles.update(mount_points)
-
+            bundles = set(JBoxDefaultPackagesVol._get_package_mounts(mount_index.keys()))
             JBoxDefaultPackagesVol.BUNDLES_IN_USE = bundles
             JBoxDefaultPackagesVol.log_info("Packages in use: %r", bundles)
         finally:
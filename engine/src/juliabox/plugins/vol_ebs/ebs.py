@@ -1,12 +1,10 @@
 import os
-import threading
-import time
 from string import ascii_lowercase
 
 from juliabox.plugins.compute_ec2 import EBSVol, CompEC2
 from juliabox.db import JBoxSessionProps
 from juliabox.jbox_util import unique_sessname, JBoxCfg
-from juliabox.vol import JBoxVol
+from juliabox.vol import JBoxVol, JBoxDiskAllocator
 from juliabox.cloud import Compute
 from disk_state_tbl import JBoxDiskState
 
@@ -17,10 +15,9 @@ class JBoxEBSVol(JBoxVol):
     DEVICES = []
     MAX_DISKS = 0
     DISK_LIMIT = None
-    DISK_USE_STATUS = {}
-    DISK_RESERVE_TIME = {}
+    DISK_RESERVE_SECS = 120
+    ALLOCATOR = None
     DISK_TEMPLATE_SNAPSHOT = None
-    LOCK = None
 
     @staticmethod
     def configure():
@@ -32,7 +29,7 @@ class JBoxEBSVol(JBoxVol):
         JBoxEBSVol.DEVICES = JBoxEBSVol._guess_configured_devices('xvd', num_disks_max)
         JBoxEBSVol.log_debug("Assuming %d EBS volumes configured in range xvdba..xvdcz", len(JBoxEBSVol.DEVICES))
 
-        JBoxEBSVol.LOCK = threading.Lock()
+        JBoxEBSVol.ALLOCATOR = JBoxDiskAllocator(JBoxEBSVol.DEVICES, JBoxEBSVol.DISK_RESERVE_SECS)
         JBoxEBSVol.refresh_disk_use_status()
 
     @classmethod
@@ -50,27 +47,14 @@ class JBoxEBSVol(JBoxVol):
         return devices
 
     @staticmethod
-    def refresh_disk_use_status(container_id_list=None):
+    def refresh_disk_use_status(container_id_list=None, mount_index=None):
         JBoxEBSVol.log_debug("Refrshing EBS disk use status")
-        JBoxEBSVol.LOCK.acquire()
         try:
-            nfree = 0
-            for idx in range(0, JBoxEBSVol.MAX_DISKS):
-                dev = JBoxEBSVol.DEVICES[idx]
-                if JBoxEBSVol._is_reserved(dev):
-                    JBoxEBSVol.DISK_USE_STATUS[dev] = True
-                else:
-                    JBoxEBSVol.DISK_USE_STATUS[dev] = False
-                    nfree += 1
-
-            for device, volume in JBoxEBSVol.get_mapped_volumes().iteritems():
-                JBoxEBSVol.DISK_USE_STATUS[os.path.basename(device)] = True
-                nfree -= 1
+            mapped = [os.path.basename(device) for device in JBoxEBSVol.get_mapped_volumes().iterkeys()]
+            nfree = JBoxEBSVol.ALLOCATOR.set_used(mapped)
             JBoxEBSVol.log_info("EBS Disk free: " + str(nfree) + "/" + str(JBoxEBSVol.MAX_DISKS))
         except:
             JBoxEBSVol.log_exception("Exception refrshing EBS disk use status")
-        finally:
-            JBoxEBSVol.LOCK.release()
 
     @staticmethod
     def get_mapped_volumes():
@@ -78,38 +62,14 @@ class JBoxEBSVol(JBoxVol):
         JBoxEBSVol.log_debug("Devices mapped: %r", allmaps)
         return dict((d, v) for d, v in allmaps.iteritems() if os.path.basename(d) in JBoxEBSVol.DEVICES)
 
-    @staticmethod
-    def _get_unused_disk_id():
-        for idx in range(0, JBoxEBSVol.MAX_DISKS):
-            dev = JBoxEBSVol.DEVICES[idx]
-            if not JBoxEBSVol.DISK_USE_STATUS[dev]:
-                return dev
-        return None
-
-    @staticmethod
-    def _is_reserved(idx):
-        if (idx in JBoxEBSVol.DISK_RESERVE_TIME) and (JBoxEBSVol.DISK_RESERVE_TIME[idx] < time.time()):
-            del JBoxEBSVol.DISK_RESERVE_TIME[idx]
-        return idx in JBoxEBSVol.DISK_RESERVE_TIME
-
-    @staticmethod
-    def _mark_disk_used(idx, used=True, for_secs=0):
-        JBoxEBSVol.DISK_USE_STATUS[idx] = used
-        if used and (for_secs > 0):
-            JBoxEBSVol.DISK_RESERVE_TIME[idx] = time.time() + for_secs
-        else:
-            if idx in JBoxEBSVol.DISK_RESERVE_TIME:
-                del JBoxEBSVol.DISK_RESERVE_TIME[idx]
-
     @staticmethod
     def _reserve_disk_id():
-        JBoxEBSVol.LOCK.acquire()
-        try:
-            disk_id = JBoxEBSVol._get_unused_disk_id()
-            JBoxEBSVol._mark_disk_used(disk_id, for_secs=120)
-            return disk_id
-        finally:
-            JBoxEBSVol.LOCK.release()
+        disk_id = JBoxEBSVol.ALLOCATOR.reserve()
+        if disk_id is None:
+            # released volumes are detached asynchronously, and their devices are free only once seen unmapped
+            JBoxEBSVol.refresh_disk_use_status()
+            disk_id = JBoxEBSVol.ALLOCATOR.reserve()
+        return disk_id
 
     @staticmethod
     def is_mount_path(fs_path):
@@ -118,8 +78,7 @@ class JBoxEBSVol(JBoxVol):
 
     @staticmethod
     def disk_ids_used_pct():
-        pct = (sum(JBoxEBSVol.DISK_USE_STATUS.values()) * 100) / len(JBoxEBSVol.DISK_USE_STATUS)
-        return min(100, max(0, pct))
+        return min(100, max(0, JBoxEBSVol.ALLOCATOR.used_pct()))
 
     @staticmethod
     def get_disk_for_user(user_email):
@@ -1,8 +1,12 @@
 __author__ = 'tan'
 import os
 
+import tornado.web
+import tornado.gen
+
 from juliabox.handlers import JBPluginHandler, JBPluginUI
 from juliabox.jbox_tasks import JBPluginTask, JBoxAsyncJob
+from juliabox.jbox_async_service import JBoxAsyncService
 from juliabox.interactive import SessContainer
 from juliabox.db import JBoxUserV2
 from juliabox.vol import JBoxVol
@@ -105,6 +109,8 @@ class JBoxEBSVolHandler(JBPluginHandler):
     def get(self):
         return self.post()
 
+    @tornado.web.asynchronous
+    @tornado.gen.coroutine
     def post(self):
         sessname = self.get_session_id()
         user_id = self.get_user_id()
@@ -120,6 +126,7 @@ class JBoxEBSVolHandler(JBPluginHandler):
 
         try:
             if mode == 'attach' or mode == 'detach':
+                # attached and detached by the container manager, only queued here
                 JBoxAsyncJob.async_plugin_task(JBoxEBSVolAsyncTask.__name__, {
                     'action': mode,
                     'user_id': user_id,
@@ -127,7 +134,9 @@ class JBoxEBSVolHandler(JBPluginHandler):
                 })
                 response = {'code': 0, 'data': ''}
             elif mode == 'status':
-                response = {'code': 0, 'data': self._get_state(sessname, user_id)}
+                state = yield JBoxAsyncService.run('docker.get_ebs_state', JBoxEBSVolHandler._get_state, sessname,
+                                                   user_id)
+                response = {'code': 0, 'data': state}
             else:
                 response = {'code': -1, 'data': 'Unknown data volume operation ' + mode}
         except Exception as ex:
@@ -137,7 +146,8 @@ class JBoxEBSVolHandler(JBPluginHandler):
 
         self.write(response)
 
-    def _get_state(self, sessname, user_id):
+    @staticmethod
+    def _get_state(sessname, user_id):
         vol = JBoxEBSVol.get_disk_from_container(sessname)
         state_code = JBoxDiskState.STATE_DETACHED
         try:
@@ -150,7 +160,7 @@ class JBoxEBSVolHandler(JBPluginHandler):
                 ((state_code == JBoxDiskState.STATE_DETACHED) and (vol is not None)):
             state_code = -1
 
-        self.log_debug("EBS disk state: %r", state_code)
+        JBoxEBSVolHandler.log_debug("EBS disk state: %r", state_code)
         return {
             'disk_size': '10 GB',
             'state': state_code
@@ -3,7 +3,7 @@ import os
 import datetime
 
 from juliabox.jbox_tasks import JBPluginTask
-from juliabox.db import JBoxSessionProps
+from juliabox.db import JBoxDB, JBoxSessionProps
 from juliabox.plugins.compute_ec2 import EBSVol
 from juliabox.jbox_util import unique_sessname
 from juliabox.srvr_jboxd import jboxd_method
@@ -66,9 +66,10 @@ class JBoxEBSHousekeep(JBPluginTask):
                 if old_snap_id is not None:
                     EBSVol.delete_snapshot(old_snap_id)
             if modified:
-                sess_props.save()
-                disk_info.set_snapshot_ids(incomplete_snapshots)
-                disk_info.save()
+                with JBoxDB.unit_of_work():
+                    sess_props.save()
+                    disk_info.set_snapshot_ids(incomplete_snapshots)
+                    disk_info.save()
             if len(incomplete_snapshots) == 0:
                 if (time_now - disk_info.get_detach_time()).total_seconds() > 24*60*60:
                     vol_id = disk_info.get_volume_id()
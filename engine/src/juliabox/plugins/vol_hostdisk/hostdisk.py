@@ -26,8 +26,7 @@ class JBoxHostDiskVol(JBoxVol):
     def _get_disk_ids_used(cid):
         used = []
         try:
-            props = JBoxHostDiskVol.dckr().inspect_container(cid)
-            for _cpath, hpath in JBoxVol.extract_mounts(props):
+            for _cpath, hpath in JBoxVol.get_mounts(cid):
                 if hpath.startswith(JBoxHostDiskVol.FS_LOC):
                     used.append(hpath.split('/')[-1])
         except:
@@ -36,7 +35,7 @@ class JBoxHostDiskVol(JBoxVol):
         return used
 
     @staticmethod
-    def refresh_disk_use_status(container_id_list=None):
+    def refresh_disk_use_status(container_id_list=None, mount_index=None):
         pass
 
     @staticmethod
@@ -1,10 +1,7 @@
 import os
-import threading
-import time
 
 from juliabox.jbox_util import ensure_delete, JBoxCfg
-from juliabox.vol import JBoxVol
-from juliabox.interactive import SessContainer
+from juliabox.vol import JBoxVol, JBoxDiskAllocator
 
 
 class JBoxLoopbackVol(JBoxVol):
@@ -13,9 +10,7 @@ class JBoxLoopbackVol(JBoxVol):
     FS_LOC = None
     DISK_LIMIT = None
     MAX_DISKS = 0
-    DISK_USE_STATUS = {}
-    DISK_RESERVE_TIME = {}
-    LOCK = None
+    ALLOCATOR = None
 
     @staticmethod
     def configure():
@@ -23,95 +18,45 @@ class JBoxLoopbackVol(JBoxVol):
         JBoxLoopbackVol.FS_LOC = os.path.expanduser(JBoxCfg.get('mnt_location'))
         JBoxLoopbackVol.MAX_DISKS = JBoxCfg.get('numdisksmax')
         JBoxLoopbackVol.DISK_RESERVE_SECS = JBoxCfg.get('disk_reserve_secs', 180)
-        JBoxLoopbackVol.LOCK = threading.Lock()
+        JBoxLoopbackVol.ALLOCATOR = JBoxDiskAllocator(range(0, JBoxLoopbackVol.MAX_DISKS),
+                                                      JBoxLoopbackVol.DISK_RESERVE_SECS)
         JBoxLoopbackVol.refresh_disk_use_status()
 
     @classmethod
     def get_disk_allocated_size(cls):
         return JBoxLoopbackVol.DISK_LIMIT
 
+    @staticmethod
+    def _get_disk_ids(host_paths):
+        return [int(hpath.split('/')[-1]) for hpath in host_paths if hpath.startswith(JBoxLoopbackVol.FS_LOC)]
+
     @staticmethod
     def _get_disk_ids_used(cid):
-        used = []
         try:
-            props = JBoxLoopbackVol.dckr().inspect_container(cid)
-            for _cpath, hpath in JBoxVol.extract_mounts(props):
-                if hpath.startswith(JBoxLoopbackVol.FS_LOC):
-                    used.append(int(hpath.split('/')[-1]))
+            return JBoxLoopbackVol._get_disk_ids([hpath for _cpath, hpath in JBoxVol.get_mounts(cid)])
         except:
             JBoxLoopbackVol.log_error("error finding disk ids used in " + cid)
             return []
-        return used
 
     @staticmethod
-    def refresh_disk_use_status(container_id_list=None):
-        JBoxLoopbackVol.LOCK.acquire()
-        try:
-            nfree = 0
-            for idx in range(0, JBoxLoopbackVol.MAX_DISKS):
-                if JBoxLoopbackVol._is_reserved(idx):
-                    JBoxLoopbackVol.DISK_USE_STATUS[idx] = True
-                else:
-                    JBoxLoopbackVol.DISK_USE_STATUS[idx] = False
-                    nfree += 1
-
-            if container_id_list is None:
-                container_id_list = [cdesc['Id'] for cdesc in SessContainer.session_containers(allcontainers=True)]
-
-            for cid in container_id_list:
-                disk_ids = JBoxLoopbackVol._get_disk_ids_used(cid)
-                for disk_id in disk_ids:
-                    JBoxLoopbackVol._mark_disk_used(disk_id)
-                    nfree -= 1
-            JBoxLoopbackVol.log_info("Loopback Disk free: " + str(nfree) + "/" + str(JBoxLoopbackVol.MAX_DISKS))
-        finally:
-            JBoxLoopbackVol.LOCK.release()
+    def refresh_disk_use_status(container_id_list=None, mount_index=None):
+        if mount_index is None:
+            mount_index = JBoxVol.get_mount_index(container_id_list)
+        nfree = JBoxLoopbackVol.ALLOCATOR.set_used(JBoxLoopbackVol._get_disk_ids(mount_index.keys()))
+        JBoxLoopbackVol.log_info("Loopback Disk free: " + str(nfree) + "/" + str(JBoxLoopbackVol.MAX_DISKS))
 
     @staticmethod
     def disk_ids_used_pct():
-        pct = (sum(JBoxLoopbackVol.DISK_USE_STATUS.values()) * 100) / len(JBoxLoopbackVol.DISK_USE_STATUS)
-        return min(100, max(0, pct))
-
-    @staticmethod
-    def _get_unused_disk_id(begin_idx=0):
-        for idx in range(begin_idx, JBoxLoopbackVol.MAX_DISKS):
-            if not JBoxLoopbackVol.DISK_USE_STATUS[idx]:
-                return idx
-        return -1
-
-    @staticmethod
-    def _is_reserved(idx):
-        if (idx in JBoxLoopbackVol.DISK_RESERVE_TIME) and (JBoxLoopbackVol.DISK_RESERVE_TIME[idx] < time.time()):
-            del JBoxLoopbackVol.DISK_RESERVE_TIME[idx]
-        return idx in JBoxLoopbackVol.DISK_RESERVE_TIME
-
-    @staticmethod
-    def _mark_disk_used(idx, used=True, for_secs=0):
-        JBoxLoopbackVol.DISK_USE_STATUS[idx] = used
-        if used and (for_secs > 0):
-            JBoxLoopbackVol.DISK_RESERVE_TIME[idx] = time.time() + for_secs
-        else:
-            if idx in JBoxLoopbackVol.DISK_RESERVE_TIME:
-                del JBoxLoopbackVol.DISK_RESERVE_TIME[idx]
+        return min(100, max(0, JBoxLoopbackVol.ALLOCATOR.used_pct()))
 
     @staticmethod
-    def _reserve_disk_id(begin_idx=0):
-        JBoxLoopbackVol.LOCK.acquire()
-        try:
-            disk_id = JBoxLoopbackVol._get_unused_disk_id(begin_idx=begin_idx)
-            if disk_id >= 0:
-                JBoxLoopbackVol._mark_disk_used(disk_id, for_secs=JBoxLoopbackVol.DISK_RESERVE_SECS)
-            return disk_id
-        finally:
-            JBoxLoopbackVol.LOCK.release()
+    def _reserve_disk_id():
+        disk_id = JBoxLoopbackVol.ALLOCATOR.reserve()
+        return -1 if disk_id is None else disk_id
 
     @staticmethod
     def _unreserve_disk_id(idx):
-        JBoxLoopbackVol.LOCK.acquire()
-        try:
-            JBoxLoopbackVol._mark_disk_used(idx, used=False)
-        finally:
-            JBoxLoopbackVol.LOCK.release()
+        JBoxLoopbackVol.ALLOCATOR.release(idx)
 
     @staticmethod
     def get_disk_for_user(user_email):
@@ -126,6 +71,23 @@ class JBoxLoopbackVol(JBoxVol):
         loopvol.restore()
         return loopvol
 
+    @staticmethod
+    def get_blank_disk():
+        disk_id = JBoxLoopbackVol._reserve_disk_id()
+        if disk_id < 0:
+            return None
+        disk_path = os.path.join(JBoxLoopbackVol.FS_LOC, str(disk_id))
+        loopvol = JBoxLoopbackVol(disk_path)
+        loopvol.refresh_disk()
+        JBoxLoopbackVol.log_debug("prepared blank disk %s", disk_path)
+        return loopvol
+
+    def assign_to_user(self, user_email):
+        loopvol = JBoxLoopbackVol(self.disk_path, user_email=user_email)
+        JBoxLoopbackVol.log_debug("restoring data for %s", user_email)
+        loopvol.restore()
+        return loopvol
+
     @staticmethod
     def is_mount_path(fs_path):
         return fs_path.startswith(JBoxLoopbackVol.FS_LOC)
@@ -158,3 +120,5 @@ class JBoxLoopbackVol(JBoxVol):
         if backup:
             self._backup()
         self.refresh_disk()
+        # containers are killed before their disks are released
+        JBoxLoopbackVol._unreserve_disk_id(int(self.disk_path.split('/')[-1]))
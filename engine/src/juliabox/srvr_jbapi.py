@@ -12,7 +12,8 @@ import db
 from db import is_cluster_leader
 from jbox_tasks import JBoxAsyncJob
 from jbox_util import LoggerMixin, JBoxCfg
-from api import APIContainer
+from jbox_async_service import JBoxAsyncService
+from api import APIContainer, APIConnector, APIAutoScaler
 from handlers import APIHandler, APIInfoHandler
 
 
@@ -23,7 +24,10 @@ class JBoxAPI(LoggerMixin):
         LoggerMixin.configure()
         db.configure()
         Compute.configure()
+        JBoxAsyncService.configure()
         APIContainer.configure()
+        APIConnector.configure()
+        APIAutoScaler.configure()
 
         JBoxAsyncJob.configure()
         JBoxAsyncJob.init(JBoxAsyncJob.MODE_PUB)
@@ -35,7 +39,9 @@ class JBoxAPI(LoggerMixin):
 
         self.application.settings["cookie_secret"] = JBoxCfg.get('sesskey')
         self.application.listen(JBoxCfg.get('api.manager_port'), address=socket.gethostname())
-        self.application.listen(JBoxCfg.get('api.manager_port'), address='localhost')
+        # the hostname may resolve to the loopback address, which is bound already then
+        if socket.gethostbyname(socket.gethostname()) != '127.0.0.1':
+            self.application.listen(JBoxCfg.get('api.manager_port'), address='localhost')
 
         self.ioloop = ioloop.IOLoop.instance()
 
@@ -43,16 +49,20 @@ class JBoxAPI(LoggerMixin):
         run_interval = 5 * 60 * 1000
         self.log_info("Container maintenance every " + str(run_interval / (60 * 1000)) + " minutes")
         self.ct = ioloop.PeriodicCallback(JBoxAPI.do_housekeeping, run_interval, self.ioloop)
+        self.scalect = ioloop.PeriodicCallback(JBoxAPI.do_autoscale, APIAutoScaler.INTERVAL_SECS * 1000, self.ioloop)
         self.sigct = ioloop.PeriodicCallback(JBoxAPI.do_signals, 1000, self.ioloop)
 
     def run(self):
         APIContainer.refresh_container_list()
+        APIContainer.refresh_warm_pools()
+        APIContainer.apply_desired_counts()
         JBoxAPI.log_debug("Setting up signal handlers")
         signal.signal(signal.SIGINT, JBoxAPI.signal_handler)
         signal.signal(signal.SIGTERM, JBoxAPI.signal_handler)
 
         JBoxAPI.log_debug("Starting ioloops")
         self.ct.start()
+        self.scalect.start()
         self.sigct.start()
         self.ioloop.start()
         JBoxAPI.log_info("Stopped.")
@@ -81,6 +91,13 @@ class JBoxAPI(LoggerMixin):
             APIContainer.maintain()
             JBoxAsyncJob.async_plugin_maintenance(is_leader)
 
+    @staticmethod
+    def do_autoscale():
+        try:
+            APIAutoScaler.tick()
+        except:
+            JBoxAPI.log_exception("Exception scaling API containers")
+
     @staticmethod
     def signal_handler(signum, frame):
         JBoxAPI.shutdown = True
@@ -14,6 +14,8 @@ from db import JBoxDynConfig, JBoxUserV2, JBoxInstanceProps, is_cluster_leader,
 from jbox_tasks import JBoxAsyncJob
 from jbox_util import LoggerMixin, JBoxCfg
 from jbox_tasks import JBPluginTask
+from jbox_launch_status import JBoxLaunchStatus
+from jbox_async_service import JBoxAsyncService
 from vol import VolMgr, JBoxVol
 from juliabox.interactive import SessContainer
 from handlers import AdminHandler, MainHandler, PingHandler, CorsHandler
@@ -32,6 +34,8 @@ class JBox(LoggerMixin):
 
         JBoxAsyncJob.configure()
         JBoxAsyncJob.init(JBoxAsyncJob.MODE_PUB)
+        JBoxLaunchStatus.configure()
+        JBoxAsyncService.configure()
 
         self.application = tornado.web.Application(handlers=[
             (r"/", MainHandler),
@@ -47,9 +51,12 @@ class JBox(LoggerMixin):
         self.application.settings["cookie_secret"] = JBoxCfg.get('sesskey')
         self.application.settings["plugin_features"] = JBox.get_pluggedin_features()
         self.application.listen(JBoxCfg.get('interactive.manager_port'), address=socket.gethostname())
-        self.application.listen(JBoxCfg.get('interactive.manager_port'), address='localhost')
+        # the hostname may resolve to the loopback address, which is bound already then
+        if socket.gethostbyname(socket.gethostname()) != '127.0.0.1':
+            self.application.listen(JBoxCfg.get('interactive.manager_port'), address='localhost')
 
         self.ioloop = tornado.ioloop.IOLoop.instance()
+        JBoxLaunchStatus.init_subscriber(self.ioloop)
 
         # run container maintainence every 5 minutes
         run_interval = 5 * 60 * 1000
@@ -137,12 +144,28 @@ class JBox(LoggerMixin):
 
         return None
 
+    @staticmethod
+    def publish_call_latency():
+        """ Publish the 99th percentile and max latency of blocking calls made by request handlers, per category. """
+        groups = dict()
+        for name, hist in JBoxAsyncService.get_stats().iteritems():
+            group = name.split('.')[0].capitalize()
+            p99, max_ms = groups.get(group, (0, 0))
+            groups[group] = (max(p99, hist['p99_ms']), max(max_ms, hist['max_ms']))
+        stats = []
+        for group, (p99, max_ms) in groups.iteritems():
+            stats.append(("CallLatency" + group + "P99", "Milliseconds", p99))
+            stats.append(("CallLatency" + group + "Max", "Milliseconds", max_ms))
+        if len(stats) > 0:
+            Compute.publish_stats_multi(stats)
+
     @staticmethod
     def do_housekeeping():
         terminating = False
         server_delete_timeout = JBoxCfg.get('interactive.expire')
         inactive_timeout = JBoxCfg.get('interactive.inactivity_timeout')
         SessContainer.maintain(max_timeout=server_delete_timeout, inactive_timeout=inactive_timeout)
+        JBox.publish_call_latency()
         is_leader = is_cluster_leader()
 
         if is_leader:
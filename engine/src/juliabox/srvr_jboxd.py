@@ -4,15 +4,19 @@ import time
 import signal
 # import os
 import sys
-import psutil
 import socket
 
 from cloud import JBPluginCloud
-from cloud import Compute
+from cloud import Compute, JBoxClusterSnapshot, JBoxMetrics
 import db
-from db import JBoxUserV2, JBoxDynConfig, JBoxSessionProps, JBoxInstanceProps, is_proposed_cluster_leader
+from db import JBoxUserV2, JBoxDynConfig, JBoxSessionProps, JBoxInstanceProps, JBoxDBConnPool, \
+    is_proposed_cluster_leader
 from jbox_tasks import JBoxAsyncJob, JBPluginTask
 from jbox_util import LoggerMixin, JBoxCfg, retry
+from jbox_workers import JBoxWorkerPool
+from jbox_host_sampler import JBoxHostSampler
+from jbox_keypool import JBoxSSHKeyPool
+from jbox_launch_status import JBoxLaunchStatus
 from juliabox.interactive import SessContainer
 from api import APIContainer
 from jbox_container import BaseContainer
@@ -45,6 +49,14 @@ class JBoxd(LoggerMixin):
     ACTIVATION_SENDER = None
     QUEUE = None
 
+    # worker pool that each command is executed on. commands not listed here go to the maintenance pool.
+    CMD_POOLS = {
+        JBoxAsyncJob.CMD_LAUNCH_SESSION: JBoxWorkerPool.POOL_LAUNCH,
+        JBoxAsyncJob.CMD_BACKUP_CLEANUP: JBoxWorkerPool.POOL_BACKUP,
+        JBoxAsyncJob.CMD_REQ_RESP: JBoxWorkerPool.POOL_CONTROL,
+        JBoxAsyncJob.CMD_PLUGIN_TASK: JBoxWorkerPool.POOL_CONTROL
+    }
+
     def __init__(self):
         LoggerMixin.configure()
         db.configure()
@@ -55,6 +67,11 @@ class JBoxd(LoggerMixin):
 
         JBoxAsyncJob.configure()
         JBoxAsyncJob.init(JBoxAsyncJob.MODE_SUB)
+        JBoxWorkerPool.configure()
+        JBoxHostSampler.configure()
+        JBoxSSHKeyPool.configure()
+        JBoxLaunchStatus.configure()
+        JBoxLaunchStatus.init_publisher()
 
         self.log_debug("Container manager listening on ports: %s", repr(JBoxCfg.get('container_manager_ports')))
         JBoxd.QUEUE = JBoxAsyncJob.get()
@@ -80,11 +97,11 @@ class JBoxd(LoggerMixin):
             JBoxd.LOCK.release()
             return
 
-        t = threading.Thread(target=target, args=args, name=sign)
-        JBoxd.ACTIVE[sign] = t
+        pool = JBoxd.CMD_POOLS.get(cmd, JBoxWorkerPool.POOL_MAINTENANCE)
+        JBoxd.ACTIVE[sign] = pool
         JBoxd.LOCK.release()
-        JBoxd.log_debug("scheduled " + sign)
-        t.start()
+        JBoxWorkerPool.submit(pool, sign, target, args)
+        JBoxd.log_debug("scheduled %s on pool %s", sign, pool)
 
     @staticmethod
     def finish_thread():
@@ -120,6 +137,7 @@ class JBoxd(LoggerMixin):
         cont.stop()
         cont.delete(backup=True)
         JBoxSessionProps.detach_instance(Compute.get_install_id(), cont.get_name(), Compute.get_instance_id())
+        JBoxHostSampler.note_removal()
         JBoxd.publish_perf_counters()
         JBoxd.publish_anticipated_load()
 
@@ -149,6 +167,7 @@ class JBoxd(LoggerMixin):
             JBoxd.log_error("did not start: %s", cont.debug_str())
             BaseContainer.DCKR.kill(cont.dockid)
             return False
+        JBoxLaunchStatus.publish(name, JBoxLaunchStatus.STAGE_STARTED)
         # wait for services to start
         for port in cont.get_host_ports():
             if not JBoxd._wait_for_port(port):
@@ -158,15 +177,27 @@ class JBoxd(LoggerMixin):
             else:
                 JBoxd.log_debug("port %s active: %s", port, cont.debug_str())
         JBoxd.log_info("passed connectivity check: %s", cont.debug_str())
+        JBoxLaunchStatus.publish(name, JBoxLaunchStatus.STAGE_READY)
         return True
 
     @staticmethod
     @jboxd_method
     def launch_session(name, email, reuse=True):
-        JBoxd.publish_anticipated_load(name)
-        JBoxd._wait_for_session_backup(name)
-        VolMgr.refresh_disk_use_status()
-        JBoxd._launch_session(name, email, reuse)
+        JBoxLaunchStatus.publish(name, JBoxLaunchStatus.STAGE_PREPARING)
+        launched = False
+        try:
+            JBoxd.publish_anticipated_load(name)
+            JBoxd._wait_for_session_backup(name)
+            launched = JBoxd._launch_session(name, email, reuse)
+        finally:
+            if not launched:
+                JBoxLaunchStatus.publish(name, JBoxLaunchStatus.STAGE_FAILED)
+        JBoxd.schedule_thread(JBoxAsyncJob.CMD_REFILL_WARM_POOL, JBoxd.refill_warm_pool, ())
+
+    @staticmethod
+    @jboxd_method
+    def refill_warm_pool():
+        SessContainer.refill_warm_pool()
 
     @staticmethod
     @jboxd_method
@@ -207,6 +238,8 @@ class JBoxd(LoggerMixin):
     def update_user_home_image():
         VolMgr.update_user_home_image(fetch=True)
         VolMgr.refresh_user_home_image()
+        # warm containers have config and packages from the old images
+        SessContainer.drain_warm_pool()
 
     @staticmethod
     @jboxd_method
@@ -232,26 +265,27 @@ class JBoxd(LoggerMixin):
     @staticmethod
     def publish_anticipated_load(session_name=None):
         iid = Compute.get_instance_id()
-        if session_name is None:
-            nactive = BaseContainer.num_active(BaseContainer.SFX_INT)
-        else:
+        if session_name is not None:
             JBoxSessionProps.attach_instance(Compute.get_install_id(), session_name, iid, "Preparing")
-            nactive = BaseContainer.num_active(BaseContainer.SFX_INT) + 1
-        cont_load_pct = min(100, max(0, nactive * 100 / SessContainer.MAX_CONTAINERS))
+            JBoxHostSampler.note_launch()
+        host = JBoxHostSampler.latest()
+        cont_load_pct = min(100, max(0, host['sessions'] * 100 / SessContainer.MAX_CONTAINERS))
         self_load = max(Compute.get_instance_stats(iid, 'Load'), cont_load_pct)
         Compute.publish_stats("Load", "Percent", self_load)
         accept = Compute.should_accept_session(is_proposed_cluster_leader())
-        JBoxInstanceProps.set_props(Compute.get_install_id(), iid, load=self_load, accept=accept)
+        JBoxInstanceProps.set_props(Compute.get_install_id(), iid, load=self_load, accept=accept,
+                                    disk_ids_used=host['disk_ids'], warm=host['warm'])
 
     @staticmethod
     def publish_sessions():
         iid = Compute.get_instance_id()
+        container_states = dict()
         for c in SessContainer.session_containers(allcontainers=True):
             if ('Names' in c) and (c['Names'] is not None):
                 sessname = SessContainer(c['Id']).get_name()
                 if sessname:
-                    JBoxSessionProps.attach_instance(Compute.get_install_id(),
-                                                     sessname, iid, c["Status"])
+                    container_states[sessname] = c["Status"]
+        JBoxSessionProps.attach_instances(Compute.get_install_id(), iid, container_states)
 
     @staticmethod
     def publish_instance_state():
@@ -267,39 +301,33 @@ class JBoxd(LoggerMixin):
         self_load = Compute.get_instance_stats(iid, 'Load')
         accept = Compute.should_accept_session(is_proposed_cluster_leader())
 
-        JBoxInstanceProps.set_props(Compute.get_install_id(), iid, load=self_load, accept=accept, api_status=api_status)
+        host = JBoxHostSampler.latest()
+        JBoxInstanceProps.set_props(Compute.get_install_id(), iid, load=self_load, accept=accept, api_status=api_status,
+                                    disk_ids_used=host['disk_ids'], warm=host['warm'])
 
     @staticmethod
     def publish_perf_counters():
-        """ Publish performance counters. Used for status monitoring and auto scaling. """
-        VolMgr.refresh_disk_use_status()
-        
-        nactive = BaseContainer.num_active(BaseContainer.SFX_INT)
+        """ Publish performance counters. Used for status monitoring and auto scaling.
+        Host usage is read from the latest samples of JBoxHostSampler, so this does not query docker or the host.
+        """
+        host = JBoxHostSampler.latest()
+
+        nactive = host['sessions']
         stats = []
         stats.append(("NumActiveContainers", "Count", nactive))
 
-        nactive_api = BaseContainer.num_active(BaseContainer.SFX_API)
+        nactive_api = host['apis']
         stats.append(("NumActiveAPIContainers", "Count", nactive_api))
 
-        curr_cpu_used_pct = psutil.cpu_percent()
-        last_cpu_used_pct = curr_cpu_used_pct if BaseContainer.LAST_CPU_PCT is None else BaseContainer.LAST_CPU_PCT
-        BaseContainer.LAST_CPU_PCT = curr_cpu_used_pct
-        cpu_used_pct = int((curr_cpu_used_pct + last_cpu_used_pct)/2)
+        stats.append(("NumWarmContainers", "Count", host['warm']))
+
+        cpu_used_pct = int(JBoxHostSampler.mean('cpu', 2))
         stats.append(("CPUUsed", "Percent", cpu_used_pct))
 
-        mem_used_pct = psutil.virtual_memory().percent
+        mem_used_pct = host['mem']
         stats.append(("MemUsed", "Percent", mem_used_pct))
 
-        disk_used_pct = 0
-        for x in psutil.disk_partitions():
-            if not VolMgr.is_mount_path(x.mountpoint):
-                try:
-                    disk_used_pct = max(psutil.disk_usage(x.mountpoint).percent, disk_used_pct)
-                except:
-                    pass
-        if BaseContainer.INITIAL_DISK_USED_PCT is None:
-            BaseContainer.INITIAL_DISK_USED_PCT = disk_used_pct
-        disk_used_pct = max(0, (disk_used_pct - BaseContainer.INITIAL_DISK_USED_PCT))
+        disk_used_pct = host['disk']
         stats.append(("DiskUsed", "Percent", disk_used_pct))
 
         cont_load_pct = min(100, max(0, nactive * 100 / SessContainer.MAX_CONTAINERS))
@@ -308,10 +336,49 @@ class JBoxd(LoggerMixin):
         api_cont_load_pct = min(100, max(0, nactive_api * 100 / APIContainer.MAX_CONTAINERS))
         stats.append(("APIContainersUsed", "Percent", api_cont_load_pct))
 
-        stats.append(("DiskIdsUsed", "Percent", VolMgr.used_pct()))
+        stats.append(("DiskIdsUsed", "Percent", host['disk_ids']))
 
-        overall_load_pct = max(cont_load_pct, api_cont_load_pct, disk_used_pct, mem_used_pct, cpu_used_pct, VolMgr.used_pct())
+        overall_load_pct = max(cont_load_pct, api_cont_load_pct, disk_used_pct, mem_used_pct, cpu_used_pct,
+                               host['disk_ids'])
         stats.append(("Load", "Percent", overall_load_pct))
+
+        keypool_stats = JBoxSSHKeyPool.get_stats()
+        stats.append(("SSHKeyPoolDepth", "Count", keypool_stats['depth']))
+        stats.append(("SSHKeyPoolMisses", "Count", keypool_stats['misses']))
+
+        dynconfig_stats = JBoxDynConfig.get_cache_stats()
+        stats.append(("DynConfigCacheHits", "Count", dynconfig_stats['hits']))
+        stats.append(("DynConfigCacheMisses", "Count", dynconfig_stats['misses']))
+
+        if JBoxClusterSnapshot.is_configured():
+            snapshot_stats = JBoxClusterSnapshot.get_stats()
+            if snapshot_stats['age'] is not None:
+                stats.append(("ClusterSnapshotAge", "Seconds", snapshot_stats['age']))
+            stats.append(("ClusterSnapshotMaxAge", "Seconds", snapshot_stats['max_age']))
+            stats.append(("ClusterSnapshotRefreshTime", "Seconds", snapshot_stats['refresh_secs']))
+            stats.append(("ClusterSnapshotRefreshErrors", "Count", snapshot_stats['refresh_errors']))
+            stats.append(("ClusterSnapshotSyncRefreshes", "Count", snapshot_stats['sync_refreshes']))
+
+        if JBoxMetrics.is_enabled():
+            metrics_stats = JBoxMetrics.get_stats()
+            stats.append(("MetricsPending", "Count", metrics_stats['pending']))
+            stats.append(("MetricsDropped", "Count", metrics_stats['dropped']))
+            stats.append(("MetricsFlushErrors", "Count", metrics_stats['flush_errors']))
+
+        for pool_name, pool_stats in JBoxWorkerPool.get_all_stats().iteritems():
+            stat_pfx = "Worker" + pool_name.capitalize()
+            stats.append((stat_pfx + "QueueDepth", "Count", pool_stats['queued']))
+            stats.append((stat_pfx + "Busy", "Count", pool_stats['busy']))
+            stats.append((stat_pfx + "MaxWait", "Seconds", pool_stats['max_wait']))
+
+        for pool_name, pool_stats in JBoxDBConnPool.get_all_stats().iteritems():
+            stat_pfx = "DBPool" + pool_name.capitalize()
+            stats.append((stat_pfx + "Used", "Percent", pool_stats['max_busy'] * 100 / pool_stats['size']))
+            stats.append((stat_pfx + "Waits", "Count", pool_stats['waits']))
+            stats.append((stat_pfx + "MaxWait", "Seconds", pool_stats['max_wait']))
+            stats.append((stat_pfx + "Statements", "Count", pool_stats['statements']))
+            stats.append((stat_pfx + "MeanStatementTime", "Seconds", pool_stats['mean_statement_time']))
+            stats.append((stat_pfx + "MaxStatementTime", "Seconds", pool_stats['max_statement_time']))
         Compute.publish_stats_multi(stats)
 
     @staticmethod
@@ -324,6 +391,8 @@ class JBoxd(LoggerMixin):
             JBoxInstanceProps.purge_stale_instances(Compute.get_install_id())
             features.append(JBPluginTask.JBP_CLUSTER)
 
+        JBoxd.schedule_thread(JBoxAsyncJob.CMD_REFILL_WARM_POOL, JBoxd.refill_warm_pool, ())
+
         for feature in features:
             for plugin in JBPluginTask.jbox_get_plugins(feature):
                 JBoxd.schedule_thread(cmd, plugin.do_periodic_task, (feature,))
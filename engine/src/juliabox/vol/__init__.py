@@ -1,3 +1,4 @@
 __author__ = 'tan'
 from jbox_volume import JBoxVol
+from jbox_disk_allocator import JBoxDiskAllocator
 from volmgr import VolMgr
\ No newline at end of file
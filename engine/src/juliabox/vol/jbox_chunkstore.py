@@ -0,0 +1,286 @@
+import os
+import stat
+import json
+import gzip
+import zlib
+import shutil
+import hashlib
+import datetime
+import tempfile
+import itertools
+import collections
+import pytz
+from multiprocessing.pool import ThreadPool
+
+from juliabox.jbox_util import LoggerMixin
+
+
+class JBoxChunkStore(LoggerMixin):
+    """ Incremental, deduplicated backups of a folder into a bucket store.
+
+    Files are split into fixed size chunks, which are compressed and stored under names derived from their content
+    hash. A chunk already present in the bucket is never uploaded again, whichever user or backup it came from.
+    Each backup is described by a per-session manifest listing the files with their attributes and chunks, and the
+    stored (compressed) size of each chunk. Files whose size and modification time match the previous manifest are not
+    read again. The total stored size of a backup is kept in the metadata of its manifest.
+    """
+
+    CHUNK_SIZE = 4 * 1024 * 1024
+    CHUNK_PREFIX = "chunk_"
+    MANIFEST_SUFFIX = ".manifest.gz"
+    VERSION = 1
+    # number of chunks downloaded in parallel while restoring, and how far ahead of the restore they may get
+    FETCH_THREADS = 8
+    FETCH_AHEAD = 16
+
+    def __init__(self, plugin, bucket, staging_dir, pull=None):
+        self.plugin = plugin
+        self.bucket = bucket
+        # bucket store plugins name keys after the local file, so chunks are staged in a private folder
+        self.staging_dir = tempfile.mkdtemp(prefix='chunks_', dir=staging_dir)
+        if pull is None:
+            pull = lambda local_file, metadata_only=False: plugin.pull(bucket, local_file, metadata_only=metadata_only)
+        self.pull = pull
+        self.known_chunks = set()
+        # stored size of chunks, by hash
+        self.chunk_sizes = dict()
+
+        self.num_files = 0
+        self.num_files_unchanged = 0
+        self.bytes_scanned = 0
+        self.num_chunks_uploaded = 0
+        self.bytes_uploaded = 0
+
+    def close(self):
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    def _staging_path(self, key_name):
+        return os.path.join(self.staging_dir, key_name)
+
+    @staticmethod
+    def manifest_name(sessname):
+        return sessname + JBoxChunkStore.MANIFEST_SUFFIX
+
+    def load_manifest(self, sessname):
+        local_file = self._staging_path(JBoxChunkStore.manifest_name(sessname))
+        k = self.pull(local_file)
+        if (k is None) or (not os.path.exists(local_file)):
+            return None
+        try:
+            with gzip.open(local_file, 'rb') as f:
+                manifest = json.load(f)
+        finally:
+            os.remove(local_file)
+        if manifest.get('version', 0) > JBoxChunkStore.VERSION:
+            raise Exception("Unsupported backup manifest version %r for %s" % (manifest.get('version'), sessname))
+        return manifest
+
+    def save_manifest(self, sessname, manifest):
+        local_file = self._staging_path(JBoxChunkStore.manifest_name(sessname))
+        with gzip.open(local_file, 'wb') as f:
+            json.dump(manifest, f)
+        try:
+            stored_size = os.path.getsize(local_file) + sum(manifest['chunk_sizes'].itervalues())
+            metadata = {'backup_time': manifest['backup_time'], 'stored_size': str(stored_size)}
+            if self.plugin.push(self.bucket, local_file, metadata=metadata) is None:
+                raise Exception("Error uploading backup manifest for " + sessname)
+        finally:
+            os.remove(local_file)
+
+    @staticmethod
+    def delete_manifest(plugin, bucket, sessname):
+        """ Remove the manifest of sessname, if there is one. Chunks are left for other backups to share. """
+        name = JBoxChunkStore.manifest_name(sessname)
+        if plugin.pull(bucket, name, metadata_only=True) is not None:
+            plugin.delete(bucket, name)
+            return True
+        return False
+
+    @staticmethod
+    def backup_size(plugin, bucket, sessname):
+        """ Stored size of the incremental backup of sessname (manifest and its distinct chunks), as recorded when it
+        was made. None if there is no manifest, or it does not record the size. Chunks shared with other backups are
+        counted in each.
+        """
+        k = plugin.pull(bucket, JBoxChunkStore.manifest_name(sessname), metadata_only=True)
+        if k is None:
+            return None
+        stored_size = (getattr(k, 'metadata', None) or {}).get('stored_size', None)
+        return int(stored_size) if stored_size is not None else None
+
+    def _has_chunk(self, chunk_hash):
+        if chunk_hash in self.known_chunks:
+            return True
+        k = self.plugin.pull(self.bucket, JBoxChunkStore.CHUNK_PREFIX + chunk_hash, metadata_only=True)
+        if k is not None:
+            self.known_chunks.add(chunk_hash)
+            self.chunk_sizes[chunk_hash] = k.size
+            return True
+        return False
+
+    def _put_chunk(self, data):
+        chunk_hash = hashlib.sha256(data).hexdigest()
+        if not self._has_chunk(chunk_hash):
+            zdata = zlib.compress(data)
+            local_file = self._staging_path(JBoxChunkStore.CHUNK_PREFIX + chunk_hash)
+            with open(local_file, 'wb') as f:
+                f.write(zdata)
+            try:
+                if self.plugin.push(self.bucket, local_file) is None:
+                    raise Exception("Error uploading backup chunk " + chunk_hash)
+            finally:
+                os.remove(local_file)
+            self.known_chunks.add(chunk_hash)
+            self.chunk_sizes[chunk_hash] = len(zdata)
+            self.num_chunks_uploaded += 1
+            self.bytes_uploaded += len(zdata)
+        return chunk_hash
+
+    def get_chunk(self, chunk_hash):
+        # the same chunk may be fetched concurrently
+        fetch_dir = tempfile.mkdtemp(dir=self.staging_dir)
+        local_file = os.path.join(fetch_dir, JBoxChunkStore.CHUNK_PREFIX + chunk_hash)
+        try:
+            if (self.pull(local_file) is None) or (not os.path.exists(local_file)):
+                raise Exception("Missing backup chunk " + chunk_hash)
+            with open(local_file, 'rb') as f:
+                return zlib.decompress(f.read())
+        finally:
+            shutil.rmtree(fetch_dir, ignore_errors=True)
+
+    def _prefetch(self, chunk_hashes):
+        """ Yields contents of chunk_hashes in order, downloading up to FETCH_AHEAD chunks ahead in parallel. """
+        pool = ThreadPool(JBoxChunkStore.FETCH_THREADS)
+        try:
+            chunk_hashes = iter(chunk_hashes)
+            pending = collections.deque()
+            for chunk_hash in itertools.islice(chunk_hashes, JBoxChunkStore.FETCH_AHEAD):
+                pending.append(pool.apply_async(self.get_chunk, (chunk_hash,)))
+            while len(pending) > 0:
+                result = pending.popleft()
+                for chunk_hash in itertools.islice(chunk_hashes, 1):
+                    pending.append(pool.apply_async(self.get_chunk, (chunk_hash,)))
+                yield result.get()
+        finally:
+            pool.terminate()
+
+    def _file_chunks(self, path, st, prev_entry):
+        unchanged = (prev_entry is not None) and (prev_entry['size'] == st.st_size) and \
+            (prev_entry['mtime'] == st.st_mtime)
+        # chunks not known from the previous manifest are checked (and their sizes noted) before being reused
+        if unchanged and all(self._has_chunk(chunk_hash) for chunk_hash in prev_entry['chunks']):
+            self.num_files_unchanged += 1
+            return prev_entry['chunks']
+        chunks = []
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(JBoxChunkStore.CHUNK_SIZE)
+                if len(data) == 0:
+                    break
+                self.bytes_scanned += len(data)
+                chunks.append(self._put_chunk(data))
+        return chunks
+
+    def backup(self, src_path, sessname, exclude=()):
+        """ Upload chunks of files in src_path not already in the bucket and save a new manifest for sessname.
+        Entries named in exclude are skipped at the top level of src_path.
+        """
+        prev_files = dict()
+        prev = self.load_manifest(sessname)
+        if prev is not None:
+            # chunks of manifests that do not record their sizes are looked up once more
+            self.chunk_sizes.update(prev.get('chunk_sizes', {}))
+            for entry in prev['entries']:
+                if entry['type'] == 'f':
+                    prev_files[entry['path']] = entry
+            self.known_chunks.update(self.chunk_sizes)
+
+        entries = []
+        for root, dirs, files in os.walk(src_path):
+            rel_root = os.path.relpath(root, src_path)
+            if rel_root == '.':
+                dirs[:] = [d for d in dirs if d not in exclude]
+                files = [f for f in files if f not in exclude]
+            # files before folders, so that top level files are restored first
+            for name in sorted(files) + sorted(dirs):
+                path = os.path.join(root, name)
+                rel_path = os.path.normpath(os.path.join(rel_root, name))
+                st = os.lstat(path)
+                entry = {'path': rel_path, 'mode': stat.S_IMODE(st.st_mode), 'mtime': st.st_mtime}
+                if stat.S_ISLNK(st.st_mode):
+                    entry['type'] = 'l'
+                    entry['link'] = os.readlink(path)
+                elif stat.S_ISDIR(st.st_mode):
+                    entry['type'] = 'd'
+                elif stat.S_ISREG(st.st_mode):
+                    entry['type'] = 'f'
+                    entry['size'] = st.st_size
+                    entry['chunks'] = self._file_chunks(path, st, prev_files.get(rel_path, None))
+                    self.num_files += 1
+                else:
+                    continue
+                entries.append(entry)
+
+        chunk_hashes = set(itertools.chain.from_iterable(entry['chunks'] for entry in entries if entry['type'] == 'f'))
+        manifest = {
+            'version': JBoxChunkStore.VERSION,
+            'backup_time': datetime.datetime.now(pytz.utc).isoformat(),
+            'chunk_size': JBoxChunkStore.CHUNK_SIZE,
+            'chunk_sizes': dict((chunk_hash, self.chunk_sizes[chunk_hash]) for chunk_hash in chunk_hashes),
+            'entries': entries
+        }
+        self.save_manifest(sessname, manifest)
+        return manifest
+
+    @staticmethod
+    def _is_safe_path(rel_path):
+        return (len(rel_path) > 0) and (not os.path.isabs(rel_path)) and \
+               ('..' not in rel_path.split(os.path.sep))
+
+    def restore(self, manifest, dest_path, skip=None, progress=None):
+        """ Recreate the files listed in manifest under dest_path.
+        Entries for which skip(path) returns True are not restored.
+        If given, progress(bytes_restored, total_bytes) is called after each file.
+        """
+        entries = [entry for entry in manifest['entries'] if JBoxChunkStore._is_safe_path(entry['path']) and
+                   ((skip is None) or (not skip(entry['path'])))]
+        chunks = self._prefetch(itertools.chain.from_iterable(entry['chunks'] for entry in entries
+                                                               if entry['type'] == 'f'))
+        try:
+            self._restore_entries(entries, chunks, dest_path, progress)
+        finally:
+            chunks.close()
+
+    @staticmethod
+    def _restore_entries(entries, chunks, dest_path, progress=None):
+        total_size = sum(entry['size'] for entry in entries if entry['type'] == 'f')
+        restored_size = 0
+        dir_entries = []
+        for entry in entries:
+            path = os.path.join(dest_path, entry['path'])
+            etype = entry['type']
+            if etype == 'd':
+                if not os.path.isdir(path):
+                    os.makedirs(path)
+                # keep folders writable till all their contents are restored
+                os.chmod(path, entry['mode'] | stat.S_IRWXU)
+                dir_entries.append((path, entry))
+            elif etype == 'l':
+                if os.path.lexists(path):
+                    os.remove(path)
+                os.symlink(entry['link'], path)
+            elif etype == 'f':
+                if os.path.islink(path):
+                    os.remove(path)
+                with open(path, 'wb') as f:
+                    for _chunk_hash in entry['chunks']:
+                        f.write(chunks.next())
+                os.chmod(path, entry['mode'])
+                os.utime(path, (entry['mtime'], entry['mtime']))
+                restored_size += entry['size']
+                if progress is not None:
+                    progress(restored_size, total_size)
+
+        for path, entry in reversed(dir_entries):
+            os.chmod(path, entry['mode'])
+            os.utime(path, (entry['mtime'], entry['mtime']))
@@ -0,0 +1,77 @@
+import heapq
+import threading
+import time
+
+from juliabox.jbox_util import LoggerMixin
+
+
+class JBoxDiskAllocator(LoggerMixin):
+    """ Allocates disks out of a fixed set of disk ids.
+
+    A disk is in use if it is mounted in a container (as last reported through `set_used`) or is reserved. Reservations
+    expire after a while, so that a disk reserved for a launch that failed midway becomes free again.
+
+    Free disks are kept in a set and reservations in a heap ordered by expiry time, so reserving a disk does not scan
+    through all disks. The lock is held only for these in-memory updates. Finding the disks mounted in containers is
+    left to the caller, so reservations never wait for docker or the cloud provider.
+    """
+
+    def __init__(self, disk_ids, reserve_secs):
+        self.disk_ids = frozenset(disk_ids)
+        self.reserve_secs = reserve_secs
+        self.lock = threading.Lock()
+        self.used = set()
+        # disk id: expiry time, and a heap of (expiry time, disk id) that may have stale entries
+        self.reserved = dict()
+        self.expiry = []
+        self.free = set(self.disk_ids)
+
+    def _expire(self, now):
+        while (len(self.expiry) > 0) and (self.expiry[0][0] <= now):
+            expires_at, disk_id = heapq.heappop(self.expiry)
+            if self.reserved.get(disk_id, None) != expires_at:
+                continue
+            del self.reserved[disk_id]
+            if disk_id not in self.used:
+                self.free.add(disk_id)
+
+    def reserve(self, for_secs=None):
+        """ Reserve a free disk. Returns its id, or None if all disks are in use. """
+        now = time.time()
+        with self.lock:
+            self._expire(now)
+            if len(self.free) == 0:
+                return None
+            disk_id = self.free.pop()
+            expires_at = now + (self.reserve_secs if for_secs is None else for_secs)
+            self.reserved[disk_id] = expires_at
+            heapq.heappush(self.expiry, (expires_at, disk_id))
+            return disk_id
+
+    def release(self, disk_id):
+        """ Return a disk to the free set, once the container it was mounted in is gone. """
+        if disk_id not in self.disk_ids:
+            return
+        with self.lock:
+            self.reserved.pop(disk_id, None)
+            self.used.discard(disk_id)
+            self.free.add(disk_id)
+
+    def set_used(self, used_ids):
+        """ Set the disks mounted in containers. Reserved disks stay reserved. Returns the number of free disks. """
+        now = time.time()
+        with self.lock:
+            self._expire(now)
+            self.used = set(self.disk_ids.intersection(used_ids))
+            self.free = set(self.disk_ids.difference(self.used, self.reserved))
+            return len(self.free)
+
+    def num_free(self):
+        with self.lock:
+            self._expire(time.time())
+            return len(self.free)
+
+    def used_pct(self):
+        if len(self.disk_ids) == 0:
+            return 0
+        return ((len(self.disk_ids) - self.num_free()) * 100) / len(self.disk_ids)
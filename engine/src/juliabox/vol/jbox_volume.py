@@ -7,13 +7,20 @@ import errno
 import json
 import pytz
 import subprocess
+import threading
+import multiprocessing
+from distutils.spawn import find_executable
 
 from juliabox.cloud import JBPluginCloud, Compute
 from juliabox.jbox_util import unique_sessname, ensure_delete, esc_sessname, get_user_name, parse_iso_time
 from juliabox.jbox_util import LoggerMixin, JBoxCfg, make_sure_path_exists
 from juliabox.jbox_util import JBoxPluginType
+from juliabox.jbox_container import BaseContainer
+from juliabox.jbox_container_cache import JBoxContainerCache
 from juliabox.jbox_util import create_host_mnt_command, create_container_mnt_command
-from juliabox.jbox_crypto import ssh_keygen
+from juliabox.jbox_keypool import JBoxSSHKeyPool
+from juliabox.jbox_launch_status import JBoxLaunchStatus
+from jbox_chunkstore import JBoxChunkStore
 
 
 class JBoxVol(LoggerMixin):
@@ -34,10 +41,15 @@ class JBoxVol(LoggerMixin):
     - `get_disk_for_user(user_id)`: Create, initialize and return an object representing a disk for the gived user id.
     - `get_disk_from_container(cid)`: Return an object representing the disk mounted in the provided container if any.
     - `is_mount_path(fs_path)`: Check if the provided path belongs to a disk managed by the plugin.
-    - `refresh_disk_use_status(container_id_list=None)`: Update status of all disks managed by the plugin by iterating through all containers.
+    - `refresh_disk_use_status(container_id_list=None, mount_index=None)`: Update status of all disks managed by the plugin by iterating through all containers.
+        `mount_index`, if provided, is the result of `JBoxVol.get_mount_index` for the containers.
     - `disk_ids_used_pct()`: Percent of configured disks in use (indicates load on the system).
     - `refresh_user_home_image()`: Update any pre-created disk images with a freshly downloaded JuliaBox user home image. Not required for data volumes.
     - `release(backup)`: Release the disk. Backup contents if indicated.
+
+    User home providers can optionally support warm containers, by implementing:
+    - `get_blank_disk()`: Reserve and return a blank disk not yet assigned to any user. None if none available.
+    - `assign_to_user(user_email)`: Restore data for the user on to a blank disk, and return the user's disk.
     """
 
     __metaclass__ = JBoxPluginType
@@ -70,6 +82,14 @@ class JBoxVol(LoggerMixin):
 
     SH_DEVICE_VERSION = None
 
+    # back up incrementally as content addressed chunks into the bucket store
+    BACKUP_INCREMENTAL = True
+    # stream backups into the bucket store, compressing with pigz on multiple cores if available
+    BACKUP_STREAM = True
+    PIGZ = None
+    RESTORE_READ_SIZE = 1024 * 1024
+    COMPRESS_THREADS = 1
+
     def __init__(self, disk_path, user_email=None, user_name=None, sessname=None, old_sessname=None):
         self.disk_path = disk_path
         self.user_email = user_email
@@ -103,9 +123,33 @@ class JBoxVol(LoggerMixin):
 
     @classmethod
     def get_cname(cls, cid):
-        props = JBoxVol.DCKR.inspect_container(cid)
+        props = JBoxContainerCache.inspect(cid)
         return props['Name'] if ('Name' in props) else None
 
+    @staticmethod
+    def get_mounts(cid):
+        """ (container path, host path) of volumes mounted in the container. """
+        return JBoxVol.extract_mounts(JBoxContainerCache.inspect(cid))
+
+    @staticmethod
+    def get_mount_index(container_id_list=None):
+        """ Host paths of volumes mounted in containers, as {host path: container id}.
+        Containers default to all session and warm containers. Each container is inspected once and inspection results
+        are shared through the container cache, so plugins can look up their disks without inspecting containers again.
+        """
+        if container_id_list is None:
+            container_id_list = [cdesc['Id'] for cdesc in BaseContainer.session_containers(allcontainers=True)]
+            container_id_list.extend([cdesc['Id'] for cdesc in BaseContainer.warm_containers(allcontainers=True)])
+
+        mount_index = dict()
+        for cid in container_id_list:
+            try:
+                for _cpath, hpath in JBoxVol.get_mounts(cid):
+                    mount_index[hpath] = cid
+            except:
+                JBoxVol.log_exception("error finding mounts of %s", cid)
+        return mount_index
+
     @classmethod
     def get_pid(cls, cid):
         props = JBoxVol.DCKR.inspect_container(cid)
@@ -128,6 +172,14 @@ class JBoxVol(LoggerMixin):
         JBoxVol.LOCAL_TZ_OFFSET = JBoxVol.local_time_offset()
         JBoxVol.BACKUP_BUCKET = JBoxCfg.get('cloud_host.backup_bucket')
 
+        JBoxVol.BACKUP_INCREMENTAL = JBoxCfg.get('backup.incremental', True)
+        JBoxVol.BACKUP_STREAM = JBoxCfg.get('backup.stream', True)
+        if JBoxCfg.get('backup.parallel_compress', True):
+            JBoxVol.PIGZ = find_executable('pigz')
+        JBoxVol.COMPRESS_THREADS = JBoxCfg.get('backup.compress_threads', 0) or multiprocessing.cpu_count()
+        JBoxVol.log_info("Backup streaming: %r, compressor: %s", JBoxVol.BACKUP_STREAM,
+                         ("pigz (%d threads)" % (JBoxVol.COMPRESS_THREADS,)) if JBoxVol.PIGZ else "gzip")
+
         for plugin in JBoxVol.plugins:
             assert issubclass(plugin, JBoxVol)
             plugin.configure()
@@ -204,7 +256,7 @@ class JBoxVol(LoggerMixin):
         if os.path.exists(ssh_pub_key_path) and not os.access(ssh_pub_key_path, os.W_OK):
             os.chmod(ssh_pub_key_path, 0644)
 
-        public_key, private_key = ssh_keygen()
+        public_key, private_key = JBoxSSHKeyPool.get_keypair()
         public_key += " juliabox\n"
         private_key += "\n"
         with open(ssh_key_path, 'w') as f:
@@ -313,18 +365,112 @@ class JBoxVol(LoggerMixin):
             return None
         return plugin.pull(JBoxVol.BACKUP_BUCKET, local_file, metadata_only=metadata_only)
 
-    def _backup(self, clear_volume=False):
+    @staticmethod
+    def stream_from_bucketstore(key_name):
+        """ Open a backup in the bucket store for reading, if the bucket store supports streaming. """
+        plugin = JBPluginCloud.jbox_get_plugin(JBPluginCloud.JBP_BUCKETSTORE)
+        if (plugin is None) or (JBoxVol.BACKUP_BUCKET is None) or (not hasattr(plugin, 'pull_stream')):
+            return None
+        return plugin.pull_stream(JBoxVol.BACKUP_BUCKET, key_name)
+
+    @staticmethod
+    def _start_compressor(out_file):
+        """ Start a multi-core gzip compressor that writes to out_file (a file object or subprocess.PIPE).
+        Returns None if no parallel compressor is available.
+        """
+        if JBoxVol.PIGZ is None:
+            return None
+        return subprocess.Popen([JBoxVol.PIGZ, '-c', '-p', str(JBoxVol.COMPRESS_THREADS)],
+                                stdin=subprocess.PIPE, stdout=out_file, close_fds=True)
+
+    @staticmethod
+    def _start_decompressor():
+        """ Start a gzip decompressor in a separate process, reading and writing through pipes.
+        Returns None if pigz is not available.
+        """
+        if JBoxVol.PIGZ is None:
+            return None
+        return subprocess.Popen([JBoxVol.PIGZ, '-d', '-c'], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                close_fds=True)
+
+    def _archive_to(self, fileobj, compress):
+        """ Write a tar archive of the disk into fileobj. Returns the uncompressed size of the archive. """
+        bkup_tar = tarfile.open(fileobj=fileobj, mode=('w|gz' if compress else 'w|'))
+        try:
+            # top level files go first, so that they are restored before the (possibly large) folders
+            names = sorted(os.listdir(self.disk_path), key=lambda f: os.path.isdir(os.path.join(self.disk_path, f)))
+            for f in names:
+                if f.startswith('.') and (f in ['.juliabox']):
+                    continue
+                full_path = os.path.join(self.disk_path, f)
+                bkup_tar.add(full_path, os.path.join('juser', f))
+        finally:
+            bkup_tar.close()
+        return bkup_tar.offset
+
+    def _backup_stream(self, plugin):
+        """ Archive, compress and upload the disk in a single pass without staging it locally.
+        Returns the uncompressed and compressed sizes.
+        """
+        JBoxVol.log_info("Streaming backup of " + self.sessname + " to bucket " + JBoxVol.BACKUP_BUCKET)
+        compressor = JBoxVol._start_compressor(subprocess.PIPE)
+        if compressor is not None:
+            tar_out, compressed_in = compressor.stdin, compressor.stdout
+        else:
+            rfd, wfd = os.pipe()
+            tar_out, compressed_in = os.fdopen(wfd, 'wb'), os.fdopen(rfd, 'rb')
+
+        result = dict()
+
+        def _write():
+            try:
+                result['raw'] = self._archive_to(tar_out, compressor is None)
+            except Exception as ex:
+                result['error'] = ex
+            finally:
+                tar_out.close()
+
+        writer = threading.Thread(target=_write, name=threading.current_thread().name + '_tar')
+        writer.daemon = True
+        writer.start()
+
+        reader = CountingReader(compressed_in)
+        try:
+            metadata = {'backup_time': datetime.datetime.now(pytz.utc).isoformat()}
+            plugin.push_stream(JBoxVol.BACKUP_BUCKET, self.sessname + ".tar.gz", reader, metadata=metadata)
+        finally:
+            # closing the read end unblocks the writer if the upload failed midway
+            compressed_in.close()
+            writer.join()
+            if compressor is not None:
+                compressor.wait()
+
+        if 'error' in result:
+            raise result['error']
+        if (compressor is not None) and (compressor.returncode != 0):
+            raise Exception("Error compressing backup. pigz exit code %r" % (compressor.returncode,))
+        return result['raw'], reader.count
+
+    def _backup_local(self, plugin, clear_volume):
+        """ Archive the disk to the local backup location and then upload it to the bucket store if configured.
+        Returns the uncompressed and compressed sizes.
+        """
         JBoxVol.log_info("Backing up " + self.sessname + " at " + str(JBoxVol.BACKUP_LOC))
 
         bkup_file = os.path.join(JBoxVol.BACKUP_LOC, self.sessname + ".tar.gz")
-        bkup_tar = tarfile.open(bkup_file, 'w:gz')
-
-        for f in os.listdir(self.disk_path):
-            if f.startswith('.') and (f in ['.juliabox']):
-                continue
-            full_path = os.path.join(self.disk_path, f)
-            bkup_tar.add(full_path, os.path.join('juser', f))
-        bkup_tar.close()
+        with open(bkup_file, 'wb') as bkup_out:
+            compressor = JBoxVol._start_compressor(bkup_out)
+            if compressor is None:
+                raw_size = self._archive_to(bkup_out, True)
+            else:
+                try:
+                    raw_size = self._archive_to(compressor.stdin, False)
+                finally:
+                    compressor.stdin.close()
+                    compressor.wait()
+                if compressor.returncode != 0:
+                    raise Exception("Error compressing backup. pigz exit code %r" % (compressor.returncode,))
+        compressed_size = os.path.getsize(bkup_file)
         os.chmod(bkup_file, 0666)
 
         if clear_volume:
@@ -333,72 +479,250 @@ class JBoxVol(LoggerMixin):
         # Upload to S3 if so configured. Delete from local if successful.
         bkup_file_mtime = datetime.datetime.fromtimestamp(os.path.getmtime(bkup_file), pytz.utc) + \
             datetime.timedelta(seconds=JBoxVol.LOCAL_TZ_OFFSET)
-        plugin = JBPluginCloud.jbox_get_plugin(JBPluginCloud.JBP_BUCKETSTORE)
         if plugin is not None and JBoxVol.BACKUP_BUCKET is not None:
             if plugin.push(JBoxVol.BACKUP_BUCKET, bkup_file,
                            metadata={'backup_time': bkup_file_mtime.isoformat()}) is not None:
                 os.remove(bkup_file)
                 JBoxVol.log_info("Moved backup to S3 " + self.sessname)
+        return raw_size, compressed_size
+
+    @staticmethod
+    def _publish_backup_stats(sessname, raw_size, compressed_size, secs):
+        ratio = float(raw_size) / compressed_size if compressed_size > 0 else 0.0
+        throughput = raw_size / secs if secs > 0 else 0.0
+        JBoxVol.log_info("Backed up %s. size: %d, compressed: %d, ratio: %.2f, time: %.1f secs, throughput: %.2f MB/s",
+                         sessname, raw_size, compressed_size, ratio, secs, throughput / (1024 * 1024))
+        try:
+            Compute.publish_stats_multi([("BackupCompressionRatio", "None", ratio),
+                                         ("BackupThroughput", "Bytes/Second", throughput)])
+        except:
+            JBoxVol.log_exception("Error publishing backup stats")
+
+    def _backup_incremental(self, plugin):
+        """ Upload chunks of changed files and a new manifest to the bucket store. """
+        JBoxVol.log_info("Incremental backup of " + self.sessname + " to bucket " + JBoxVol.BACKUP_BUCKET)
+        tstart = time.time()
+        store = JBoxChunkStore(plugin, JBoxVol.BACKUP_BUCKET, JBoxVol.BACKUP_LOC)
+        try:
+            store.backup(self.disk_path, self.sessname, exclude=('.juliabox',))
+        finally:
+            store.close()
+        secs = time.time() - tstart
+        JBoxVol.log_info("Backed up %s. files: %d (%d unchanged), scanned: %d bytes, uploaded: %d chunks (%d bytes), "
+                         "time: %.1f secs", self.sessname, store.num_files, store.num_files_unchanged,
+                         store.bytes_scanned, store.num_chunks_uploaded, store.bytes_uploaded, secs)
+        try:
+            Compute.publish_stats_multi([("BackupUploadBytes", "Bytes", store.bytes_uploaded),
+                                         ("BackupTime", "Seconds", secs)])
+        except:
+            JBoxVol.log_exception("Error publishing backup stats")
+
+    def _backup(self, clear_volume=False):
+        tstart = time.time()
+        plugin = JBPluginCloud.jbox_get_plugin(JBPluginCloud.JBP_BUCKETSTORE)
+        use_bucket = (JBoxVol.BACKUP_BUCKET is not None) and (plugin is not None)
+
+        if JBoxVol.BACKUP_INCREMENTAL and use_bucket:
+            try:
+                self._backup_incremental(plugin)
+                if clear_volume:
+                    ensure_delete(self.disk_path)
+                return
+            except:
+                JBoxVol.log_exception("Error in incremental backup of %s. Falling back to full archive.",
+                                      self.sessname)
+
+        sizes = None
+        if JBoxVol.BACKUP_STREAM and use_bucket and hasattr(plugin, 'push_stream'):
+            try:
+                sizes = self._backup_stream(plugin)
+                if clear_volume:
+                    ensure_delete(self.disk_path)
+            except:
+                JBoxVol.log_exception("Error streaming backup of %s. Falling back to local archive.", self.sessname)
+
+        if sizes is None:
+            tstart = time.time()
+            sizes = self._backup_local(plugin, clear_volume)
+
+        if use_bucket:
+            # an older incremental backup would otherwise be preferred over this one on restore
+            try:
+                if JBoxChunkStore.delete_manifest(plugin, JBoxVol.BACKUP_BUCKET, self.sessname):
+                    JBoxVol.log_info("Removed older incremental backup manifest of %s", self.sessname)
+            except:
+                JBoxVol.log_exception("Error removing incremental backup manifest of %s", self.sessname)
+
+        raw_size, compressed_size = sizes
+        JBoxVol._publish_backup_stats(self.sessname, raw_size, compressed_size, time.time() - tstart)
+
+    @staticmethod
+    def _is_restore_skipped(rel_path):
+        return rel_path.startswith('.') and JBoxVol._is_path_user_home_essential(rel_path)
+
+    def _restore_incremental(self, sessname, pull_from_bucketstore, progress=None):
+        """ Restore from the incremental backup manifest of sessname, if there is one. """
+        if JBoxVol.BACKUP_LOC is None:
+            return False
+        store = JBoxChunkStore(None, JBoxVol.BACKUP_BUCKET, JBoxVol.BACKUP_LOC, pull=pull_from_bucketstore)
+        try:
+            manifest = store.load_manifest(sessname)
+            if manifest is None:
+                return False
+            JBoxVol.log_info("Restoring incremental backup of %s (%d entries) to %s",
+                             sessname, len(manifest['entries']), self.disk_path)
+            try:
+                store.restore(manifest, self.disk_path, skip=JBoxVol._is_restore_skipped, progress=progress)
+                JBoxVol.log_info("Restored backup at " + self.disk_path)
+            except (IOError, OSError) as ioe:
+                if ioe.errno == errno.ENOSPC:
+                    # continue login on ENOSPC to allow user to delete files
+                    JBoxVol.log_exception("No space left to restore backup for %s", sessname)
+                else:
+                    raise
+            return True
+        finally:
+            store.close()
 
     def restore(self):
         sessname = unique_sessname(self.user_email)
         old_sessname = esc_sessname(self.user_email)
-        src = os.path.join(JBoxVol.BACKUP_LOC, sessname + ".tar.gz")
 
         pull_from_bucketstore = JBoxVol.pull_from_bucketstore
+        stream_from_bucketstore = JBoxVol.stream_from_bucketstore if JBoxVol.BACKUP_STREAM else None
         mig_hndl = JBPluginCloud.jbox_get_plugin(JBPluginCloud.JBP_MIGRATE)
         if mig_hndl and mig_hndl.should_migrate(self.user_email):
             pull_from_bucketstore = mig_hndl.pull_from_bucketstore
+            stream_from_bucketstore = None
 
-        k = pull_from_bucketstore(src)  # download from S3 if exists
-        if not os.path.exists(src):
-            if old_sessname is not None:
-                src = os.path.join(JBoxVol.BACKUP_LOC, old_sessname + ".tar.gz")
-                k = pull_from_bucketstore(src)  # download from S3 if exists
+        JBoxLaunchStatus.publish(sessname, JBoxLaunchStatus.STAGE_DISK)
+        progress = JBoxLaunchStatus.progress_reporter(sessname)
 
-        if not os.path.exists(src):
+        # prefer the backup format currently in use, but restore from the other if that is all there is
+        if JBoxVol.BACKUP_INCREMENTAL and self._restore_incremental(sessname, pull_from_bucketstore, progress):
+            return
+        if self._restore_archive(sessname, old_sessname, pull_from_bucketstore, stream_from_bucketstore, progress):
             return
+        if not JBoxVol.BACKUP_INCREMENTAL:
+            self._restore_incremental(sessname, pull_from_bucketstore, progress)
+
+    def _restore_archive(self, sessname, old_sessname, pull_from_bucketstore, stream_from_bucketstore,
+                         progress=None):
+        """ Restore from the full backup archive of sessname (or old_sessname), if there is one.
+        The archive is extracted while it is being downloaded if the bucket store supports streaming.
+        """
+        for name in (sessname, old_sessname):
+            if name is None:
+                continue
+            key_name = name + ".tar.gz"
+            if stream_from_bucketstore is not None:
+                try:
+                    stream = stream_from_bucketstore(key_name)
+                    if stream is not None:
+                        JBoxVol.log_info("Streaming restore of backup " + key_name + " to " + self.disk_path)
+                        self._extract_backup(stream, sessname, getattr(stream, 'size', None), progress)
+                        return True
+                except:
+                    JBoxVol.log_exception("Error streaming backup %s. Falling back to download.", key_name)
+
+            src = os.path.join(JBoxVol.BACKUP_LOC, key_name)
+            k = pull_from_bucketstore(src)  # download from S3 if exists
+            if os.path.exists(src):
+                JBoxVol.log_info("Restoring backup " + src + " to " + self.disk_path)
+                self._extract_backup(open(src, 'rb'), sessname, os.path.getsize(src), progress)
+                # delete local copy of backup if we have it on bucketstore
+                if k is not None:
+                    os.remove(src)
+                return True
+        return False
 
-        JBoxVol.log_info("Filtering out restore info from backup " + src + " to " + self.disk_path)
+    def _extract_backup(self, fileobj, sessname, size=None, progress=None):
+        """ Extract a gzipped backup archive read from fileobj in a single pass. Closes fileobj.
+        Reading (downloading) and decompressing happen in separate threads (or process) from extraction.
+        If the archive size is known, progress(bytes_read, size) is called as it is read.
+        """
+        decompressor = JBoxVol._start_decompressor()
+        if decompressor is not None:
+            feed_out, tar_in = decompressor.stdin, decompressor.stdout
+        else:
+            rfd, wfd = os.pipe()
+            feed_out, tar_in = os.fdopen(wfd, 'wb'), os.fdopen(rfd, 'rb')
+
+        result = dict()
+
+        def _feed():
+            nread = 0
+            try:
+                while True:
+                    data = fileobj.read(JBoxVol.RESTORE_READ_SIZE)
+                    if len(data) == 0:
+                        break
+                    feed_out.write(data)
+                    nread += len(data)
+                    if (progress is not None) and size:
+                        progress(nread, size)
+            except Exception as ex:
+                result['error'] = ex
+            finally:
+                feed_out.close()
+
+        feeder = threading.Thread(target=_feed, name=threading.current_thread().name + '_feed')
+        feeder.daemon = True
+        feeder.start()
 
-        src_tar = tarfile.open(src, 'r:gz')
         try:
-            perms = {}
-            for info in src_tar.getmembers():
-                if not info.name.startswith('juser/'):
-                    continue
-                extract_name = info.name[6:]
-                if (info.type == tarfile.LNKTYPE or info.type == tarfile.SYMTYPE) and \
-                        info.linkname.startswith('juser/'):
-                    info.linkname = info.linkname[6:]
-                if info.name.startswith('juser/.'):
-                    if JBoxVol._is_path_user_home_essential(extract_name):
-                        continue
-                info.name = extract_name
-                if len(info.name) == 0:
-                    continue
-                src_tar.extract(info, self.disk_path)
-                extracted_path = os.path.join(self.disk_path, extract_name)
-                if os.path.isdir(extracted_path) and not os.access(extracted_path, os.W_OK):
-                    st = os.stat(extracted_path)
-                    perms[extracted_path] = st
-                    os.chmod(extracted_path, st.st_mode | stat.S_IWRITE)
-            if len(perms) > 0:
-                JBoxVol.log_debug("resetting permissions on %d folders", len(perms))
-                for extracted_path, perm in perms.iteritems():
-                    os.chmod(extracted_path, perm)
-            JBoxVol.log_info("Restored backup at " + self.disk_path)
-        except IOError as ioe:
-            if ioe.errno == errno.ENOSPC:
-                # continue login on ENOSPC to allow user to delete files
-                JBoxVol.log_exception("No space left to restore backup for %s", sessname)
-            else:
-                raise
+            src_tar = tarfile.open(fileobj=tar_in, mode=('r|' if decompressor is not None else 'r|gz'))
+            try:
+                self._extract_user_home(src_tar)
+                JBoxVol.log_info("Restored backup at " + self.disk_path)
+            except IOError as ioe:
+                if ioe.errno == errno.ENOSPC:
+                    # continue login on ENOSPC to allow user to delete files
+                    JBoxVol.log_exception("No space left to restore backup for %s", sessname)
+                else:
+                    raise
+            finally:
+                src_tar.close()
         finally:
-            src_tar.close()
-        # delete local copy of backup if we have it on bucketstore
-        if k is not None:
-            os.remove(src)
+            # closing the read end unblocks the feeder if extraction stopped midway
+            tar_in.close()
+            feeder.join()
+            if decompressor is not None:
+                decompressor.wait()
+            fileobj.close()
+
+        if 'error' in result:
+            raise result['error']
+        if (decompressor is not None) and (decompressor.returncode != 0):
+            raise Exception("Error decompressing backup. pigz exit code %r" % (decompressor.returncode,))
+
+    def _extract_user_home(self, src_tar):
+        """ Extract members of a backup archive (opened in stream mode) into the disk, in archive order.
+        Essential files from the user home image are not overwritten. Read-only folders are kept writable till all
+        their contents are extracted.
+        """
+        dir_modes = []
+        for info in src_tar:
+            if not info.name.startswith('juser/'):
+                continue
+            extract_name = info.name[6:]
+            if len(extract_name) == 0:
+                continue
+            if (info.type == tarfile.LNKTYPE or info.type == tarfile.SYMTYPE) and \
+                    info.linkname.startswith('juser/'):
+                info.linkname = info.linkname[6:]
+            if extract_name.startswith('.') and JBoxVol._is_path_user_home_essential(extract_name):
+                continue
+            info.name = extract_name
+            if info.isdir() and ((info.mode & stat.S_IRWXU) != stat.S_IRWXU):
+                dir_modes.append((os.path.join(self.disk_path, extract_name), info.mode))
+                info.mode |= stat.S_IRWXU
+            src_tar.extract(info, self.disk_path)
+
+        if len(dir_modes) > 0:
+            JBoxVol.log_debug("resetting permissions on %d folders", len(dir_modes))
+            for extracted_path, mode in reversed(dir_modes):
+                os.chmod(extracted_path, mode)
 
     def get_disk_space_used(self):
         sub = subprocess.Popen(['df', '-H', self.disk_path],
@@ -406,3 +730,28 @@ class JBoxVol(LoggerMixin):
         op = sub.stdout.read().split('\n')[1].split()
         disk_used = op[2] + ' / ' + op[1]
         return disk_used
+
+
+class CountingReader(object):
+    """ Wraps a readable file object and counts the bytes read through it.
+    Reads block till the requested size is available, returning less only at end of file.
+    """
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.count = 0
+
+    def read(self, size=-1):
+        if size < 0:
+            data = self.fileobj.read()
+        else:
+            chunks = []
+            remaining = size
+            while remaining > 0:
+                chunk = self.fileobj.read(remaining)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                remaining -= len(chunk)
+            data = ''.join(chunks)
+        self.count += len(data)
+        return data
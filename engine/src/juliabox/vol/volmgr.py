@@ -6,6 +6,7 @@ import pytz
 from juliabox.jbox_util import LoggerMixin, unique_sessname
 from juliabox.db import JBoxUserV2, JBoxDynConfig
 from jbox_volume import JBoxVol
+from jbox_chunkstore import JBoxChunkStore
 from juliabox.cloud import JBPluginCloud, Compute
 
 
@@ -151,7 +152,11 @@ class VolMgr(LoggerMixin):
             raise Exception("No plugin found for %s" % (JBoxVol.JBP_USERHOME,))
 
         disk = plugin.get_disk_for_user(email)
+        VolMgr._setup_user_disk(disk, email)
+        return disk
 
+    @staticmethod
+    def _setup_user_disk(disk, email):
         try:
             disk.setup_tutorial_link()
             disk.gen_ssh_key()
@@ -163,12 +168,38 @@ class VolMgr(LoggerMixin):
             else:
                 raise
 
+    @staticmethod
+    def get_blank_disk():
+        """ A blank user home disk for a warm container, or None if not supported or available. """
+        plugin = JBoxVol.jbox_get_plugin(JBoxVol.JBP_USERHOME)
+        if (plugin is None) or not hasattr(plugin, 'get_blank_disk'):
+            return None
+        return plugin.get_blank_disk()
+
+    @staticmethod
+    def get_cfg_mount_for_session(sessname):
+        plugin = JBoxVol.jbox_get_plugin(JBoxVol.JBP_CONFIG)
+        if plugin is None:
+            raise Exception("No plugin found for %s" % (JBoxVol.JBP_CONFIG,))
+        return plugin.get_disk_for_session(sessname)
+
+    @staticmethod
+    def assign_disk_to_user(cid, email):
+        """ Restore the user's data on to the blank user home disk of a warm container. """
+        VolMgr.log_debug("restoring disk of %s for %s", cid, email)
+        blank_disk = VolMgr.get_disk_from_container(cid, JBoxVol.JBP_USERHOME)
+        if blank_disk is None:
+            raise Exception("No user home disk found in container %s" % (cid,))
+        disk = blank_disk.assign_to_user(email)
+        VolMgr._setup_user_disk(disk, email)
         return disk
 
     @staticmethod
     def refresh_disk_use_status(container_id_list=None):
+        # containers are inspected once for all plugins
+        mount_index = JBoxVol.get_mount_index(container_id_list)
         for plugin in JBoxVol.plugins:
-            plugin.refresh_disk_use_status(container_id_list=container_id_list)
+            plugin.refresh_disk_use_status(container_id_list=container_id_list, mount_index=mount_index)
 
     @staticmethod
     def calc_stat(user_email):
@@ -177,9 +208,14 @@ class VolMgr(LoggerMixin):
 
         plugin = JBPluginCloud.jbox_get_plugin(JBPluginCloud.JBP_BUCKETSTORE)
         if plugin is not None:
-            k = plugin.pull(JBoxVol.BACKUP_BUCKET, sessname + ".tar.gz", metadata_only=True)
-            if k is not None:
-                VolMgr.STATS['loopback']['sizes'].append(k.size)
+            # an incremental backup, where there is one, is the latest (full archives remove its manifest)
+            size = JBoxChunkStore.backup_size(plugin, JBoxVol.BACKUP_BUCKET, sessname)
+            if size is None:
+                k = plugin.pull(JBoxVol.BACKUP_BUCKET, sessname + ".tar.gz", metadata_only=True)
+                if k is not None:
+                    size = k.size
+            if size is not None:
+                VolMgr.STATS['loopback']['sizes'].append(size)
 
     @staticmethod
     def calc_stats():
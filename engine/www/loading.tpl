@@ -2,27 +2,43 @@
 
 {% block head %}
 <script type="text/javascript">
-    var monitor_loading_timer;
+    var loading_seq = 0;
+    var loading_messages = {
+        'preparing': 'Creating a JuliaBox instance just for you!',
+        'disk': 'Setting up your files...',
+        'restore': 'Restoring your files...',
+        'started': 'Starting services...',
+        'ready': 'Almost there...'
+    };
 
     function monitor_loading() {
         $.ajax({
-            url: '/?monitor_loading=yes',
+            url: '/?monitor_loading=yes&seq=' + loading_seq,
             type: 'GET',
             success: function(res) {
                 if(res.code != 0) {
-                    clearInterval(monitor_loading_timer);
                     top.location.href = '/';
+                    return;
+                }
+                if(res.stage in loading_messages) {
+                    loading_seq = res.seq;
+                    var msg = loading_messages[res.stage];
+                    if((res.stage == 'restore') && (res.progress != null)) {
+                        msg = 'Restoring your files... ' + res.progress + '%';
+                    }
+                    $('#loading_state').text(msg);
                 }
+                // the server holds the request till the launch progresses, so poll again right away
+                monitor_loading();
             },
             error: function(res) {
-                clearInterval(monitor_loading_timer);
                 top.location.href = '/';
             }
         });
     };
 
     $(document).ready(function() {
-        monitor_loading_timer = setInterval(monitor_loading, 2000);
+        monitor_loading();
     });
 </script>
 {% end %}
@@ -37,6 +37,16 @@ def table_create(table_name, columns=None, types=None, keys=None, keys_types=Non
     c.execute(sql)
     conn.commit()
 
+def columns_add(table_name, columns, types):
+    # tables created by older versions may lack columns added since
+    c.execute("show columns from `%s`" % (table_name,))
+    existing = [row[0] for row in c.fetchall()]
+    for col, t in zip(columns, types):
+        if col not in existing:
+            c.execute("alter table `%s` add column `%s` %s" % (table_name, col, t))
+            conn.commit()
+            print("\tadded column %s." % (col,))
+
 def index_exists(tname, iname):
     f = c.execute("show index from `%s` where Key_name=\"%s\"" % (tname, iname))
     return f != 0
@@ -79,6 +89,7 @@ for cls in tables:
     print("Creating %s..." % (cls.NAME,))
     if table_exists(cls.NAME):
         print("\texists already!")
+        columns_add(cls.NAME, cls.ATTRIBUTES, cls.TYPES)
     else:
         table_create(cls.NAME, cls.ATTRIBUTES, cls.TYPES, cls.KEYS, cls.KEYS_TYPES)
         print("\tcreated.")
@@ -32,6 +32,17 @@ def table_create(table_name, columns, keys=None):
     c.execute(sql)
     conn.commit()
 
+
+def columns_add(table_name, columns):
+    # tables created by older versions may lack columns added since
+    c.execute('pragma table_info("%s")' % (table_name,))
+    existing = [row[1] for row in c.fetchall()]
+    for col in columns:
+        if col not in existing:
+            c.execute('alter table %s add column %s' % (table_name, col))
+            conn.commit()
+            print("\tadded column %s." % (col,))
+
 print("connecting to %s" % (sys.argv[1],))
 conn = sqlite3.connect(sys.argv[1])
 c = conn.cursor()
@@ -44,6 +55,7 @@ for cls in tables:
     print("Creating %s..." % (cls.NAME,))
     if table_exists(cls.NAME):
         print("\texists already!")
+        columns_add(cls.NAME, cls.ATTRIBUTES)
     else:
         table_create(cls.NAME, cls.ATTRIBUTES, cls.KEYS)
         print("\tcreated.")
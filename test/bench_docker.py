@@ -0,0 +1,570 @@
+#! /usr/bin/env python
+"""
+Simulated docker daemon, for benchmarking the JuliaBox engine on machines without docker.
+
+Serves the subset of the docker remote API (v1.24) that the engine calls through docker-py, with a configurable
+latency for each operation. Containers do not run anything. Starting a container opens listening sockets for its
+published ports (after a simulated boot delay), and for API containers, a worker that answers requests from the
+API queue named in the container environment.
+
+Run standalone as: bench_docker.py [port]
+"""
+
+import os
+import sys
+import re
+import json
+import time
+import uuid
+import random
+import socket
+import hashlib
+import datetime
+import threading
+import urlparse
+import SocketServer
+import BaseHTTPServer
+
+import zmq
+
+ZERO_TIME = '0001-01-01T00:00:00Z'
+# body frame of binary API responses
+BINARY_CHUNK = os.urandom(64 * 1024)
+
+# seconds taken by each operation. the actual delay is uniformly distributed around it, within +/- 50%.
+DEFAULT_LATENCY = {
+    'list': 0.01,
+    'inspect': 0.005,
+    'images': 0.01,
+    'create': 0.2,
+    'start': 0.3,
+    'stop': 0.5,
+    'kill': 0.05,
+    'restart': 0.8,
+    'rename': 0.02,
+    'remove': 0.1,
+    # after start, till the ports of a container accept connections
+    'boot': 1.0,
+    # time taken by an API container to respond to a request
+    'api_call': 0.02
+}
+
+
+def _now_iso():
+    return datetime.datetime.utcnow().isoformat() + 'Z'
+
+
+def _image_id(image):
+    return 'sha256:' + hashlib.sha256(image).hexdigest()
+
+
+class APIError(Exception):
+    def __init__(self, code, msg):
+        super(APIError, self).__init__(msg)
+        self.code = code
+
+
+class SimAPIWorker(object):
+    """ Stands in for the process in an API container. Answers requests from the API queue till terminated. """
+
+    def __init__(self, container):
+        self.container = container
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name='sim_api_' + container.name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+
+    def _run(self):
+        sock = zmq.Context.instance().socket(zmq.REP)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.connect(self.container.env['JBAPI_QUEUE'])
+        poller = zmq.Poller()
+        poller.register(sock, zmq.POLLIN)
+        cid = self.container.env.get('JBAPI_CID', self.container.name)
+        try:
+            while not self.stopped:
+                if not poller.poll(100):
+                    continue
+                req = json.loads(sock.recv())
+                if req['cmd'] == ':terminate':
+                    sock.send(json.dumps({'code': 200, 'data': '', 'nid': cid}))
+                    self.container.daemon.exited(self.container)
+                    break
+                self.container.daemon.delay('api_call')
+                if req['cmd'] == 'binary':
+                    # header frame followed by raw body frames
+                    nbytes = int(req['args'][0])
+                    hdr = {'code': 200, 'hdrs': {'Content-Type': 'application/octet-stream'}, 'nid': cid}
+                    body = [BINARY_CHUNK[:min(len(BINARY_CHUNK), nbytes - pos)]
+                            for pos in range(0, nbytes, len(BINARY_CHUNK))]
+                    sock.send_multipart([json.dumps(hdr)] + body)
+                    continue
+                resp = {
+                    'code': 200,
+                    'data': ' '.join([req['cmd']] + req.get('args', [])),
+                    'hdrs': {'Content-Type': 'text/plain'},
+                    'nid': cid
+                }
+                sock.send(json.dumps(resp))
+        finally:
+            sock.close()
+
+
+class SimContainer(object):
+    def __init__(self, daemon, name, spec):
+        self.daemon = daemon
+        self.id = uuid.uuid4().hex + uuid.uuid4().hex
+        self.name = name
+        self.image = spec.get('Image', '')
+        self.env = dict(e.split('=', 1) for e in (spec.get('Env', None) or []))
+        hostcfg = spec.get('HostConfig', None) or {}
+        self.binds = hostcfg.get('Binds', None) or []
+        self.port_bindings = hostcfg.get('PortBindings', None) or {}
+        for port in (spec.get('ExposedPorts', None) or {}):
+            self.port_bindings.setdefault(port, [{'HostIp': '', 'HostPort': ''}])
+        self.memory = hostcfg.get('Memory', 0)
+        self.cpu_shares = spec.get('CpuShares', hostcfg.get('CpuShares', 0))
+        self.created = time.time()
+        self.started_at = ZERO_TIME
+        self.finished_at = ZERO_TIME
+        self.running = False
+        self.sockets = dict()
+        self.worker = None
+
+    def start(self):
+        self.running = True
+        self.started_at = _now_iso()
+        for port in self.port_bindings:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(('127.0.0.1', 0))
+            self.sockets[port] = sock
+        boot = threading.Timer(self.daemon.latency('boot'), self._boot)
+        boot.daemon = True
+        boot.start()
+
+    def _boot(self):
+        with self.daemon.lock:
+            if not self.running:
+                return
+            for sock in self.sockets.values():
+                sock.listen(128)
+            if 'JBAPI_QUEUE' in self.env:
+                self.worker = SimAPIWorker(self)
+
+    def stop(self):
+        self.running = False
+        self.finished_at = _now_iso()
+        for sock in self.sockets.values():
+            sock.close()
+        self.sockets = dict()
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
+
+    def status(self):
+        if self.running:
+            return 'Up %d seconds' % (int(time.time() - self.created),)
+        if self.finished_at != ZERO_TIME:
+            return 'Exited (0) 1 seconds ago'
+        return 'Created'
+
+    def summary(self):
+        return {
+            'Id': self.id,
+            'Names': ['/' + self.name],
+            'Image': self.image,
+            'ImageID': _image_id(self.image),
+            'Command': '',
+            'Created': int(self.created),
+            'State': 'running' if self.running else 'exited',
+            'Status': self.status(),
+            'Ports': [],
+            'Labels': {}
+        }
+
+    def inspect(self):
+        mounts = []
+        for bind in self.binds:
+            parts = bind.split(':')
+            mode = parts[2] if len(parts) > 2 else 'rw'
+            mounts.append({'Source': parts[0], 'Destination': parts[1], 'Mode': mode, 'RW': mode != 'ro'})
+
+        ports = dict()
+        for port, sock in self.sockets.iteritems():
+            ports[port] = [{'HostIp': '127.0.0.1', 'HostPort': str(sock.getsockname()[1])}]
+
+        return {
+            'Id': self.id,
+            'Name': '/' + self.name,
+            'Image': _image_id(self.image),
+            'Created': datetime.datetime.utcfromtimestamp(self.created).isoformat() + 'Z',
+            'State': {
+                'Running': self.running,
+                'Paused': False,
+                'Restarting': False,
+                'Pid': 1 if self.running else 0,
+                'ExitCode': 0,
+                'StartedAt': self.started_at,
+                'FinishedAt': self.finished_at
+            },
+            'Config': {
+                'Image': self.image,
+                'Env': ['%s=%s' % (n, v) for n, v in self.env.iteritems()],
+                'ExposedPorts': dict((p, {}) for p in self.port_bindings)
+            },
+            'HostConfig': {
+                'Binds': self.binds,
+                'PortBindings': self.port_bindings,
+                'Memory': self.memory,
+                'CpuShares': self.cpu_shares
+            },
+            'NetworkSettings': {
+                'Ports': ports
+            },
+            'Mounts': mounts
+        }
+
+
+class SimDocker(object):
+    """ Container state of the simulated daemon. Thread safe. """
+
+    def __init__(self, latency=None):
+        self.latencies = dict(DEFAULT_LATENCY)
+        if latency is not None:
+            self.latencies.update(latency)
+        self.lock = threading.RLock()
+        self.events_cond = threading.Condition(self.lock)
+        self.containers = dict()
+        self.images = dict()
+        self.events = []
+        self.num_calls = dict()
+
+    def latency(self, op):
+        return self.latencies.get(op, 0) * random.uniform(0.5, 1.5)
+
+    def delay(self, op):
+        with self.lock:
+            self.num_calls[op] = self.num_calls.get(op, 0) + 1
+        secs = self.latency(op)
+        if secs > 0:
+            time.sleep(secs)
+
+    def _emit(self, cont, status):
+        with self.lock:
+            self.events.append({
+                'status': status,
+                'id': cont.id,
+                'from': cont.image,
+                'Type': 'container',
+                'Action': status,
+                'Actor': {'ID': cont.id, 'Attributes': {'name': cont.name}},
+                'time': int(time.time()),
+                'timeNano': int(time.time() * 1e9)
+            })
+            self.events_cond.notify_all()
+
+    def _find(self, ref):
+        if ref.startswith('/'):
+            ref = ref[1:]
+        if ref in self.containers:
+            return self.containers[ref]
+        for cont in self.containers.itervalues():
+            if cont.name == ref or cont.id.startswith(ref):
+                return cont
+        raise APIError(404, 'No such container: ' + ref)
+
+    def list(self, all_containers, filters):
+        with self.lock:
+            conts = self.containers.values()
+        if not all_containers:
+            conts = [c for c in conts if c.running]
+        for cid in filters.get('id', []):
+            conts = [c for c in conts if c.id.startswith(cid)]
+        for name in filters.get('name', []):
+            conts = [c for c in conts if name in c.name]
+        return [c.summary() for c in conts]
+
+    def inspect(self, ref):
+        with self.lock:
+            return self._find(ref).inspect()
+
+    def list_images(self):
+        with self.lock:
+            return [{'Id': _image_id(image), 'RepoTags': [image if ':' in image else (image + ':latest')],
+                     'Created': int(created)} for image, created in self.images.iteritems()]
+
+    def create(self, name, spec):
+        with self.lock:
+            if name is None:
+                name = uuid.uuid4().hex[:12]
+            if any(c.name == name for c in self.containers.itervalues()):
+                raise APIError(409, 'Conflict. The name "/%s" is already in use' % (name,))
+            cont = SimContainer(self, name, spec)
+            self.containers[cont.id] = cont
+            self.images.setdefault(cont.image, time.time())
+        self._emit(cont, 'create')
+        return {'Id': cont.id, 'Warnings': None}
+
+    def start(self, ref):
+        with self.lock:
+            cont = self._find(ref)
+            if cont.running:
+                return 304
+            cont.start()
+        self._emit(cont, 'start')
+        return 204
+
+    def stop(self, ref, status='stop'):
+        with self.lock:
+            cont = self._find(ref)
+            if not cont.running:
+                return 304
+            cont.stop()
+        self._emit(cont, 'die')
+        self._emit(cont, status)
+        return 204
+
+    def exited(self, cont):
+        """ Called when the process in a container exits by itself. """
+        with self.lock:
+            if (cont.id not in self.containers) or (not cont.running):
+                return
+            cont.stop()
+        self._emit(cont, 'die')
+
+    def restart(self, ref):
+        self.stop(ref)
+        self.start(ref)
+        with self.lock:
+            cont = self._find(ref)
+        self._emit(cont, 'restart')
+        return 204
+
+    def rename(self, ref, name):
+        with self.lock:
+            cont = self._find(ref)
+            if any((c.name == name) and (c is not cont) for c in self.containers.itervalues()):
+                raise APIError(409, 'Conflict. The name "/%s" is already in use' % (name,))
+            cont.name = name
+        self._emit(cont, 'rename')
+        return 204
+
+    def remove(self, ref, force):
+        with self.lock:
+            cont = self._find(ref)
+            if cont.running:
+                if not force:
+                    raise APIError(409, 'You cannot remove a running container ' + cont.id)
+                cont.stop()
+            del self.containers[cont.id]
+        self._emit(cont, 'destroy')
+        return 204
+
+    def follow_events(self, since, stopped):
+        """ Yields events since the given time, waiting for new ones till stopped() returns True. """
+        with self.lock:
+            pos = 0
+            while (pos < len(self.events)) and (self.events[pos]['time'] < since):
+                pos += 1
+        while not stopped():
+            with self.lock:
+                if pos >= len(self.events):
+                    self.events_cond.wait(1)
+                new_events = self.events[pos:]
+                pos = len(self.events)
+            for event in new_events:
+                yield event
+
+    def stop_all(self):
+        """ Stop all running containers, waiting for their API workers to exit. """
+        with self.lock:
+            workers = [c.worker for c in self.containers.itervalues() if c.worker is not None]
+            for cont in self.containers.itervalues():
+                if cont.running:
+                    cont.stop()
+        for worker in workers:
+            worker.thread.join(1)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'containers': len(self.containers),
+                'running': len([c for c in self.containers.itervalues() if c.running]),
+                'calls': dict(self.num_calls)
+            }
+
+
+class SimDockerHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    ROUTES = [
+        ('GET', r'^/containers/json$', '_list'),
+        ('POST', r'^/containers/create$', '_create'),
+        ('GET', r'^/containers/([^/]+)/json$', '_inspect'),
+        ('POST', r'^/containers/([^/]+)/start$', '_start'),
+        ('POST', r'^/containers/([^/]+)/stop$', '_stop'),
+        ('POST', r'^/containers/([^/]+)/kill$', '_kill'),
+        ('POST', r'^/containers/([^/]+)/restart$', '_restart'),
+        ('POST', r'^/containers/([^/]+)/rename$', '_rename'),
+        ('DELETE', r'^/containers/([^/]+)$', '_remove'),
+        ('GET', r'^/images/json$', '_images'),
+        ('GET', r'^/events$', '_events'),
+        ('GET', r'^/version$', '_version'),
+        ('GET', r'^/_ping$', '_ping')
+    ]
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    @property
+    def sim(self):
+        return self.server.sim
+
+    def _dispatch(self, method):
+        url = urlparse.urlparse(self.path)
+        path = re.sub(r'^/v[0-9.]+', '', url.path)
+        self.params = dict((n, v[-1]) for n, v in urlparse.parse_qs(url.query).iteritems())
+        length = int(self.headers.getheader('Content-Length', 0))
+        body = self.rfile.read(length) if length > 0 else ''
+        self.body = json.loads(body) if len(body) > 0 else None
+
+        for route_method, pattern, fn_name in SimDockerHandler.ROUTES:
+            match = re.match(pattern, path)
+            if (route_method == method) and (match is not None):
+                try:
+                    getattr(self, fn_name)(*match.groups())
+                except APIError as ex:
+                    self._respond(ex.code, {'message': str(ex)})
+                return
+        self._respond(404, {'message': 'page not found'})
+
+    def _respond(self, code, obj=None):
+        body = '' if obj is None else json.dumps(obj)
+        self.send_response(code)
+        if obj is not None:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _flag(self, name):
+        return self.params.get(name, '0') in ('1', 'True', 'true')
+
+    def _list(self):
+        self.sim.delay('list')
+        filters = json.loads(self.params['filters']) if 'filters' in self.params else {}
+        self._respond(200, self.sim.list(self._flag('all'), filters))
+
+    def _create(self):
+        self.sim.delay('create')
+        self._respond(201, self.sim.create(self.params.get('name', None), self.body or {}))
+
+    def _inspect(self, ref):
+        self.sim.delay('inspect')
+        self._respond(200, self.sim.inspect(ref))
+
+    def _start(self, ref):
+        self.sim.delay('start')
+        self._respond(self.sim.start(ref))
+
+    def _stop(self, ref):
+        self.sim.delay('stop')
+        self._respond(self.sim.stop(ref))
+
+    def _kill(self, ref):
+        self.sim.delay('kill')
+        self._respond(self.sim.stop(ref, status='kill'))
+
+    def _restart(self, ref):
+        self.sim.delay('restart')
+        self._respond(self.sim.restart(ref))
+
+    def _rename(self, ref):
+        self.sim.delay('rename')
+        self._respond(self.sim.rename(ref, self.params['name']))
+
+    def _remove(self, ref):
+        self.sim.delay('remove')
+        self._respond(self.sim.remove(ref, self._flag('force')))
+
+    def _images(self):
+        self.sim.delay('images')
+        self._respond(200, self.sim.list_images())
+
+    def _version(self):
+        self._respond(200, {'Version': '1.12.0', 'ApiVersion': '1.24', 'Os': 'linux', 'Arch': 'amd64'})
+
+    def _ping(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write('OK')
+
+    def _events(self):
+        since = int(self.params.get('since', 0) or 0)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for event in self.sim.follow_events(since, lambda: self.server.stopped):
+                chunk = json.dumps(event) + '\n'
+                self.wfile.write('%x\r\n%s\r\n' % (len(chunk), chunk))
+                self.wfile.flush()
+            self.wfile.write('0\r\n\r\n')
+        except socket.error:
+            pass
+        self.close_connection = 1
+
+
+class SimDockerServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, port=0, latency=None):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), SimDockerHandler)
+        self.sim = SimDocker(latency)
+        self.stopped = False
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return 'tcp://127.0.0.1:%d' % (self.server_address[1],)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='sim_docker')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def handle_error(self, request, client_address):
+        # clients going away midway, e.g. while following events
+        if not isinstance(sys.exc_info()[1], socket.error):
+            BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+    def stop(self):
+        self.stopped = True
+        self.shutdown()
+        self.sim.stop_all()
+
+
+if __name__ == "__main__":
+    server = SimDockerServer(int(sys.argv[1]) if len(sys.argv) > 1 else 2375)
+    print("simulated docker daemon at %s" % (server.base_url,))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,643 @@
+#! /usr/bin/env python
+"""
+Self-contained benchmark of the JuliaBox engine. Needs neither docker nor any cloud service.
+
+Runs the session manager (JBox), container manager (JBoxd) and API server (JBoxAPI) as separate processes, as in a
+deployment, against a simulated docker daemon (bench_docker.py) with configurable latencies, the sqlite database
+plugin with its database on a memory backed file system where available, and the single node compute plugin.
+
+It then replays:
+- a storm of logins (zero auth), each followed by the loading page long poll till the session is up,
+- ping traffic from the logged in sessions,
+- calls to a registered API, served by simulated API containers,
+- maintenance cycles: periodic housekeeping of the servers, and commands / status queries to the container manager,
+and reports latency percentiles, throughput and errors for each engine entry point, with the number of threads of
+each server process.
+
+Latencies of entry points that run inside a server (housekeeping, container manager commands) are measured in that
+server process and collected on exit.
+
+Examples:
+    benchmark.py
+    benchmark.py --users 100 --duration 120 --latency create=0.5 --latency start=1
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import signal
+import random
+import socket
+import shutil
+import tarfile
+import sqlite3
+import urllib
+import urllib2
+import cookielib
+import tempfile
+import argparse
+import threading
+import subprocess
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+ENGINE_DIR = os.path.join(TEST_DIR, "..", "engine")
+sys.path.append(os.path.join(ENGINE_DIR, "src"))
+
+import psutil
+
+from bench_docker import SimDockerServer, DEFAULT_LATENCY
+
+SERVERS = ('jboxd', 'jbox', 'jbapi')
+PLUGINS = [
+    "juliabox.plugins.compute_singlenode",
+    "juliabox.plugins.db_sqlite3",
+    "juliabox.plugins.vol_hostdisk",
+    "juliabox.plugins.vol_defcfg",
+    "juliabox.plugins.vol_defpkg",
+    "juliabox.plugins.auth_zero"
+]
+# templates (re)generated by the session manager for the plugins in use
+GENERATED_TEMPLATES = ('admin_modules.tpl', 'auth_modules.tpl', 'session_modules.tpl')
+API_NAME = 'bench'
+
+
+class Timings(object):
+    """ Start times and latencies of named operations, with the reasons of failed ones. Thread safe. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = dict()
+        self.errors = dict()
+
+    def record(self, name, tstart, secs, error=None):
+        with self.lock:
+            self.samples.setdefault(name, []).append((tstart, secs, error is None))
+            if error is not None:
+                key = name + ': ' + error
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+    def wrap(self, name, fn):
+        def _timed(*args, **kwargs):
+            tstart = time.time()
+            error = 'exception'
+            try:
+                ret = fn(*args, **kwargs)
+                error = None
+                return ret
+            finally:
+                self.record(name, tstart, time.time() - tstart, error)
+        _timed.__name__ = fn.__name__
+        return _timed
+
+    def update(self, other):
+        with self.lock:
+            for name, values in other['samples'].iteritems():
+                self.samples.setdefault(name, []).extend([tuple(v) for v in values])
+            for key, count in other['errors'].iteritems():
+                self.errors[key] = self.errors.get(key, 0) + count
+
+    def to_json(self):
+        with self.lock:
+            return {'samples': self.samples, 'errors': self.errors}
+
+    def report(self):
+        """ Rows of (name, count, errors, per sec, p50 ms, p99 ms, max ms), by name.
+        Rates are over the time from the first call to the end of the last.
+        """
+        rows = []
+        with self.lock:
+            for name in sorted(self.samples.keys()):
+                values = self.samples[name]
+                secs = sorted(v[1] for v in values)
+                errors = len([v for v in values if not v[2]])
+                span = max(v[0] + v[1] for v in values) - min(v[0] for v in values)
+                rate = (len(values) / span) if span > 0 else 0
+                rows.append((name, len(values), errors, rate,
+                             percentile(secs, 50) * 1000, percentile(secs, 99) * 1000, secs[-1] * 1000))
+        return rows
+
+
+def percentile(sorted_values, pct):
+    idx = int(math.ceil(pct / 100.0 * len(sorted_values))) - 1
+    return sorted_values[max(0, idx)]
+
+
+def free_ports(num):
+    socks = []
+    for _ in range(num):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('', 0))
+        socks.append(sock)
+    ports = [sock.getsockname()[1] for sock in socks]
+    for sock in socks:
+        sock.close()
+    return ports
+
+
+def conf_files(workdir):
+    return os.path.join(ENGINE_DIR, "conf", "tornado.conf.tpl"), os.path.join(workdir, "bench.conf")
+
+
+def stats_file(workdir, name):
+    return os.path.join(workdir, name + ".stats.json")
+
+
+def serve(name, workdir, docker_url, maintain_secs):
+    """ Runs one of the servers, with a docker client connected to the simulated daemon. """
+    import docker
+    from juliabox.jbox_util import JBoxCfg
+
+    if name == 'jbapi':
+        from zmq.eventloop import ioloop
+        ioloop.install()
+
+    JBoxCfg.read(*conf_files(workdir))
+    JBoxCfg.dckr = docker.Client(base_url=docker_url)
+    timings = Timings()
+    extra_stats = lambda: {}
+
+    if name == 'jboxd':
+        from juliabox.srvr_jboxd import JBoxd
+        from juliabox.jbox_workers import JBoxWorkerPool
+        for cmd in ('launch_session', 'backup_and_cleanup', 'refresh_disks', 'collect_stats', 'plugin_action',
+                    'process_and_respond', 'refill_warm_pool', 'schedule_housekeeping'):
+            setattr(JBoxd, cmd, staticmethod(timings.wrap('jboxd ' + cmd, getattr(JBoxd, cmd))))
+        server = JBoxd()
+        extra_stats = lambda: {'workers': JBoxWorkerPool.get_all_stats(reset_max=False)}
+    elif name == 'jbox':
+        import tornado.ioloop
+        from juliabox.srvr_jbox import JBox
+        from juliabox.jbox_async_service import JBoxAsyncService
+        # blocking calls made off the IOLoop, as measured by the async service
+        record = JBoxAsyncService._record
+
+        def _record(call, secs):
+            record(call, secs)
+            timings.record('jbox async ' + call, time.time() - secs, secs)
+        JBoxAsyncService._record = staticmethod(_record)
+        server = JBox()
+        tornado.ioloop.PeriodicCallback(timings.wrap('jbox do_housekeeping', JBox.do_housekeeping),
+                                        maintain_secs * 1000, server.ioloop).start()
+    else:
+        from zmq.eventloop import ioloop
+        from juliabox.srvr_jbapi import JBoxAPI
+        server = JBoxAPI()
+        ioloop.PeriodicCallback(timings.wrap('jbapi do_housekeeping', JBoxAPI.do_housekeeping),
+                                maintain_secs * 1000, server.ioloop).start()
+
+    try:
+        server.run()
+    finally:
+        with open(stats_file(workdir, name), 'w') as f:
+            json.dump({'timings': timings.to_json(), 'extra': extra_stats()}, f)
+
+
+class NoRedirect(urllib2.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class BenchUser(object):
+    def __init__(self, idx):
+        self.user_id = 'user%d@bench.juliabox.org' % (idx,)
+        self.cookies = cookielib.CookieJar()
+        self.opener = urllib2.build_opener(urllib2.HTTPCookieProcessor(self.cookies), NoRedirect())
+        self.has_session = False
+
+
+class Benchmark(object):
+    def __init__(self, opts):
+        self.opts = opts
+        self.workdir = tempfile.mkdtemp(prefix='jbox_bench_')
+        shm = '/dev/shm'
+        self.dbdir = tempfile.mkdtemp(prefix='jbox_bench_db_', dir=shm if os.path.isdir(shm) else None)
+        self.timings = Timings()
+        self.procs = dict()
+        self.threads = dict()
+        self.phases = []
+        self.templates = dict()
+        self.sampler_stopped = False
+        self.users = [BenchUser(idx) for idx in range(opts.users)]
+
+        latency = dict(DEFAULT_LATENCY)
+        for spec in opts.latency:
+            op, secs = spec.split('=')
+            if op not in latency:
+                raise ValueError("unknown docker operation %s. known operations: %s" %
+                                 (op, ', '.join(sorted(latency.keys()))))
+            latency[op] = float(secs)
+        self.docker = SimDockerServer(latency=latency)
+
+        (self.mgr_port_push, self.mgr_port_req, self.launch_status_port,
+         self.jbox_port, self.api_port) = free_ports(5)
+        self.jbox_url = 'http://localhost:%d' % (self.jbox_port,)
+        self.api_url = 'http://localhost:%d' % (self.api_port,)
+
+    def log(self, msg, *args):
+        print("[%s] %s" % (time.strftime('%H:%M:%S'), msg % args))
+        sys.stdout.flush()
+
+    def setup(self):
+        data = os.path.join(self.workdir, 'data')
+        for folder in ('disks', 'configs', 'packages', 'backups', 'keys'):
+            os.makedirs(os.path.join(data, folder))
+
+        home_src = os.path.join(self.workdir, 'user_home')
+        for path, content in (('.juliabox/README', 'JuliaBox'),
+                              ('.ipython/profile_default/ipython_notebook_config.py', 'c = get_config()\n'),
+                              ('.juliarc.jl', '# benchmark\n')):
+            path = os.path.join(home_src, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(content)
+        user_home_image = os.path.join(data, 'user_home.tar.gz')
+        with tarfile.open(user_home_image, 'w:gz') as tar:
+            for name in os.listdir(home_src):
+                tar.add(os.path.join(home_src, name), arcname=name)
+        pkg_image = os.path.join(data, 'julia_packages.tar.gz')
+        with tarfile.open(pkg_image, 'w:gz') as tar:
+            tar.add(os.path.join(home_src, '.juliabox'), arcname='v0.4')
+
+        cfg = {
+            "container_manager_ports": (self.mgr_port_push, self.mgr_port_req),
+            "jbox_log_level": self.opts.log_level,
+            "root_log_level": 40,
+            "sesskey": uuid.uuid4().hex,
+            "numdisksmax": self.opts.max_sessions,
+            "launch_status": {"port": self.launch_status_port},
+            "interactive": {
+                "manager_port": self.jbox_port,
+                "numlocalmax": self.opts.max_sessions,
+                "warm_pool": {"min": 0, "max": 0}
+            },
+            "api": {
+                "manager_port": self.api_port,
+                "bridge_ip": "127.0.0.1"
+            },
+            "cloud_host": {
+                "install_id": "JuliaBoxBench",
+                "scale_down": False,
+                "backup_bucket": None,
+                "status_bucket": None
+            },
+            "ssh_keypool": {"location": os.path.join(data, 'keys'), "size": self.opts.users},
+            "backup_location": os.path.join(data, 'backups'),
+            "pkg_location": os.path.join(data, 'packages'),
+            "cfg_location": os.path.join(data, 'configs'),
+            "mnt_location": os.path.join(data, 'disks'),
+            "user_home_image": user_home_image,
+            "pkg_image": pkg_image,
+            "db": {"connect_str": os.path.join(self.dbdir, 'juliabox.db')},
+            "plugins": PLUGINS
+        }
+        with open(conf_files(self.workdir)[1], 'w') as f:
+            f.write(repr(cfg))
+
+        from juliabox.jbox_util import JBoxCfg, LoggerMixin
+        JBoxCfg.read(*conf_files(self.workdir))
+        LoggerMixin.configure()
+        self.create_tables()
+
+        from juliabox import db
+        from juliabox.db import JBoxAPISpec
+        from juliabox.cloud import Compute
+        from juliabox.jbox_tasks import JBoxAsyncJob
+        db.configure()
+        Compute.configure()
+        JBoxAPISpec(API_NAME, cmd='', description='benchmark', publisher='bench@juliabox.org', timeout_secs=30,
+                    min_idle=self.opts.api_min_idle, create=True)
+        # this process acts as another web server, that sends commands and status queries to the container manager
+        JBoxAsyncJob.configure()
+        JBoxAsyncJob.init(JBoxAsyncJob.MODE_PUB)
+
+        www = os.path.join(ENGINE_DIR, 'www')
+        for name in GENERATED_TEMPLATES:
+            path = os.path.join(www, name)
+            if os.path.exists(path):
+                with open(path) as f:
+                    self.templates[path] = f.read()
+
+    def create_tables(self):
+        from juliabox.db import JBoxUserV2, JBoxDynConfig, JBoxSessionProps, JBoxInstanceProps, JBoxAPISpec, \
+            JBoxUserProfile
+        from juliabox.jbox_util import JBoxCfg
+
+        conn = sqlite3.connect(JBoxCfg.get('db.connect_str'))
+        c = conn.cursor()
+        for cls in (JBoxUserV2, JBoxDynConfig, JBoxSessionProps, JBoxInstanceProps, JBoxAPISpec, JBoxUserProfile):
+            allcolumns = cls.ATTRIBUTES if cls.KEYS is None else cls.KEYS + cls.ATTRIBUTES
+            sql = 'create table %s (%s' % (cls.NAME, ', '.join(allcolumns))
+            if cls.KEYS is not None:
+                sql += (', primary key (%s)' % (', '.join(cls.KEYS),))
+            c.execute(sql + ')')
+        conn.commit()
+        conn.close()
+
+    def start_servers(self):
+        self.docker.start()
+        self.log("simulated docker daemon at %s", self.docker.base_url)
+        for name in SERVERS:
+            log_file = open(os.path.join(self.workdir, name + '.log'), 'w')
+            cmd = [sys.executable, os.path.abspath(__file__), '--serve', name, self.workdir, self.docker.base_url,
+                   str(self.opts.maintain_secs)]
+            self.procs[name] = subprocess.Popen(cmd, stdout=log_file, stderr=subprocess.STDOUT, cwd=TEST_DIR)
+            self.threads[name] = []
+
+        for port in (self.jbox_port, self.api_port):
+            self.wait_for_port(port)
+        self.log("servers started. logs in %s", self.workdir)
+
+        sampler = threading.Thread(target=self.sample_threads, name='sampler')
+        sampler.daemon = True
+        sampler.start()
+
+    def wait_for_port(self, port, timeout=60):
+        tstart = time.time()
+        while (time.time() - tstart) < timeout:
+            for name, proc in self.procs.iteritems():
+                if proc.poll() is not None:
+                    raise Exception("%s exited with code %r. see %s" %
+                                    (name, proc.returncode, os.path.join(self.workdir, name + '.log')))
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                if sock.connect_ex(('localhost', port)) == 0:
+                    return
+            finally:
+                sock.close()
+            time.sleep(0.2)
+        raise Exception("timed out waiting for port %d" % (port,))
+
+    def sample_threads(self):
+        while not self.sampler_stopped:
+            for name, proc in self.procs.items():
+                try:
+                    self.threads[name].append(psutil.Process(proc.pid).num_threads())
+                except psutil.Error:
+                    pass
+            time.sleep(0.5)
+
+    def stop_servers(self):
+        self.sampler_stopped = True
+        for proc in self.procs.values():
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGTERM)
+        tstart = time.time()
+        for name, proc in self.procs.iteritems():
+            while (proc.poll() is None) and ((time.time() - tstart) < 15):
+                time.sleep(0.1)
+            if proc.poll() is None:
+                self.log("killing %s", name)
+                proc.kill()
+                proc.wait()
+        self.docker.stop()
+
+        for path, content in self.templates.iteritems():
+            with open(path, 'w') as f:
+                f.write(content)
+
+    def http(self, name, opener, url):
+        """ Make a timed request, returning the response code and body. """
+        tstart = time.time()
+        code = 0
+        body = ''
+        try:
+            resp = opener.open(url, timeout=60)
+            code = resp.getcode()
+            body = resp.read()
+        except urllib2.HTTPError as ex:
+            code = ex.code
+            body = ex.read()
+        except Exception as ex:
+            body = str(ex)
+        if 200 <= code < 400:
+            error = None
+        elif code > 0:
+            error = 'HTTP %d' % (code,)
+        else:
+            error = body
+        self.timings.record(name, tstart, time.time() - tstart, error)
+        return code, body
+
+    def run_threads(self, num, target, *args):
+        threads = [threading.Thread(target=target, args=args, name='%s_%d' % (target.__name__, idx))
+                   for idx in range(num)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+
+    def phase(self, name, fn):
+        self.log("%s...", name)
+        tstart = time.time()
+        fn()
+        self.phases.append((name, tstart, time.time()))
+        self.log("%s done in %.1fs", name, time.time() - tstart)
+
+    def login(self, user):
+        tstart = time.time()
+        url = self.jbox_url + '/jboxauth/zero/?' + urllib.urlencode({'user_id': user.user_id})
+        code, _body = self.http('jbox /jboxauth/zero/ (login)', user.opener, url)
+        if code != 302:
+            return
+        code, _body = self.http('jbox / (loading)', user.opener, self.jbox_url + '/')
+
+        seq = 0
+        while (code == 200) and ((time.time() - tstart) < self.opts.launch_timeout):
+            code, body = self.http('jbox /?monitor_loading (long poll)', user.opener,
+                                   self.jbox_url + '/?monitor_loading=1&seq=%d' % (seq,))
+            if code != 200:
+                break
+            status = json.loads(body)
+            if status['code'] != 0:
+                break
+            seq = status.get('seq', seq)
+
+        code, body = self.http('jbox / (session)', user.opener, self.jbox_url + '/')
+        user.has_session = (code == 200) and any(c.name.startswith('jp_') for c in user.cookies)
+        self.timings.record('session launch (login to session page)', tstart, time.time() - tstart,
+                            None if user.has_session else 'no session')
+
+    def login_storm(self):
+        pending = list(self.users)
+        lock = threading.Lock()
+
+        def _login():
+            while True:
+                with lock:
+                    if len(pending) == 0:
+                        return
+                    user = pending.pop(0)
+                self.login(user)
+
+        self.run_threads(min(self.opts.users, self.opts.login_concurrency), _login)
+
+    def ping_traffic(self, deadline):
+        users = [u for u in self.users if u.has_session]
+        if len(users) == 0:
+            self.log("no sessions to ping")
+            return
+
+        def _ping():
+            while time.time() < deadline:
+                self.http('jbox /jboxping/', random.choice(users).opener, self.jbox_url + '/jboxping/')
+                time.sleep(self.opts.ping_interval)
+
+        self.run_threads(self.opts.ping_concurrency, _ping)
+
+    def api_calls(self, deadline):
+        opener = urllib2.build_opener()
+        counter = [0]
+
+        def _call():
+            while time.time() < deadline:
+                counter[0] += 1
+                if self.opts.api_binary_bytes > 0:
+                    self.http('jbapi /%s/binary/ (api call)' % (API_NAME,), opener,
+                              '%s/%s/binary/%d' % (self.api_url, API_NAME, self.opts.api_binary_bytes))
+                else:
+                    self.http('jbapi /%s/<cmd>/ (api call)' % (API_NAME,), opener,
+                              '%s/%s/echo/%d' % (self.api_url, API_NAME, counter[0]))
+
+        self.run_threads(self.opts.api_concurrency, _call)
+
+    def maintenance(self, deadline):
+        from juliabox.jbox_tasks import JBoxAsyncJob
+
+        while time.time() < deadline:
+            self.timings.wrap('jboxd api_status (req/resp)', JBoxAsyncJob.sync_api_status)('localhost')
+            self.timings.wrap('jboxd is_terminating (req/resp)', JBoxAsyncJob.sync_is_terminating)()
+            JBoxAsyncJob.async_plugin_maintenance(True)
+            JBoxAsyncJob.async_refresh_disks()
+            JBoxAsyncJob.async_collect_stats()
+            time.sleep(self.opts.maintain_secs)
+
+    def steady_traffic(self):
+        deadline = time.time() + self.opts.duration
+        workers = [threading.Thread(target=fn, args=(deadline,), name=fn.__name__)
+                   for fn in (self.ping_traffic, self.api_calls, self.maintenance)]
+        for t in workers:
+            t.daemon = True
+            t.start()
+        for t in workers:
+            t.join()
+
+    def collect_server_stats(self):
+        extra = dict()
+        for name in SERVERS:
+            path = stats_file(self.workdir, name)
+            if not os.path.exists(path):
+                self.log("no stats from %s", name)
+                continue
+            with open(path) as f:
+                stats = json.load(f)
+            self.timings.update(stats['timings'])
+            extra[name] = stats['extra']
+        return extra
+
+    def report(self, extra):
+        print("")
+        print("=== phases")
+        for name, tstart, tend in self.phases:
+            print("%-20s %8.1fs" % (name, tend - tstart))
+
+        print("")
+        print("=== entry points")
+        print("%-45s %7s %6s %8s %9s %9s %9s" % ('', 'count', 'errors', 'per sec', 'p50 ms', 'p99 ms', 'max ms'))
+        for row in self.timings.report():
+            print("%-45s %7d %6d %8.2f %9.1f %9.1f %9.1f" % row)
+
+        if len(self.timings.errors) > 0:
+            print("")
+            print("=== errors")
+            for key in sorted(self.timings.errors.keys()):
+                print("%-70s %7d" % (key[:70], self.timings.errors[key]))
+
+        workers = extra.get('jboxd', {}).get('workers', {})
+        if len(workers) > 0:
+            print("")
+            print("=== container manager worker pools")
+            print("%-45s %7s %7s %9s %9s" % ('', 'workers', 'done', 'mean wait', 'max wait'))
+            for name in sorted(workers.keys()):
+                s = workers[name]
+                print("%-45s %7d %7d %8.2fs %8.2fs" % (name, s['workers'], s['done'], s['mean_wait'], s['max_wait']))
+
+        print("")
+        print("=== threads")
+        print("%-45s %7s %7s" % ('', 'max', 'last'))
+        for name in SERVERS:
+            samples = self.threads[name]
+            if len(samples) > 0:
+                print("%-45s %7d %7d" % (name, max(samples), samples[-1]))
+
+        docker_stats = self.docker.sim.stats()
+        print("")
+        print("=== simulated docker: %d containers (%d running)" % (docker_stats['containers'],
+                                                                     docker_stats['running']))
+        print(", ".join("%s: %d" % (op, cnt) for op, cnt in sorted(docker_stats['calls'].iteritems())))
+
+    def cleanup(self):
+        shutil.rmtree(self.dbdir, ignore_errors=True)
+        if self.opts.keep:
+            self.log("kept logs and data in %s", self.workdir)
+        else:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def run(self):
+        try:
+            self.setup()
+            self.start_servers()
+            self.phase('login storm', self.login_storm)
+            self.phase('steady traffic', self.steady_traffic)
+        finally:
+            self.stop_servers()
+        self.report(self.collect_server_stats())
+        self.cleanup()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the JuliaBox engine against a simulated docker daemon.')
+    parser.add_argument('--users', type=int, default=20, help='number of users logging in (default: 20)')
+    parser.add_argument('--login-concurrency', type=int, default=20,
+                        help='number of users logging in at the same time (default: 20)')
+    parser.add_argument('--max-sessions', type=int, default=100,
+                        help='maximum sessions on the instance, "interactive.numlocalmax" (default: 100)')
+    parser.add_argument('--launch-timeout', type=int, default=180,
+                        help='seconds to wait for a session to launch (default: 180)')
+    parser.add_argument('--duration', type=int, default=60,
+                        help='seconds of ping, API and maintenance traffic after the logins (default: 60)')
+    parser.add_argument('--ping-concurrency', type=int, default=10, help='number of pinging threads (default: 10)')
+    parser.add_argument('--ping-interval', type=float, default=0.1,
+                        help='seconds between pings of each thread (default: 0.1)')
+    parser.add_argument('--api-concurrency', type=int, default=5,
+                        help='number of threads making API calls (default: 5)')
+    parser.add_argument('--api-binary-bytes', type=int, default=0,
+                        help='make API calls that return this many bytes as raw body frames (default: 0, echo calls)')
+    parser.add_argument('--api-min-idle', type=int, default=0,
+                        help='idle containers kept started for the API (default: 0)')
+    parser.add_argument('--maintain-secs', type=int, default=15,
+                        help='seconds between maintenance cycles (default: 15)')
+    parser.add_argument('--latency', action='append', default=[], metavar='OP=SECS',
+                        help='latency of a simulated docker operation. can be repeated. operations and defaults: ' +
+                             ', '.join('%s=%g' % (n, v) for n, v in sorted(DEFAULT_LATENCY.iteritems())))
+    parser.add_argument('--log-level', type=int, default=20, help='log level of the servers (default: 20, info)')
+    parser.add_argument('--keep', action='store_true', help='keep server logs and data')
+    parser.add_argument('--serve', nargs=4, metavar=('SERVER', 'WORKDIR', 'DOCKER_URL', 'MAINTAIN_SECS'),
+                        help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.serve is not None:
+        serve(args.serve[0], args.serve[1], args.serve[2], int(args.serve[3]))
+    else:
+        Benchmark(args).run()
+        # skip interpreter teardown, which can crash while the simulated daemon's threads are still unwinding
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(0)
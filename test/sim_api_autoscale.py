@@ -0,0 +1,72 @@
+#! /usr/bin/env python
+"""
+Simulate the API container autoscaler against a synthetic load, to tune its policy.
+
+The load is a sequence of phases, each a request rate held for a duration, e.g. `--load 0.2:60 6:120 0.5:180 0:400`
+(requests per second : seconds). Prints the desired and serving containers, and the queue length over time, followed
+by a summary. Policy settings are those of "api.autoscale" in the engine configuration, e.g.
+`--policy target_utilization=0.5 --policy scale_down_delay_secs=30`.
+"""
+
+import os
+import sys
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'engine', 'src'))
+
+from juliabox.api import APIAutoScaler
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Simulate the API container autoscaler.')
+    parser.add_argument('--load', nargs='+', default=['0.2:60', '6:120', '0.5:180', '0:400'], metavar='RATE:SECS',
+                        help='phases of the load (default: 0.2:60 6:120 0.5:180 0:400)')
+    parser.add_argument('--service-secs', type=float, default=0.5, help='mean service time (default: 0.5)')
+    parser.add_argument('--boot-secs', type=float, default=10, help='seconds for a container to start (default: 10)')
+    parser.add_argument('--max-containers', type=int, default=5,
+                        help='maximum containers of the API, "api.numapilocalmax" (default: 5)')
+    parser.add_argument('--min-idle', type=int, default=0,
+                        help='spare containers to keep started, "min_idle" of the API spec (default: 0)')
+    parser.add_argument('--interval-secs', type=float, default=APIAutoScaler.INTERVAL_SECS,
+                        help='seconds between decisions (default: %g)' % (APIAutoScaler.INTERVAL_SECS,))
+    parser.add_argument('--policy', action='append', default=[], metavar='NAME=VALUE',
+                        help='policy setting. can be repeated. settings and defaults: ' +
+                             ', '.join('%s=%g' % (n, v) for n, v in sorted(APIAutoScaler.DEFAULT_POLICY.iteritems())))
+    parser.add_argument('--seed', type=int, default=None, help='random seed')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    rates = []
+    for phase in args.load:
+        rate, secs = phase.split(':')
+        rates.extend([float(rate)] * int(float(secs) / args.interval_secs))
+
+    policy = dict()
+    for setting in args.policy:
+        name, value = setting.split('=')
+        policy[name] = float(value)
+
+    timeline = APIAutoScaler.simulate(rates, args.service_secs, policy=policy, interval_secs=args.interval_secs,
+                                      boot_secs=args.boot_secs, max_count=args.max_containers, initial=args.min_idle,
+                                      min_idle=args.min_idle)
+
+    print("%8s %8s %8s %8s %8s %8s" % ('time', 'rate', 'queued', 'desired', 'serving', 'booting'))
+    for row in timeline:
+        print("%8d %8g %8d %8d %8d %8d" % (row['time'], row['rate'], row['queued'], row['desired'], row['serving'],
+                                           row['booting']))
+
+    container_secs = sum(row['serving'] + row['booting'] for row in timeline) * args.interval_secs
+    print("")
+    print("max queued: %d, mean queued: %.2f, container seconds: %d" % (
+        max(row['queued'] for row in timeline), sum(row['queued'] for row in timeline) / float(len(timeline)),
+        container_secs))
+
+
+if __name__ == "__main__":
+    main()
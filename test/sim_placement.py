@@ -0,0 +1,274 @@
+#! /usr/bin/env python
+"""
+Simulate placement of sessions on a cluster, comparing the redirect chain of `CompEC2.should_accept_session` and
+`CompEC2.get_redirect_instance_id` with the single decision of `JBoxPlacement`.
+
+Users arrive at random instances (as through a load balancer) at `--rate` per second, and keep their sessions for an
+exponentially distributed time. Returning users (`--return-frac`) have a stopped container on the instance they were
+last on, and are sent there first by both algorithms. Instances see their own load as it is, and loads of others as
+last published, every `--publish-secs`.
+
+Launch latency is the time spent in hops and placement decisions, plus the time to start the session: reusing a
+stopped container is fastest, then taking a warm container, then starting a new one. Prints counts, hops and launch
+latencies for each algorithm.
+"""
+
+import os
+import sys
+import heapq
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'engine', 'src'))
+
+from juliabox.cloud import JBoxPlacement
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Simulate placement of sessions on a cluster.')
+    parser.add_argument('--instances', type=int, default=5, help='instances in the cluster (default: 5)')
+    parser.add_argument('--capacity', type=int, default=20,
+                        help='sessions per instance, "numlocalmax" (default: 20)')
+    parser.add_argument('--warm', type=int, default=2, help='warm containers per instance (default: 2)')
+    parser.add_argument('--warm-refill-secs', type=float, default=30,
+                        help='seconds to start a warm container (default: 30)')
+    parser.add_argument('--rate', type=float, default=0.1, help='sessions requested per second (default: 0.1)')
+    parser.add_argument('--session-secs', type=float, default=600, help='mean session duration (default: 600)')
+    parser.add_argument('--duration', type=float, default=3600, help='seconds to simulate (default: 3600)')
+    parser.add_argument('--return-frac', type=float, default=0.3,
+                        help='fraction of users with a stopped container (default: 0.3)')
+    parser.add_argument('--publish-secs', type=float, default=60,
+                        help='seconds between load updates seen by other instances (default: 60)')
+    parser.add_argument('--numhopmax', type=int, default=10, help='maximum hops (default: 10)')
+    parser.add_argument('--hop-secs', type=float, default=0.3, help='seconds per redirect (default: 0.3)')
+    parser.add_argument('--stats-query-secs', type=float, default=0.1,
+                        help='seconds per CloudWatch query of an instance load, by the redirect chain (default: 0.1)')
+    parser.add_argument('--reuse-secs', type=float, default=3, help='seconds to restart a stopped container')
+    parser.add_argument('--warm-secs', type=float, default=5, help='seconds to take up a warm container')
+    parser.add_argument('--cold-secs', type=float, default=20, help='seconds to start a new container')
+    parser.add_argument('--policy', action='append', default=[], metavar='NAME=VALUE',
+                        help='placement policy setting. can be repeated. settings and defaults: ' +
+                             ', '.join('%s=%g' % (n, v) for n, v in sorted(JBoxPlacement.DEFAULT_POLICY.iteritems())))
+    parser.add_argument('--seed', type=int, default=1, help='random seed (default: 1)')
+    return parser.parse_args()
+
+
+def make_arrivals(args, instances, rnd):
+    """ (time, session duration, instance arrived at, user id) of each session requested. """
+    arrivals = []
+    now = rnd.expovariate(args.rate)
+    users = 0
+    returning = []
+    while now < args.duration:
+        if (len(returning) > 0) and (rnd.random() < args.return_frac):
+            user = returning.pop(rnd.randrange(len(returning)))
+        else:
+            user = users
+            users += 1
+        returning.append(user)
+        arrivals.append((now, rnd.expovariate(1.0 / args.session_secs), rnd.choice(instances), user))
+        now += rnd.expovariate(args.rate)
+    return arrivals
+
+
+class Cluster(object):
+    def __init__(self, args, instances):
+        self.args = args
+        self.instances = instances
+        self.sessions = dict((iid, 0) for iid in instances)
+        self.warm = dict((iid, args.warm) for iid in instances)
+        # instance each user last had a container on, and whether it is still running
+        self.stopped = dict()
+        self.running = set()
+        self.events = []
+        self.published = None
+        self.published_at = None
+
+    def load(self, iid):
+        return min(100, self.sessions[iid] * 100 / self.args.capacity)
+
+    def advance(self, now):
+        while (len(self.events) > 0) and (self.events[0][0] <= now):
+            _t, kind, iid, user = heapq.heappop(self.events)
+            if kind == 'end':
+                self.sessions[iid] -= 1
+                self.running.discard(user)
+                self.stopped[user] = iid
+            elif kind == 'warm':
+                self.warm[iid] += 1
+        if (self.published_at is None) or (now - self.published_at >= self.args.publish_secs):
+            self.publish(now)
+
+    def publish(self, now):
+        self.published = dict((iid, {
+            'load': self.load(iid),
+            'accept': True,
+            'warm': self.warm[iid]
+        }) for iid in self.instances)
+        self.published_at = now
+
+    def launch(self, now, iid, user, duration):
+        """ Start a session. Returns the seconds taken. """
+        if self.stopped.get(user, None) == iid:
+            secs = self.args.reuse_secs
+        elif self.warm[iid] > 0:
+            self.warm[iid] -= 1
+            heapq.heappush(self.events, (now + self.args.warm_refill_secs, 'warm', iid, None))
+            secs = self.args.warm_secs
+        else:
+            secs = self.args.cold_secs
+        self.stopped.pop(user, None)
+        self.sessions[iid] += 1
+        self.running.add(user)
+        heapq.heappush(self.events, (now + duration, 'end', iid, user))
+        return secs
+
+
+def legacy_loads(cluster, self_iid):
+    loads = dict((iid, props['load']) for (iid, props) in cluster.published.iteritems())
+    loads[self_iid] = cluster.load(self_iid)
+    return loads
+
+
+def legacy_accept(cluster, self_iid):
+    """ As `CompEC2.should_accept_session`, with all instances on the same image. """
+    loads = legacy_loads(cluster, self_iid)
+    self_load = loads[self_iid]
+    if self_load >= 100:
+        return False
+    if self_iid == cluster.instances[0]:
+        # the cluster leader
+        return True
+    avg_load = float(sum(loads.values())) / len(loads)
+    filtered = []
+    if avg_load >= 50:
+        if self_load >= avg_load:
+            return True
+        filtered = [k for k, v in loads.iteritems() if v < avg_load]
+    if len(filtered) == 0:
+        filtered = loads.keys()
+    return sorted(filtered)[0] == self_iid
+
+
+def legacy_redirect(cluster, self_iid):
+    """ As `CompEC2.get_redirect_instance_id`. """
+    loads = legacy_loads(cluster, self_iid)
+    avg_load = float(sum(loads.values())) / len(loads)
+    if avg_load >= 50:
+        filtered = [k for k, v in loads.iteritems() if v < avg_load]
+    else:
+        filtered = [k for k, v in loads.iteritems() if 100 > v > avg_load]
+        if len(filtered) == 0:
+            least_load = min(loads.values())
+            filtered = [k for k, v in loads.iteritems() if 100 > v > least_load]
+        if len(filtered) == 0:
+            filtered = [k for k, v in loads.iteritems() if 100 > v]
+    if len(filtered) == 0:
+        filtered = loads.keys()
+    return sorted(filtered)[0]
+
+
+def place_legacy(cluster, iid, user, args):
+    """ Returns the instance launched on (or None), hops and seconds spent deciding. """
+    hops = 0
+    decide_secs = 0.0
+    while True:
+        if hops > args.numhopmax:
+            return (iid if cluster.load(iid) < 100 else None), hops, decide_secs
+        # a CloudWatch query for the load of each instance
+        decide_secs += args.stats_query_secs * len(cluster.instances)
+        if legacy_accept(cluster, iid):
+            return iid, hops, decide_secs
+        decide_secs += args.stats_query_secs * len(cluster.instances)
+        iid = legacy_redirect(cluster, iid)
+        hops += 1
+
+
+def place_new(cluster, iid, user, args, policy, rnd):
+    hops = 0
+    while True:
+        if hops > args.numhopmax:
+            return (iid if cluster.load(iid) < 100 else None), hops, 0.0
+        if (hops > 0) and (cluster.load(iid) < 100):
+            # placed here by another instance
+            return iid, hops, 0.0
+        candidates = dict((k, dict(v)) for (k, v) in cluster.published.iteritems())
+        candidates[iid]['load'] = cluster.load(iid)
+        affinity = iid if cluster.stopped.get(user, None) == iid else None
+        target = JBoxPlacement.choose(candidates, affinity=affinity, policy=policy, rnd=rnd)
+        if target is None:
+            return None, hops, 0.0
+        if target == iid:
+            return iid, hops, 0.0
+        iid = target
+        hops += 1
+
+
+def run(args, instances, arrivals, place):
+    cluster = Cluster(args, instances)
+    results = []
+    for (now, duration, iid, user) in arrivals:
+        cluster.advance(now)
+        hops = 0
+        last_iid = cluster.stopped.get(user, None)
+        if (last_iid is not None) and (last_iid != iid):
+            # sent to the instance with the user's stopped container first
+            iid = last_iid
+            hops += 1
+        placed_iid, nhops, decide_secs = place(cluster, iid, user)
+        hops += nhops
+        if placed_iid is None:
+            results.append({'launched': False, 'hops': hops})
+            continue
+        reused = (last_iid == placed_iid)
+        launch_secs = cluster.launch(now, placed_iid, user, duration)
+        results.append({
+            'launched': True,
+            'hops': hops,
+            'reused': reused,
+            'latency': hops * args.hop_secs + decide_secs + launch_secs
+        })
+    return results
+
+
+def pct(values, p):
+    values = sorted(values)
+    if len(values) == 0:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def summarize(name, results):
+    launched = [r for r in results if r['launched']]
+    hops = [r['hops'] for r in results]
+    latency = [r['latency'] for r in launched]
+    print("%-8s %8d %8d %8.2f %8d %8d %8.1f %8.1f %8d" % (
+        name, len(launched), len(results) - len(launched), sum(hops) / float(max(len(hops), 1)), pct(hops, 95),
+        max(hops) if len(hops) > 0 else 0, sum(latency) / max(len(latency), 1), pct(latency, 95),
+        len([r for r in launched if r['reused']])))
+
+
+def main():
+    args = parse_args()
+    instances = ["i-%02d" % (idx,) for idx in range(args.instances)]
+    arrivals = make_arrivals(args, instances, random.Random(args.seed))
+
+    policy = dict()
+    for setting in args.policy:
+        name, value = setting.split('=')
+        policy[name] = float(value)
+    policy = JBoxPlacement.make_policy(policy)
+
+    legacy = run(args, instances, arrivals, lambda cluster, iid, user: place_legacy(cluster, iid, user, args))
+    rnd = random.Random(args.seed)
+    placed = run(args, instances, arrivals,
+                 lambda cluster, iid, user: place_new(cluster, iid, user, args, policy, rnd))
+
+    print("%-8s %8s %8s %8s %8s %8s %8s %8s %8s" % ('', 'launched', 'failed', 'hops', 'p95hops', 'maxhops',
+                                                   'latency', 'p95lat', 'reused'))
+    summarize('legacy', legacy)
+    summarize('placed', placed)
+
+
+if __name__ == "__main__":
+    main()